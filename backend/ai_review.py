@@ -0,0 +1,80 @@
+"""AI book reviews from the RapidAPI chat endpoint.
+
+Building the request and reading the answer are shared by the blocking
+routes in `backend.app` (which use `requests`) and the async endpoint in
+`backend.asgi` (which uses a pooled `httpx.AsyncClient`). Settings come from
+`RAPIDAPI_URL`, `RAPIDAPI_KEY`, `RAPIDAPI_HOST` and `AI_REQUEST_TIMEOUT`.
+"""
+
+import os
+
+DEFAULT_URL = 'https://open-ai21.p.rapidapi.com/conversationllama'
+DEFAULT_HOST = 'open-ai21.p.rapidapi.com'
+
+
+def build_prompt(title, author_name, rating):
+    return (
+        f"Based on the following book in my library, please "
+        f"provide a detailed recommendation or analysis.\n"
+        f"Book: {title} by {author_name or 'Unknown Author'}\n"
+        f"Rating: {rating if rating else 'Not rated'}\n\n"
+        f"Please provide:\n"
+        f"1. Book title\n"
+        f"2. Author name\n"
+        f"3. Why you recommend it or analysis\n"
+        f"4. Genre/themes it shares with other books\n"
+    )
+
+
+def request_settings():
+    """Return (url, headers, timeout) for the AI service."""
+    url = os.environ.get('RAPIDAPI_URL', DEFAULT_URL)
+    headers = {
+        "x-rapidapi-key": os.environ.get('RAPIDAPI_KEY'),
+        "x-rapidapi-host": os.environ.get('RAPIDAPI_HOST', DEFAULT_HOST),
+        "Content-Type": "application/json"
+    }
+    # 60 seconds by default (30 was too short for some requests)
+    timeout = int(os.environ.get('AI_REQUEST_TIMEOUT', 60))
+    # requests drops unset headers itself, httpx refuses them
+    headers = {k: v for k, v in headers.items() if v is not None}
+    return url, headers, timeout
+
+
+def build_payload(prompt):
+    return {
+        "messages": [
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        "web_access": False
+    }
+
+
+def book_prompt(book):
+    return build_prompt(book.title,
+                        book.author.name if book.author else None,
+                        book.rating)
+
+
+def parse_recommendation(result):
+    """Extract the review text from the service's JSON answer."""
+    recommendation = result.get('result', 'No recommendation generated')
+    if isinstance(recommendation, dict):
+        recommendation = recommendation.get('message', str(recommendation))
+    return recommendation
+
+
+def fetch_recommendation(book):
+    """Ask the AI service about `book`, blocking until it answers.
+
+    Raises `requests` exceptions on timeouts, connection and HTTP errors.
+    """
+    import requests
+    url, headers, timeout = request_settings()
+    response = requests.post(url, json=build_payload(book_prompt(book)),
+                             headers=headers, timeout=timeout)
+    response.raise_for_status()
+    return parse_recommendation(response.json())
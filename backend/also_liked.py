@@ -0,0 +1,241 @@
+""""Readers who liked this also liked": item-item suggestions from the
+ratings of individual readers.
+
+Readers rate books on their own behalf (`reader_rating`; `book.rating`
+stays the library's rating). A batch job turns those ratings into a top-N
+table, `also_liked`. A reader likes a book when they rated it at least
+`LIKED_RATING`. Two books are scored by the cosine similarity of their
+columns in the sparse reader x book "liked" matrix,
+
+    score(a, b) = readers who liked both / sqrt(likers(a) * likers(b))
+
+and only pairs liked together by at least `MIN_READERS` readers are kept,
+so one reader's taste alone never becomes a suggestion. Suggestions stay
+within a library (backend.libraries): a reader's likes in two libraries
+count as two readers.
+
+With NumPy installed (optional) the matrix product is vectorized: every
+(book, book) pair liked by the same reader is generated as an array,
+counted with `numpy.unique`, scored and ranked with array operations, a
+batch of books at a time (`PAIR_BATCH` pairs at most). Without it the
+product is computed one book (column) at a time: the liked lists of the
+book's readers are chained and counted by `Counter`, whose counting loop
+runs in C. Both do work proportional to the sum over readers of (books
+liked)^2 and store the same rows. Book pages read the stored rows;
+recompute them with
+
+    flask --app backend.app rebuild-also-liked
+
+from cron, or set `ALSO_LIKED_INTERVAL_SECONDS` to have the server do it in
+a background thread (`backend.server.start_background_jobs`).
+"""
+
+import heapq
+import math
+import threading
+import time
+from collections import Counter, defaultdict
+from itertools import chain
+
+from sqlalchemy import select
+
+from backend.data_models import AlsoLiked, Book, ReaderRating, db, utcnow
+from backend.libraries import each_database
+from backend.listings import book_listing_select, fetch_book_listings
+
+try:
+    import numpy
+except ImportError:
+    # optional: the pure-Python computation is used instead
+    numpy = None
+
+LIKED_RATING = 7
+MIN_READERS = 2
+TOP_N = 20
+INSERT_BATCH = 1000
+# Book pairs held in memory at once by the NumPy computation
+PAIR_BATCH = 4_000_000
+
+
+def set_reader_rating(conn, reader_id, book_id, rating, when=None):
+    """Record `reader_id`'s rating of a book, replacing an earlier one."""
+    table = ReaderRating.__table__
+    c = table.c
+    values = {'rating': rating, 'rated_at': when or utcnow()}
+    result = conn.execute(
+        table.update()
+        .where(c.reader_id == reader_id, c.book_id == book_id)
+        .values(values))
+    if result.rowcount == 0:
+        conn.execute(table.insert().values(
+            reader_id=reader_id, book_id=book_id, **values))
+
+
+def reader_rating(reader_id, book_id):
+    """The reader's rating of a book, or None."""
+    return db.session.query(ReaderRating.rating).filter_by(
+        reader_id=reader_id, book_id=book_id).scalar()
+
+
+def liked_matrix(conn):
+    """The liked matrix by rows and by columns: ({reader: [book_id]},
+    {book_id: [reader]}), live books only. A reader is (library id, reader
+    id), so no row links the books of two libraries."""
+    rating = ReaderRating.__table__
+    book = Book.__table__
+    by_reader = defaultdict(list)
+    by_book = defaultdict(list)
+    for library_id, reader_id, book_id in conn.execute(
+            select(book.c.library_id, rating.c.reader_id, rating.c.book_id)
+            .join(book, book.c.id == rating.c.book_id)
+            .where(rating.c.rating >= LIKED_RATING,
+                   book.c.deleted_at.is_(None))):
+        reader = (library_id, reader_id)
+        by_reader[reader].append(book_id)
+        by_book[book_id].append(reader)
+    return by_reader, by_book
+
+
+def top_also_liked(book_id, by_reader, by_book, top_n=TOP_N,
+                   min_readers=MIN_READERS):
+    """[(score, readers, other_id)] for one book, best first."""
+    together = Counter(chain.from_iterable(
+        by_reader[reader] for reader in by_book[book_id]))
+    del together[book_id]
+    likers = len(by_book[book_id])
+    scored = ((n / math.sqrt(likers * len(by_book[other_id])), n, other_id)
+              for other_id, n in together.items() if n >= min_readers)
+    return heapq.nlargest(top_n, scored, key=lambda s: (s[0], s[1], -s[2]))
+
+
+def all_also_liked(by_reader, by_book, top_n=TOP_N,
+                   min_readers=MIN_READERS):
+    """(book_id, [(score, readers, other_id)]) of every book with a list,
+    best first: `top_also_liked()` of each book."""
+    for book_id, likers in by_book.items():
+        if len(likers) < min_readers:
+            continue
+        best = top_also_liked(book_id, by_reader, by_book, top_n,
+                              min_readers)
+        if best:
+            yield book_id, best
+
+
+def all_also_liked_numpy(by_reader, by_book, top_n=TOP_N,
+                         min_readers=MIN_READERS):
+    """`all_also_liked()` with NumPy array operations."""
+    book_ids = numpy.array(sorted(by_book), dtype=numpy.int64)
+    if not len(book_ids):
+        return
+    n_books = len(book_ids)
+    likers = numpy.array([len(by_book[b]) for b in book_ids.tolist()],
+                         dtype=numpy.float64)
+    # The liked entries as columns (book indexes), grouped by reader
+    lists = list(by_reader.values())
+    sizes = numpy.array([len(books) for books in lists], dtype=numpy.int64)
+    cols = numpy.searchsorted(book_ids, numpy.fromiter(
+        chain.from_iterable(lists), dtype=numpy.int64, count=sizes.sum()))
+    starts = numpy.cumsum(sizes) - sizes
+    entry_sizes = numpy.repeat(sizes, sizes)
+    entry_starts = numpy.repeat(starts, sizes)
+    # Entries by column, cut into batches of whole columns
+    by_col = numpy.argsort(cols, kind='stable')
+    col_pairs = numpy.bincount(cols, weights=entry_sizes, minlength=n_books)
+    batch_of_col = (numpy.cumsum(col_pairs) - col_pairs) // PAIR_BATCH
+    col_ends = numpy.searchsorted(cols[by_col], numpy.arange(n_books),
+                                  side='right')
+    first = 0
+    for last_col in numpy.flatnonzero(
+            numpy.diff(batch_of_col, append=batch_of_col[-1] + 1)):
+        entries = by_col[first:col_ends[last_col]]
+        first = col_ends[last_col]
+        counts = entry_sizes[entries]
+        total = counts.sum()
+        if not total:
+            continue
+        # Every (book, book) pair liked by one reader
+        offsets = numpy.arange(total) - numpy.repeat(
+            numpy.cumsum(counts) - counts, counts)
+        left = numpy.repeat(cols[entries], counts)
+        right = cols[numpy.repeat(entry_starts[entries], counts) + offsets]
+        keys, together = numpy.unique(
+            left[left != right] * n_books + right[left != right],
+            return_counts=True)
+        keep = together >= min_readers
+        keys, together = keys[keep], together[keep]
+        left, right = keys // n_books, keys % n_books
+        scores = together / numpy.sqrt(likers[left] * likers[right])
+        # Per book: best score, then most readers, then lowest id
+        order = numpy.lexsort((right, -together, -scores, left))
+        left, right = left[order], right[order]
+        scores, together = scores[order], together[order]
+        group_starts = numpy.flatnonzero(numpy.diff(left, prepend=-1))
+        rank = numpy.arange(len(left)) - numpy.repeat(
+            group_starts, numpy.diff(numpy.append(group_starts, len(left))))
+        keep = rank < top_n
+        left, right = left[keep], right[keep]
+        scores, together = scores[keep].tolist(), together[keep].tolist()
+        others = book_ids[right].tolist()
+        bounds = numpy.flatnonzero(numpy.diff(left, prepend=-1)).tolist()
+        for start, end, col in zip(bounds, bounds[1:] + [len(left)],
+                                   left[bounds].tolist()):
+            yield int(book_ids[col]), list(zip(
+                scores[start:end], together[start:end], others[start:end]))
+
+
+def rebuild_also_liked(conn, top_n=TOP_N, min_readers=MIN_READERS):
+    """Recompute the whole table from the current reader ratings. Returns
+    the number of books that got a list.
+
+    Everything is computed before the old rows are deleted, so the write
+    part of the transaction is just the DELETE and batched INSERTs.
+    """
+    by_reader, by_book = liked_matrix(conn)
+    compute = all_also_liked if numpy is None else all_also_liked_numpy
+    when = utcnow()
+    rows = []
+    books = 0
+    for book_id, best in compute(by_reader, by_book, top_n, min_readers):
+        books += 1
+        rows.extend({'book_id': book_id, 'other_id': other_id,
+                     'score': score, 'readers': n, 'computed_at': when}
+                    for score, n, other_id in best)
+    table = AlsoLiked.__table__
+    conn.execute(table.delete())
+    for start in range(0, len(rows), INSERT_BATCH):
+        conn.execute(table.insert(), rows[start:start + INSERT_BATCH])
+    return books
+
+
+def also_liked_listings(book_id, limit):
+    """Listing rows (backend.listings) of the live books most liked by the
+    readers who liked this one."""
+    return fetch_book_listings(
+        book_listing_select()
+        .join(AlsoLiked, AlsoLiked.other_id == Book.id)
+        .where(AlsoLiked.book_id == book_id)
+        .order_by(AlsoLiked.score.desc(), Book.id)
+        .limit(limit))
+
+
+def start_also_liked_thread(app):
+    """Run `rebuild_also_liked` every `ALSO_LIKED_INTERVAL_SECONDS` in a
+    daemon thread. Returns the thread, or None when the interval is 0."""
+    interval = app.config.get('ALSO_LIKED_INTERVAL_SECONDS', 0)
+    if not interval:
+        return None
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                with app.app_context():
+                    for _ in each_database():
+                        with db.engine.begin() as conn:
+                            rebuild_also_liked(conn)
+            except Exception as exc:
+                app.logger.warning('Also-liked recompute failed: %s', exc)
+
+    thread = threading.Thread(target=loop, name='also-liked', daemon=True)
+    thread.start()
+    return thread
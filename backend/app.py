@@ -1,21 +1,70 @@
 
 import re
-from sqlalchemy import or_, inspect
+from sqlalchemy import inspect, func, exists
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
 from datetime import datetime
-from backend.data_models import db, Author, Book
-from flask import Flask, render_template, request, redirect, url_for, flash
+from backend.ai_review import fetch_recommendation
+from backend.also_liked import (also_liked_listings, rebuild_also_liked,
+                                reader_rating, set_reader_rating)
+from backend.assets import build_assets, init_assets
+from backend.catalogue import SnapshotPagination, init_catalogue
+from backend.change_feed import init_change_feed
+from backend.change_log import (changes_since, compact_change_log,
+                                init_change_log)
+from backend.data_models import (db, Author, Book, RatingEvent, Reader,
+                                 DEFAULT_LIBRARY_NAME, utcnow)
+from backend.database import database_url, engine_options
+from backend.author_names import MATCH_THRESHOLD
+from backend.dedupe import (apply_author_merges, author_merge_plan,
+                            merge_duplicate_isbns, similar_authors)
+from backend.enrichment import (enqueue_isbns, enqueue_missing,
+                                needs_enrichment, provider_from_config,
+                                run_enrichment)
+from backend.page_cache import (book_validators, can_revalidate,
+                                init_page_cache, not_modified,
+                                not_modified_response, set_validators)
+from backend.listings import (REVIEWED, ProjectionPagination,
+                              author_listing_select, author_listings,
+                              book_listing_select, count_rows,
+                              fetch_book_listings, iter_author_listings,
+                              iter_book_listings, stream_rows)
+from backend.isbn import InvalidIsbn, isbn_key, normalize_isbn
+from backend.libraries import (LIBRARY_ID_KEY, LIBRARY_NAME_KEY,
+                               find_or_create_library, for_each_database,
+                               init_libraries)
+from backend.purge import purge_deleted
+from backend.rating_buffer import init_rating_buffer
+from backend.similar_books import (rebuild_similar_books,
+                                   refresh_similar_books,
+                                   similar_book_listings,
+                                   similar_books_enabled,
+                                   suggested_book_listings)
+from backend.search import (author_name_key, author_prefix_filter,
+                            author_search_filter, book_search_filter,
+                            search_mode)
+from backend.streaming import render_listing, streaming_enabled
+from backend.read_routing import init_read_routing
+from backend.rating_stats import (set_ratings, refresh_author_summaries,
+                                  rebuild_rating_stats, author_summary,
+                                  recent_ratings)
+from flask import (Flask, render_template, request, redirect, url_for, flash,
+                   abort, jsonify, make_response, session, g)
 from markupsafe import Markup, escape
 import os
-import requests
-from dotenv import load_dotenv
+import click
 
-# Load environment variables from .env file
-load_dotenv()
+# `requests`, `dotenv` and `flask_migrate` are imported lazily (see
+# `ai_review_book`, `load_env_file` and `init_migrate`): importing this module
+# only defines `create_app`, so scripts and tests don't pay for them.
+_env_loaded = False
 
-try:
-    from flask_migrate import Migrate
-except Exception:
-    Migrate = None
+# Partial rendering one listing row, by the `data-live-view` of the row
+LIVE_ROW_TEMPLATES = {
+    'home': '_home_book_row.html',
+    'library': '_library_book_card.html',
+    'review': '_review_card.html',
+}
 
 
 # Jinja filter to highlight keyword matches in results
@@ -53,10 +102,122 @@ def check_db_tables(required_tables=None):
         return (False, [str(exc)])
 
 
+def form_id_list(field):
+    """Return the distinct integer ids posted under `field`.
+
+    Checkbox lists post one value per selected row; values that are not
+    integers are ignored.
+    """
+    return sorted(set(request.form.getlist(field, type=int)))
+
+
+def admin_return_url():
+    """URL of the admin page the bulk form was posted from."""
+    return url_for(
+        'admin',
+        page=request.form.get('page', 1, type=int),
+        author_page=request.form.get('author_page', 1, type=int),
+        per_page=request.form.get('per_page', type=int))
+
+
+def author_id_by_name(name):
+    """Id of the author named exactly `name` (the oldest one if several
+    share it), or None."""
+    if not name:
+        return None
+    return db.session.query(Author.id).filter(Author.name == name) \
+        .order_by(Author.id).limit(1).scalar()
+
+
+def book_with_isbn(isbn):
+    """(id, deleted_at) of the oldest book, deleted or not, whose ISBN is
+    `isbn` in any spelling, or None. An index lookup on `isbn_key`."""
+    return db.session.query(Book.id, Book.deleted_at) \
+        .execution_options(include_deleted=True) \
+        .filter(db.or_(Book.isbn_key == isbn_key(isbn), Book.isbn == isbn)) \
+        .order_by(Book.id).first()
+
+
+def isbn_taken_message(isbn, duplicate):
+    if duplicate is not None and duplicate.deleted_at is not None:
+        return (f'A recently deleted book has ISBN {isbn}; undo its '
+                f'deletion or add it again once it has been purged.')
+    return f'A book with ISBN {isbn} is already in the library.'
+
+
+def is_isbn_conflict(exc):
+    """Whether the IntegrityError `exc` is the unique ISBN constraint (and
+    not, say, a missing value)."""
+    message = str(exc.orig)
+    # PostgreSQL names the constraint, SQLite its columns
+    return ('uq_book_library_isbn' in message
+            or 'book.library_id, book.isbn' in message)
+
+
+def load_env_file():
+    """Load environment variables from .env once (python-dotenv is
+    optional)."""
+    global _env_loaded
+    if _env_loaded:
+        return
+    _env_loaded = True
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
+    load_dotenv()
+
+
+MIGRATE_MISSING = ("Flask-Migrate not installed - migrations disabled. "
+                   "Install Flask-Migrate or run 'bash bin/setup.sh' "
+                   "to enable migrations.")
+
+
+def setup_migrate(app):
+    """Register Flask-Migrate (and its `flask db` commands) on `app`, or
+    return None when it isn't installed."""
+    try:
+        from flask_migrate import Migrate
+    except ImportError:
+        app.logger.warning(MIGRATE_MISSING)
+        return None
+    return Migrate(app, db)
+
+
+class MigrateCommands(click.Group):
+    """The `flask db ...` commands, with Flask-Migrate (and alembic)
+    imported and registered only once one of them runs."""
+
+    def __init__(self, app):
+        super().__init__('db', help='Perform database migrations.')
+        self.app = app
+
+    def make_context(self, info_name, args, parent=None, **extra):
+        # Hand the command line over to Flask-Migrate's own group
+        if 'migrate' not in self.app.extensions \
+                and setup_migrate(self.app) is None:
+            raise click.ClickException(MIGRATE_MISSING)
+        from flask_migrate.cli import db as commands
+        return commands.make_context(info_name, args, parent=parent, **extra)
+
+
+def init_migrate(app):
+    """Make the `flask db ...` commands available.
+
+    Only those commands need Flask-Migrate, so it is imported when one of
+    them runs (`MigrateCommands`) instead of on every app start. With
+    MIGRATE_ENABLED set it is registered right away.
+    """
+    if app.config.get('MIGRATE_ENABLED'):
+        return setup_migrate(app)
+    app.cli.add_command(MigrateCommands(app))
+    return None
+
+
 def create_app(config_overrides=None):
     # Create Flask application instance
     # Point to frontend directory for templates and static files
-    import os
+    load_env_file()
     basedir = os.path.abspath(os.path.dirname(__file__))
     frontend_dir = os.path.join(os.path.dirname(basedir), 'frontend')
     app = Flask(__name__,
@@ -71,51 +232,331 @@ def create_app(config_overrides=None):
     # Database is in project root, one level up from backend/
     project_root = os.path.dirname(basedir)
     db_path = os.path.join(project_root, 'data', 'library.sqlite')
-    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_path}"
+    # DATABASE_URL (e.g. postgresql+psycopg://...) replaces the SQLite file;
+    # DATABASE_URI is the older name from the .env examples
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url(
+        os.environ.get('DATABASE_URL') or os.environ.get('DATABASE_URI'),
+        f"sqlite:///{db_path}")
+    # Connection pool for server databases (ignored for SQLite): connections
+    # kept open, extra connections allowed under load, seconds to wait for
+    # one, seconds before a connection is replaced, and a liveness check
+    # on checkout
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 5))
+    app.config['DB_MAX_OVERFLOW'] = int(
+        os.environ.get('DB_MAX_OVERFLOW', 10))
+    app.config['DB_POOL_TIMEOUT'] = float(
+        os.environ.get('DB_POOL_TIMEOUT', 30))
+    app.config['DB_POOL_RECYCLE'] = int(
+        os.environ.get('DB_POOL_RECYCLE', 1800))
+    app.config['DB_POOL_PRE_PING'] = os.environ.get(
+        'DB_POOL_PRE_PING', '1').lower() in ('1', 'true', 'yes')
+    # Keyword search: 'auto' uses trigram indexes on PostgreSQL and plain
+    # LIKE elsewhere; 'fulltext' switches PostgreSQL to word search
+    # (see backend.search)
+    app.config['SEARCH_MODE'] = os.environ.get('SEARCH_MODE', 'auto')
     # Turn off the extra event system to keep things simple and avoid a warning
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Page size for the admin listings (overridable through ?per_page=)
+    app.config['ADMIN_PER_PAGE'] = 50
+    app.config['ADMIN_MAX_PER_PAGE'] = 500
+    # Local "similar books" (backend.similar_books): neighbour lists kept
+    # up to date on writes, and how many the book and recommendation pages
+    # show
+    app.config['SIMILAR_BOOKS'] = os.environ.get(
+        'SIMILAR_BOOKS', '1').lower() in ('1', 'true', 'yes')
+    app.config['SIMILAR_BOOKS_SHOWN'] = 6
+    # "Readers who liked this also liked" (backend.also_liked): books shown
+    # on the book page, and how often the app recomputes the table itself
+    # (0 = never; run `flask rebuild-also-liked` from cron instead)
+    app.config['ALSO_LIKED_SHOWN'] = 6
+    app.config['ALSO_LIKED_INTERVAL_SECONDS'] = int(
+        os.environ.get('ALSO_LIKED_INTERVAL_SECONDS', 0))
+    # Metadata enrichment by ISBN (backend.enrichment, `flask enrich-books`):
+    # the provider ('openlibrary', or 'stub' answering from
+    # ENRICHMENT_STUB_FILE), ISBNs per request and requests in flight
+    app.config['ENRICHMENT_PROVIDER'] = os.environ.get(
+        'ENRICHMENT_PROVIDER', 'openlibrary')
+    app.config['ENRICHMENT_URL'] = os.environ.get(
+        'ENRICHMENT_URL', 'https://openlibrary.org')
+    app.config['ENRICHMENT_TIMEOUT'] = float(
+        os.environ.get('ENRICHMENT_TIMEOUT', 10))
+    app.config['ENRICHMENT_STUB_FILE'] = os.environ.get('ENRICHMENT_STUB_FILE')
+    app.config['ENRICHMENT_BATCH_SIZE'] = int(
+        os.environ.get('ENRICHMENT_BATCH_SIZE', 50))
+    app.config['ENRICHMENT_CONCURRENCY'] = int(
+        os.environ.get('ENRICHMENT_CONCURRENCY', 4))
+    # Suggestions per author picker lookup (overridable through ?limit=)
+    app.config['AUTHOR_LOOKUP_LIMIT'] = 20
+    app.config['AUTHOR_LOOKUP_MAX_LIMIT'] = 100
+    # Deletes are soft: rows keep a `deleted_at` tombstone and can be
+    # restored until the purge job removes them after this many seconds
+    app.config['SOFT_DELETE_RETENTION_SECONDS'] = int(
+        os.environ.get('SOFT_DELETE_RETENTION_SECONDS', 24 * 3600))
+    # Purge pacing: rows per transaction, pause between batches, and how
+    # often the in-process purge thread runs (0 = never; use the
+    # `purge-deleted` CLI command from cron instead)
+    app.config['PURGE_BATCH_SIZE'] = int(
+        os.environ.get('PURGE_BATCH_SIZE', 500))
+    app.config['PURGE_PAUSE_SECONDS'] = float(
+        os.environ.get('PURGE_PAUSE_SECONDS', 0.2))
+    app.config['PURGE_INTERVAL_SECONDS'] = int(
+        os.environ.get('PURGE_INTERVAL_SECONDS', 0))
+    # The purge and also-liked threads run in the one server process holding
+    # this file's lock (backend.server.start_background_jobs; None = a file
+    # in the temp directory named after the database)
+    app.config['BACKGROUND_LOCK_FILE'] = os.environ.get(
+        'BACKGROUND_LOCK_FILE')
+    # Ratings posted to the JSON rating endpoint are coalesced in memory and
+    # written in one UPDATE every N seconds or once this many are pending
+    app.config['RATING_BUFFER_FLUSH_INTERVAL'] = float(
+        os.environ.get('RATING_BUFFER_FLUSH_INTERVAL', 2.0))
+    app.config['RATING_BUFFER_MAX_PENDING'] = int(
+        os.environ.get('RATING_BUFFER_MAX_PENDING', 100))
+    # Home page listing: books per page (0 = all on one page, the default)
+    # and the largest ?per_page= a visitor may ask for
+    app.config['HOME_PER_PAGE'] = int(os.environ.get('HOME_PER_PAGE', 0))
+    app.config['HOME_MAX_PER_PAGE'] = 500
+    # Static assets are linked by content hash (see backend.assets); build
+    # the hashed copies on first use unless a deploy step runs
+    # `flask build-assets` (set ASSET_AUTO_BUILD=0 then)
+    app.config['ASSET_AUTO_BUILD'] = os.environ.get(
+        'ASSET_AUTO_BUILD', '1').lower() in ('1', 'true', 'yes')
+    # gzip HTML/JSON responses of at least COMPRESS_MIN_SIZE bytes
+    app.config['COMPRESS_RESPONSES'] = os.environ.get(
+        'COMPRESS_RESPONSES', '1').lower() in ('1', 'true', 'yes')
+    app.config['COMPRESS_MIN_SIZE'] = int(
+        os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    app.config['COMPRESS_LEVEL'] = int(os.environ.get('COMPRESS_LEVEL', 6))
+    # Rendered page fragments kept in memory (LRU entries; 0 = off)
+    app.config['FRAGMENT_CACHE_SIZE'] = int(
+        os.environ.get('FRAGMENT_CACHE_SIZE', 1024))
+    # Stream the listing pages (home, admin, recommendations) while their
+    # rows are read, N rows per fetch, instead of rendering them in memory
+    # first (see backend.streaming)
+    app.config['STREAM_LISTINGS'] = os.environ.get(
+        'STREAM_LISTINGS', '').lower() in ('1', 'true', 'yes')
+    app.config['STREAM_BATCH_SIZE'] = int(
+        os.environ.get('STREAM_BATCH_SIZE', 500))
+    # Serve the home page listing from an in-process snapshot of the
+    # catalogue instead of ORM queries (see backend.catalogue). The shared
+    # change counter is checked at most every N seconds (0 = every request)
+    app.config['CATALOGUE_SNAPSHOT'] = os.environ.get(
+        'CATALOGUE_SNAPSHOT', '').lower() in ('1', 'true', 'yes')
+    app.config['CATALOGUE_REFRESH_SECONDS'] = float(
+        os.environ.get('CATALOGUE_REFRESH_SECONDS', 0))
+    # Upstream connections the async AI endpoint (backend.asgi) may keep
+    # open at once; further reviews wait for a free connection
+    app.config['AI_MAX_CONNECTIONS'] = int(
+        os.environ.get('AI_MAX_CONNECTIONS', 50))
+    # Optional read replica for GET/HEAD requests: a database URI, or a
+    # read-only second engine on the primary SQLite file
+    app.config['READ_REPLICA_URI'] = os.environ.get('READ_REPLICA_URI')
+    app.config['SQLITE_READ_ONLY_READS'] = os.environ.get(
+        'SQLITE_READ_ONLY_READS', '').lower() in ('1', 'true', 'yes')
+    # After a write, that user's reads stay on the primary this long
+    app.config['READ_YOUR_WRITES_SECONDS'] = float(
+        os.environ.get('READ_YOUR_WRITES_SECONDS', 5))
+    # Push committed book/author changes to open home and recommendations
+    # pages over Server-Sent Events (see backend.change_feed). A stream
+    # sends a keepalive comment after N quiet seconds and ends after
+    # LIVE_UPDATES_MAX_SECONDS (the browser reconnects), freeing its thread
+    app.config['LIVE_UPDATES'] = os.environ.get(
+        'LIVE_UPDATES', '1').lower() in ('1', 'true', 'yes')
+    app.config['LIVE_UPDATES_KEEPALIVE_SECONDS'] = float(
+        os.environ.get('LIVE_UPDATES_KEEPALIVE_SECONDS', 15))
+    app.config['LIVE_UPDATES_MAX_SECONDS'] = float(
+        os.environ.get('LIVE_UPDATES_MAX_SECONDS', 300))
+    # Most rows one /live/rows request renders
+    app.config['LIVE_ROWS_MAX'] = 200
+    # Log every book/author insert, update and delete in the change_log
+    # table for /api/changes (see backend.change_log). Entries older than
+    # N seconds that a later entry supersedes are compacted away
+    app.config['CHANGE_LOG'] = os.environ.get(
+        'CHANGE_LOG', '1').lower() in ('1', 'true', 'yes')
+    app.config['CHANGE_LOG_PAGE_SIZE'] = 500
+    app.config['CHANGE_LOG_MAX_PAGE_SIZE'] = 5000
+    app.config['CHANGE_LOG_COMPACT_AFTER_SECONDS'] = int(
+        os.environ.get('CHANGE_LOG_COMPACT_AFTER_SECONDS', 7 * 24 * 3600))
+    app.config['CHANGE_LOG_COMPACT_BATCH_SIZE'] = int(
+        os.environ.get('CHANGE_LOG_COMPACT_BATCH_SIZE', 1000))
+    # Keep every library but the main one in a SQLite file of its own in
+    # this directory, at most N of them open at once (see
+    # backend.libraries)
+    app.config['LIBRARY_DATABASE_DIR'] = os.environ.get('LIBRARY_DATABASE_DIR')
+    app.config['LIBRARY_ENGINE_CACHE_SIZE'] = int(
+        os.environ.get('LIBRARY_ENGINE_CACHE_SIZE', 16))
+    # Set Flask-Migrate up on every start (normally only for `flask db`)
+    app.config['MIGRATE_ENABLED'] = os.environ.get(
+        'MIGRATE_ENABLED', '').lower() in ('1', 'true', 'yes')
 
     if config_overrides:
         app.config.update(config_overrides)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS',
+                          engine_options(app.config))
 
+    init_libraries(app)
     # If `db` was provided by data_models, initialize it with the Flask app
     if db is not None:
         db.init_app(app)
-        # Initialize Flask-Migrate for migration support if it's available.
-        if Migrate is not None:
-            try:
-                migrate = Migrate(app, db)
-            except Exception:
-                migrate = None
-        else:
-            migrate = None
-
-    # Helpful runtime warning if Flask-Migrate isn't installed
-    if Migrate is None:
-        # Prefer app.logger where available for visibility when Flask runs
-        try:
-            app.logger.warning(
-                "Flask-Migrate not installed - migrations disabled. "
-                "Install Flask-Migrate or run 'bash bin/setup.sh' "
-                "to enable migrations.")
-        except Exception:
-            # fallback to print for very early runtime
-            print(
-                "Warning: Flask-Migrate not installed - "
-                "migrations disabled. Install Flask-Migrate or run "
-                "'bash bin/setup.sh' to enable migrations.")
+        init_read_routing(app)
+        init_migrate(app)
 
     app.jinja_env.filters['highlight'] = highlight
+    rating_buffer = init_rating_buffer(app)
+    catalogue = init_catalogue(app, rating_buffer)
+    init_assets(app)
+    page_cache = init_page_cache(app)
+    change_feed = init_change_feed(app)
+    init_change_log(app)
+
+    @app.cli.command('purge-deleted')
+    @click.option('--retention', type=int, default=None,
+                  help='Only purge rows deleted more than N seconds ago.')
+    @click.option('--batch-size', type=int, default=None)
+    @click.option('--pause', type=float, default=None,
+                  help='Seconds to sleep between batches.')
+    @for_each_database
+    def purge_deleted_command(retention, batch_size, pause):
+        """Physically remove soft-deleted books and authors."""
+        purged = purge_deleted(retention, batch_size, pause)
+        click.echo(f"Purged {purged['books']} book(s) and "
+                   f"{purged['authors']} author(s).")
+
+    @app.cli.command('compact-change-log')
+    @click.option('--older-than', type=int, default=None,
+                  help='Only remove entries older than N seconds.')
+    @click.option('--batch-size', type=int, default=None)
+    @for_each_database
+    def compact_change_log_command(older_than, batch_size):
+        """Remove change log entries superseded by a later one."""
+        removed = compact_change_log(older_than, batch_size)
+        click.echo(f"Removed {removed} change log entr"
+                   f"{'y' if removed == 1 else 'ies'}.")
+
+    @app.cli.command('rebuild-rating-stats')
+    @for_each_database
+    def rebuild_rating_stats_command():
+        """Backfill rating history and recompute all rating summaries."""
+        with db.engine.begin() as conn:
+            added, summaries = rebuild_rating_stats(conn)
+        click.echo(f"Added {added} rating event(s); "
+                   f"rebuilt {summaries} summary row(s).")
+
+    @app.cli.command('rebuild-similar-books')
+    @for_each_database
+    def rebuild_similar_books_command():
+        """Recompute every book's content vector and similar books."""
+        with db.engine.begin() as conn:
+            indexed = rebuild_similar_books(conn)
+        click.echo(f"Indexed {indexed} book(s).")
+
+    @app.cli.command('rebuild-also-liked')
+    @for_each_database
+    def rebuild_also_liked_command():
+        """Recompute the "readers who liked this also liked" lists."""
+        with db.engine.begin() as conn:
+            books = rebuild_also_liked(conn)
+        click.echo(f"Computed also-liked lists for {books} book(s).")
+
+    @app.cli.command('dedupe-isbns')
+    @click.option('--dry-run', is_flag=True,
+                  help='Only count the duplicates.')
+    @for_each_database
+    def dedupe_isbns_command(dry_run):
+        """Merge books stored more than once under one ISBN."""
+        stats = merge_duplicate_isbns(dry_run=dry_run)
+        verb = 'Would merge' if dry_run else 'Merged'
+        click.echo(f"{verb} {stats['groups']} ISBN(s) stored more than "
+                   f"once; {stats['removed']} duplicate book(s) "
+                   f"{'to remove' if dry_run else 'removed'}.")
+
+    @app.cli.command('dedupe-authors')
+    @click.option('--dry-run', is_flag=True,
+                  help='Only print the merge plan.')
+    @click.option('--threshold', type=float, default=MATCH_THRESHOLD,
+                  show_default=True,
+                  help='Lowest name similarity (0-1) merged.')
+    @for_each_database
+    def dedupe_authors_command(dry_run, threshold):
+        """Merge authors entered under several spellings of one name."""
+        plan = author_merge_plan(threshold)
+        if dry_run:
+            for (survivor_id, name), *others in plan:
+                duplicates = ', '.join(f'{other} (#{other_id})'
+                                       for other_id, other in others)
+                click.echo(f"{name} (#{survivor_id}) <- {duplicates}")
+            click.echo(f"Would merge {len(plan)} group(s); "
+                       f"{sum(len(group) - 1 for group in plan)} "
+                       f"author(s) to remove.")
+            return
+        removed = apply_author_merges(plan)
+        click.echo(f"Merged {len(plan)} group(s); {removed} duplicate "
+                   f"author(s) removed.")
+
+    @app.cli.command('enrich-books')
+    @click.option('--provider', default=None,
+                  help='Provider name (default: ENRICHMENT_PROVIDER).')
+    @click.option('--batch-size', type=int, default=None)
+    @click.option('--concurrency', type=int, default=None,
+                  help='Provider requests in flight at once.')
+    @click.option('--limit', type=int, default=None,
+                  help='Process at most N queued ISBNs.')
+    @click.option('--enqueue/--no-enqueue', default=True,
+                  help='First queue books missing a field (default: yes).')
+    @for_each_database
+    def enrich_books_command(provider, batch_size, concurrency, limit,
+                             enqueue):
+        """Fill in missing cover URLs and publication years by ISBN."""
+        try:
+            source = provider_from_config(app.config, provider)
+        except ValueError as exc:
+            raise click.UsageError(str(exc))
+        if enqueue:
+            queued = enqueue_missing()
+            db.session.commit()
+            click.echo(f"Queued {queued} ISBN(s).")
+        stats = run_enrichment(
+            source,
+            batch_size or app.config['ENRICHMENT_BATCH_SIZE'],
+            concurrency or app.config['ENRICHMENT_CONCURRENCY'],
+            limit)
+        click.echo(f"Fetched {stats['fetched']} and reused {stats['cached']} "
+                   f"cached answer(s): {stats['done']} found, "
+                   f"{stats['not_found']} not found, {stats['failed']} "
+                   f"failed, {stats['retry']} left for a retry; filled in "
+                   f"{stats['filled']} book(s).")
+
+    @app.cli.command('build-assets')
+    @click.option('--clean', is_flag=True,
+                  help='Remove built files the manifest no longer uses.')
+    def build_assets_command(clean):
+        """Write fingerprinted, precompressed copies of the static files."""
+        manifest = build_assets(app.static_folder, clean=clean)
+        for name, target in sorted(manifest.items()):
+            click.echo(f'{name} -> {target}')
+
+    # Tables don't disappear once created, so after the first successful
+    # check the inspector queries are skipped for the rest of the process
+    schema_checked = False
 
     @app.before_request
     def ensure_db_schema():
+        nonlocal schema_checked
+        if schema_checked:
+            return
         ok, missing = check_db_tables()
+        schema_checked = ok
         if not ok:
             # Show error page if tables are missing - do not auto-create to
             # prevent data loss
             return render_template(
                 'error_db_missing.html', missing=missing), 503
 
+    @app.context_processor
+    def inject_reader():
+        # Kept in the session, so the header costs no query
+        return {'reader_name': session.get('reader_name')}
+
     @app.route('/')
     def home():
         # Query all books and pass to the template. The Book model includes a
@@ -128,37 +569,84 @@ def create_app(config_overrides=None):
         scope = request.args.get('scope', request.args.get('scope', 'books'))
         sort_by = request.args.get('sort', 'title')
         order = request.args.get('order', 'asc')
-
-        # Build the base query
-        query = Book.query
+        # Optional pagination: ?page=&per_page= (or HOME_PER_PAGE)
+        per_page = request.args.get(
+            'per_page', app.config['HOME_PER_PAGE'], type=int)
+        page = request.args.get('page', 1, type=int)
+        books_page = None
+        authors_search = []
+
+        if sort_by == 'rating':
+            # Buffered ratings must be in the table before sorting on them
+            rating_buffer.flush()
+
+        # The catalogue snapshot answers book listings and substring
+        # searches; author searches and full-text search use the database
+        if (catalogue is not None and not (q and scope == 'authors')
+                and not (q and search_mode() == 'fulltext')):
+            snapshot = catalogue.current()
+            indexes = snapshot.select(q, sort_by, order)
+            if per_page:
+                books_page = SnapshotPagination(
+                    page=page, per_page=per_page,
+                    max_per_page=app.config['HOME_MAX_PER_PAGE'],
+                    error_out=False, snapshot=snapshot, indexes=indexes)
+                books = books_page.items
+            elif streaming_enabled():
+                books = snapshot.iter_rows(indexes)
+            else:
+                books = snapshot.rows(indexes)
+            book_counts = snapshot.book_counts
+            total_books = len(snapshot)
+            total_authors = len(snapshot.authors)
+            return render_listing(
+                'home.html',
+                books=books,
+                books_page=books_page,
+                found=len(indexes),
+                book_counts=book_counts,
+                sort_by=sort_by,
+                order=order,
+                q=q,
+                no_results=(not indexes and bool(q)),
+                scope=scope,
+                authors_search=authors_search,
+                total_authors=total_authors,
+                total_books=total_books,
+                per_page=per_page)
+
+        # Build the base query: only the columns the listing shows, as
+        # plain tuples (see backend.listings)
+        query = book_listing_select()
 
         # If a search term is provided, filter books or authors depending on
         # scope
         if q:
             if scope == 'authors':
                 # we will handle author results separately
-                author_results = Author.query.filter(
-                    Author.name.ilike(f"%{q}%")).order_by(
-                    Author.name).all()
+                author_results = author_listings(db.session.execute(
+                    author_listing_select().filter(
+                        author_search_filter(q)).order_by(Author.name)))
             else:
-                # join Author so we can search against author.name as well
-                query = query.join(Author).filter(or_(Book.title.ilike(
-                    f"%{q}%"), Book.isbn.ilike(f"%{q}%"), Author.name.ilike(f"%{q}%")))
+                # the listing select joins Author, so we can search against
+                # author.name as well (the match itself depends on the
+                # database, see backend.search)
+                query = query.filter(book_search_filter(q))
 
         # Apply ordering after filtering
         if sort_by == 'author':
-            # join Author and order by author's name
-            query = query.join(Author)
+            # order by author's name (then title)
             if order == 'desc':
-                query = query.order_by(Author.name.desc())
+                query = query.order_by(Author.name.desc(), Book.title.desc())
             else:
-                query = query.order_by(Author.name)
+                query = query.order_by(Author.name, Book.title)
         elif sort_by == 'rating':
-            # Order by rating (nulls last for 'not rated' books)
+            # Order by rating (nulls last for 'not rated' books; spelled out
+            # because SQLite and PostgreSQL put NULLs at opposite ends)
             if order == 'desc':
-                query = query.order_by(Book.rating.desc())
+                query = query.order_by(Book.rating.desc().nullslast())
             else:
-                query = query.order_by(Book.rating)
+                query = query.order_by(Book.rating.nullslast())
         else:
             # default to ordering by title
             if order == 'desc':
@@ -166,25 +654,43 @@ def create_app(config_overrides=None):
             else:
                 query = query.order_by(Book.title)
         # Fetch results
-        books = query.all()
         if q and scope == 'authors':
             # when searching authors only, clear books and have authors_search
             # set
             books = []
+            found = 0
             authors_search = author_results
+        elif per_page:
+            books_page = ProjectionPagination(
+                page=page, per_page=per_page,
+                max_per_page=app.config['HOME_MAX_PER_PAGE'],
+                error_out=False, select=query, rows=iter_book_listings,
+                stream=streaming_enabled())
+            books = books_page.items
+            found = books_page.total
+        elif streaming_enabled():
+            # rows are read while the page streams out; only a search
+            # shows how many were found
+            books = stream_rows(query)
+            found = count_rows(query) if q else None
         else:
-            authors_search = []
-
-        # Also query authors for display (we keep authors listing but not shown
-        # anymore per UI change)
-        authors = Author.query.order_by(Author.name).all()
+            books = fetch_book_listings(query)
+            found = len(books)
+
+        # "(N books)" next to each author: one grouped query instead of
+        # loading every author's books through the relationship
+        book_counts = dict(
+            db.session.query(Book.author_id, func.count(Book.id))
+            .group_by(Book.author_id).all())
         total_books = Book.query.count()
         total_authors = Author.query.count()
-        no_results = (len(books) == 0 and bool(q))
-        return render_template(
+        no_results = (found == 0 and bool(q))
+        return render_listing(
             'home.html',
             books=books,
-            authors=authors,
+            books_page=books_page,
+            found=found,
+            book_counts=book_counts,
             sort_by=sort_by,
             order=order,
             q=q,
@@ -192,7 +698,8 @@ def create_app(config_overrides=None):
             scope=scope,
             authors_search=authors_search,
             total_authors=total_authors,
-            total_books=total_books)
+            total_books=total_books,
+            per_page=per_page)
 
     @app.route('/add_author', methods=['GET', 'POST'])
     def add_author():
@@ -202,8 +709,17 @@ def create_app(config_overrides=None):
             birth_date = request.form.get('birth_date')
             date_of_death = request.form.get('date_of_death')
 
+            # Similar names already in the library need a confirmation
+            similar = [] if request.form.get('confirm_similar') \
+                else similar_authors(name or '')
             if not name:
                 flash('Author name is required.', 'error')
+            elif similar:
+                flash(f'"{name}" looks like an author already in the '
+                      f'library. Tick "Add anyway" if it is someone else.',
+                      'error')
+                return render_template('add_author.html',
+                                       similar=similar), 409
             else:
                 try:
                     from datetime import datetime
@@ -228,50 +744,10 @@ def create_app(config_overrides=None):
     @app.route('/book/<int:book_id>/ai_review', methods=['POST'])
     def ai_review_book(book_id):
         """Fetch AI recommendation for a book and cache it in DB."""
+        import requests
         book = Book.query.get_or_404(book_id)
-        # Prepare prompt for AI
-        prompt = (
-            f"Based on the following book in my library, please "
-            f"provide a detailed recommendation or analysis.\n"
-            f"Book: {book.title} by "
-            f"{book.author.name if book.author else 'Unknown Author'}\n"
-            f"Rating: {book.rating if book.rating else 'Not rated'}\n\n"
-            f"Please provide:\n"
-            f"1. Book title\n"
-            f"2. Author name\n"
-            f"3. Why you recommend it or analysis\n"
-            f"4. Genre/themes it shares with other books\n"
-        )
         try:
-            url = os.environ.get(
-                'RAPIDAPI_URL',
-                'https://open-ai21.p.rapidapi.com/conversationllama')
-            payload = {
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "web_access": False
-            }
-            headers = {
-                "x-rapidapi-key": os.environ.get('RAPIDAPI_KEY'),
-                "x-rapidapi-host": os.environ.get('RAPIDAPI_HOST', 'open-ai21.p.rapidapi.com'),
-                "Content-Type": "application/json"
-            }
-            timeout = int(os.environ.get('AI_REQUEST_TIMEOUT', 60))
-            # Increased timeout to 60 seconds (30 was too short for some
-            # requests)
-            response = requests.post(
-                url, json=payload, headers=headers, timeout=timeout)
-            response.raise_for_status()
-            result = response.json()
-            recommendation = result.get(
-                'result', 'No recommendation generated')
-            if isinstance(recommendation, dict):
-                recommendation = recommendation.get(
-                    'message', str(recommendation))
+            recommendation = fetch_recommendation(book)
             # Save to DB
             book.ai_recommendation = recommendation
             db.session.commit()
@@ -293,6 +769,26 @@ def create_app(config_overrides=None):
             flash(f'Error generating recommendation: {str(e)}', 'error')
         return redirect(url_for('recommend'))
 
+    @app.route('/api/book/<int:book_id>/ai_review', methods=['POST'])
+    def api_ai_review_book(book_id):
+        """JSON variant of `ai_review_book`.
+
+        Under an ASGI server `backend.asgi` answers this URL itself with a
+        non-blocking upstream call; this view serves it under WSGI.
+        """
+        import requests
+        book = Book.query.get_or_404(book_id)
+        try:
+            recommendation = fetch_recommendation(book)
+        except requests.exceptions.Timeout:
+            return jsonify(error='AI service timed out.'), 504
+        except requests.exceptions.RequestException as e:
+            return jsonify(
+                error=f'Error connecting to AI service: {str(e)}'), 502
+        book.ai_recommendation = recommendation
+        db.session.commit()
+        return jsonify(book_id=book.id, ai_recommendation=recommendation)
+
     @app.route('/book/<int:book_id>/edit_review', methods=['POST'])
     def edit_review(book_id):
         """Edit and save the AI recommendation for a book."""
@@ -310,12 +806,11 @@ def create_app(config_overrides=None):
 
     @app.route('/add_book', methods=['GET', 'POST'])
     def add_book():
-        # Provide list of authors for the dropdown and keep any sorting state
+        # Keep any sorting state; the author is picked through /api/authors
         sort_by = request.args.get('sort', request.form.get('sort')) or 'title'
         order = request.args.get('order', request.form.get('order')) or 'asc'
         q = request.args.get('q', request.form.get('q')) or ''
         message = None
-        authors = Author.query.order_by(Author.name).all()
         book_id = request.args.get('book_id') or request.form.get('book_id')
         if request.method == 'POST':
             isbn = request.form.get('isbn')
@@ -333,37 +828,98 @@ def create_app(config_overrides=None):
                 pub_year = None
                 rating = None
                 author_id = None
-
-            if book_id:
+            if author_id is None:
+                # Typed without picking a suggestion (or without JavaScript)
+                author_id = author_id_by_name(
+                    request.form.get('author_name', '').strip())
+
+            def form_error(error, status):
+                # Back to the form with the reason, nothing written
+                flash(error, 'error')
+                book_obj = db.session.get(Book, int(book_id)) \
+                    if str(book_id).isdigit() else None
+                return render_template(
+                    'add_book.html', sort=sort_by, order=order, q=q,
+                    book=book_obj), status
+
+            title = (title or '').strip()
+            if not title:
+                return form_error('Please enter a title.', 400)
+            if author_id is None or db.session.get(Author, author_id) is None:
+                return form_error('Please choose an existing author.', 400)
+            if rating is not None and not 1 <= rating <= 10:
+                return form_error('Rating must be between 1 and 10.', 400)
+
+            # Validate and check for the ISBN (any spelling) before writing,
+            # instead of running into the unique constraint
+            try:
+                isbn = normalize_isbn(isbn)
+            except InvalidIsbn as exc:
+                return form_error(str(exc), 400)
+            duplicate = book_with_isbn(isbn)
+            if duplicate is not None and str(duplicate.id) != str(book_id):
+                return form_error(isbn_taken_message(isbn, duplicate), 409)
+
+            existing = db.session.get(Book, int(book_id)) \
+                if str(book_id).isdigit() else None
+            if existing:
+                rating_buffer.discard(existing.id)
+                old_author_id = existing.author_id
+                existing.isbn = isbn
+                existing.title = title
+                existing.publication_year = pub_year
+                existing.cover_url = cover_url
+                existing.author_id = author_id
                 try:
-                    book_id = int(book_id)
-                    existing = Book.query.get(book_id)
-                    if existing:
-                        existing.isbn = isbn
-                        existing.title = title
-                        existing.publication_year = pub_year
-                        existing.cover_url = cover_url
-                        existing.rating = rating
-                        existing.author_id = author_id
-                        db.session.commit()
-                        return redirect(
-                            url_for(
-                                'home',
-                                sort=sort_by,
-                                order=order,
-                                q=q,
-                                success='book_updated'))
-                except Exception:
-                    pass
+                    if needs_enrichment(existing):
+                        enqueue_isbns([isbn])
+                    db.session.flush()
+                    # The rating goes through set_ratings() so the
+                    # change is logged and the aggregates follow
+                    conn = db.session.connection()
+                    set_ratings(conn, {existing.id: rating})
+                    if old_author_id != author_id:
+                        refresh_author_summaries(
+                            conn, [old_author_id, author_id])
+                    db.session.commit()
+                except IntegrityError as exc:
+                    db.session.rollback()
+                    if not is_isbn_conflict(exc):
+                        raise
+                    # Taken by another book since the check above
+                    return form_error(
+                        isbn_taken_message(isbn, book_with_isbn(isbn)), 409)
+                return redirect(
+                    url_for(
+                        'home',
+                        sort=sort_by,
+                        order=order,
+                        q=q,
+                        success='book_updated'))
             new_book = Book(
                 isbn=isbn,
                 title=title,
                 publication_year=pub_year,
                 author_id=author_id,
-                cover_url=cover_url,
-                rating=rating)
+                cover_url=cover_url)
             db.session.add(new_book)
-            db.session.commit()
+            # The INSERT (at the first flush, possibly the autoflush of the
+            # enrichment queue's query) runs into the unique constraint
+            # when someone added the ISBN since the check above
+            try:
+                if needs_enrichment(new_book):
+                    # Filled in later by `flask enrich-books`
+                    enqueue_isbns([isbn])
+                db.session.flush()
+                if rating is not None:
+                    set_ratings(db.session.connection(), {new_book.id: rating})
+                db.session.commit()
+            except IntegrityError as exc:
+                db.session.rollback()
+                if not is_isbn_conflict(exc):
+                    raise
+                return form_error(
+                    isbn_taken_message(isbn, book_with_isbn(isbn)), 409)
             return redirect(
                 url_for(
                     'home',
@@ -373,15 +929,10 @@ def create_app(config_overrides=None):
                     success='book_added'))
 
         # For GET, allow prefill if editing
-        book_obj = None
-        if book_id:
-            try:
-                book_obj = Book.query.get(int(book_id))
-            except Exception:
-                book_obj = None
+        book_obj = db.session.get(Book, int(book_id)) \
+            if str(book_id).isdigit() else None
         return render_template(
             'add_book.html',
-            authors=authors,
             sort=sort_by,
             order=order,
             q=q,
@@ -389,48 +940,192 @@ def create_app(config_overrides=None):
 
     @app.route('/admin')
     def admin():
-        # Test page that lists authors and books with controls for edit/delete
-        authors = Author.query.order_by(Author.name).all()
-        books = Book.query.order_by(Book.title).all()
-        return render_template('test_ui.html', authors=authors, books=books)
+        # Test page that lists authors and books with controls for edit/delete.
+        # Both listings are paginated independently so the page stays small
+        # on large libraries (`page` for books, `author_page` for authors).
+        per_page = request.args.get(
+            'per_page', app.config['ADMIN_PER_PAGE'], type=int)
+        per_page = max(1, min(per_page, app.config['ADMIN_MAX_PER_PAGE']))
+        # Read-only listings: projected columns, no ORM entities
+        books_page = ProjectionPagination(
+            page=request.args.get('page', 1, type=int),
+            per_page=per_page, error_out=False,
+            select=book_listing_select().order_by(Book.title, Book.id),
+            rows=iter_book_listings, stream=streaming_enabled())
+        authors_page = ProjectionPagination(
+            page=request.args.get('author_page', 1, type=int),
+            per_page=per_page, error_out=False,
+            select=author_listing_select().order_by(Author.name, Author.id),
+            rows=iter_author_listings)
+        # One grouped query for the book counts of the listed authors instead
+        # of loading every author's books through the relationship
+        author_ids = [a.id for a in authors_page.items]
+        book_counts = {}
+        if author_ids:
+            book_counts = dict(
+                db.session.query(Book.author_id, func.count(Book.id))
+                .filter(Book.author_id.in_(author_ids))
+                .group_by(Book.author_id).all())
+        return render_listing(
+            'test_ui.html',
+            authors=authors_page.items,
+            books=books_page.items,
+            authors_page=authors_page,
+            books_page=books_page,
+            book_counts=book_counts,
+            per_page=per_page)
+
+    @app.route('/admin/bulk/delete_books', methods=['POST'])
+    def admin_bulk_delete_books():
+        """Delete every selected book with a single DELETE statement."""
+        ids = form_id_list('book_ids')
+        if not ids:
+            flash('No books selected.', 'error')
+            return redirect(admin_return_url())
+        try:
+            author_ids = [a for (a,) in db.session.query(Book.author_id)
+                          .filter(Book.id.in_(ids)).distinct()]
+            deleted = Book.query.filter(Book.id.in_(ids)).update(
+                {Book.deleted_at: utcnow()}, synchronize_session=False)
+            refresh_author_summaries(db.session.connection(), author_ids)
+            db.session.commit()
+            flash(f'{deleted} book(s) deleted', 'success')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error deleting books: {str(e)}', 'error')
+        return redirect(admin_return_url())
+
+    @app.route('/admin/bulk/rate_books', methods=['POST'])
+    def admin_bulk_rate_books():
+        """Set the same rating (1-10) on every selected book."""
+        ids = form_id_list('book_ids')
+        rating = request.form.get('rating', type=int)
+        if not ids:
+            flash('No books selected.', 'error')
+        elif rating is None or not 1 <= rating <= 10:
+            flash('Rating must be between 1 and 10.', 'error')
+        else:
+            try:
+                # Only books of the current library (set_ratings() is Core)
+                ids = [i for (i,) in db.session.query(Book.id)
+                       .filter(Book.id.in_(ids))]
+                rating_buffer.discard(*ids)
+                # One UPDATE ... CASE for all books, plus their history rows
+                updated = set_ratings(
+                    db.session.connection(), dict.fromkeys(ids, rating))
+                db.session.commit()
+                flash(f'Rating set to {rating}/10 for {updated} book(s)',
+                      'success')
+            except Exception as e:
+                db.session.rollback()
+                flash(f'Error updating ratings: {str(e)}', 'error')
+        return redirect(admin_return_url())
+
+    @app.route('/admin/bulk/reassign_books', methods=['POST'])
+    def admin_bulk_reassign_books():
+        """Move every selected book to another author."""
+        ids = form_id_list('book_ids')
+        author_id = request.form.get('author_id', type=int)
+        if not ids:
+            flash('No books selected.', 'error')
+        elif author_id is None or db.session.get(Author, author_id) is None:
+            flash('Please choose an existing author.', 'error')
+        else:
+            try:
+                # Only books of the current library: rating events have no
+                # library of their own
+                rows = db.session.query(Book.id, Book.author_id).filter(
+                    Book.id.in_(ids)).all()
+                ids = [book_id for book_id, _ in rows]
+                old_author_ids = list({a for _, a in rows})
+                updated = Book.query.filter(Book.id.in_(ids)).update(
+                    {Book.author_id: author_id}, synchronize_session=False)
+                # Rating history and aggregates follow the books
+                RatingEvent.query.filter(RatingEvent.book_id.in_(ids)).update(
+                    {RatingEvent.author_id: author_id},
+                    synchronize_session=False)
+                refresh_author_summaries(
+                    db.session.connection(), old_author_ids + [author_id])
+                if similar_books_enabled():
+                    # set-based UPDATE: the flush hook doesn't see it
+                    refresh_similar_books(db.session.connection(), ids)
+                db.session.commit()
+                flash(f'{updated} book(s) reassigned', 'success')
+            except Exception as e:
+                db.session.rollback()
+                flash(f'Error reassigning books: {str(e)}', 'error')
+        return redirect(admin_return_url())
+
+    @app.route('/admin/bulk/delete_authors', methods=['POST'])
+    def admin_bulk_delete_authors():
+        """Delete the selected authors and all of their books."""
+        ids = form_id_list('author_ids')
+        if not ids:
+            flash('No authors selected.', 'error')
+            return redirect(admin_return_url())
+        try:
+            # Tombstone the authors and their books with the same timestamp,
+            # one UPDATE per table
+            when = utcnow()
+            deleted = Author.query.filter(Author.id.in_(ids)).update(
+                {Author.deleted_at: when}, synchronize_session=False)
+            Book.query.filter(Book.author_id.in_(ids)).update(
+                {Book.deleted_at: when}, synchronize_session=False)
+            db.session.commit()
+            flash(f'{deleted} author(s) deleted', 'success')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error deleting authors: {str(e)}', 'error')
+        return redirect(admin_return_url())
 
     @app.route('/admin/delete_author/<int:author_id>', methods=['POST'])
     def admin_delete_author(author_id):
         a = Author.query.get_or_404(author_id)
-        # For safety in demo, cascade or reassign books will be blocked by FK
-        # constraints; we'll delete books first
-        Book.query.filter_by(author_id=author_id).delete()
-        db.session.delete(a)
+        a.soft_delete()
         db.session.commit()
         flash('Author deleted', 'success')
+        flash(url_for('undo_delete_author', author_id=author_id), 'undo')
         return redirect(url_for('admin'))
 
     @app.route('/admin/delete_book/<int:book_id>', methods=['POST'])
     def admin_delete_book(book_id):
         b = Book.query.get_or_404(book_id)
-        db.session.delete(b)
+        b.soft_delete()
+        db.session.flush()
+        refresh_author_summaries(db.session.connection(), [b.author_id])
         db.session.commit()
         flash('Book deleted', 'success')
+        flash(url_for('undo_delete_book', book_id=book_id), 'undo')
         return redirect(url_for('admin'))
 
     @app.route('/book/<int:book_id>/delete', methods=['POST'])
     def delete_book(book_id):
         """Delete a book from the database. Check if it's the author's last book."""
-        b = Book.query.get_or_404(book_id)
-        author_id = b.author_id
-
-        # Check if this is the author's last book
-        remaining_books = Book.query.filter_by(author_id=author_id).count()
-
-        if remaining_books == 1:
+        # Load the book and check whether it's the author's last book in
+        # the same query
+        other = aliased(Book)
+        has_other_books = exists().where(
+            other.author_id == Book.author_id,
+            other.id != Book.id,
+            other.deleted_at.is_(None))
+        row = db.session.execute(
+            db.select(Book, has_other_books).where(Book.id == book_id)).first()
+        if row is None:
+            abort(404)
+        b, has_other = row
+
+        if not has_other:
             # This is the last book by this author
             # Ask user if they want to delete the author too
             return redirect(url_for('confirm_delete_book', book_id=book_id))
         else:
             # Not the last book, safe to delete
-            db.session.delete(b)
+            b.soft_delete()
+            db.session.flush()
+            refresh_author_summaries(db.session.connection(), [b.author_id])
             db.session.commit()
             flash('Book deleted successfully.', 'success')
+            flash(url_for('undo_delete_book', book_id=book_id), 'undo')
             return redirect(url_for('home'))
 
     @app.route('/book/<int:book_id>/confirm_delete', methods=['GET', 'POST'])
@@ -442,19 +1137,25 @@ def create_app(config_overrides=None):
         if request.method == 'POST':
             delete_author = request.form.get('delete_author') == 'yes'
 
-            # Delete the book
-            db.session.delete(b)
-            db.session.commit()
-
-            # Delete author if requested
+            # Delete the book, and the author too if requested (with the same
+            # timestamp, so undoing the author delete restores the book)
+            deleted_at = b.soft_delete()
             if delete_author and author:
-                db.session.delete(author)
+                author_id = author.id
+                author.soft_delete(deleted_at)
                 db.session.commit()
                 flash('Book and author deleted successfully.', 'success')
+                flash(url_for('undo_delete_author', author_id=author_id),
+                      'undo')
             else:
+                db.session.flush()
+                refresh_author_summaries(
+                    db.session.connection(), [b.author_id])
+                db.session.commit()
                 flash(
                     'Book deleted successfully. Author kept in database.',
                     'success')
+                flash(url_for('undo_delete_book', book_id=book_id), 'undo')
 
             return redirect(url_for('home'))
 
@@ -466,9 +1167,40 @@ def create_app(config_overrides=None):
 
     @app.route('/book/<int:book_id>')
     def book_detail(book_id):
-        """Display detailed information about a specific book."""
+        """Display detailed information about a specific book.
+
+        Answers If-None-Match / If-Modified-Since with 304 before the book
+        is even loaded (see backend.page_cache).
+        """
+        validators = None
+        reader_id = session.get('reader_id')
+        # A buffered rating shows on the page but hasn't touched the row yet
+        if can_revalidate() and rating_buffer.get(book_id) is None:
+            validators = book_validators(book_id, page_cache.template_version(
+                'book_detail.html', 'base.html', '_book_review.html'),
+                reader_id)
+            if validators is None:
+                abort(404)
+            if not_modified(*validators):
+                return not_modified_response(*validators)
         book = Book.query.get_or_404(book_id)
-        return render_template('book_detail.html', book=book)
+        review_block = page_cache.fragments.get_or_render(
+            ('book_review', book.library_id, book.id, book.updated_at),
+            lambda: render_template('_book_review.html', book=book))
+        similar_books = []
+        if app.config['SIMILAR_BOOKS']:
+            similar_books = similar_book_listings(
+                book.id, app.config['SIMILAR_BOOKS_SHOWN'])
+        rating = book.rating if reader_id is None \
+            else reader_rating(reader_id, book.id)
+        response = make_response(render_template(
+            'book_detail.html', book=book, review_block=review_block,
+            rating=rating, similar_books=similar_books,
+            also_liked=also_liked_listings(
+                book.id, app.config['ALSO_LIKED_SHOWN'])))
+        if validators is not None:
+            set_validators(response, *validators)
+        return response
 
     @app.route('/book/<int:book_id>/rate', methods=['POST'])
     def rate_book(book_id):
@@ -479,8 +1211,17 @@ def create_app(config_overrides=None):
         if rating:
             try:
                 rating_val = int(rating)
-                if 1 <= rating_val <= 10:
-                    book.rating = rating_val
+                if 1 <= rating_val <= 10 and 'reader_id' in session:
+                    # A reader rates for themselves; book.rating is untouched
+                    set_reader_rating(db.session.connection(),
+                                      session['reader_id'], book_id,
+                                      rating_val)
+                    db.session.commit()
+                    flash(f'Your rating of "{book.title}" is now '
+                          f'{rating_val}/10.', 'success')
+                elif 1 <= rating_val <= 10:
+                    rating_buffer.discard(book_id)
+                    set_ratings(db.session.connection(), {book_id: rating_val})
                     db.session.commit()
                     flash(
                         f'Rating updated to {rating_val}/10 for "{book.title}".',
@@ -492,6 +1233,122 @@ def create_app(config_overrides=None):
 
         return redirect(url_for('book_detail', book_id=book_id))
 
+    @app.route('/api/book/<int:book_id>/rating', methods=['POST'])
+    def api_rate_book(book_id):
+        """Buffer a rating update sent as JSON: {"rating": 1-10}.
+
+        The rating is written in the next batched flush; until then every
+        page served by this process already shows the new value.
+        """
+        data = request.get_json(silent=True) or {}
+        rating = data.get('rating')
+        if isinstance(rating, bool) or not isinstance(rating, int) \
+                or not 1 <= rating <= 10:
+            return jsonify(
+                error='Rating must be an integer between 1 and 10.'), 400
+        # Existence check on the primary key only; no entity is loaded
+        if db.session.query(Book.id).filter_by(id=book_id).scalar() is None:
+            return jsonify(error='Book not found.'), 404
+        rating_buffer.add(book_id, rating)
+        if change_feed is not None:
+            # listings show buffered ratings already
+            change_feed.publish(books=[book_id], library=g.library_id)
+        return jsonify(book_id=book_id, rating=rating), 202
+
+    @app.route('/reader', methods=['GET', 'POST'])
+    def choose_reader():
+        """Pick who is rating: the book pages then record and show that
+        reader's own ratings. Readers are created on first use; an empty
+        name goes back to rating for the library."""
+        if request.method == 'POST':
+            name = (request.form.get('name') or '').strip()
+            if not name:
+                session.pop('reader_id', None)
+                session.pop('reader_name', None)
+                flash('Ratings now go to the library.', 'success')
+                return redirect(url_for('home'))
+            if len(name) > 100:
+                flash('Reader name must be at most 100 characters.', 'error')
+                return render_template('reader.html'), 400
+            reader = Reader.query.filter_by(name=name).first()
+            if reader is None:
+                reader = Reader(name=name)
+                db.session.add(reader)
+                db.session.commit()
+            session['reader_id'] = reader.id
+            session['reader_name'] = reader.name
+            flash(f'Reading as {reader.name}.', 'success')
+            return redirect(url_for('home'))
+        return render_template('reader.html')
+
+    @app.route('/library', methods=['GET', 'POST'])
+    def choose_library():
+        """Pick the library to work on: every page then shows and adds
+        that library's books and authors. Libraries are created on first
+        use; an empty name goes back to the main library."""
+        if request.method == 'POST':
+            name = (request.form.get('name') or '').strip()
+            if not name or name == DEFAULT_LIBRARY_NAME:
+                session.pop(LIBRARY_ID_KEY, None)
+                session.pop(LIBRARY_NAME_KEY, None)
+                flash(f'Back to the {DEFAULT_LIBRARY_NAME}.', 'success')
+                return redirect(url_for('home'))
+            if len(name) > 100:
+                flash('Library name must be at most 100 characters.',
+                      'error')
+                return render_template(
+                    'library.html',
+                    default_library_name=DEFAULT_LIBRARY_NAME), 400
+            library_id, name = find_or_create_library(name)
+            session[LIBRARY_ID_KEY] = library_id
+            session[LIBRARY_NAME_KEY] = name
+            flash(f'Working on {name}.', 'success')
+            return redirect(url_for('home'))
+        return render_template('library.html',
+                               default_library_name=DEFAULT_LIBRARY_NAME)
+
+    @app.route('/api/authors')
+    def api_authors():
+        """Authors whose name starts with ?q= (any case), for the author
+        picker: {"authors": [{"id": ..., "name": ...}], "more": bool}.
+
+        A range scan of the name prefix index returning at most ?limit=
+        rows, whatever the size of the author table.
+        """
+        q = request.args.get('q', '').strip()
+        limit = request.args.get(
+            'limit', app.config['AUTHOR_LOOKUP_LIMIT'], type=int)
+        limit = max(1, min(limit, app.config['AUTHOR_LOOKUP_MAX_LIMIT']))
+        query = db.session.query(Author.id, Author.name)
+        if q:
+            query = query.filter(author_prefix_filter(q))
+        # One extra row tells whether there are more matches
+        rows = query.order_by(author_name_key(), Author.id) \
+            .limit(limit + 1).all()
+        return jsonify(
+            authors=[{'id': row.id, 'name': row.name} for row in rows[:limit]],
+            more=len(rows) > limit)
+
+    @app.route('/api/changes')
+    def api_changes():
+        """Book and author changes after the cursor ?since= (0 for all),
+        oldest first, at most ?limit= of them: {"changes": [{"id", "entity",
+        "entity_id", "op", "changed_at", "data"}], "cursor": ..., "more":
+        bool}. Pass "cursor" as ?since= to read on.
+
+        `data` is the row as it is now, null once it is deleted (see
+        backend.change_log).
+        """
+        if not app.config['CHANGE_LOG']:
+            abort(404)
+        since = max(0, request.args.get('since', 0, type=int))
+        limit = request.args.get(
+            'limit', app.config['CHANGE_LOG_PAGE_SIZE'], type=int)
+        limit = max(1, min(limit, app.config['CHANGE_LOG_MAX_PAGE_SIZE']))
+        changes, more = changes_since(since, limit)
+        cursor = changes[-1]['id'] if changes else since
+        return jsonify(changes=changes, cursor=cursor, more=more)
+
     @app.route('/author/<int:author_id>')
     def author_detail(author_id):
         """Display detailed information about a specific author and all their books."""
@@ -500,10 +1357,14 @@ def create_app(config_overrides=None):
         books = Book.query.filter_by(
             author_id=author_id).order_by(
             Book.title).all()
+        # Rating stats come from the incrementally maintained summary row and
+        # an index range scan of the rating history, not from the books
         return render_template(
             'author_detail.html',
             author=author,
-            books=books)
+            books=books,
+            rating_summary=author_summary(author_id),
+            recent_ratings=recent_ratings(author_id))
 
     @app.route('/author/<int:author_id>/delete', methods=['POST'])
     def delete_author(author_id):
@@ -511,51 +1372,176 @@ def create_app(config_overrides=None):
         author = Author.query.get_or_404(author_id)
         author_name = author.name
 
-        # Delete all books by this author (cascade handles this automatically)
-        Book.query.filter_by(author_id=author_id).delete()
-
-        # Delete the author
-        db.session.delete(author)
+        # Soft-delete the author and all of their books with one UPDATE per
+        # table; the purge job removes the rows later (and the database
+        # cascade takes care of the books then)
+        author.soft_delete()
         db.session.commit()
 
         flash(
             f'Author "{author_name}" and all their books have been deleted successfully.',
             'success')
+        flash(url_for('undo_delete_author', author_id=author_id), 'undo')
         return redirect(url_for('home'))
 
+    @app.route('/book/<int:book_id>/undo_delete', methods=['POST'])
+    def undo_delete_book(book_id):
+        """Restore a soft-deleted book (until the purge job removes it)."""
+        if not Book.restore(book_id):
+            abort(404)
+        author_id = db.session.query(Book.author_id).filter_by(
+            id=book_id).scalar()
+        refresh_author_summaries(db.session.connection(), [author_id])
+        db.session.commit()
+        flash('Book restored.', 'success')
+        return redirect(url_for('book_detail', book_id=book_id))
+
+    @app.route('/author/<int:author_id>/undo_delete', methods=['POST'])
+    def undo_delete_author(author_id):
+        """Restore a soft-deleted author together with the books that were
+        deleted with them."""
+        if not Author.restore(author_id):
+            abort(404)
+        db.session.commit()
+        flash('Author restored.', 'success')
+        return redirect(url_for('author_detail', author_id=author_id))
+
     @app.route('/recommend')
     def recommend():
         """Show cached AI recommendations for books in the user's library."""
-        books = Book.query.order_by(Book.title).all()
-
-        if not books:
+        # Buffered ratings must be in the table before averaging them
+        rating_buffer.flush()
+        book_count, rated_count, average_rating, reviewed_count = \
+            db.session.execute(db.select(
+                func.count(Book.id), func.count(Book.rating),
+                func.avg(Book.rating),
+                func.count(Book.id).filter(REVIEWED))).one()
+
+        if not book_count:
             flash(
                 'Add some books to your library first to get recommendations!',
                 'info')
             return redirect(url_for('home'))
 
-        # Count books with cached reviews
-        books_with_reviews = [book for book in books if book.ai_recommendation]
-
-        if not books_with_reviews:
+        if not reviewed_count:
             flash(
                 'No AI recommendations cached yet. '
                 'Trigger a new review for any book to fetch data.',
                 'info')
 
-        return render_template(
+        # The reviews, then the whole library (without the review texts)
+        reviewed = book_listing_select(with_review=True).where(
+            REVIEWED).order_by(Book.title)
+        library = book_listing_select().order_by(Book.title)
+        if streaming_enabled():
+            reviewed_books, books = stream_rows(reviewed), stream_rows(library)
+        else:
+            reviewed_books = fetch_book_listings(reviewed)
+            books = fetch_book_listings(library)
+        # Computed locally from the precomputed similar books (no AI call)
+        suggested_books = []
+        if app.config['SIMILAR_BOOKS']:
+            suggested_books = suggested_book_listings(
+                app.config['SIMILAR_BOOKS_SHOWN'])
+
+        return render_listing(
             'recommend.html',
-            book_count=len(books),
+            book_count=book_count,
             books=books,
-            books_with_reviews_count=len(books_with_reviews))
+            reviewed_books=reviewed_books,
+            suggested_books=suggested_books,
+            rated_count=rated_count,
+            average_rating=average_rating,
+            books_with_reviews_count=reviewed_count)
+
+    @app.route('/live/changes')
+    def live_changes():
+        """Server-Sent Events stream of committed book and author changes
+        (see backend.change_feed)."""
+        if change_feed is None:
+            abort(404)
+        response = app.response_class(
+            change_feed.stream(
+                request.headers.get('Last-Event-ID'),
+                keepalive=app.config['LIVE_UPDATES_KEEPALIVE_SECONDS'],
+                max_seconds=app.config['LIVE_UPDATES_MAX_SECONDS'],
+                library_id=g.library_id),
+            mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        # Don't let a reverse proxy hold the events back
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    @app.route('/live/rows')
+    def live_rows():
+        """Current HTML of the listing rows of some books, for the live
+        updates: ?views=home,library,review&ids=1,2,3[&q=]. Returns
+        {"rows": {view: {book_id: html, or null if the book is no longer
+        listed there}}}."""
+        views = [view for view in request.args.get('views', '').split(',')
+                 if view in LIVE_ROW_TEMPLATES]
+        try:
+            ids = sorted({int(i) for i in request.args.get('ids', '').split(',')
+                          if i.strip()})
+        except ValueError:
+            return jsonify(error='ids must be comma-separated integers.'), 400
+        if len(ids) > app.config['LIVE_ROWS_MAX']:
+            return jsonify(error='Too many ids.'), 400
+        books = {}
+        book_counts = {}
+        if ids and views:
+            books = {book.id: book for book in fetch_book_listings(
+                book_listing_select(with_review=True)
+                .where(Book.id.in_(ids)))}
+            author_ids = {book.author.id for book in books.values()
+                          if book.author}
+            if author_ids:
+                book_counts = dict(db.session.execute(
+                    db.select(Book.author_id, func.count(Book.id))
+                    .where(Book.author_id.in_(author_ids))
+                    .group_by(Book.author_id)).all())
+        q = request.args.get('q', '').strip()
+        rows = {}
+        for view in views:
+            rows[view] = {}
+            for book_id in ids:
+                book = books.get(book_id)
+                if book is None or (view == 'review'
+                                    and not book.ai_recommendation):
+                    rows[view][book_id] = None
+                else:
+                    rows[view][book_id] = render_template(
+                        LIVE_ROW_TEMPLATES[view], book=book,
+                        book_counts=book_counts, q=q)
+        return jsonify(rows=rows)
 
     return app
 
 
-# Create the global app instance for running the app
-app = create_app()
+_default_app = None
+
+
+def __getattr__(name):
+    """Create the global `app` instance on first access only.
+
+    `from backend.app import app` keeps working, but importing
+    `create_app` (or anything else) from this module no longer builds an
+    application as a side effect.
+    """
+    global _default_app
+    if name == 'app':
+        if _default_app is None:
+            _default_app = create_app()
+        return _default_app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == '__main__':
+    from werkzeug.serving import is_running_from_reloader
+    from backend.server import start_background_jobs
+    app = create_app()
+    if is_running_from_reloader():
+        # the reloader's child serves; its parent only watches the files
+        start_background_jobs(app)
     # Bind to 0.0.0.0 for Codio deployment (makes app accessible externally)
     app.run(host='0.0.0.0', port=5002, debug=True)
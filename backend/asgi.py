@@ -0,0 +1,170 @@
+"""ASGI entry point with a non-blocking AI review endpoint.
+
+Under WSGI every AI review holds a worker thread for the whole upstream
+round trip (often tens of seconds). Served from here, the JSON endpoint
+
+    POST /api/book/<id>/ai_review
+
+awaits the AI service on one shared, pooled `httpx.AsyncClient`, so hundreds
+of reviews can be in flight on a single event loop. Only the short database
+reads and writes run in worker threads. Every other URL, including the
+original form-based `/book/<id>/ai_review`, is handed to the Flask app
+unchanged (through asgiref's WSGI adapter).
+
+    uvicorn backend.asgi:app --port 5002
+
+Needs `httpx` and `asgiref` (and an ASGI server such as uvicorn); the WSGI
+entry points don't use this module.
+"""
+
+import asyncio
+import json
+import re
+
+import httpx
+from asgiref.wsgi import WsgiToAsgi
+
+from backend.ai_review import (book_prompt, build_payload,
+                               parse_recommendation, request_settings)
+from backend.data_models import db, Book
+from backend.libraries import library_from_cookie, use_library
+from backend.server import prepare_worker
+from backend.similar_books import (refresh_similar_books,
+                                   similar_books_enabled)
+
+AI_REVIEW_PATH = re.compile(r'/api/book/(\d+)/ai_review')
+
+
+class AsyncReviewApp:
+    """ASGI app: the async AI review endpoint in front of a Flask app."""
+
+    def __init__(self, flask_app, client=None):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.client = client
+        self.max_connections = flask_app.config['AI_MAX_CONNECTIONS']
+        # Reviews beyond the connection limit wait here rather than in the
+        # client's pool, whose queue handling gets slow with long queues
+        self.upstream_slots = asyncio.Semaphore(self.max_connections)
+
+    def make_client(self):
+        return httpx.AsyncClient(limits=httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] == 'http' and scope['method'] == 'POST':
+            match = AI_REVIEW_PATH.fullmatch(scope['path'])
+            if match:
+                # the library chosen in the Flask session cookie
+                cookie = dict(scope['headers']).get(b'cookie', b'')
+                library_id = library_from_cookie(self.flask_app,
+                                                 cookie.decode('latin-1'))
+                await self.ai_review(int(match.group(1)), send, library_id)
+                return
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # same per-process setup as the WSGI server's workers
+                await asyncio.to_thread(prepare_worker, self.flask_app)
+                if self.client is None:
+                    self.client = self.make_client()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.client is not None:
+                    await self.client.aclose()
+                    self.client = None
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def ai_review(self, book_id, send, library_id=None):
+        if self.client is None:
+            # servers without lifespan support
+            self.client = self.make_client()
+        prompt = await asyncio.to_thread(self.load_prompt, book_id,
+                                         library_id)
+        if prompt is None:
+            await send_json(send, 404, {'error': 'Book not found.'})
+            return
+        url, headers, timeout = request_settings()
+        try:
+            async with self.upstream_slots:
+                response = await self.client.post(
+                    url, json=build_payload(prompt), headers=headers,
+                    timeout=timeout)
+            response.raise_for_status()
+            recommendation = parse_recommendation(response.json())
+        except httpx.TimeoutException:
+            await send_json(send, 504, {'error': 'AI service timed out.'})
+            return
+        except (httpx.HTTPError, ValueError) as e:
+            # ValueError: an answer that isn't JSON (httpx.DecodingError,
+            # for a body that can't be decoded, is an HTTPError)
+            await send_json(send, 502, {
+                'error': f'Error connecting to AI service: {str(e)}'})
+            return
+        saved = await asyncio.to_thread(
+            self.save_recommendation, book_id, recommendation, library_id)
+        if not saved:
+            await send_json(send, 404, {'error': 'Book not found.'})
+            return
+        await send_json(send, 200, {'book_id': book_id,
+                                    'ai_recommendation': recommendation})
+
+    def load_prompt(self, book_id, library_id=None):
+        with self.flask_app.app_context(), use_library(library_id):
+            try:
+                book = db.session.get(Book, book_id)
+                if book is None:
+                    return None
+                return book_prompt(book)
+            finally:
+                db.session.remove()
+
+    def save_recommendation(self, book_id, recommendation, library_id=None):
+        # The book may have been deleted during the upstream call
+        with self.flask_app.app_context(), use_library(library_id):
+            try:
+                updated = Book.query.filter_by(id=book_id).update(
+                    {'ai_recommendation': recommendation},
+                    synchronize_session=False)
+                if updated and similar_books_enabled():
+                    # set-based UPDATE: the flush hook doesn't see it
+                    refresh_similar_books(db.session.connection(), [book_id])
+                db.session.commit()
+                return updated == 1
+            finally:
+                db.session.remove()
+
+
+async def send_json(send, status, data):
+    body = json.dumps(data).encode()
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def create_asgi_app(config_overrides=None, client=None):
+    from backend.app import create_app
+    return AsyncReviewApp(create_app(config_overrides), client=client)
+
+
+_default_app = None
+
+
+def __getattr__(name):
+    """Build the ASGI `app` (`uvicorn backend.asgi:app`) on first access
+    only, like `backend.app.app`."""
+    global _default_app
+    if name == 'app':
+        if _default_app is None:
+            _default_app = create_asgi_app()
+        return _default_app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
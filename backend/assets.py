@@ -0,0 +1,255 @@
+"""Fingerprinted static assets and response compression.
+
+Static files: `flask build-assets` copies every file of `frontend/static`
+to `static/dist/<name>.<hash>.<ext>`, next to a gzip variant (and a brotli
+one when the optional `brotli` package is installed), and records the
+names in `static/dist/manifest.json`. Unless `ASSET_AUTO_BUILD` is off the
+same build runs on first use, so a fresh checkout works without the extra
+step. Templates link to `asset_url('styles.css')`, whose URL changes
+whenever the content does, so those files are served with a one-year
+`immutable` Cache-Control and the best precompressed variant the browser
+accepts. Repeat page loads don't ask for them again.
+
+Dynamic responses: HTML and JSON bodies of at least `COMPRESS_MIN_SIZE`
+bytes are gzip-compressed when the client accepts it. Streamed pages are
+compressed piece by piece, so they still start right away.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import tempfile
+import threading
+import zlib
+
+from flask import current_app, request, send_from_directory, url_for
+
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+ONE_YEAR = 31536000
+# Images and fonts are compressed already
+PRECOMPRESS_SUFFIXES = ('.css', '.js', '.svg', '.json', '.txt', '.html')
+# Precompressed variants, most preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+COMPRESSIBLE_TYPES = frozenset(('text/html', 'application/json'))
+
+
+def load_brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def fingerprinted_name(name, digest):
+    root, ext = os.path.splitext(name)
+    return f'{root}.{digest}{ext}'
+
+
+def source_files(static_folder):
+    """Static files to fingerprint, as '/'-separated relative paths."""
+    for root, dirs, files in os.walk(static_folder):
+        rel_root = os.path.relpath(root, static_folder)
+        if rel_root == '.':
+            dirs[:] = [d for d in dirs if d != DIST_DIR]
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for name in sorted(files):
+            if name.startswith('.'):
+                continue
+            path = name if rel_root == '.' else os.path.join(rel_root, name)
+            yield path.replace(os.sep, '/')
+
+
+def write_file(path, data):
+    """Write `data` to `path` atomically (workers may build at once)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def build_assets(static_folder, clean=False):
+    """Write the fingerprinted and precompressed copies of the static files
+    and the manifest; return the manifest ({name: fingerprinted name}).
+    Files already built are left alone. `clean` removes built files the
+    manifest no longer mentions (keep them during rolling deploys: pages
+    rendered by old workers still link to them)."""
+    dist = os.path.join(static_folder, DIST_DIR)
+    brotli = load_brotli()
+    manifest = {}
+    for name in source_files(static_folder):
+        with open(os.path.join(static_folder, name), 'rb') as f:
+            data = f.read()
+        target = fingerprinted_name(name, content_hash(data))
+        manifest[name] = target
+        path = os.path.join(dist, target)
+        if not os.path.exists(path):
+            write_file(path, data)
+        if not name.endswith(PRECOMPRESS_SUFFIXES):
+            continue
+        if not os.path.exists(path + '.gz'):
+            write_file(path + '.gz', gzip.compress(data, 9, mtime=0))
+        if brotli is not None and not os.path.exists(path + '.br'):
+            write_file(path + '.br', brotli.compress(data, quality=11))
+    encoded = json.dumps(manifest, indent=2, sort_keys=True).encode()
+    manifest_path = os.path.join(dist, MANIFEST)
+    if read_bytes(manifest_path) != encoded:
+        write_file(manifest_path, encoded)
+    if clean:
+        keep = {MANIFEST}
+        for target in manifest.values():
+            keep.update(target + suffix for suffix in ('', '.gz', '.br'))
+        for name in source_files(dist):
+            if name not in keep:
+                os.remove(os.path.join(dist, name))
+    return manifest
+
+
+def read_bytes(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def read_manifest(static_folder):
+    data = read_bytes(os.path.join(static_folder, DIST_DIR, MANIFEST))
+    return json.loads(data) if data else {}
+
+
+class Assets:
+    """Manifest lookup and serving of the fingerprinted files of an app."""
+
+    def __init__(self, app):
+        self.app = app
+        self._manifest = None
+        self._lock = threading.Lock()
+
+    @property
+    def manifest(self):
+        if self._manifest is None:
+            with self._lock:
+                if self._manifest is None:
+                    self._manifest = self._load()
+        return self._manifest
+
+    def _load(self):
+        static_folder = self.app.static_folder
+        if not self.app.config['ASSET_AUTO_BUILD']:
+            return read_manifest(static_folder)
+        try:
+            return build_assets(static_folder)
+        except OSError as exc:
+            # e.g. a read-only deployment: plain URLs still work
+            self.app.logger.warning('Could not build static assets: %s', exc)
+            return read_manifest(static_folder)
+
+    def url(self, name):
+        """URL of static file `name`, fingerprinted when it was built."""
+        target = self.manifest.get(name)
+        if target is None:
+            return url_for('static', filename=name)
+        return url_for('static', filename=f'{DIST_DIR}/{target}')
+
+    def send(self, filename):
+        """Response for a fingerprinted file: immutable, and precompressed
+        when the client accepts an encoding we have a variant for."""
+        static_folder = self.app.static_folder
+        mimetype = mimetypes.guess_type(filename)[0]
+        for encoding, suffix in ENCODINGS:
+            if (request.accept_encodings[encoding] and os.path.isfile(
+                    os.path.join(static_folder, filename + suffix))):
+                response = send_from_directory(
+                    static_folder, filename + suffix, mimetype=mimetype,
+                    max_age=ONE_YEAR)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(static_folder, filename,
+                                           max_age=ONE_YEAR)
+        response.headers['Cache-Control'] = IMMUTABLE
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+def gzip_stream(chunks, level):
+    """Gzip a streamed body, flushing after every piece so the browser can
+    render it as it arrives."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compressor.compress(chunk) + compressor.flush(
+                zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def compress_response(response):
+    """`after_request` hook: gzip HTML and JSON responses."""
+    config = current_app.config
+    if (not config['COMPRESS_RESPONSES']
+            or response.mimetype not in COMPRESSIBLE_TYPES
+            or response.status_code < 200
+            or response.status_code in (204, 206, 304)
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings['gzip']:
+        return response
+    level = config['COMPRESS_LEVEL']
+    if response.is_streamed:
+        response.response = gzip_stream(response.response, level)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(gzip.compress(data, level, mtime=0))
+    response.headers['Content-Encoding'] = 'gzip'
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # the bytes differ from the uncompressed representation
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_assets(app):
+    """Set up `asset_url()` for templates, serving of fingerprinted files
+    and response compression."""
+    assets = Assets(app)
+    app.extensions['assets'] = assets
+    app.jinja_env.globals['asset_url'] = assets.url
+
+    @app.before_request
+    def serve_fingerprinted_asset():
+        if request.endpoint != 'static':
+            return None
+        filename = request.view_args.get('filename', '')
+        if filename.startswith(DIST_DIR + '/'):
+            return assets.send(filename)
+        return None
+
+    app.after_request(compress_response)
+    return assets
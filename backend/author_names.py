@@ -0,0 +1,137 @@
+"""Author name matching: blocking keys and similarity scores.
+
+`parse_name()` reads a name as typed into (surname, given names), with
+accents, punctuation and case folded away: "Austen, Jane", "JANE AUSTEN"
+and "Jane Austen" all read as ('austen', ('jane',)). Suffixes (Jr.,
+III) are dropped, particles are kept with the surname ("Ursula K. Le
+Guin" has the surname 'leguin') and run-together capitals are initials
+("JK Rowling" is "J. K. Rowling").
+
+`block_key()`, the surname plus the first initial ("austen j"), is the
+value of the indexed `author.name_block` column. Only authors sharing a
+block are ever compared, so finding duplicates in a large table costs one
+sort plus a few comparisons per block instead of comparing every pair. A
+name spelled with a different surname ("Dostoevsky" / "Dostoyevsky") or
+without any given name lands in another block and is not matched.
+
+`name_similarity()` scores two parsed names between 0 and 1: a given
+name against its initial scores 0.9, other tokens are compared with
+difflib and a name scores as its weakest token. Tokens one name has and
+the other lacks cost a little, and two clearly different given names
+("Jane" / "John") score 0.
+"""
+
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+# Pairs scoring at least this are treated as the same author
+MATCH_THRESHOLD = 0.85
+# Below this, two full given names are different people
+TOKEN_THRESHOLD = 0.8
+INITIAL_SCORE = 0.9
+MISSING_TOKEN_SCORE = 0.95
+MISSING_GIVEN_SCORE = 0.8
+SUFFIXES = frozenset(('jr', 'sr', 'ii', 'iii', 'iv'))
+PARTICLES = frozenset(('da', 'de', 'del', 'della', 'der', 'di', 'du', 'la',
+                       'le', 'st', 'ten', 'van', 'von'))
+WORDS = re.compile(r"[^\W\d_]+(?:['’][^\W\d_]+)*")
+BLOCK_LENGTH = 64
+
+
+def fold(text):
+    """`text` without accents, case folded."""
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed
+                   if not unicodedata.combining(c)).casefold()
+
+
+def words(text):
+    found = WORDS.findall(text)
+    tokens = []
+    for i, word in enumerate(found):
+        # "JK Rowling" has two initials, "LEE CHILD" and "Ann LEE" none
+        if 1 < len(word) <= 3 and word.isupper() and not text.isupper() \
+                and i < len(found) - 1:
+            tokens.extend(word)
+        else:
+            tokens.append(word)
+    return [fold(token).replace("'", '').replace('’', '')
+            for token in tokens]
+
+
+def parse_name(name):
+    """(surname, given names) of a name as typed."""
+    surname_part, comma, given_part = (name or '').partition(',')
+    if comma and [t for t in words(given_part) if t not in SUFFIXES]:
+        # "Austen, Jane"
+        name = f'{given_part} {surname_part}'
+    tokens = [token for token in words(name) if token not in SUFFIXES]
+    if not tokens:
+        return ('', ())
+    surname = tokens.pop()
+    while tokens and tokens[-1] in PARTICLES:
+        surname = tokens.pop() + surname
+    return (surname, tuple(tokens))
+
+
+def block_key(name):
+    """Blocking key of a name: surname and first initial."""
+    surname, given = parse_name(name)
+    if not surname:
+        return None
+    key = f'{surname} {given[0][0]}' if given else surname
+    return key[:BLOCK_LENGTH]
+
+
+def is_initial(token):
+    return len(token) == 1
+
+
+def ratio(a, b):
+    # Cheap upper bounds first: SequenceMatcher.ratio() is slow
+    if 2 * min(len(a), len(b)) / (len(a) + len(b)) < TOKEN_THRESHOLD:
+        return 0.0
+    matcher = SequenceMatcher(None, a, b)
+    if matcher.quick_ratio() < TOKEN_THRESHOLD:
+        return 0.0
+    return matcher.ratio()
+
+
+# Given names repeat a lot across blocks
+@lru_cache(maxsize=65536)
+def token_similarity(a, b):
+    if a == b:
+        return 1.0
+    if is_initial(a) or is_initial(b):
+        return INITIAL_SCORE if a[0] == b[0] else 0.0
+    score = ratio(a, b)
+    return score if score >= TOKEN_THRESHOLD else 0.0
+
+
+def name_similarity(a, b):
+    """Similarity of two parsed names (see `parse_name`), 0 to 1."""
+    (surname_a, given_a), (surname_b, given_b) = a, b
+    score = 1.0 if surname_a == surname_b else ratio(surname_a, surname_b)
+    if not given_a or not given_b:
+        return score * (MISSING_GIVEN_SCORE
+                        if given_a or given_b else 1.0)
+    # The name scores as its weakest token: "J. R. R." against "John
+    # Ronald Reuel" is as good a match as "J." against "John"
+    score = min(score, token_similarity(given_a[0], given_b[0]))
+    # Middle names: each one of the shorter list against its best match
+    rest_a, rest_b = sorted((list(given_a[1:]), list(given_b[1:])), key=len)
+    for token in rest_a:
+        best = max(rest_b, key=lambda other: token_similarity(token, other))
+        score = min(score, token_similarity(token, best))
+        rest_b.remove(best)
+    return score * MISSING_TOKEN_SCORE ** len(rest_b)
+
+
+def fullness(parsed):
+    """How much of a name is spelled out (more is a better survivor)."""
+    _, given = parsed
+    return (sum(not is_initial(token) for token in given), len(given))
@@ -0,0 +1,428 @@
+"""In-process catalogue snapshot for the home page listing.
+
+With `CATALOGUE_SNAPSHOT` on, every process keeps a compact, read-only copy
+of the live books: one array per column (ids, author ids, ratings,
+publication years, has-review flags) plus lists of titles, ISBNs and cover
+URLs, and one `AuthorRow` (backend.listings) per author holding its
+interned name. `home()` sorts, filters and paginates that copy in plain
+Python and only wraps the rows of the page being shown in `BookRow` views
+(`__slots__` objects that read from the columns), so no ORM objects are
+built for the listing.
+
+Keeping it current (`CatalogueState` in backend.data_models): while the
+snapshot is enabled, every transaction that writes `book` or `author`
+increments the shared version counter once and stamps the rows it touches
+with it. Before serving, a process compares the counter with its
+snapshot's version (one primary-key read) and applies only the rows
+changed since, or rebuilds from scratch after a DELETE. The counter lives
+in the database, so pre-forked workers and CLI commands see each other's
+writes; every process writing the database must run with the same
+setting.
+
+Snapshots are never modified in place: a refresh builds a new one (copying
+the arrays is cheap) and swaps it in, so requests can keep reading the one
+they started with. Each library (backend.libraries) has a snapshot of its
+own.
+"""
+
+import threading
+import time
+from array import array
+from collections import Counter
+
+from flask import current_app, has_app_context
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import and_, event, select
+
+from backend.data_models import (db, Author, Book, CatalogueState,
+                                 CHANGE_VERSION_KEY, DEFAULT_LIBRARY_ID,
+                                 current_library_id)
+from backend.libraries import on_every_engine
+from backend.listings import AuthorRow
+
+TRACKED_TABLES = frozenset((Book.__tablename__, Author.__tablename__))
+EPOCH_BUMPED_KEY = 'catalogue_epoch_bumped'
+# 0 stands for "no value" in the rating and year arrays (ratings are 1-10,
+# and there was no year 0)
+NO_VALUE = 0
+
+book = Book.__table__
+author = Author.__table__
+state = CatalogueState.__table__
+
+BOOK_COLUMNS = (book.c.id, book.c.title, book.c.isbn, book.c.cover_url,
+                book.c.rating, book.c.publication_year, book.c.author_id,
+                and_(book.c.ai_recommendation.isnot(None),
+                     book.c.ai_recommendation != '').label('has_review'))
+
+
+class BookRow:
+    """Read-only view of one book of a snapshot, with the attributes the
+    listing template uses."""
+    __slots__ = ('_snapshot', '_index')
+
+    def __init__(self, snapshot, index):
+        self._snapshot = snapshot
+        self._index = index
+
+    @property
+    def id(self):
+        return self._snapshot.ids[self._index]
+
+    @property
+    def title(self):
+        return self._snapshot.titles[self._index]
+
+    @property
+    def isbn(self):
+        return self._snapshot.isbns[self._index]
+
+    @property
+    def cover_url(self):
+        return self._snapshot.covers[self._index]
+
+    @property
+    def rating(self):
+        snapshot = self._snapshot
+        if snapshot.rating_overlay is not None:
+            # ratings still waiting in the write buffer
+            pending = snapshot.rating_overlay(self.id)
+            if pending is not None:
+                return pending
+        return snapshot.ratings[self._index] or None
+
+    @property
+    def publication_year(self):
+        return self._snapshot.years[self._index] or None
+
+    @property
+    def has_review(self):
+        return bool(self._snapshot.reviewed[self._index])
+
+    @property
+    def author_id(self):
+        return self._snapshot.author_ids[self._index]
+
+    @property
+    def author(self):
+        return self._snapshot.authors.get(self.author_id)
+
+    def __repr__(self):
+        return f"<BookRow id={self.id} title={self.title!r}>"
+
+
+class CatalogueSnapshot:
+    """The live catalogue at one `CatalogueState` version, column by
+    column. Treat as immutable."""
+
+    def __init__(self, version, epoch):
+        self.version = version
+        self.epoch = epoch
+        self.ids = array('q')
+        self.author_ids = array('q')
+        self.ratings = array('b')
+        self.years = array('i')
+        self.reviewed = array('b')
+        self.titles = []
+        self.isbns = []
+        self.covers = []
+        self.authors = {}
+        self.rating_overlay = None
+        self._orders = {}
+        self._index_by_id = None
+        self._book_counts = None
+        self._search_keys = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, row):
+        """Add one book from a row of `BOOK_COLUMNS`."""
+        (book_id, title, isbn, cover_url, rating, year, author_id,
+         has_review) = row
+        self.ids.append(book_id)
+        self.titles.append(title)
+        self.isbns.append(isbn)
+        self.covers.append(cover_url)
+        self.ratings.append(rating or NO_VALUE)
+        self.years.append(year or NO_VALUE)
+        self.author_ids.append(author_id)
+        self.reviewed.append(1 if has_review else 0)
+
+    def set(self, index, row):
+        """Replace the book at `index` with a row of `BOOK_COLUMNS`."""
+        (book_id, title, isbn, cover_url, rating, year, author_id,
+         has_review) = row
+        self.titles[index] = title
+        self.isbns[index] = isbn
+        self.covers[index] = cover_url
+        self.ratings[index] = rating or NO_VALUE
+        self.years[index] = year or NO_VALUE
+        self.author_ids[index] = author_id
+        self.reviewed[index] = 1 if has_review else 0
+
+    def copy(self, version):
+        """A new snapshot at `version` with the same contents."""
+        other = CatalogueSnapshot(version, self.epoch)
+        for name in ('ids', 'author_ids', 'ratings', 'years', 'reviewed',
+                     'titles', 'isbns', 'covers'):
+            setattr(other, name, getattr(self, name)[:])
+        other.authors = dict(self.authors)
+        return other
+
+    def keep(self, indexes):
+        """Drop every book whose index is not in `indexes` (sorted)."""
+        for name in ('ids', 'author_ids', 'ratings', 'years', 'reviewed'):
+            column = getattr(self, name)
+            setattr(self, name,
+                    array(column.typecode, (column[i] for i in indexes)))
+        for name in ('titles', 'isbns', 'covers'):
+            column = getattr(self, name)
+            setattr(self, name, [column[i] for i in indexes])
+
+    @property
+    def index_by_id(self):
+        if self._index_by_id is None:
+            self._index_by_id = {book_id: i for i, book_id
+                                 in enumerate(self.ids)}
+        return self._index_by_id
+
+    @property
+    def book_counts(self):
+        """Number of live books per author id."""
+        if self._book_counts is None:
+            self._book_counts = Counter(self.author_ids)
+        return self._book_counts
+
+    def author_name(self, index):
+        row = self.authors.get(self.author_ids[index])
+        return row.name if row is not None else ''
+
+    def order(self, sort_by='title', order='asc'):
+        """Book indexes sorted like the home page (unrated books last in
+        both directions when sorting by rating). Cached per snapshot."""
+        key = (sort_by, order)
+        if key not in self._orders:
+            self._orders[key] = self._sort(sort_by, order)
+        return self._orders[key]
+
+    def _sort(self, sort_by, order):
+        desc = order == 'desc'
+        if sort_by == 'rating':
+            ratings = self.ratings
+            rated = sorted((i for i in range(len(self)) if ratings[i]),
+                           key=ratings.__getitem__, reverse=desc)
+            return array('l', rated + [i for i in range(len(self))
+                                       if not ratings[i]])
+        if sort_by == 'author':
+            titles = self.titles
+            indexes = sorted(range(len(self)), key=lambda i: (
+                self.author_name(i), titles[i]), reverse=desc)
+        else:
+            indexes = sorted(range(len(self)),
+                             key=self.titles.__getitem__, reverse=desc)
+        return array('l', indexes)
+
+    def search_keys(self):
+        """Case-folded 'title, isbn, author' per book, built on first use."""
+        if self._search_keys is None:
+            self._search_keys = [
+                f'{title}\0{isbn}\0{self.author_name(i)}'.casefold()
+                for i, (title, isbn) in enumerate(zip(self.titles,
+                                                      self.isbns))]
+        return self._search_keys
+
+    def select(self, q=None, sort_by='title', order='asc'):
+        """Indexes of the books matching `q` (substring of title, ISBN or
+        author name, ignoring case), in listing order."""
+        indexes = self.order(sort_by, order)
+        if not q:
+            return indexes
+        needle = q.casefold()
+        keys = self.search_keys()
+        return array('l', (i for i in indexes if needle in keys[i]))
+
+    def rows(self, indexes):
+        return [BookRow(self, i) for i in indexes]
+
+    def iter_rows(self, indexes):
+        for i in indexes:
+            yield BookRow(self, i)
+
+
+class SnapshotPagination(Pagination):
+    """Flask-SQLAlchemy pagination over book indexes of a snapshot."""
+
+    def _query_items(self):
+        indexes = self._query_args['indexes']
+        start = self._query_offset
+        return self._query_args['snapshot'].rows(
+            indexes[start:start + self.per_page])
+
+    def _query_count(self):
+        return len(self._query_args['indexes'])
+
+
+def read_state(conn):
+    """(version, epoch) of the shared change counter."""
+    row = conn.execute(select(state.c.version, state.c.epoch).where(
+        state.c.id == 1)).first()
+    return tuple(row) if row is not None else (0, 0)
+
+
+def load_authors(conn, where=None):
+    query = select(author.c.id, author.c.name, author.c.deleted_at)
+    if where is not None:
+        query = query.where(where)
+    return conn.execute(query)
+
+
+def build_snapshot(conn, version, epoch, library_id=DEFAULT_LIBRARY_ID):
+    """Read the whole live catalogue of a library."""
+    snapshot = CatalogueSnapshot(version, epoch)
+    for author_id, name, deleted_at in load_authors(
+            conn, and_(author.c.library_id == library_id,
+                       author.c.deleted_at.is_(None))):
+        snapshot.authors[author_id] = AuthorRow(author_id, name)
+    for row in conn.execute(select(*BOOK_COLUMNS).where(
+            book.c.library_id == library_id,
+            book.c.deleted_at.is_(None)).order_by(book.c.id)):
+        snapshot.append(row)
+    return snapshot
+
+
+def apply_changes(conn, snapshot, version, library_id=DEFAULT_LIBRARY_ID):
+    """New snapshot at `version`: `snapshot` plus the library's rows
+    written after it. Rows written after `version` too are applied again
+    next time, which is harmless."""
+    since = snapshot.version
+    changed = snapshot.copy(version)
+    for author_id, name, deleted_at in load_authors(
+            conn, and_(author.c.library_id == library_id,
+                       author.c.change_seq > since)):
+        if deleted_at is None:
+            changed.authors[author_id] = AuthorRow(author_id, name)
+        else:
+            changed.authors.pop(author_id, None)
+    index_by_id = snapshot.index_by_id
+    removed = set()
+    for row in conn.execute(
+            select(*BOOK_COLUMNS, book.c.deleted_at).where(
+                book.c.library_id == library_id,
+                book.c.change_seq > since)):
+        row, deleted_at = row[:-1], row[-1]
+        index = index_by_id.get(row[0])
+        if deleted_at is not None:
+            if index is not None:
+                removed.add(index)
+        elif index is not None:
+            changed.set(index, row)
+        else:
+            changed.append(row)
+    if removed:
+        changed.keep([i for i in range(len(changed)) if i not in removed])
+    return changed
+
+
+class Catalogue:
+    """Holds the current snapshot of each library of one app and
+    refreshes them on demand."""
+
+    def __init__(self, app, refresh_interval=0.0, rating_overlay=None):
+        self.app = app
+        self.refresh_interval = refresh_interval
+        self.rating_overlay = rating_overlay
+        self.stats = {'full': 0, 'incremental': 0}
+        # {library id: (snapshot, time checked)}
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def current(self):
+        """The current library's snapshot, refreshed first if the database
+        changed (checked at most every `refresh_interval` seconds). Needs
+        an app context."""
+        library_id = current_library_id() or DEFAULT_LIBRARY_ID
+        snapshot, checked_at = self._snapshots.get(library_id, (None, 0.0))
+        if (snapshot is not None and self.refresh_interval
+                and time.monotonic() - checked_at < self.refresh_interval):
+            return snapshot
+        with self._lock:
+            return self._refresh(library_id)
+
+    def _refresh(self, library_id):
+        snapshot, _ = self._snapshots.get(library_id, (None, 0.0))
+        with db.engine.connect() as conn:
+            version, epoch = read_state(conn)
+            if snapshot is None or epoch != snapshot.epoch:
+                snapshot = build_snapshot(conn, version, epoch, library_id)
+                self.stats['full'] += 1
+            elif version != snapshot.version:
+                snapshot = apply_changes(conn, snapshot, version, library_id)
+                self.stats['incremental'] += 1
+        snapshot.rating_overlay = self.rating_overlay
+        self._snapshots[library_id] = (snapshot, time.monotonic())
+        return snapshot
+
+
+def bump_version(conn, clauseelement, multiparams, params, execution_options):
+    """Engine `before_execute` hook: the first write to `book` or `author`
+    in a transaction increments the shared version (and DELETEs the epoch)
+    and stores the new version for the `change_seq` column defaults.
+    DELETEs run with the `tombstones_only` execution option (the purge)
+    change nothing a snapshot holds and are ignored."""
+    if not getattr(clauseelement, 'is_dml', False):
+        return
+    table = getattr(clauseelement, 'table', None)
+    if getattr(table, 'name', None) not in TRACKED_TABLES:
+        return
+    options = dict(clauseelement.get_execution_options(), **execution_options)
+    if clauseelement.is_delete and options.get('tombstones_only'):
+        # purged tombstones: no snapshot holds them, nothing to refresh
+        return
+    if clauseelement.is_delete and not conn.info.get(EPOCH_BUMPED_KEY):
+        bump(conn, state.c.epoch)
+        conn.info[EPOCH_BUMPED_KEY] = True
+    if CHANGE_VERSION_KEY not in conn.info:
+        bump(conn, state.c.version)
+        conn.info[CHANGE_VERSION_KEY] = read_state(conn)[0]
+
+
+def bump(conn, column):
+    """Increment one counter of the state row (creating the row if the
+    table is still empty)."""
+    updated = conn.execute(state.update().where(state.c.id == 1).values(
+        {column: column + 1})).rowcount
+    if not updated:
+        conn.execute(state.insert().values(
+            {'id': 1, 'version': 0, 'epoch': 0, column.name: 1}))
+
+
+def end_transaction(conn):
+    conn.info.pop(CHANGE_VERSION_KEY, None)
+    conn.info.pop(EPOCH_BUMPED_KEY, None)
+
+
+def track_changes(engine):
+    event.listen(engine, 'before_execute', bump_version)
+    event.listen(engine, 'commit', end_transaction)
+    event.listen(engine, 'rollback', end_transaction)
+
+
+def init_catalogue(app, rating_buffer=None):
+    """Set up the app's catalogue snapshot when `CATALOGUE_SNAPSHOT` is on.
+    Returns the `Catalogue`, or None."""
+    if not app.config.get('CATALOGUE_SNAPSHOT'):
+        return None
+    on_every_engine(app, track_changes)
+    catalogue = Catalogue(
+        app, refresh_interval=app.config['CATALOGUE_REFRESH_SECONDS'],
+        rating_overlay=(rating_buffer.get if rating_buffer is not None
+                        else None))
+    app.extensions['catalogue'] = catalogue
+    return catalogue
+
+
+def current_catalogue():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('catalogue')
@@ -0,0 +1,252 @@
+"""Live library updates: an in-process change feed served as Server-Sent
+Events.
+
+With `LIVE_UPDATES` on, every committed transaction that changed books or
+authors is published on the app's `ChangeFeed` as one event: the ids of
+the books and authors it touched, and which books it added. The home and
+recommendations pages subscribe to `/live/changes` (an `EventSource`),
+fetch the rows shown for those ids from `/live/rows` and swap them in
+place, so other readers' ratings, reviews and deletions show up without
+reloading the page.
+
+The changes are noted by the hooks of the change log (backend.change_log:
+ORM flushes, bulk ORM writes and `record_changes()` calls), together with
+the authors of changed books, whose book counts the pages show. They are
+kept in the connection's `info` until the session's `after_commit`
+publishes them, so a page that fetches a row on an event always reads the
+committed data; a rollback drops them. Ratings accepted
+into the write buffer are published when accepted, since listings already
+show buffered values.
+
+Events carry an increasing id (prefixed with a token of the feed) and the
+last `HISTORY` events are kept, so a browser reconnecting with
+`Last-Event-ID` gets what it missed; one that fell further behind (or
+whose queue overflowed) is told to reload. An id from another feed (a
+restarted or different process) starts a fresh stream.
+
+Each event belongs to one library (backend.libraries), and a page only
+hears about its own library's changes.
+
+The feed is per process: with several worker processes, a page only hears
+about the writes made by the process serving its stream. Each open stream
+holds a worker thread; streams end after `LIVE_UPDATES_MAX_SECONDS` and
+the browser reconnects.
+"""
+
+import json
+import queue
+import secrets
+import threading
+import time
+from collections import deque
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from backend.data_models import DEFAULT_LIBRARY_ID, current_library_id
+from backend.libraries import on_every_engine
+
+HISTORY = 1000
+QUEUE_SIZE = 256
+PENDING_KEY = 'change_feed_pending'
+SESSION_INFO_KEY = 'change_feed_connection_info'
+
+
+class Subscription:
+    """One listener's queue of events."""
+
+    def __init__(self, size=QUEUE_SIZE, library_id=None):
+        self.queue = queue.Queue(maxsize=size)
+        self.library_id = library_id
+        self.overflowed = False
+
+    def wants(self, change):
+        return self.library_id is None or change['library'] == self.library_id
+
+    def get(self, timeout):
+        """The next event, or None after `timeout` seconds."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class ChangeFeed:
+    """In-process publish/subscribe of change events (thread-safe).
+
+    An event is a dict: {'id', 'books', 'authors', 'added', 'library'},
+    sorted id lists and the id of the library they belong to (None if not
+    given).
+    """
+
+    def __init__(self, history=HISTORY, queue_size=QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.token = secrets.token_hex(4)
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def publish(self, books=(), authors=(), added=(), library=None):
+        """Send one event to every subscriber of its library. Returns it,
+        or None if there was nothing to publish."""
+        if not (books or authors):
+            return None
+        with self._lock:
+            self._last_id += 1
+            change = {'id': self._last_id, 'books': sorted(books),
+                      'authors': sorted(authors), 'added': sorted(added),
+                      'library': library}
+            self._history.append(change)
+            for subscription in self._subscribers:
+                if not subscription.wants(change):
+                    continue
+                try:
+                    subscription.queue.put_nowait(change)
+                except queue.Full:
+                    subscription.overflowed = True
+        return change
+
+    def event_id(self, change_id):
+        return f'{self.token}-{change_id}'
+
+    def parse_event_id(self, value):
+        """The change id of an event id sent by this feed, or None."""
+        token, _, change_id = (value or '').partition('-')
+        if token != self.token or not change_id.isdigit():
+            return None
+        return int(change_id)
+
+    def subscribe(self, last_event_id=None, library_id=None):
+        """A new `Subscription` to the events of `library_id` (None: of
+        every library), primed with those after the one with id
+        `last_event_id` (or a reload if those are no longer kept)."""
+        subscription = Subscription(self.queue_size, library_id)
+        last_event_id = self.parse_event_id(last_event_id)
+        with self._lock:
+            if last_event_id is not None and last_event_id < self._last_id:
+                kept = [change for change in self._history
+                        if change['id'] > last_event_id]
+                missed = [change for change in kept
+                          if subscription.wants(change)]
+                if (len(kept) < self._last_id - last_event_id
+                        or len(missed) >= self.queue_size):
+                    subscription.overflowed = True
+                else:
+                    for change in missed:
+                        subscription.queue.put_nowait(change)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def stream(self, last_event_id=None, keepalive=15.0, max_seconds=None,
+               library_id=None):
+        """Server-Sent Events text for a new subscription (see `subscribe`):
+        one message per event, a comment every `keepalive` seconds of
+        silence, ending after `max_seconds` (or on a reload). Subscribes
+        when iteration starts and unsubscribes when the stream is closed."""
+        subscription = self.subscribe(last_event_id, library_id)
+        deadline = (time.monotonic() + max_seconds) if max_seconds else None
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                if subscription.overflowed:
+                    yield sse_message('reload', {},
+                                      self.event_id(self.last_id))
+                    return
+                timeout = keepalive
+                if deadline is not None:
+                    timeout = min(timeout, deadline - time.monotonic())
+                    if timeout <= 0:
+                        return
+                change = subscription.get(timeout)
+                if change is not None:
+                    yield sse_message('change', {
+                        key: change[key]
+                        for key in ('books', 'authors', 'added')},
+                        self.event_id(change['id']))
+                elif deadline is None or time.monotonic() < deadline:
+                    yield ': keepalive\n\n'
+        finally:
+            self.unsubscribe(subscription)
+
+
+def sse_message(name, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {name}')
+    lines.append(f'data: {json.dumps(data, separators=(",", ":"))}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def current_feed():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('change_feed')
+
+
+def note_changes(conn, books=(), authors=(), added=(), library_id=None):
+    """Record books and authors of `library_id` (default: the current
+    library) written on `conn` in this transaction. Published, one event
+    per library, when a session commits the transaction."""
+    if current_feed() is None or not (books or authors):
+        return
+    library_id = library_id or current_library_id() or DEFAULT_LIBRARY_ID
+    pending = conn.info.setdefault(PENDING_KEY, {}).setdefault(
+        library_id, {'books': set(), 'authors': set(), 'added': set()})
+    pending['books'].update(books)
+    pending['authors'].update(authors)
+    pending['added'].update(added)
+
+
+def forget_changes(conn):
+    """Engine `begin` hook: drop anything left by a transaction that no
+    session committed (e.g. `engine.begin()` blocks)."""
+    conn.info.pop(PENDING_KEY, None)
+
+
+@event.listens_for(Session, 'after_begin')
+def remember_connection(session, transaction, connection):
+    if current_feed() is not None:
+        session.info[SESSION_INFO_KEY] = connection.info
+
+
+@event.listens_for(Session, 'after_commit')
+def publish_changes(session):
+    info = session.info.pop(SESSION_INFO_KEY, None)
+    feed = current_feed()
+    if info is None or feed is None:
+        return
+    for library_id, pending in sorted(info.pop(PENDING_KEY, {}).items()):
+        feed.publish(library=library_id, **pending)
+
+
+@event.listens_for(Session, 'after_rollback')
+def drop_changes(session):
+    info = session.info.pop(SESSION_INFO_KEY, None)
+    if info is not None:
+        info.pop(PENDING_KEY, None)
+
+
+def init_change_feed(app):
+    """Set up the app's change feed when `LIVE_UPDATES` is on. Returns the
+    `ChangeFeed`, or None."""
+    if not app.config.get('LIVE_UPDATES'):
+        return None
+    on_every_engine(app, lambda engine: event.listen(engine, 'begin',
+                                                     forget_changes))
+    feed = ChangeFeed()
+    app.extensions['change_feed'] = feed
+    return feed
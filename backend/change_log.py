@@ -0,0 +1,332 @@
+"""Persistent change log of books and authors (a transactional outbox).
+
+Tools that mirror the catalogue read `/api/changes?since=<cursor>`
+instead of diffing full dumps. Every insert, update and delete of a `Book`
+or `Author` appends a `change_log` row (`ChangeLogEntry` in
+backend.data_models) in the transaction that makes it, so an entry
+commits or rolls back together with its change:
+
+ - ORM flushes: objects added, changed or deleted (`track_flush`). The
+   books of a deleted author, which the database removes by cascade, are
+   logged before the flush (`track_cascades`),
+ - bulk ORM UPDATE / DELETE statements (`Query.update()` / `.delete()`,
+   `update(Book)`): the rows they match are selected first with the same
+   WHERE clause (`track_bulk_writes`),
+ - Core writes call `record_changes()` themselves
+   (`rating_stats.set_ratings`, the author merge).
+
+To a consumer a soft delete is a delete and its undo an insert, so that is
+how they are logged. Purging tombstones (already logged as deleted) and
+back-filling the derived key columns are not logged.
+
+Entries are compact (entity, id, operation, time, library);
+`changes_since()` adds each row's current state and, within a request,
+only returns the current library's entries. A consumer keeps the cursor of the last page it
+read and asks for the entries after it, so a sync costs O(changes), not
+O(library). `compact_change_log()` removes old entries superseded by a
+later entry for the same row: a consumer at any cursor still ends up with
+the latest state of every row.
+
+On PostgreSQL two transactions could commit their entries out of id
+order, and a consumer reading in between would skip the late one for
+good. Writers take a transaction-level advisory lock before their first
+entry, which serializes book and author writes (SQLite serializes writers
+anyway).
+
+The same hooks feed the live updates (backend.change_feed).
+"""
+
+import zlib
+from collections import defaultdict
+from datetime import timedelta
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, exists, func, inspect, select
+from sqlalchemy.orm import Session
+
+from backend.change_feed import current_feed, note_changes
+from backend.data_models import (db, Author, Book, ChangeLogEntry,
+                                 DEFAULT_LIBRARY_ID, current_library_id,
+                                 utcnow)
+from backend.libraries import on_every_engine
+
+BOOK, AUTHOR = 'book', 'author'
+INSERT, UPDATE, DELETE = 'insert', 'update', 'delete'
+ENTITIES = {Book: BOOK, Author: AUTHOR}
+# Columns of the current state returned with each entry
+FIELDS = {
+    BOOK: ('isbn', 'title', 'author_id', 'publication_year', 'rating',
+           'cover_url'),
+    AUTHOR: ('name', 'birth_date', 'date_of_death'),
+}
+MODELS = {BOOK: Book, AUTHOR: Author}
+LOCKED_KEY = 'change_log_locked'
+ADVISORY_LOCK_KEY = zlib.crc32(b'bookalchemy.change_log')
+
+change_log = ChangeLogEntry.__table__
+
+
+def change_log_enabled():
+    return has_app_context() and current_app.config.get('CHANGE_LOG', False)
+
+
+def tracking():
+    """Whether anything listens for changes (the log or the live feed)."""
+    return change_log_enabled() or current_feed() is not None
+
+
+def serialize_writers(conn):
+    """Hold the change log lock until the transaction ends (PostgreSQL),
+    so entries are committed in id order."""
+    if conn.dialect.name != 'postgresql' or conn.info.get(LOCKED_KEY):
+        return
+    conn.execute(select(func.pg_advisory_xact_lock(ADVISORY_LOCK_KEY)))
+    conn.info[LOCKED_KEY] = True
+
+
+def end_transaction(conn):
+    conn.info.pop(LOCKED_KEY, None)
+
+
+def libraries_of(conn, entity, ids):
+    """{library id: ids} of the `entity` rows `ids`, each by its row's
+    own library (not the current one: a Core write isn't scoped to it)."""
+    table = MODELS[entity].__table__
+    found = dict(conn.execute(select(table.c.id, table.c.library_id)
+                              .where(table.c.id.in_(ids))).all())
+    by_library = defaultdict(list)
+    for entity_id in ids:
+        by_library[found.get(entity_id, DEFAULT_LIBRARY_ID)].append(entity_id)
+    return by_library
+
+
+def record_changes(conn, entity, op, ids, when=None, libraries=None):
+    """Log `op` ('insert', 'update' or 'delete') of the `entity` ('book'
+    or 'author') rows `ids` in the transaction of `conn`, and pass them on
+    to the live updates. `libraries` ({id: library id}) saves looking up
+    which library each row belongs to."""
+    ids = sorted(set(ids))
+    if not ids:
+        return
+    if libraries is not None:
+        by_library = defaultdict(list)
+        for entity_id in ids:
+            by_library[libraries[entity_id]].append(entity_id)
+    else:
+        by_library = libraries_of(conn, entity, ids)
+    if change_log_enabled():
+        serialize_writers(conn)
+        when = when or utcnow()
+        conn.execute(change_log.insert(), [
+            {'entity': entity, 'entity_id': entity_id, 'op': op,
+             'changed_at': when, 'library_id': library_id}
+            for library_id, library_ids in sorted(by_library.items())
+            for entity_id in library_ids])
+    for library_id, library_ids in by_library.items():
+        if entity == BOOK:
+            note_changes(conn, books=library_ids,
+                         added=library_ids if op == INSERT else (),
+                         library_id=library_id)
+        else:
+            note_changes(conn, authors=library_ids, library_id=library_id)
+
+
+def flush_op(session, obj):
+    """What a flush does to `obj`, one of `session.dirty`, or None."""
+    history = inspect(obj).attrs.deleted_at.history
+    if history.added:
+        return DELETE if history.added[0] is not None else INSERT
+    if session.is_modified(obj, include_collections=False):
+        return UPDATE
+    return None
+
+
+def bulk_op(statement):
+    """What a bulk ORM UPDATE or DELETE does to the rows it matches."""
+    if statement.is_delete:
+        return DELETE
+    # SET deleted_at = ...: a soft delete, or its undo
+    params = statement.compile().params
+    if 'deleted_at' in params:
+        return DELETE if params['deleted_at'] is not None else INSERT
+    return UPDATE
+
+
+@event.listens_for(Session, 'before_flush')
+def track_cascades(session, flush_context, instances):
+    """Log the live books of the authors this flush deletes: the database
+    deletes them by cascade, unseen by the ORM."""
+    author_ids = [obj.id for obj in session.deleted
+                  if isinstance(obj, Author) and obj.id is not None]
+    if not author_ids or not tracking():
+        return
+    rows = session.execute(select(Book.id, Book.library_id).where(
+        Book.author_id.in_(author_ids))).all()
+    record_changes(session.connection(), BOOK, DELETE,
+                   [row.id for row in rows], libraries=dict(rows))
+
+
+@event.listens_for(Session, 'after_flush')
+def track_flush(session, flush_context):
+    """Log the books and authors this flush added, changed or deleted."""
+    if not tracking():
+        return
+    changes = defaultdict(list)
+    libraries = {}
+    authors_of_books = defaultdict(set)
+    for op, objects in ((INSERT, session.new), (None, session.dirty),
+                        (DELETE, session.deleted)):
+        for obj in objects:
+            entity = ENTITIES.get(type(obj))
+            if entity is None:
+                continue
+            obj_op = op or flush_op(session, obj)
+            if obj_op is None:
+                continue
+            changes[entity, obj_op].append(obj.id)
+            libraries[entity, obj.id] = obj.library_id
+            if entity == BOOK and obj.author_id is not None:
+                authors_of_books[obj.library_id].add(obj.author_id)
+    if not changes:
+        return
+    conn = session.connection()
+    for (entity, op), ids in changes.items():
+        record_changes(conn, entity, op, ids, libraries={
+            entity_id: libraries[entity, entity_id] for entity_id in ids})
+    # the live pages show each author's book count
+    for library_id, author_ids in authors_of_books.items():
+        note_changes(conn, authors=author_ids, library_id=library_id)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def track_bulk_writes(orm_execute_state):
+    """Log the rows a bulk ORM UPDATE or DELETE of books or authors is
+    about to change (one SELECT with the same WHERE clause and soft delete
+    filtering)."""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    entity = ENTITIES.get(mapper.class_) if mapper is not None else None
+    options = orm_execute_state.execution_options
+    if entity is None or options.get('tombstones_only') or not tracking():
+        return
+    model = mapper.class_
+    statement = orm_execute_state.statement
+    columns = [model.id, model.library_id]
+    if model is Book:
+        columns.append(Book.author_id)
+    query = select(*columns).execution_options(
+        include_deleted=options.get('include_deleted', False))
+    if statement.whereclause is not None:
+        query = query.where(statement.whereclause)
+    session = orm_execute_state.session
+    rows = session.execute(query).all()
+    conn = session.connection()
+    record_changes(conn, entity, bulk_op(statement), [row.id for row in rows],
+                   libraries={row.id: row.library_id for row in rows})
+    if model is Book:
+        authors = defaultdict(set)
+        for row in rows:
+            if row.author_id is not None:
+                authors[row.library_id].add(row.author_id)
+        for library_id, author_ids in authors.items():
+            note_changes(conn, authors=author_ids, library_id=library_id)
+
+
+def as_json(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def current_rows(entity, ids):
+    """{id: current state} of the live `entity` rows among `ids` (of the
+    current library, if one is chosen)."""
+    if not ids:
+        return {}
+    table = MODELS[entity].__table__
+    fields = FIELDS[entity]
+    query = (select(table.c.id, *[table.c[field] for field in fields])
+             .where(table.c.id.in_(ids), table.c.deleted_at.is_(None)))
+    library_id = current_library_id()
+    if library_id is not None:
+        query = query.where(table.c.library_id == library_id)
+    rows = db.session.execute(query)
+    return {row.id: {'id': row.id, **{field: as_json(getattr(row, field))
+                                      for field in fields}}
+            for row in rows}
+
+
+def changes_since(cursor, limit):
+    """Up to `limit` entries after the entry id `cursor`, oldest first,
+    each with its row as it is now (`data`, None once deleted); only the
+    current library's, if one is chosen. Returns (changes, more)."""
+    query = select(change_log).where(change_log.c.id > cursor)
+    library_id = current_library_id()
+    if library_id is not None:
+        query = query.where(change_log.c.library_id == library_id)
+    entries = db.session.execute(
+        query.order_by(change_log.c.id).limit(limit + 1)).all()
+    more = len(entries) > limit
+    entries = entries[:limit]
+    ids = defaultdict(set)
+    for entry in entries:
+        ids[entry.entity].add(entry.entity_id)
+    current = {entity: current_rows(entity, ids[entity])
+               for entity in MODELS}
+    changes = [{'id': entry.id, 'entity': entry.entity,
+                'entity_id': entry.entity_id, 'op': entry.op,
+                'changed_at': entry.changed_at.isoformat(),
+                'data': current.get(entry.entity, {}).get(entry.entity_id)}
+               for entry in entries]
+    return changes, more
+
+
+def compact_change_log(older_than=None, batch_size=None):
+    """Remove entries older than `older_than` seconds that a later entry
+    for the same row supersedes, reading `batch_size` entries per
+    transaction. Must be called inside an app context; the arguments
+    default to `CHANGE_LOG_COMPACT_AFTER_SECONDS` and
+    `CHANGE_LOG_COMPACT_BATCH_SIZE`. Returns the number removed."""
+    config = current_app.config
+    if older_than is None:
+        older_than = config['CHANGE_LOG_COMPACT_AFTER_SECONDS']
+    if batch_size is None:
+        batch_size = config['CHANGE_LOG_COMPACT_BATCH_SIZE']
+    cutoff = utcnow() - timedelta(seconds=older_than)
+    newer = change_log.alias('newer')
+    superseded = exists().where(
+        newer.c.entity == change_log.c.entity,
+        newer.c.entity_id == change_log.c.entity_id,
+        newer.c.id > change_log.c.id)
+    removed = 0
+    after = 0
+    while True:
+        # One id range at a time, oldest first: entries are appended in
+        # time order, so the first range reaching the cutoff is the last
+        rows = db.session.execute(
+            select(change_log.c.id, change_log.c.changed_at,
+                   superseded.label('superseded'))
+            .where(change_log.c.id > after)
+            .order_by(change_log.c.id).limit(batch_size)).all()
+        doomed = [row.id for row in rows
+                  if row.changed_at < cutoff and row.superseded]
+        if doomed:
+            db.session.execute(change_log.delete().where(
+                change_log.c.id.in_(doomed)))
+            removed += len(doomed)
+        db.session.commit()
+        if len(rows) < batch_size or rows[-1].changed_at >= cutoff:
+            return removed
+        after = rows[-1].id
+
+
+def init_change_log(app):
+    """Set the change log up when `CHANGE_LOG` is on (the writer lock flag
+    is reset at the end of every transaction)."""
+    if not app.config.get('CHANGE_LOG'):
+        return
+
+    def setup(engine):
+        event.listen(engine, 'commit', end_transaction)
+        event.listen(engine, 'rollback', end_transaction)
+
+    on_every_engine(app, setup)
@@ -5,23 +5,346 @@ This file defines the `db` object used by the Flask application.
 Models like `Author` and `Book` will be implemented in later steps.
 """
 
+import sqlite3
+from datetime import datetime, timezone
+
+from flask import current_app, g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, validates, with_loader_criteria
+
+from backend.author_names import block_key
+from backend.isbn import isbn_key
+from backend.read_routing import RoutingSession
+
+# The library everything belongs to until others are created
+DEFAULT_LIBRARY_ID = 1
+DEFAULT_LIBRARY_NAME = 'Main Library'
+# app.extensions key of the open engines of the libraries kept in files of
+# their own (backend.libraries)
+LIBRARY_ENGINES_KEY = 'library_engines'
+
+
+def current_library_id():
+    """Id of the library the current request works on (set by
+    backend.libraries), or None where no library was chosen: CLI commands,
+    background jobs and tests outside a request see every library."""
+    if not has_app_context():
+        return None
+    return g.get('library_id')
+
+
+class LibrarySQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy whose default engine is the current library's own
+    database when libraries are kept in separate files
+    (`LIBRARY_DATABASE_DIR`, see backend.libraries). `db.engine`, sessions
+    and `db.create_all()` all follow it."""
+
+    @property
+    def engines(self):
+        engines = super().engines
+        library_engines = current_app.extensions.get(LIBRARY_ENGINES_KEY)
+        if library_engines is not None:
+            engine = library_engines.engine(current_library_id())
+            if engine is not None:
+                return {**engines, None: engine}
+        return engines
+
+    @property
+    def primary_engine(self):
+        """The engine of the configured database, whatever the library."""
+        return super().engines[None]
+
 
 # Create the SQLAlchemy "db" object.
 # This will be initialized by the Flask app using `db.init_app(app)`.
-# Keep the models in this file when you're ready.
+# Sessions route GET-request reads to a read replica when one is configured
+# (see backend.read_routing).
+
+db = LibrarySQLAlchemy(session_options={'class_': RoutingSession})
+
+
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """Turn on foreign key enforcement for every new SQLite connection.
+
+    SQLite ignores FOREIGN KEY clauses (including ON DELETE CASCADE) unless
+    this pragma is set per connection, so without it deleting an author
+    would leave its books behind.
+    """
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
+# SQL condition shared by the partial indexes below
+LIVE_ROWS = db.text('deleted_at IS NULL')
+TOMBSTONES = db.text('deleted_at IS NOT NULL')
+
+# Text search configuration of the PostgreSQL full-text indexes: 'simple'
+# (no stemming or stop words) suits titles and names in any language
+TSVECTOR_CONFIG = "'simple'"
+
+
+def trigram_available(ddl, target, bind, **kw):
+    """DDL condition: PostgreSQL with the pg_trgm extension installable
+    (it ships with contrib, which minimal servers may lack)."""
+    return bind.dialect.name == 'postgresql' and bind.exec_driver_sql(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+    ).scalar() is not None
+
+
+def search_indexes(table, *columns):
+    """GIN trigram and full-text indexes for `columns` of `table`, created
+    on PostgreSQL only (see backend.search)."""
+    indexes = []
+    for column in columns:
+        indexes.append(db.Index(
+            f'ix_{table}_{column}_trgm', column, postgresql_using='gin',
+            postgresql_ops={column: 'gin_trgm_ops'},
+            postgresql_where=LIVE_ROWS).ddl_if(callable_=trigram_available))
+        if column != 'isbn':
+            indexes.append(db.Index(
+                f'ix_{table}_{column}_fts',
+                db.text(f'to_tsvector({TSVECTOR_CONFIG}, {column})'),
+                postgresql_using='gin',
+                postgresql_where=LIVE_ROWS).ddl_if(dialect='postgresql'))
+    return tuple(indexes)
+
+
+# The trigram operator classes come from the pg_trgm extension
+event.listen(db.metadata, 'before_create', db.DDL(
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(
+    callable_=trigram_available))
+
+
+def utcnow():
+    """Naive UTC timestamp, as stored in the DateTime columns."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# Connection.info key holding the catalogue version of the current write
+# transaction (set by backend.catalogue when change tracking is on)
+CHANGE_VERSION_KEY = 'catalogue_version'
+
+
+def change_version(context):
+    """Default / onupdate value of `change_seq`: the catalogue version of
+    the writing transaction, or None while change tracking is off."""
+    return context.connection.info.get(CHANGE_VERSION_KEY)
+
+
+def default_name_block(context):
+    """Default of `author.name_block` for inserts that bypass the ORM
+    attribute."""
+    return block_key(context.get_current_parameters().get('name'))
+
 
-db = SQLAlchemy()
+def default_library_id(context):
+    """Default of `library_id`: rows are added to the current library
+    (the main one outside requests)."""
+    return current_library_id() or DEFAULT_LIBRARY_ID
 
 
-class Author(db.Model):
+def default_isbn_key(context):
+    """Default of `book.isbn_key` for inserts that bypass the ORM
+    attribute (e.g. bulk Core inserts)."""
+    return isbn_key(context.get_current_parameters().get('isbn'))
+
+
+class SoftDeleteMixin:
+    """Adds a `deleted_at` tombstone column.
+
+    Deleting a row only sets `deleted_at`; the row stays in the table so the
+    delete can be undone, and `backend.purge` removes it physically later.
+    Every ORM query filters tombstones out automatically (see
+    `hide_soft_deleted` below); pass
+    `.execution_options(include_deleted=True)` to see them.
+    """
+    deleted_at = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def is_deleted(self):
+        return self.deleted_at is not None
+
+    def soft_delete(self, when=None):
+        """Mark this row deleted and return the tombstone timestamp."""
+        self.deleted_at = when or utcnow()
+        return self.deleted_at
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def hide_soft_deleted(execute_state):
+    """Add `deleted_at IS NULL` to every ORM statement on soft-deletable
+    models, unless the statement opts out with `include_deleted=True`.
+
+    Refreshes and lazy loads are filtered too, so an expired tombstone in
+    the identity map behaves exactly like a deleted row (`session.get()`
+    returns None for it).
+    """
+    if execute_state.execution_options.get('include_deleted', False):
+        return
+    execute_state.statement = execute_state.statement.options(
+        with_loader_criteria(
+            SoftDeleteMixin,
+            lambda cls: cls.deleted_at.is_(None),
+            include_aliases=True))
+
+
+class LibraryMixin:
+    """Adds the `library_id` of the library (tenant) a row belongs to.
+
+    While a request works on a library, every ORM query only sees that
+    library's rows (see `scope_to_library` below) and new rows join it;
+    pass `.execution_options(all_libraries=True)` to see every library.
+    There is no foreign key to `library`: a library's rows can be kept in
+    a database file of their own (backend.libraries).
+    """
+    library_id = db.Column(db.Integer, nullable=False,
+                           default=default_library_id)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def scope_to_library(execute_state):
+    """Add `library_id = <current library>` to every ORM statement on
+    library rows while a library is chosen, unless the statement opts out
+    with `all_libraries=True`."""
+    library_id = current_library_id()
+    if library_id is None or execute_state.execution_options.get(
+            'all_libraries', False):
+        return
+    execute_state.statement = execute_state.statement.options(
+        with_loader_criteria(
+            LibraryMixin,
+            lambda cls: cls.library_id == library_id,
+            include_aliases=True))
+
+
+@event.listens_for(Session, 'after_flush')
+def collect_soft_deleted(session, flush_context):
+    """Remember objects whose tombstone was set in this flush."""
+    for obj in session.dirty:
+        if (isinstance(obj, SoftDeleteMixin)
+                and obj.deleted_at is not None
+                and inspect(obj).attrs.deleted_at.history.added):
+            session.info.setdefault('soft_deleted', set()).add(obj)
+
+
+@event.listens_for(Session, 'after_commit')
+def expunge_soft_deleted(session):
+    """Detach soft-deleted objects once committed, the same way hard-deleted
+    objects leave the session. Refresh loads bypass loader criteria, so a
+    tombstone left in the identity map would otherwise still be returned by
+    `session.get()`."""
+    for obj in session.info.pop('soft_deleted', ()):
+        if obj in session:
+            session.expunge(obj)
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_soft_deleted(session):
+    session.info.pop('soft_deleted', None)
+
+
+class Library(db.Model):
+    """A library (tenant) of its own books and authors (see
+    `LibraryMixin`). With `LIBRARY_DATABASE_DIR` set this table stays in
+    the configured database, as the directory of the libraries."""
+    __tablename__ = 'library'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+    def __repr__(self):
+        return f"<Library id={self.id} name={self.name!r}>"
+
+
+@event.listens_for(Library.__table__, 'after_create')
+def create_default_library(target, connection, **kw):
+    """The main library exists from the start: rows written without a
+    library belong to it."""
+    connection.execute(target.insert().values(
+        id=DEFAULT_LIBRARY_ID, name=DEFAULT_LIBRARY_NAME,
+        created_at=utcnow()))
+    if connection.dialect.name == 'postgresql':
+        # An explicit id doesn't advance the sequence
+        connection.exec_driver_sql(
+            "SELECT setval(pg_get_serial_sequence('library', 'id'), "
+            f"{DEFAULT_LIBRARY_ID})")
+
+
+class Author(LibraryMixin, SoftDeleteMixin, db.Model):
     """Simple Author model with basic metadata."""
     __tablename__ = 'author'
+    __table_args__ = (
+        # Partial indexes: listings only ever read live rows, and the purge
+        # job only ever reads tombstones. Listing indexes lead with the
+        # library, so one library's pages never scan another's rows
+        db.Index('ix_author_live_name', 'library_id', 'name',
+                 sqlite_where=LIVE_ROWS, postgresql_where=LIVE_ROWS),
+        db.Index('ix_author_tombstones', 'deleted_at',
+                 sqlite_where=TOMBSTONES, postgresql_where=TOMBSTONES),
+        *search_indexes('author', 'name'),
+        # Case-insensitive name prefix lookups (backend.search.author_name_key)
+        db.Index('ix_author_live_name_nocase', 'library_id',
+                 db.text('name COLLATE NOCASE'),
+                 sqlite_where=LIVE_ROWS).ddl_if(dialect='sqlite'),
+        db.Index('ix_author_live_name_lower', 'library_id',
+                 db.text('(lower(name) COLLATE "C")'),
+                 postgresql_where=LIVE_ROWS).ddl_if(dialect='postgresql'),
+        db.Index('ix_author_change_seq', 'change_seq'),
+        db.Index('ix_author_name_block', 'library_id', 'name_block'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(128), nullable=False)
+    # Surname and first initial (backend.author_names.block_key): only
+    # authors sharing it are compared when looking for duplicates
+    name_block = db.Column(db.String(64), nullable=True,
+                           default=default_name_block)
     birth_date = db.Column(db.Date, nullable=True)
     date_of_death = db.Column(db.Date, nullable=True)
+    # Catalogue version of the last write to this row (see CatalogueState)
+    change_seq = db.Column(db.Integer, nullable=True,
+                           default=change_version, onupdate=change_version)
+    # Time of the last write to this row (HTTP validators, backend.page_cache)
+    updated_at = db.Column(db.DateTime, nullable=True,
+                           default=utcnow, onupdate=utcnow)
+
+    @validates('name')
+    def track_name_block(self, key, value):
+        self.name_block = block_key(value)
+        return value
+
+    def soft_delete(self, when=None):
+        """Mark the author and all of their live books deleted.
+
+        The books are tombstoned with one set-based UPDATE using the same
+        timestamp as the author, so `restore()` brings back exactly the
+        books removed together with the author.
+        """
+        when = super().soft_delete(when)
+        Book.query.filter_by(author_id=self.id).update(
+            {Book.deleted_at: when}, synchronize_session=False)
+        return when
+
+    @classmethod
+    def restore(cls, author_id):
+        """Undo a soft delete. Returns False if there is no tombstone."""
+        when = db.session.query(cls.deleted_at).execution_options(
+            include_deleted=True).filter(cls.id == author_id).scalar()
+        if when is None:
+            return False
+        Book.query.execution_options(include_deleted=True).filter(
+            Book.author_id == author_id, Book.deleted_at == when).update(
+            {Book.deleted_at: None}, synchronize_session=False)
+        cls.query.execution_options(include_deleted=True).filter(
+            cls.id == author_id).update(
+            {cls.deleted_at: None}, synchronize_session=False)
+        return True
 
     def __repr__(self):
         return f"<Author id={self.id} name={self.name!r}>"
@@ -31,12 +354,32 @@ class Author(db.Model):
         return f"{self.name} (id={self.id})"
 
 
-class Book(db.Model):
+class Book(LibraryMixin, SoftDeleteMixin, db.Model):
     """Book model referencing an Author with a foreign key."""
     __tablename__ = 'book'
+    __table_args__ = (
+        # An ISBN is unique within its library
+        db.UniqueConstraint('library_id', 'isbn',
+                            name='uq_book_library_isbn'),
+        db.Index('ix_book_live_title', 'library_id', 'title',
+                 sqlite_where=LIVE_ROWS, postgresql_where=LIVE_ROWS),
+        db.Index('ix_book_live_author', 'author_id',
+                 sqlite_where=LIVE_ROWS, postgresql_where=LIVE_ROWS),
+        db.Index('ix_book_live_rating', 'library_id', 'rating',
+                 sqlite_where=LIVE_ROWS, postgresql_where=LIVE_ROWS),
+        db.Index('ix_book_tombstones', 'deleted_at',
+                 sqlite_where=TOMBSTONES, postgresql_where=TOMBSTONES),
+        *search_indexes('book', 'title', 'isbn'),
+        db.Index('ix_book_change_seq', 'change_seq'),
+        db.Index('ix_book_isbn_key', 'library_id', 'isbn_key'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    isbn = db.Column(db.String(20), unique=True, nullable=False)
+    isbn = db.Column(db.String(20), nullable=False)
+    # ISBN-13 of the ISBN, whatever its spelling (backend.isbn.isbn_key):
+    # what duplicate checks look up
+    isbn_key = db.Column(db.String(20), nullable=True,
+                         default=default_isbn_key)
     title = db.Column(db.String(200), nullable=False)
     publication_year = db.Column(db.Integer, nullable=True)
 # Optional direct link to a cover image (e.g., hosted image URL)
@@ -51,12 +394,42 @@ class Book(db.Model):
         nullable=False)
     # Cached AI recommendation/metadata for this book
     ai_recommendation = db.Column(db.Text, nullable=True)
+    # Catalogue version of the last write to this row (see CatalogueState)
+    change_seq = db.Column(db.Integer, nullable=True,
+                           default=change_version, onupdate=change_version)
+    # Time of the last write to this row (HTTP validators, backend.page_cache)
+    updated_at = db.Column(db.DateTime, nullable=True,
+                           default=utcnow, onupdate=utcnow)
 
     # relationship to Author. backref creates .books on Author instances.
     # cascade='all, delete-orphan' ensures books are deleted when author is
-    # deleted
+    # deleted. passive_deletes=True leaves that to the database's
+    # ON DELETE CASCADE, so deleting an author is a single DELETE statement
+    # and unloaded books are never pulled into the session.
     author = db.relationship('Author', backref=db.backref(
-        'books', lazy=True, cascade='all, delete-orphan'))
+        'books', lazy=True, cascade='all, delete-orphan',
+        passive_deletes=True))
+
+    @validates('isbn')
+    def track_isbn_key(self, key, value):
+        self.isbn_key = isbn_key(value)
+        return value
+
+    @classmethod
+    def restore(cls, book_id):
+        """Undo a soft delete. Returns False if there is no tombstone or the
+        book's author is itself deleted (restore the author instead)."""
+        restored = cls.query.execution_options(include_deleted=True).filter(
+            cls.id == book_id,
+            cls.deleted_at.isnot(None),
+            cls.author_id.in_(db.select(Author.id).where(
+                Author.deleted_at.is_(None)))).update(
+            {cls.deleted_at: None}, synchronize_session=False)
+        return restored > 0
+
+    @property
+    def has_review(self):
+        return bool(self.ai_recommendation)
 
     def __repr__(self):
         return f"<Book id={self.id} title={self.title!r} isbn={self.isbn!r}>"
@@ -65,6 +438,247 @@ class Book(db.Model):
         return f"{self.title} by {self.author.name if self.author else 'Unknown'}"
 
 
+class RatingEvent(db.Model):
+    """One row per rating given to a book (append-only history).
+
+    `author_id` is copied from the book so "recently rated" for an author is
+    a range scan on (author_id, created_at) without joining every book.
+    """
+    __tablename__ = 'rating_event'
+    __table_args__ = (
+        db.Index('ix_rating_event_book', 'book_id', 'created_at'),
+        db.Index('ix_rating_event_author', 'author_id', 'created_at'),
+        db.Index('ix_rating_event_created', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(
+        db.Integer,
+        db.ForeignKey('book.id', ondelete='CASCADE'),
+        nullable=False)
+    author_id = db.Column(db.Integer, nullable=False)
+    rating = db.Column(db.Integer, nullable=False)
+    # rating the book had before this event (None if it was unrated)
+    previous_rating = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+    book = db.relationship('Book')
+
+    def __repr__(self):
+        return (f"<RatingEvent book_id={self.book_id} rating={self.rating} "
+                f"at={self.created_at}>")
+
+
+class RatingSummary(db.Model):
+    """Running rating aggregates, kept up to date incrementally.
+
+    scope='book': every rating event of the book (how often and how it was
+    rated over time).
+    scope='author': the current ratings of the author's live books, so the
+    average matches what the library shows.
+    """
+    __tablename__ = 'rating_summary'
+
+    scope = db.Column(db.String(10), primary_key=True)
+    subject_id = db.Column(db.Integer, primary_key=True)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    # histogram: number of ratings with each value 1..10
+    hist_1 = db.Column(db.Integer, nullable=False, default=0)
+    hist_2 = db.Column(db.Integer, nullable=False, default=0)
+    hist_3 = db.Column(db.Integer, nullable=False, default=0)
+    hist_4 = db.Column(db.Integer, nullable=False, default=0)
+    hist_5 = db.Column(db.Integer, nullable=False, default=0)
+    hist_6 = db.Column(db.Integer, nullable=False, default=0)
+    hist_7 = db.Column(db.Integer, nullable=False, default=0)
+    hist_8 = db.Column(db.Integer, nullable=False, default=0)
+    hist_9 = db.Column(db.Integer, nullable=False, default=0)
+    hist_10 = db.Column(db.Integer, nullable=False, default=0)
+    last_rated_at = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def average(self):
+        if not self.rating_count:
+            return None
+        return self.rating_sum / self.rating_count
+
+    @property
+    def histogram(self):
+        """List of (rating, count) pairs for ratings 1..10."""
+        return [(value, getattr(self, f'hist_{value}'))
+                for value in range(1, 11)]
+
+
+class CatalogueState(db.Model):
+    """Single-row change counter behind the in-process catalogue snapshot
+    (backend.catalogue).
+
+    Every transaction that writes `book` or `author` increments `version`
+    once and stamps the rows it touches with the new value (`change_seq`),
+    so a snapshot at version N only has to re-read rows with
+    `change_seq > N`. `epoch` is incremented by DELETE statements: removed
+    rows can't be found that way, so snapshots rebuild from scratch.
+    """
+    __tablename__ = 'catalogue_state'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    epoch = db.Column(db.Integer, nullable=False, default=0)
+
+
+class BookFeature(db.Model):
+    """One weighted feature of a book's content vector (backend.similar_books).
+
+    `feature` is a hashed token (title word, review word, author, period).
+    Indexed by (feature, weight) as well, so the table doubles as an
+    inverted index read heaviest-first.
+    """
+    __tablename__ = 'book_feature'
+    __table_args__ = (
+        db.Index('ix_book_feature_postings', 'feature', 'weight'),
+    )
+
+    book_id = db.Column(
+        db.Integer,
+        db.ForeignKey('book.id', ondelete='CASCADE'),
+        primary_key=True)
+    feature = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    weight = db.Column(db.Float, nullable=False)
+
+
+class SimilarBook(db.Model):
+    """Precomputed nearest neighbours: `similar_id` is one of the books most
+    like `book_id`, with their cosine similarity as `score`."""
+    __tablename__ = 'similar_book'
+    __table_args__ = (
+        db.Index('ix_similar_book_similar', 'similar_id'),
+    )
+
+    book_id = db.Column(
+        db.Integer,
+        db.ForeignKey('book.id', ondelete='CASCADE'),
+        primary_key=True)
+    similar_id = db.Column(
+        db.Integer,
+        db.ForeignKey('book.id', ondelete='CASCADE'),
+        primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+    # When this pair was (re)computed: part of the book page validators
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+
+class Reader(db.Model):
+    """Someone rating books on their own behalf (see `ReaderRating`)."""
+    __tablename__ = 'reader'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+    def __repr__(self):
+        return f"<Reader id={self.id} name={self.name!r}>"
+
+
+class ReaderRating(db.Model):
+    """One reader's current rating of a book. `book.rating` stays the
+    library's own rating; these feed `AlsoLiked`."""
+    __tablename__ = 'reader_rating'
+    __table_args__ = (
+        db.Index('ix_reader_rating_book', 'book_id'),
+    )
+
+    reader_id = db.Column(
+        db.Integer,
+        db.ForeignKey('reader.id', ondelete='CASCADE'),
+        primary_key=True)
+    book_id = db.Column(
+        db.Integer,
+        db.ForeignKey('book.id', ondelete='CASCADE'),
+        primary_key=True)
+    rating = db.Column(db.Integer, nullable=False)
+    rated_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+
+class AlsoLiked(db.Model):
+    """Batch-computed "readers who liked this also liked" lists
+    (backend.also_liked): `other_id` is one of the books most often liked
+    by the readers who liked `book_id`."""
+    __tablename__ = 'also_liked'
+    __table_args__ = (
+        db.Index('ix_also_liked_other', 'other_id'),
+    )
+
+    book_id = db.Column(
+        db.Integer,
+        db.ForeignKey('book.id', ondelete='CASCADE'),
+        primary_key=True)
+    other_id = db.Column(
+        db.Integer,
+        db.ForeignKey('book.id', ondelete='CASCADE'),
+        primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+    # Readers who liked both books
+    readers = db.Column(db.Integer, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+
+class EnrichmentJob(db.Model):
+    """An ISBN waiting for (or done with) metadata enrichment
+    (backend.enrichment). One row per ISBN; `status` is 'pending' until a
+    provider answered, then 'done', 'not_found' or, after too many
+    errors, 'failed'."""
+    __tablename__ = 'enrichment_job'
+    __table_args__ = (
+        db.Index('ix_enrichment_job_status', 'status', 'enqueued_at'),
+    )
+
+    isbn = db.Column(db.String(20), primary_key=True)
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    enqueued_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<EnrichmentJob isbn={self.isbn!r} status={self.status!r}>"
+
+
+class MetadataCache(db.Model):
+    """A provider's answer for an ISBN, kept so it is never fetched twice.
+    `found` is False when the provider doesn't know the ISBN; `payload` is
+    the normalised record as JSON."""
+    __tablename__ = 'metadata_cache'
+
+    provider = db.Column(db.String(40), primary_key=True)
+    isbn = db.Column(db.String(20), primary_key=True)
+    found = db.Column(db.Boolean, nullable=False)
+    payload = db.Column(db.Text, nullable=True)
+    fetched_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+
+class ChangeLogEntry(db.Model):
+    """One insert, update or delete of a book or author, appended in the
+    transaction that made it (backend.change_log). Consumers read the log
+    of their library in `id` order from a cursor; compaction keeps the
+    latest entry per row."""
+    __tablename__ = 'change_log'
+    __table_args__ = (
+        db.Index('ix_change_log_entity', 'entity', 'entity_id', 'id'),
+        db.Index('ix_change_log_library', 'library_id', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Library of the changed row (no foreign key, like `LibraryMixin`)
+    library_id = db.Column(db.Integer, nullable=False,
+                           default=DEFAULT_LIBRARY_ID)
+    # 'book' or 'author'
+    entity = db.Column(db.String(16), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    # 'insert', 'update' or 'delete'
+    op = db.Column(db.String(8), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+
 # Note for beginners: do NOT put `db.create_all()` here, because importing
 # `app` from this file would cause a circular import (app imports data_models).
 # Instead, run the following snippet once from a separate script (we already
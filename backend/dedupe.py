@@ -0,0 +1,394 @@
+"""Merging duplicate books and authors.
+
+Books
+-----
+
+Before ISBNs were validated and checked on entry (backend.isbn), one book
+could be stored several times under different spellings of its ISBN
+("978-0-14-143951-8", "9780141439518", "0141439513"). They all share
+`book.isbn_key`, so `merge_duplicate_isbns()` finds every group with one
+grouped scan of the `ix_book_isbn_key` index and folds each into a single
+book (copies in different libraries are not duplicates):
+
+ - the survivor is the oldest live copy (the oldest tombstone if all
+   copies are deleted), and keeps its own values; fields it is missing
+   are taken from the other copies,
+ - rating history and reader ratings move to the survivor (when a reader
+   rated two copies, their rating of the survivor wins),
+ - the other copies are deleted for good, together with their derived
+   rows (similar books, features, "also liked"),
+ - the survivor's ISBN is rewritten without separators, and the rating
+   summaries of the affected books and authors are recomputed.
+
+Groups are merged `MERGE_BATCH` at a time, one transaction each. Keys are
+filled in first for rows that predate the `isbn_key` column.
+
+    flask --app backend.app dedupe-isbns [--dry-run]
+
+Authors
+-------
+"J. Austen", "Austen, Jane" and "Jane Austen" are matched by name
+(backend.author_names). Authors are only compared within their block
+(`author.name_block`, surname and first initial, within one library),
+and only blocks held
+by more than one author are read, block by block, from the
+`ix_author_name_block` index. Within a block, identical names match
+without scoring and the distinct names are scored pairwise; blocks with
+more than `MAX_BLOCK_NAMES` distinct names only compare each name with
+the `BLOCK_WINDOW` names that follow it in sorted order. A shortened name
+matching several full names that don't match each other ("J. Austen"
+for both "Jane" and "John Austen") is ambiguous and left alone.
+
+`author_merge_plan()` returns the groups to merge, the survivor first:
+the live author with the fullest name, then the most books, then the
+oldest. `apply_author_merges()` moves books and rating history to the
+survivor with one set-based `UPDATE ... SET author_id = CASE ...` per
+`MERGE_BATCH` groups, fills the survivor's missing dates, deletes the
+other authors and recomputes the survivors' rating summaries.
+
+    flask --app backend.app dedupe-authors [--dry-run] [--threshold 0.85]
+"""
+
+from collections import defaultdict
+from itertools import combinations, groupby
+
+from sqlalchemy import and_, bindparam, case, func, select
+
+from backend.author_names import (MATCH_THRESHOLD, block_key, fullness,
+                                  name_similarity, parse_name)
+from backend.change_feed import note_changes
+from backend.change_log import (AUTHOR, BOOK, DELETE, UPDATE,
+                                record_changes)
+from backend.data_models import (db, Author, Book, RatingEvent,
+                                 RatingSummary, ReaderRating)
+from backend.isbn import InvalidIsbn, isbn_key, normalize_isbn
+from backend.rating_stats import (AUTHOR_SCOPE, BOOK_SCOPE,
+                                  refresh_author_summaries,
+                                  refresh_book_summaries)
+from backend.similar_books import (refresh_similar_books,
+                                   similar_books_enabled)
+
+MERGE_BATCH = 200
+BACKFILL_BATCH = 1000
+# Rows read at a time when scanning author blocks
+BLOCK_FETCH = 5000
+# Above this many distinct names, a block is compared in a sliding window
+MAX_BLOCK_NAMES = 200
+BLOCK_WINDOW = 20
+# Fields a survivor takes from its duplicates when it has no value
+MERGE_FIELDS = ('publication_year', 'cover_url', 'rating',
+                'ai_recommendation')
+AUTHOR_MERGE_FIELDS = ('birth_date', 'date_of_death')
+
+
+def backfill_keys(conn, column, source, key):
+    """Fill in `column` from `key(source value)` where it is missing ('' when
+    there is no key, so the row isn't picked again). Returns the rows
+    updated."""
+    table = column.table
+    updated = 0
+    while True:
+        rows = conn.execute(
+            select(table.c.id, source).where(column.is_(None))
+            .limit(BACKFILL_BATCH)).all()
+        if not rows:
+            return updated
+        conn.execute(
+            table.update().where(table.c.id == bindparam('row_id'))
+            .values({column.name: bindparam('key')}),
+            [{'row_id': row_id, 'key': key(value) or ''}
+             for row_id, value in rows])
+        updated += len(rows)
+
+
+def backfill_isbn_keys(conn):
+    """Fill in `isbn_key` where it is missing. Returns the rows updated."""
+    book = Book.__table__
+    return backfill_keys(conn, book.c.isbn_key, book.c.isbn, isbn_key)
+
+
+def duplicate_groups(conn):
+    """[(isbn_key, [book ids, survivor first])] for every key held by more
+    than one book of a library, deleted ones included."""
+    book = Book.__table__
+    shared = select(book.c.library_id, book.c.isbn_key) \
+        .where(book.c.isbn_key != '') \
+        .group_by(book.c.library_id, book.c.isbn_key) \
+        .having(func.count() > 1).subquery()
+    rows = conn.execute(
+        select(book.c.library_id, book.c.isbn_key, book.c.id)
+        .join(shared, and_(shared.c.library_id == book.c.library_id,
+                           shared.c.isbn_key == book.c.isbn_key))
+        .order_by(book.c.library_id, book.c.isbn_key,
+                  case((book.c.deleted_at.is_(None), 0), else_=1),
+                  book.c.id))
+    return [(key, [row.id for row in group])
+            for (_, key), group in groupby(
+                rows, key=lambda row: (row.library_id, row.isbn_key))]
+
+
+def merge_group(survivor, duplicates):
+    """Fold `duplicates` into `survivor` (Book objects, in this session)."""
+    conn = db.session.connection()
+    for field in MERGE_FIELDS:
+        if getattr(survivor, field) in (None, ''):
+            for duplicate in duplicates:
+                value = getattr(duplicate, field)
+                if value not in (None, ''):
+                    setattr(survivor, field, value)
+                    break
+    duplicate_ids = [duplicate.id for duplicate in duplicates]
+    for duplicate in duplicates:
+        db.session.expunge(duplicate)
+    db.session.flush()
+
+    event = RatingEvent.__table__
+    conn.execute(event.update().where(event.c.book_id.in_(duplicate_ids))
+                 .values(book_id=survivor.id, author_id=survivor.author_id))
+    rating = ReaderRating.__table__
+    rated_survivor = select(rating.c.reader_id).where(
+        rating.c.book_id == survivor.id)
+    conn.execute(rating.delete().where(
+        rating.c.book_id.in_(duplicate_ids),
+        rating.c.reader_id.in_(rated_survivor)))
+    # A reader may have rated several duplicates: keep the latest
+    kept = {}
+    for reader_id, book_id, rated_at in conn.execute(
+            select(rating.c.reader_id, rating.c.book_id, rating.c.rated_at)
+            .where(rating.c.book_id.in_(duplicate_ids))
+            .order_by(rating.c.rated_at)):
+        kept[reader_id] = book_id
+    for reader_id, book_id in kept.items():
+        conn.execute(rating.update().where(
+            rating.c.reader_id == reader_id, rating.c.book_id == book_id)
+            .values(book_id=survivor.id))
+
+    Book.query.execution_options(include_deleted=True).filter(
+        Book.id.in_(duplicate_ids)).delete(synchronize_session=False)
+    RatingSummary.query.filter(
+        RatingSummary.scope == BOOK_SCOPE,
+        RatingSummary.subject_id.in_(duplicate_ids)).delete(
+        synchronize_session=False)
+    # The duplicates' spellings are gone, so this can't hit the unique
+    # constraint any more
+    try:
+        survivor.isbn = normalize_isbn(survivor.isbn)
+    except InvalidIsbn:
+        pass
+    return duplicate_ids
+
+
+def merge_duplicate_isbns(dry_run=False):
+    """Merge every group of books sharing an ISBN key. Must be called
+    inside an app context. Returns {'groups': ..., 'removed': ...}."""
+    backfill_isbn_keys(db.session.connection())
+    db.session.commit()
+    groups = duplicate_groups(db.session.connection())
+    stats = {'groups': len(groups),
+             'removed': sum(len(ids) - 1 for _, ids in groups)}
+    if dry_run:
+        db.session.rollback()
+        return stats
+    for start in range(0, len(groups), MERGE_BATCH):
+        chunk = groups[start:start + MERGE_BATCH]
+        books = {book.id: book for book in Book.query.execution_options(
+            include_deleted=True).filter(
+            Book.id.in_([book_id for _, ids in chunk for book_id in ids]))}
+        author_ids = {book.author_id for book in books.values()}
+        survivors = []
+        for _, ids in chunk:
+            survivor = books[ids[0]]
+            merge_group(survivor, [books[book_id] for book_id in ids[1:]])
+            survivors.append(survivor.id)
+        db.session.flush()
+        conn = db.session.connection()
+        refresh_book_summaries(conn, survivors)
+        refresh_author_summaries(conn, author_ids)
+        db.session.commit()
+    return stats
+
+
+def backfill_name_blocks(conn):
+    """Fill in `name_block` where it is missing. Returns the rows updated."""
+    author = Author.__table__
+    return backfill_keys(conn, author.c.name_block, author.c.name,
+                         block_key)
+
+
+def shared_blocks(conn):
+    """(block, [(id, name)]) for every block held by more than one author
+of a library, deleted ones included, read in one ordered pass."""
+    author = Author.__table__
+    shared = select(author.c.library_id, author.c.name_block) \
+        .where(author.c.name_block != '') \
+        .group_by(author.c.library_id, author.c.name_block) \
+        .having(func.count() > 1).subquery()
+    rows = conn.execute(
+        select(author.c.library_id, author.c.name_block, author.c.id,
+               author.c.name)
+        .join(shared, and_(shared.c.library_id == author.c.library_id,
+                           shared.c.name_block == author.c.name_block))
+        .order_by(author.c.library_id, author.c.name_block, author.c.id)
+        .execution_options(yield_per=BLOCK_FETCH))
+    for (_, block), group in groupby(
+            rows, key=lambda row: (row.library_id, row.name_block)):
+        yield block, [(row.id, row.name) for row in group]
+
+
+def match_block(members, threshold=MATCH_THRESHOLD):
+    """Groups of ids naming the same author, from the (id, name) pairs of
+    one block."""
+    ids_by_name = defaultdict(list)
+    for author_id, name in members:
+        ids_by_name[parse_name(name)].append(author_id)
+    names = sorted(ids_by_name)
+    if len(names) <= MAX_BLOCK_NAMES:
+        pairs = combinations(range(len(names)), 2)
+    else:
+        pairs = ((i, j) for i in range(len(names))
+                 for j in range(i + 1, min(len(names), i + 1 + BLOCK_WINDOW)))
+    matches = defaultdict(set)
+    for i, j in pairs:
+        if name_similarity(names[i], names[j]) >= threshold:
+            matches[i].add(j)
+            matches[j].add(i)
+    # "J. Austen" matching both "Jane" and "John Austen" could be either
+    for i in list(matches):
+        fuller = [j for j in matches[i]
+                  if fullness(names[j]) > fullness(names[i])]
+        if any(b not in matches[a] for a, b in combinations(fuller, 2)):
+            for j in matches.pop(i):
+                matches[j].discard(i)
+
+    groups, seen = [], set()
+    for start in range(len(names)):
+        if start in seen:
+            continue
+        component, todo = [], [start]
+        seen.add(start)
+        while todo:
+            i = todo.pop()
+            component.append(i)
+            todo.extend(j for j in matches.get(i, ()) if j not in seen)
+            seen.update(matches.get(i, ()))
+        ids = sorted(author_id for i in component
+                     for author_id in ids_by_name[names[i]])
+        if len(ids) > 1:
+            groups.append(ids)
+    return groups
+
+
+def order_survivor_first(conn, groups):
+    """Sort each group: live authors first, then the fullest name, the
+    most books and the lowest id."""
+    author, book = Author.__table__, Book.__table__
+    ids = [author_id for group in groups for author_id in group]
+    info = {}
+    for start in range(0, len(ids), BACKFILL_BATCH):
+        chunk = ids[start:start + BACKFILL_BATCH]
+        books = dict(conn.execute(
+            select(book.c.author_id, func.count())
+            .where(book.c.author_id.in_(chunk))
+            .group_by(book.c.author_id)).all())
+        for author_id, name, deleted_at in conn.execute(
+                select(author.c.id, author.c.name, author.c.deleted_at)
+                .where(author.c.id.in_(chunk))):
+            info[author_id] = (name, (
+                deleted_at is None, fullness(parse_name(name)),
+                books.get(author_id, 0), -author_id))
+    return [[(author_id, info[author_id][0]) for author_id in sorted(
+        group, key=lambda author_id: info[author_id][1], reverse=True)]
+        for group in groups]
+
+
+def author_merge_plan(threshold=MATCH_THRESHOLD):
+    """[[(id, name), ...]] for every group of authors to merge into one,
+    the survivor first. Must be called inside an app context; fills in
+    missing blocking keys first."""
+    backfill_name_blocks(db.session.connection())
+    db.session.commit()
+    conn = db.session.connection()
+    groups = [group for _, members in shared_blocks(conn)
+              for group in match_block(members, threshold)]
+    plan = order_survivor_first(conn, groups)
+    db.session.rollback()
+    return plan
+
+
+def apply_author_merges(plan):
+    """Merge the groups of `author_merge_plan()`, `MERGE_BATCH` per
+    transaction. Returns the number of authors removed."""
+    author, book = Author.__table__, Book.__table__
+    event, summary = RatingEvent.__table__, RatingSummary.__table__
+    removed = 0
+    for start in range(0, len(plan), MERGE_BATCH):
+        chunk = plan[start:start + MERGE_BATCH]
+        survivor_of = {author_id: group[0][0] for group in chunk
+                       for author_id, _ in group[1:]}
+        duplicates = list(survivor_of)
+        conn = db.session.connection()
+
+        # Dates the survivors lack, from their first duplicate that has one
+        rows = {row.id: row for row in conn.execute(
+            select(author.c.id, author.c.library_id,
+                   *[author.c[f] for f in AUTHOR_MERGE_FIELDS])
+            .where(author.c.id.in_(
+                duplicates + [group[0][0] for group in chunk])))}
+        for group in chunk:
+            survivor = rows[group[0][0]]
+            values = {}
+            for field in AUTHOR_MERGE_FIELDS:
+                if getattr(survivor, field) is None:
+                    for author_id, _ in group[1:]:
+                        value = getattr(rows[author_id], field)
+                        if value is not None:
+                            values[field] = value
+                            break
+            if values:
+                conn.execute(author.update().where(
+                    author.c.id == survivor.id).values(values))
+                record_changes(conn, AUTHOR, UPDATE, [survivor.id],
+                               libraries={survivor.id: survivor.library_id})
+
+        moved = dict(conn.execute(
+            select(book.c.id, book.c.library_id)
+            .where(book.c.author_id.in_(duplicates))).all())
+        for table in (book, event):
+            conn.execute(
+                table.update().where(table.c.author_id.in_(duplicates))
+                .values(author_id=case(survivor_of,
+                                       value=table.c.author_id)))
+        conn.execute(author.delete().where(author.c.id.in_(duplicates)))
+        conn.execute(summary.delete().where(
+            summary.c.scope == AUTHOR_SCOPE,
+            summary.c.subject_id.in_(duplicates)))
+        refresh_author_summaries(conn, set(survivor_of.values()))
+        if moved and similar_books_enabled():
+            refresh_similar_books(conn, list(moved))
+        record_changes(conn, BOOK, UPDATE, moved, libraries=moved)
+        record_changes(conn, AUTHOR, DELETE, duplicates, libraries={
+            author_id: rows[author_id].library_id
+            for author_id in duplicates})
+        # the survivors' book counts
+        for group in chunk:
+            survivor = rows[group[0][0]]
+            note_changes(conn, authors=[survivor.id],
+                         library_id=survivor.library_id)
+        db.session.commit()
+        removed += len(duplicates)
+    db.session.expire_all()
+    return removed
+
+
+def similar_authors(name, threshold=MATCH_THRESHOLD):
+    """Live authors whose name matches `name`, best match first (one index
+    lookup on `name_block`)."""
+    key = block_key(name)
+    if key is None:
+        return []
+    parsed = parse_name(name)
+    scored = [(name_similarity(parsed, parse_name(author.name)), author)
+              for author in Author.query.filter(Author.name_block == key)]
+    return [author for score, author in sorted(
+        scored, key=lambda pair: (-pair[0], pair[1].id))
+        if score >= threshold]
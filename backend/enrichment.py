@@ -0,0 +1,297 @@
+"""Offline metadata enrichment: fill in missing book fields by ISBN.
+
+Books are typed in by hand, so `cover_url` and `publication_year` are
+often empty. Their ISBNs are queued in `enrichment_job` (`add_book` does
+this, and `flask enrich-books` queues any other book still missing a
+field). The pipeline then
+
+ - takes the pending ISBNs, oldest first,
+ - answers what it can from `metadata_cache`, the persistent cache of
+   earlier provider responses (found or not), without any request,
+ - asks the provider for the rest in batches of `ENRICHMENT_BATCH_SIZE`
+   ISBNs, with at most `ENRICHMENT_CONCURRENCY` requests in flight,
+ - and, as each batch comes back, caches the answers, fills the empty
+   fields of the matching books (fields that have a value are never
+   overwritten) and marks the jobs done, all in one commit.
+
+Work is committed batch by batch, so an interrupted run loses at most the
+batches still in flight. Running it again only picks up the jobs still
+pending, and ISBNs whose answer was cached are never fetched again.
+Failed requests leave their jobs pending for the next run, until they
+have failed `MAX_ATTEMPTS` times.
+
+Providers are pluggable (`PROVIDERS`): `OpenLibraryProvider` talks to the
+Open Library books API, or anything that answers like it
+(`ENRICHMENT_URL`), and `StubProvider` answers from a local JSON file,
+for tests and offline development. Fetching runs in worker threads; all
+database work stays on the calling thread.
+
+    flask --app backend.app enrich-books
+"""
+
+import json
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from backend.data_models import (db, Book, EnrichmentJob, MetadataCache,
+                                 utcnow)
+
+PENDING = 'pending'
+DONE = 'done'
+NOT_FOUND = 'not_found'
+FAILED = 'failed'
+MAX_ATTEMPTS = 3
+# ISBNs per cache lookup query
+LOOKUP_CHUNK = 500
+# Book fields a provider record may fill in
+FIELDS = ('publication_year', 'cover_url')
+YEAR = re.compile(r'\b(1[0-9]{3}|20[0-9]{2})\b')
+
+
+class MetadataProvider:
+    """Looks book metadata up by ISBN.
+
+    `fetch(isbns)` returns {isbn: record or None}, a record being a dict
+    with any of `FIELDS`; None (or a missing key) means the provider
+    doesn't know the ISBN. Transport and HTTP errors are raised.
+    """
+    name = None
+
+    def fetch(self, isbns):
+        raise NotImplementedError
+
+
+class OpenLibraryProvider(MetadataProvider):
+    """The Open Library books API, one request per batch:
+    GET /api/books?bibkeys=ISBN:a,ISBN:b&format=json&jscmd=data"""
+    name = 'openlibrary'
+
+    def __init__(self, base_url='https://openlibrary.org', timeout=10):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def fetch(self, isbns):
+        import requests
+        response = requests.get(
+            f'{self.base_url}/api/books',
+            params={'bibkeys': ','.join(f'ISBN:{isbn}' for isbn in isbns),
+                    'format': 'json', 'jscmd': 'data'},
+            timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+        return {isbn: parse_open_library(data.get(f'ISBN:{isbn}'))
+                for isbn in isbns}
+
+
+def parse_open_library(entry):
+    """Record from one entry of an Open Library books API answer."""
+    if not entry:
+        return None
+    record = {}
+    year = YEAR.search(entry.get('publish_date') or '')
+    if year:
+        record['publication_year'] = int(year.group())
+    cover = entry.get('cover') or {}
+    cover_url = cover.get('medium') or cover.get('large') or cover.get('small')
+    if cover_url:
+        record['cover_url'] = cover_url
+    return record
+
+
+class StubProvider(MetadataProvider):
+    """Answers from a dict ({isbn: record}) without any network access.
+    Every batch asked for is kept in `calls`."""
+    name = 'stub'
+
+    def __init__(self, records=None):
+        self.records = dict(records or {})
+        self.calls = []
+
+    @classmethod
+    def from_file(cls, path):
+        """A stub answering from a JSON file ({isbn: record})."""
+        if not path:
+            return cls()
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def fetch(self, isbns):
+        self.calls.append(list(isbns))
+        return {isbn: self.records.get(isbn) for isbn in isbns}
+
+
+PROVIDERS = {
+    'openlibrary': lambda config: OpenLibraryProvider(
+        config['ENRICHMENT_URL'], config['ENRICHMENT_TIMEOUT']),
+    'stub': lambda config: StubProvider.from_file(
+        config.get('ENRICHMENT_STUB_FILE')),
+}
+
+
+def provider_from_config(config, name=None):
+    """The provider called `name` (default: `ENRICHMENT_PROVIDER`)."""
+    name = name or config['ENRICHMENT_PROVIDER']
+    try:
+        factory = PROVIDERS[name]
+    except KeyError:
+        raise ValueError(f'Unknown enrichment provider {name!r}; '
+                         f'choose one of {", ".join(sorted(PROVIDERS))}.')
+    return factory(config)
+
+
+def needs_enrichment(book):
+    return any(not getattr(book, field) for field in FIELDS)
+
+
+def enqueue_isbns(isbns, when=None):
+    """Queue ISBNs for enrichment in the current session. Finished jobs
+    are queued again (their cached answer is reused). Returns how many
+    jobs became pending."""
+    isbns = sorted({isbn.strip() for isbn in isbns if isbn and isbn.strip()})
+    if not isbns:
+        return 0
+    when = when or utcnow()
+    queued = 0
+    existing = {job.isbn: job for job in EnrichmentJob.query.filter(
+        EnrichmentJob.isbn.in_(isbns))}
+    for isbn in isbns:
+        job = existing.get(isbn)
+        if job is None:
+            db.session.add(EnrichmentJob(isbn=isbn, status=PENDING,
+                                         attempts=0, enqueued_at=when))
+        elif job.status != PENDING:
+            job.status = PENDING
+            job.attempts = 0
+            job.last_error = None
+            job.enqueued_at = when
+        else:
+            continue
+        queued += 1
+    return queued
+
+
+def enqueue_missing():
+    """Queue every live book missing a field whose ISBN has never been
+    queued. Returns the number of jobs added (not committed)."""
+    missing = db.or_(Book.publication_year.is_(None),
+                     Book.cover_url.is_(None), Book.cover_url == '')
+    isbns = [isbn for (isbn,) in db.session.query(Book.isbn).filter(
+        missing,
+        ~db.exists().where(EnrichmentJob.isbn == Book.isbn))]
+    return enqueue_isbns(isbns)
+
+
+def fill_missing(book, record):
+    """Copy the record's fields into the book's empty fields. Returns
+    True if anything changed."""
+    changed = False
+    for field in FIELDS:
+        value = record.get(field)
+        if value and not getattr(book, field):
+            setattr(book, field, value)
+            changed = True
+    return changed
+
+
+def cached_answers(provider_name, isbns):
+    """{isbn: record or None} for the ISBNs with a cached answer."""
+    answers = {}
+    for start in range(0, len(isbns), LOOKUP_CHUNK):
+        for row in MetadataCache.query.filter(
+                MetadataCache.provider == provider_name,
+                MetadataCache.isbn.in_(isbns[start:start + LOOKUP_CHUNK])):
+            answers[row.isbn] = (json.loads(row.payload) if row.found
+                                 else None)
+    return answers
+
+
+def apply_answers(provider_name, answers, stats, cache=True):
+    """Cache `answers` ({isbn: record or None}), fill in the books and
+    finish their jobs, then commit."""
+    when = utcnow()
+    if cache:
+        for isbn, record in answers.items():
+            db.session.merge(MetadataCache(
+                provider=provider_name, isbn=isbn, found=record is not None,
+                payload=json.dumps(record) if record is not None else None,
+                fetched_at=when))
+    for book in Book.query.filter(Book.isbn.in_(list(answers))):
+        record = answers[book.isbn]
+        if record and fill_missing(book, record):
+            stats['filled'] += 1
+    for job in EnrichmentJob.query.filter(
+            EnrichmentJob.isbn.in_(list(answers))):
+        found = answers[job.isbn] is not None
+        job.status = DONE if found else NOT_FOUND
+        job.attempts += 1
+        job.last_error = None
+        job.finished_at = when
+        stats['done' if found else 'not_found'] += 1
+    db.session.commit()
+
+
+def record_failure(isbns, error, stats):
+    """Count a failed request against its jobs, then commit."""
+    for job in EnrichmentJob.query.filter(EnrichmentJob.isbn.in_(isbns)):
+        job.attempts += 1
+        job.last_error = str(error)[:500]
+        if job.attempts >= MAX_ATTEMPTS:
+            job.status = FAILED
+            job.finished_at = utcnow()
+            stats['failed'] += 1
+        else:
+            stats['retry'] += 1
+    db.session.commit()
+
+
+def run_enrichment(provider, batch_size=50, concurrency=4, limit=None):
+    """Process the pending jobs (at most `limit`) with `provider`. Must be
+    called inside an app context.
+
+    Returns counts: 'cached' and 'fetched' ISBNs, jobs 'done' /
+    'not_found' / 'failed' / left for a 'retry', and books 'filled'.
+    """
+    # At least one request at a time, of at least one ISBN
+    batch_size, concurrency = max(1, batch_size), max(1, concurrency)
+    stats = dict.fromkeys(('cached', 'fetched', 'done', 'not_found',
+                           'failed', 'retry', 'filled'), 0)
+    query = db.session.query(EnrichmentJob.isbn).filter_by(status=PENDING) \
+        .order_by(EnrichmentJob.enqueued_at, EnrichmentJob.isbn)
+    if limit:
+        query = query.limit(limit)
+    isbns = [isbn for (isbn,) in query]
+    if not isbns:
+        return stats
+
+    cached = cached_answers(provider.name, isbns)
+    if cached:
+        stats['cached'] = len(cached)
+        apply_answers(provider.name, cached, stats, cache=False)
+    todo = [isbn for isbn in isbns if isbn not in cached]
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+
+    pool = ThreadPoolExecutor(max_workers=concurrency,
+                              thread_name_prefix='enrich')
+    in_flight = {}
+    try:
+        while batches or in_flight:
+            # Top the window up: never more than `concurrency` requests
+            while batches and len(in_flight) < concurrency:
+                batch = batches.pop(0)
+                in_flight[pool.submit(provider.fetch, batch)] = batch
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                batch = in_flight.pop(future)
+                try:
+                    answers = future.result()
+                except Exception as exc:
+                    record_failure(batch, exc, stats)
+                    continue
+                stats['fetched'] += len(batch)
+                apply_answers(provider.name,
+                              {isbn: (answers or {}).get(isbn)
+                               for isbn in batch}, stats)
+    finally:
+        # On interruption, don't start the batches still waiting
+        pool.shutdown(wait=True, cancel_futures=True)
+    return stats
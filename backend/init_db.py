@@ -4,11 +4,12 @@ Usage:
     source venv/bin/activate
     python -m backend.init_db
 """
-from backend.app import app
+from backend.app import create_app
 from backend.data_models import db
 
 
-def create_schema():
+def create_schema(app=None):
+    app = app or create_app()
     with app.app_context():
         db.create_all()
         print("Database schema created (tables should now exist).")
@@ -0,0 +1,74 @@
+"""ISBN normalisation and validation.
+
+`normalize_isbn()` checks an ISBN-10 or ISBN-13 typed with or without
+hyphens and spaces and returns it without them (the form stores that), or
+raises `InvalidIsbn` (wrong length, wrong check digit).
+
+`isbn_key()` is the value of the indexed `book.isbn_key` column that
+duplicate checks use: "978-0-14-143951-8", "9780141439518" and
+"0141439513" all have the key 9780141439518. Values that aren't a valid
+ISBN (rows from before the validation) get their characters without
+separators, upper-cased, so they only match themselves written
+differently.
+"""
+
+import re
+
+SEPARATORS = re.compile(r'[\s.\-‐‑‒–—]')
+ISBN13_PREFIXES = ('978', '979')
+
+
+class InvalidIsbn(ValueError):
+    """Raised by `normalize_isbn` with a message fit for the user."""
+
+
+def compact(raw):
+    return SEPARATORS.sub('', raw or '').upper()
+
+
+def isbn10_check_digit(first9):
+    total = sum((10 - i) * int(d) for i, d in enumerate(first9))
+    check = (11 - total % 11) % 11
+    return 'X' if check == 10 else str(check)
+
+
+def isbn13_check_digit(first12):
+    total = sum((3 if i % 2 else 1) * int(d) for i, d in enumerate(first12))
+    return str((10 - total % 10) % 10)
+
+
+def normalize_isbn(raw):
+    """A valid ISBN-10 or ISBN-13 without separators (check digit X
+    upper-cased)."""
+    value = compact(raw)
+    if len(value) == 10 and value[:9].isdigit() \
+            and (value[9].isdigit() or value[9] == 'X'):
+        if isbn10_check_digit(value[:9]) != value[9]:
+            raise InvalidIsbn(
+                f'"{raw}" is not a valid ISBN-10 (wrong check digit).')
+        return value
+    if len(value) == 13 and value.isdigit():
+        if not value.startswith(ISBN13_PREFIXES):
+            raise InvalidIsbn(
+                f'"{raw}" is not a valid ISBN-13 (must start with 978 or 979).')
+        if isbn13_check_digit(value[:12]) != value[12]:
+            raise InvalidIsbn(
+                f'"{raw}" is not a valid ISBN-13 (wrong check digit).')
+        return value
+    raise InvalidIsbn(f'"{raw}" is not an ISBN: expected 10 or 13 digits.')
+
+
+def to_isbn13(isbn):
+    """The ISBN-13 of a normalised ISBN-10 or ISBN-13."""
+    if len(isbn) == 13:
+        return isbn
+    body = '978' + isbn[:9]
+    return body + isbn13_check_digit(body)
+
+
+def isbn_key(raw):
+    """Normalised form of any stored ISBN value, for duplicate checks."""
+    try:
+        return to_isbn13(normalize_isbn(raw))
+    except InvalidIsbn:
+        return compact(raw)[:20] or None
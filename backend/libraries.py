@@ -0,0 +1,222 @@
+"""Several libraries (tenants) in one app.
+
+Books and authors belong to a library (`LibraryMixin` in
+backend.data_models). A visitor picks the library they work on at
+`/library`; it is kept in their session, and for the rest of the request
+(`g.library_id`) every ORM query only sees that library's rows and new
+rows join it. Indexes on books and authors lead with `library_id`, so one
+library's pages only ever read its own index ranges. CLI commands and
+background jobs choose no library and see all of them; the jobs that
+compare books with each other (similar books, "also liked", duplicate
+merges) keep to one library at a time.
+
+One database file per library: with `LIBRARY_DATABASE_DIR` set, every
+library but the main one keeps its books in a SQLite file of its own,
+`<dir>/library-<id>.db`, created with the current schema on first use. The
+configured database keeps the main library and the `library` table.
+`db.engine` and the session then stand for the current library's file, so
+nothing else needs to know (`LibrarySQLAlchemy`). At most
+`LIBRARY_ENGINE_CACHE_SIZE` of those engines are open at once, least
+recently used first out. A big library then never slows down a small one,
+and a library can be moved to another node by copying its file. Migrations
+only upgrade the configured database; the files of other libraries follow
+the models.
+
+Engine hooks (catalogue change tracking, change log, live updates) are
+installed with `on_every_engine()`, so library files get them too.
+"""
+
+import functools
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from flask import current_app, g, session
+from sqlalchemy import create_engine, select
+from sqlalchemy.exc import IntegrityError
+
+from backend.data_models import (db, Library, DEFAULT_LIBRARY_ID,
+                                 LIBRARY_ENGINES_KEY, utcnow)
+from backend.database import engine_options
+
+ENGINE_SETUP_KEY = 'engine_setup'
+LIBRARY_ID_KEY = 'library_id'
+LIBRARY_NAME_KEY = 'library_name'
+ENGINE_CACHE_SIZE = 16
+
+library = Library.__table__
+
+
+def library_tables():
+    """Tables kept in a library's own database file: all but `library`."""
+    return [table for table in db.metadata.sorted_tables
+            if table is not library]
+
+
+def on_every_engine(app, setup):
+    """Call `setup(engine)` for the app's database engine now, and for the
+    engine of every library file opened later."""
+    app.extensions.setdefault(ENGINE_SETUP_KEY, []).append(setup)
+    with app.app_context():
+        setup(db.primary_engine)
+
+
+class LibraryEngines:
+    """LRU of the open engines of the libraries kept in files of their
+    own (thread-safe)."""
+
+    def __init__(self, app, directory, size=ENGINE_CACHE_SIZE):
+        self.app = app
+        self.directory = directory
+        self.size = max(1, size)
+        self._engines = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._engines)
+
+    def path(self, library_id):
+        return os.path.join(self.directory, f'library-{library_id}.db')
+
+    def engine(self, library_id):
+        """The engine of the library's own database, or None for the main
+        library (and when no library is chosen)."""
+        if library_id is None or library_id == DEFAULT_LIBRARY_ID:
+            return None
+        with self._lock:
+            engine = self._engines.get(library_id)
+            if engine is not None:
+                self._engines.move_to_end(library_id)
+                return engine
+        # Opened outside the lock: creating a new file's schema takes a
+        # moment, and other libraries needn't wait for it
+        engine = self.open(library_id)
+        with self._lock:
+            existing = self._engines.get(library_id)
+            if existing is not None:
+                engine.dispose()
+                return existing
+            self._engines[library_id] = engine
+            while len(self._engines) > self.size:
+                _, evicted = self._engines.popitem(last=False)
+                # Connections still checked out close when returned
+                evicted.dispose()
+        return engine
+
+    def open(self, library_id):
+        os.makedirs(self.directory, exist_ok=True)
+        uri = f'sqlite:///{self.path(library_id)}'
+        engine = create_engine(uri, **engine_options(self.app.config, uri))
+        for setup in self.app.extensions.get(ENGINE_SETUP_KEY, ()):
+            setup(engine)
+        db.metadata.create_all(engine, tables=library_tables())
+        return engine
+
+    def dispose(self):
+        with self._lock:
+            engines, self._engines = self._engines, OrderedDict()
+        for engine in engines.values():
+            engine.dispose()
+
+
+@contextmanager
+def use_library(library_id):
+    """Work on `library_id` (None: no library, see every one) for the rest
+    of the block. Needs an app context; the caller takes care of sessions
+    bound to another library's database."""
+    previous = g.get('library_id')
+    g.library_id = library_id
+    try:
+        yield
+    finally:
+        g.library_id = previous
+
+
+def separate_files():
+    """Whether libraries are kept in files of their own."""
+    return LIBRARY_ENGINES_KEY in current_app.extensions
+
+
+def libraries():
+    """(id, name) of every library, the main one first."""
+    with db.primary_engine.connect() as conn:
+        return conn.execute(
+            select(library.c.id, library.c.name).order_by(library.c.id)).all()
+
+
+def each_database():
+    """Work on every database in turn, yielding the library chosen for it:
+    None for the configured database (every library it holds), then with
+    `LIBRARY_DATABASE_DIR` the id of each library with a file of its own.
+    The session is removed after each."""
+    library_ids = [None]
+    if separate_files():
+        library_ids += [library_id for library_id, _ in libraries()
+                        if library_id != DEFAULT_LIBRARY_ID]
+    for library_id in library_ids:
+        with use_library(library_id):
+            try:
+                yield library_id
+            finally:
+                db.session.remove()
+
+
+def for_each_database(command):
+    """Decorate a CLI command to run it once per database (see
+    `each_database`)."""
+    @functools.wraps(command)
+    def run(*args, **kwargs):
+        for _ in each_database():
+            command(*args, **kwargs)
+    return run
+
+
+def find_or_create_library(name):
+    """(id, name) of the library called `name`, created if there is none."""
+    query = select(library.c.id, library.c.name).where(library.c.name == name)
+    with db.primary_engine.begin() as conn:
+        row = conn.execute(query).first()
+        if row is not None:
+            return tuple(row)
+    try:
+        with db.primary_engine.begin() as conn:
+            conn.execute(library.insert().values(name=name,
+                                                 created_at=utcnow()))
+    except IntegrityError:
+        # created by someone else meanwhile
+        pass
+    with db.primary_engine.connect() as conn:
+        return tuple(conn.execute(query).first())
+
+
+def library_from_cookie(app, cookie_header):
+    """The library chosen in a session cookie, for requests the Flask app
+    doesn't handle itself (backend.asgi)."""
+    request = app.request_class({'HTTP_COOKIE': cookie_header or ''})
+    chosen = app.session_interface.open_session(app, request)
+    return (chosen or {}).get(LIBRARY_ID_KEY, DEFAULT_LIBRARY_ID)
+
+
+def init_libraries(app):
+    """Choose each request's library from the session, and set the
+    library files up when `LIBRARY_DATABASE_DIR` is set. Returns the
+    `LibraryEngines`, or None."""
+
+    @app.before_request
+    def choose_library():
+        g.library_id = session.get(LIBRARY_ID_KEY, DEFAULT_LIBRARY_ID)
+
+    @app.context_processor
+    def inject_library():
+        # Kept in the session, so the header costs no query
+        return {'library_name': session.get(LIBRARY_NAME_KEY)}
+
+    directory = app.config.get('LIBRARY_DATABASE_DIR')
+    if not directory:
+        return None
+    engines = LibraryEngines(app, directory,
+                             app.config.get('LIBRARY_ENGINE_CACHE_SIZE',
+                                            ENGINE_CACHE_SIZE))
+    app.extensions[LIBRARY_ENGINES_KEY] = engines
+    return engines
@@ -0,0 +1,155 @@
+"""Read-only row projections for the listing pages.
+
+The home, admin and recommendations pages only display books, so they
+select just the columns they show (`book_listing_select()`) and get plain
+`BookListing` named tuples back instead of `Book` entities: no identity
+map entries, no attribute instrumentation, no change tracking. Each author
+becomes one shared `AuthorRow`, so `book.author.name` keeps working in the
+templates.
+
+With `STREAM_LISTINGS` on, the rows are not collected at all:
+`stream_rows()` yields them straight from the cursor into a streamed
+template (see backend.streaming).
+
+Code that changes books (forms, bulk actions, the rating endpoints) keeps
+using the models.
+"""
+
+import sys
+from typing import NamedTuple, Optional
+
+from flask import current_app
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import and_, func, select
+
+from backend.data_models import db, Author, Book
+from backend.rating_buffer import current_buffer
+
+
+class AuthorRow:
+    """Author as shown in a listing: id and (interned) name."""
+    __slots__ = ('id', 'name')
+
+    def __init__(self, author_id, name):
+        self.id = author_id
+        self.name = sys.intern(name)
+
+
+class BookListing(NamedTuple):
+    """One book of a listing page."""
+    id: int
+    title: str
+    isbn: str
+    cover_url: Optional[str]
+    rating: Optional[int]
+    publication_year: Optional[int]
+    has_review: bool
+    author: Optional[AuthorRow]
+    # The review text itself, only selected where it is shown
+    ai_recommendation: Optional[str] = None
+
+
+class AuthorListing(NamedTuple):
+    """One author of the admin listing."""
+    id: int
+    name: str
+    birth_date: object
+    date_of_death: object
+
+
+# Books with a cached AI review
+REVIEWED = and_(Book.ai_recommendation.isnot(None),
+                Book.ai_recommendation != '')
+HAS_REVIEW = REVIEWED.label('has_review')
+
+BOOK_LISTING_COLUMNS = (Book.id, Book.title, Book.isbn, Book.cover_url,
+                        Book.rating, Book.publication_year, HAS_REVIEW,
+                        Book.author_id, Author.name)
+
+
+def book_listing_select(with_review=False):
+    """SELECT of the listing columns of books joined to their author, ready
+    for filters and ordering on `Book` and `Author`. Soft-deleted rows are
+    filtered like in any ORM query."""
+    columns = BOOK_LISTING_COLUMNS
+    if with_review:
+        columns += (Book.ai_recommendation,)
+    return select(*columns).outerjoin(Author, Book.author_id == Author.id)
+
+
+def iter_book_listings(rows):
+    """`BookListing`s from rows of `book_listing_select()`, one at a time,
+    with ratings still waiting in the rating buffer applied (like on loaded
+    `Book`s)."""
+    buffer = current_buffer()
+    pending = buffer.get if buffer is not None and len(buffer) else None
+    authors = {}
+    for row in rows:
+        (book_id, title, isbn, cover_url, rating, year, has_review,
+         author_id, author_name) = row[:9]
+        author = authors.get(author_id)
+        if author is None and author_name is not None:
+            author = authors[author_id] = AuthorRow(author_id, author_name)
+        if pending is not None:
+            rating = pending(book_id) or rating
+        yield BookListing(book_id, title, isbn, cover_url, rating, year,
+                          bool(has_review), author, *row[9:])
+
+
+def book_listings(rows):
+    return list(iter_book_listings(rows))
+
+
+def fetch_book_listings(statement):
+    return book_listings(db.session.execute(statement))
+
+
+def stream_rows(statement, rows=iter_book_listings):
+    """Generator over the listing tuples of `statement`, fetched
+    `STREAM_BATCH_SIZE` rows at a time (`yield_per`: a server-side cursor
+    on PostgreSQL), so memory stays flat however many rows match. The
+    query runs when iteration starts, e.g. while a streamed template
+    renders."""
+    result = db.session.execute(statement.execution_options(
+        yield_per=current_app.config['STREAM_BATCH_SIZE']))
+    try:
+        yield from rows(result)
+    finally:
+        result.close()
+
+
+def count_rows(statement):
+    """Number of rows `statement` returns."""
+    return db.session.execute(select(func.count()).select_from(
+        statement.order_by(None).subquery())).scalar()
+
+
+def author_listing_select():
+    return select(Author.id, Author.name, Author.birth_date,
+                  Author.date_of_death)
+
+
+def iter_author_listings(rows):
+    for row in rows:
+        yield AuthorListing(*row)
+
+
+def author_listings(rows):
+    return list(iter_author_listings(rows))
+
+
+class ProjectionPagination(Pagination):
+    """Flask-SQLAlchemy pagination over a projection SELECT; `rows` turns
+    the rows of one page into listing tuples. With `stream=True` the items
+    are a `stream_rows()` generator, fetched while the page renders."""
+
+    def _query_items(self):
+        statement = self._query_args['select'].limit(
+            self.per_page).offset(self._query_offset)
+        rows = self._query_args['rows']
+        if self._query_args.get('stream'):
+            return stream_rows(statement, rows)
+        return list(rows(db.session.execute(statement)))
+
+    def _query_count(self):
+        return count_rows(self._query_args['select'])
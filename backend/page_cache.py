@@ -0,0 +1,182 @@
+"""Conditional GET and fragment caching for the book detail page.
+
+Validators: a book page only changes when the book, its author, the
+author's list of books, its similar books (backend.similar_books), its
+"also liked" list (backend.also_liked) or the visiting reader's rating of
+it are written, and every such write sets a timestamp (see
+backend.data_models). `book_validators()` reads those
+timestamps and the author's book count in one small query and turns them
+into an `ETag` and a `Last-Modified` date. A browser that already has the
+page (`If-None-Match` / `If-Modified-Since`) gets a 304 without the book
+being loaded or the template rendered. The ETag also covers the template
+sources and the static asset manifest, so a deploy changes it too.
+
+Fragments: `FragmentCache` keeps rendered HTML blocks in a small
+in-process LRU, keyed by something that changes whenever the block's
+content does (e.g. the book id and `updated_at`), so entries never need
+invalidating; stale versions simply age out.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from flask import current_app, request, session
+from markupsafe import Markup
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+from werkzeug.http import is_resource_modified
+
+from backend.data_models import (db, AlsoLiked, Author, Book, ReaderRating,
+                                 SimilarBook)
+
+
+class FragmentCache:
+    """Thread-safe LRU of rendered HTML fragments."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_render(self, key, render):
+        """The fragment cached under `key`, or `render()`'s result (which
+        is cached). Rendering happens outside the lock."""
+        if self.max_entries <= 0:
+            return Markup(render())
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return html
+            self.misses += 1
+        html = Markup(render())
+        with self._lock:
+            self._entries[key] = html
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return html
+
+
+class PageCache:
+    """Per-app fragment cache and template versions."""
+
+    def __init__(self, app):
+        self.app = app
+        self.fragments = FragmentCache(app.config['FRAGMENT_CACHE_SIZE'])
+        self._versions = {}
+
+    def template_version(self, *names):
+        """Short hash of the given templates' sources and the asset
+        manifest. Cached, except in debug mode where templates reload."""
+        version = self._versions.get(names)
+        if version is None or self.app.debug:
+            env = self.app.jinja_env
+            digest = hashlib.sha256()
+            for name in names:
+                source = env.loader.get_source(env, name)[0]
+                digest.update(source.encode('utf-8'))
+            assets = self.app.extensions.get('assets')
+            if assets is not None:
+                digest.update(json.dumps(assets.manifest,
+                                         sort_keys=True).encode())
+            version = self._versions[names] = digest.hexdigest()[:12]
+        return version
+
+
+def list_stats(model, other_id, computed_at, book_id):
+    """Scalar subqueries over a precomputed list of other books (similar
+    books, also liked): when it was computed, when one of the listed books
+    last changed, and its length."""
+    other = aliased(Book)
+    rows = select(computed_at, other.updated_at) \
+        .join(other, other.id == other_id) \
+        .where(model.book_id == book_id).subquery()
+    return [select(aggregate).select_from(rows).scalar_subquery()
+            for aggregate in (func.max(rows.c[0]), func.max(rows.c[1]),
+                              func.count())]
+
+
+def book_validators(book_id, version, reader_id=None):
+    """(etag, last_modified) of a live book's detail page, or None when
+    there is no such book. `version` is the template version; `reader_id`
+    the reader whose own rating the page shows, if any."""
+    other = aliased(Book)
+    author_books = select(func.count(other.id)).where(
+        other.author_id == Book.author_id,
+        other.deleted_at.is_(None)).scalar_subquery()
+    # Soft-deleted books count: deleting one changes the author's list
+    author_books_changed = select(func.max(other.updated_at)).where(
+        other.author_id == Book.author_id).scalar_subquery()
+    lists = [
+        *list_stats(SimilarBook, SimilarBook.similar_id,
+                    SimilarBook.updated_at, book_id),
+        *list_stats(AlsoLiked, AlsoLiked.other_id, AlsoLiked.computed_at,
+                    book_id)]
+    own_rating = [
+        select(column).where(ReaderRating.reader_id == reader_id,
+                             ReaderRating.book_id == book_id)
+        .scalar_subquery()
+        for column in (ReaderRating.rating, ReaderRating.rated_at)]
+    row = db.session.execute(
+        select(Book.updated_at, Author.updated_at, author_books_changed,
+               author_books, *lists, *own_rating)
+        .outerjoin(Author, Author.id == Book.author_id)
+        .where(Book.id == book_id, Book.deleted_at.is_(None))
+        .execution_options(include_deleted=True)).first()
+    if row is None:
+        return None
+    (book_changed, author_changed, books_changed, book_count,
+     pairs_changed, similar_changed, similar_count,
+     liked_computed, liked_changed, liked_count,
+     rating, rated_at) = row
+    etag = hashlib.sha1(
+        f'{book_id}:{book_changed}:{author_changed}:{books_changed}:'
+        f'{book_count}:{pairs_changed}:{similar_changed}:{similar_count}:'
+        f'{liked_computed}:{liked_changed}:{liked_count}:'
+        f'{reader_id}:{rating}:{rated_at}:{version}'.encode()
+    ).hexdigest()[:20]
+    stamps = [t for t in (book_changed, author_changed, books_changed,
+                          pairs_changed, similar_changed, liked_computed,
+                          liked_changed, rated_at) if t]
+    return etag, (max(stamps) if stamps else None)
+
+
+def can_revalidate():
+    """Whether this request's page may be answered from the browser cache:
+    never while flash messages are waiting to be shown on it."""
+    return request.method in ('GET', 'HEAD') and '_flashes' not in session
+
+
+def not_modified(etag, last_modified):
+    return not is_resource_modified(request.environ, etag=etag,
+                                    last_modified=last_modified)
+
+
+def set_validators(response, etag, last_modified):
+    """Attach the validators; browsers must revalidate before reuse."""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def not_modified_response(etag, last_modified):
+    return set_validators(current_app.response_class(status=304), etag,
+                          last_modified)
+
+
+def init_page_cache(app):
+    cache = PageCache(app)
+    app.extensions['page_cache'] = cache
+    return cache
@@ -0,0 +1,117 @@
+"""Background purge of soft-deleted rows.
+
+Deletes in the app only set `deleted_at` (see `SoftDeleteMixin` in
+`backend.data_models`). This module physically removes tombstones once they
+are older than the undo window. Work is done in small batches, each in its
+own short transaction, with a pause between batches so the SQLite write lock
+is never held for long and regular requests can interleave.
+
+Run it once from the command line:
+
+    flask --app backend.app purge-deleted
+
+or let the server run it periodically (in one worker, see
+`backend.server.start_background_jobs`) by setting `PURGE_INTERVAL_SECONDS`.
+"""
+
+import threading
+import time
+from datetime import timedelta
+
+from backend.change_log import compact_change_log
+from backend.data_models import db, Author, Book, RatingSummary, utcnow
+from backend.libraries import each_database
+from backend.rating_stats import BOOK_SCOPE
+
+
+def purge_batch(model, cutoff, batch_size):
+    """Hard-delete up to `batch_size` tombstones of `model` older than
+    `cutoff`. Returns the number of rows removed."""
+    ids = [row[0] for row in db.session.query(model.id)
+           .execution_options(include_deleted=True)
+           .filter(model.deleted_at.isnot(None), model.deleted_at < cutoff)
+           .order_by(model.deleted_at)
+           .limit(batch_size).all()]
+    if not ids:
+        db.session.rollback()
+        return 0
+    # Authors cascade to their remaining books in the database (and books
+    # to their rating history); summary rows have no FK and go explicitly,
+    # the cascaded books' included
+    summaries = {model.__tablename__: ids}
+    if model is Author:
+        summaries[BOOK_SCOPE] = [row[0] for row in db.session.query(Book.id)
+                                 .execution_options(include_deleted=True)
+                                 .filter(Book.author_id.in_(ids))]
+    # tombstones_only: catalogue snapshots never hold these rows, so the
+    # DELETE doesn't force them to rebuild (see backend.catalogue)
+    model.query.execution_options(
+        include_deleted=True, tombstones_only=True).filter(
+        model.id.in_(ids)).delete(synchronize_session=False)
+    for scope, subject_ids in summaries.items():
+        if subject_ids:
+            RatingSummary.query.filter(
+                RatingSummary.scope == scope,
+                RatingSummary.subject_id.in_(subject_ids)).delete(
+                synchronize_session=False)
+    db.session.commit()
+    return len(ids)
+
+
+def purge_deleted(retention=None, batch_size=None, pause=None,
+                  max_batches=None):
+    """Remove tombstones older than `retention` seconds.
+
+    Must be called inside an app context. Arguments default to the
+    `SOFT_DELETE_RETENTION_SECONDS`, `PURGE_BATCH_SIZE` and
+    `PURGE_PAUSE_SECONDS` config values. Returns a dict with the number of
+    books and authors removed.
+    """
+    from flask import current_app
+    config = current_app.config
+    if retention is None:
+        retention = config['SOFT_DELETE_RETENTION_SECONDS']
+    if batch_size is None:
+        batch_size = config['PURGE_BATCH_SIZE']
+    if pause is None:
+        pause = config['PURGE_PAUSE_SECONDS']
+
+    cutoff = utcnow() - timedelta(seconds=retention)
+    purged = {'books': 0, 'authors': 0}
+    batches = 0
+    # Books before authors so the author cascade has little left to do
+    for key, model in (('books', Book), ('authors', Author)):
+        while max_batches is None or batches < max_batches:
+            removed = purge_batch(model, cutoff, batch_size)
+            purged[key] += removed
+            batches += 1
+            if removed < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+    return purged
+
+
+def start_purge_thread(app):
+    """Run `purge_deleted` (and `compact_change_log` when the change log
+    is on) every `PURGE_INTERVAL_SECONDS` in a daemon thread. Returns the
+    thread, or None when the interval is 0."""
+    interval = app.config.get('PURGE_INTERVAL_SECONDS', 0)
+    if not interval:
+        return None
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                with app.app_context():
+                    for _ in each_database():
+                        purge_deleted()
+                        if app.config.get('CHANGE_LOG'):
+                            compact_change_log()
+            except Exception as exc:
+                app.logger.warning('Purge of deleted rows failed: %s', exc)
+
+    thread = threading.Thread(target=loop, name='purge-deleted', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,175 @@
+"""Write coalescing for book ratings.
+
+The quick-rating modal on the home page tends to send bursts of rating
+changes, and committing each one costs an fsync on SQLite. The buffer keeps
+only the latest rating per book in memory and writes all of them with one
+`UPDATE book SET rating = CASE id ... END` statement, either every
+`RATING_BUFFER_FLUSH_INTERVAL` seconds or as soon as
+`RATING_BUFFER_MAX_PENDING` books are waiting (see
+`backend.rating_stats.set_ratings`). Pending values are flushed at
+interpreter exit.
+
+Reads see pending values right away: any `Book` loaded while a rating is
+buffered gets the buffered value (read-your-writes within this process).
+
+Ratings are kept per library (backend.libraries): each library is written
+in a transaction of its own, on its own database when it has one.
+"""
+
+import atexit
+import threading
+import weakref
+from collections import defaultdict
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm.attributes import set_committed_value
+
+from backend.data_models import (db, Book, DEFAULT_LIBRARY_ID,
+                                 current_library_id)
+from backend.libraries import use_library
+from backend.rating_stats import set_ratings
+
+# Every app's buffer, flushed at exit (weakly held, so an app that is no
+# longer used can go away with its buffer and engine)
+_buffers = weakref.WeakSet()
+
+
+def buffer_key(book_id, library_id=None):
+    """(library id, book id): book ids of libraries kept in files of their
+    own overlap."""
+    return (library_id or current_library_id() or DEFAULT_LIBRARY_ID,
+            book_id)
+
+
+class RatingWriteBuffer:
+    """Collects the latest rating per book and writes them in batches.
+    Books are those of the current library."""
+
+    def __init__(self, app, flush_interval=2.0, max_pending=100):
+        self.app = app
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+
+    def add(self, book_id, rating):
+        """Buffer a rating; flushes immediately once the buffer is full."""
+        with self._lock:
+            self._pending[buffer_key(book_id)] = rating
+            full = len(self._pending) >= self.max_pending
+            if not full:
+                self._start_timer()
+        if full:
+            self.flush()
+
+    def _start_timer(self):
+        # Called with self._lock held
+        if self._timer is None and self.flush_interval:
+            self._timer = threading.Timer(self.flush_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def get(self, book_id, library_id=None):
+        """Return the buffered rating for a book, or None."""
+        return self._pending.get(buffer_key(book_id, library_id))
+
+    def discard(self, *book_ids):
+        """Drop buffered ratings that a direct write is about to replace."""
+        with self._lock:
+            for book_id in book_ids:
+                self._pending.pop(buffer_key(book_id), None)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def flush(self):
+        """Write every buffered rating in one transaction.
+
+        Returns the number of books written. Ratings for books that no
+        longer exist (or were deleted meanwhile) are silently dropped.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            try:
+                self._write(batch)
+            except Exception:
+                # Put the batch back unless newer values arrived meanwhile,
+                # and try again after another interval
+                with self._lock:
+                    for key, rating in batch.items():
+                        self._pending.setdefault(key, rating)
+                    self._start_timer()
+                raise
+            return len(batch)
+
+    def _write(self, batch):
+        # Use a connection of our own so flushing from a request never
+        # commits that request's session as a side effect. set_ratings()
+        # issues the single UPDATE ... CASE and records the rating history.
+        if has_app_context() and current_app._get_current_object() is self.app:
+            self._write_libraries(batch)
+        else:
+            with self.app.app_context():
+                self._write_libraries(batch)
+
+    def _write_libraries(self, batch):
+        by_library = defaultdict(dict)
+        for (library_id, book_id), rating in batch.items():
+            by_library[library_id][book_id] = rating
+        for library_id, ratings in sorted(by_library.items()):
+            with use_library(library_id), db.engine.begin() as conn:
+                set_ratings(conn, ratings)
+
+
+def init_rating_buffer(app):
+    """Create the app's rating buffer and make sure it is flushed at exit."""
+    buffer = RatingWriteBuffer(
+        app,
+        flush_interval=app.config['RATING_BUFFER_FLUSH_INTERVAL'],
+        max_pending=app.config['RATING_BUFFER_MAX_PENDING'])
+    app.extensions['rating_buffer'] = buffer
+    _buffers.add(buffer)
+    return buffer
+
+
+def flush_quietly(buffer):
+    """Flush, logging rather than raising a failure (at exit, on shutdown)."""
+    try:
+        buffer.flush()
+    except Exception:
+        buffer.app.logger.exception('Could not flush buffered ratings')
+
+
+@atexit.register
+def flush_all():
+    for buffer in list(_buffers):
+        flush_quietly(buffer)
+
+
+def current_buffer():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('rating_buffer')
+
+
+@event.listens_for(Book, 'load')
+@event.listens_for(Book, 'refresh')
+def apply_pending_rating(target, context, attrs=None):
+    """Show buffered ratings on freshly loaded books without marking them
+    dirty, so a later commit of the session doesn't write them again."""
+    buffer = current_buffer()
+    if buffer is None or not len(buffer):
+        return
+    # Unless it wasn't loaded, the book's own library
+    rating = buffer.get(target.id, target.__dict__.get('library_id'))
+    if rating is not None:
+        set_committed_value(target, 'rating', rating)
@@ -0,0 +1,228 @@
+"""Rating history and incrementally maintained rating aggregates.
+
+Every rating write goes through `set_ratings()`, which in one transaction
+updates `book.rating`, appends a `rating_event` row per book and applies the
+difference to the `rating_summary` rows of the book and of its author. Pages
+then read averages and histograms from a single summary row instead of
+scanning the book table.
+
+Changes that move whole books in or out of an author's aggregate (delete,
+undo, reassign) call `refresh_author_summaries()`, which recomputes just the
+affected authors with one grouped query.
+
+The functions take a SQLAlchemy Connection, so they can run inside the
+request's session transaction (`db.session.connection()`) or on a
+connection of their own (the rating buffer).
+"""
+
+from collections import defaultdict
+
+from sqlalchemy import case, func, select
+
+from backend.change_log import BOOK, UPDATE, record_changes
+from backend.data_models import (db, Book, RatingEvent, RatingSummary,
+                                 utcnow)
+
+BOOK_SCOPE = 'book'
+AUTHOR_SCOPE = 'author'
+RATINGS = range(1, 11)
+
+
+def empty_delta():
+    return {'count': 0, 'sum': 0, 'hist': defaultdict(int)}
+
+
+def set_ratings(conn, ratings, when=None):
+    """Write `ratings` ({book_id: rating or None}) and record them.
+
+    Books that don't exist, are deleted or already have that rating are
+    skipped, so only real changes become events. Returns the number of
+    books updated. Raises ValueError for a rating outside `RATINGS`.
+    """
+    for rating in ratings.values():
+        if rating is not None and rating not in RATINGS:
+            raise ValueError(f'Rating must be between 1 and 10, not {rating!r}.')
+    if not ratings:
+        return 0
+    when = when or utcnow()
+    book = Book.__table__
+    current = [
+        row for row in conn.execute(
+            select(book.c.id, book.c.author_id, book.c.rating)
+            .where(book.c.id.in_(list(ratings)),
+                   book.c.deleted_at.is_(None)))
+        if row.rating != ratings[row.id]]
+    if not current:
+        return 0
+
+    conn.execute(
+        book.update()
+        .where(book.c.id.in_([row.id for row in current]))
+        .values(rating=case(ratings, value=book.c.id)))
+    record_changes(conn, BOOK, UPDATE, [row.id for row in current], when)
+
+    events = []
+    book_deltas = defaultdict(empty_delta)
+    author_deltas = defaultdict(empty_delta)
+    for row in current:
+        old, new = row.rating, ratings[row.id]
+        if new is not None:
+            events.append({'book_id': row.id, 'author_id': row.author_id,
+                           'rating': new, 'previous_rating': old,
+                           'created_at': when})
+            # the book summary counts every rating event
+            delta = book_deltas[row.id]
+            delta['count'] += 1
+            delta['sum'] += new
+            delta['hist'][new] += 1
+        # the author summary tracks current ratings: swap old for new
+        delta = author_deltas[row.author_id]
+        if old is not None:
+            delta['count'] -= 1
+            delta['sum'] -= old
+            delta['hist'][old] -= 1
+        if new is not None:
+            delta['count'] += 1
+            delta['sum'] += new
+            delta['hist'][new] += 1
+
+    if events:
+        conn.execute(RatingEvent.__table__.insert(), events)
+    for book_id, delta in book_deltas.items():
+        apply_delta(conn, BOOK_SCOPE, book_id, delta, when)
+    for author_id, delta in author_deltas.items():
+        apply_delta(conn, AUTHOR_SCOPE, author_id, delta, when)
+    return len(current)
+
+
+def apply_delta(conn, scope, subject_id, delta, when):
+    """Add `delta` to a summary row, creating the row if needed."""
+    summary = RatingSummary.__table__
+    c = summary.c
+    values = {
+        'rating_count': c.rating_count + delta['count'],
+        'rating_sum': c.rating_sum + delta['sum'],
+        'last_rated_at': when,
+    }
+    for value, diff in delta['hist'].items():
+        if diff:
+            values[f'hist_{value}'] = c[f'hist_{value}'] + diff
+    result = conn.execute(
+        summary.update()
+        .where(c.scope == scope, c.subject_id == subject_id)
+        .values(values))
+    if result.rowcount == 0:
+        row = {'scope': scope, 'subject_id': subject_id,
+               'rating_count': delta['count'], 'rating_sum': delta['sum'],
+               'last_rated_at': when}
+        row.update({f'hist_{value}': diff
+                    for value, diff in delta['hist'].items()})
+        conn.execute(summary.insert().values(row))
+
+
+def write_summaries(conn, scope, subject_ids, counts):
+    """Replace the summary rows of `subject_ids` with histograms from
+    `counts` ({subject_id: {rating: count}}), keeping `last_rated_at`."""
+    summary = RatingSummary.__table__
+    c = summary.c
+    last_rated = dict(conn.execute(
+        select(c.subject_id, c.last_rated_at)
+        .where(c.scope == scope, c.subject_id.in_(subject_ids))).all())
+    conn.execute(summary.delete().where(
+        c.scope == scope, c.subject_id.in_(subject_ids)))
+    rows = []
+    for subject_id in subject_ids:
+        hist = counts.get(subject_id, {})
+        row = {'scope': scope, 'subject_id': subject_id,
+               'rating_count': sum(hist.values()),
+               'rating_sum': sum(v * n for v, n in hist.items()),
+               'last_rated_at': last_rated.get(subject_id)}
+        row.update({f'hist_{value}': hist.get(value, 0) for value in RATINGS})
+        rows.append(row)
+    if rows:
+        conn.execute(summary.insert(), rows)
+
+
+def refresh_author_summaries(conn, author_ids):
+    """Recompute the author summaries of `author_ids` from current book
+    ratings (one grouped query over those authors' books)."""
+    author_ids = sorted({a for a in author_ids if a is not None})
+    if not author_ids:
+        return
+    book = Book.__table__
+    counts = defaultdict(dict)
+    for author_id, rating, n in conn.execute(
+            select(book.c.author_id, book.c.rating, func.count())
+            .where(book.c.author_id.in_(author_ids),
+                   book.c.rating.isnot(None),
+                   book.c.deleted_at.is_(None))
+            .group_by(book.c.author_id, book.c.rating)):
+        counts[author_id][rating] = n
+    write_summaries(conn, AUTHOR_SCOPE, author_ids, counts)
+
+
+def refresh_book_summaries(conn, book_ids):
+    """Recompute the book summaries of `book_ids` from their rating
+    history (e.g. after events were moved to another book)."""
+    book_ids = sorted(set(book_ids))
+    if not book_ids:
+        return
+    event = RatingEvent.__table__
+    counts = defaultdict(dict)
+    for book_id, rating, n in conn.execute(
+            select(event.c.book_id, event.c.rating, func.count())
+            .where(event.c.book_id.in_(book_ids))
+            .group_by(event.c.book_id, event.c.rating)):
+        counts[book_id][rating] = n
+    write_summaries(conn, BOOK_SCOPE, book_ids, counts)
+
+
+def rebuild_rating_stats(conn):
+    """Full rebuild, for existing databases and repairs.
+
+    Rated books without any history get one event for their current rating,
+    then every summary is recomputed. Returns (events_added, summaries).
+    """
+    book = Book.__table__
+    event = RatingEvent.__table__
+    missing = (
+        select(book.c.id, book.c.author_id, book.c.rating,
+               db.literal(utcnow()))
+        .where(book.c.rating.isnot(None),
+               ~select(event.c.id).where(
+                   event.c.book_id == book.c.id).exists()))
+    # Counted up front: drivers needn't report a rowcount for INSERT ... SELECT
+    # (psycopg returns -1)
+    added = conn.execute(
+        select(func.count()).select_from(missing.subquery())).scalar()
+    if added:
+        conn.execute(event.insert().from_select(
+            ['book_id', 'author_id', 'rating', 'created_at'], missing))
+
+    conn.execute(RatingSummary.__table__.delete())
+    book_counts = defaultdict(dict)
+    for book_id, rating, n in conn.execute(
+            select(event.c.book_id, event.c.rating, func.count())
+            .group_by(event.c.book_id, event.c.rating)):
+        book_counts[book_id][rating] = n
+    write_summaries(conn, BOOK_SCOPE, sorted(book_counts), book_counts)
+    author_ids = [a for (a,) in conn.execute(
+        select(book.c.author_id).where(book.c.deleted_at.is_(None))
+        .distinct())]
+    refresh_author_summaries(conn, author_ids)
+    return added, len(book_counts) + len(author_ids)
+
+
+def author_summary(author_id):
+    """The author's rating summary row (or None): one primary key lookup."""
+    return db.session.get(RatingSummary, (AUTHOR_SCOPE, author_id))
+
+
+def recent_ratings(author_id, limit=5):
+    """Latest rating events for the author's live books, newest first."""
+    return (RatingEvent.query
+            .join(Book, Book.id == RatingEvent.book_id)
+            .filter(RatingEvent.author_id == author_id,
+                    Book.author_id == author_id)
+            .order_by(RatingEvent.created_at.desc(), RatingEvent.id.desc())
+            .limit(limit).all())
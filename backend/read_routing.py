@@ -0,0 +1,112 @@
+"""Separate read and write engines.
+
+When a read replica is configured, GET and HEAD requests run their queries
+on the replica engine (`app.extensions['read_replica']`), while everything
+that writes (session flushes, INSERT/UPDATE/DELETE statements) and every
+request with another method uses the primary engine. Code outside a
+request (CLI commands, the purge thread, the rating buffer) always uses
+the primary.
+
+The replica is either
+
+ - `READ_REPLICA_URI`: any database URI, e.g. a streaming replica, or
+ - `SQLITE_READ_ONLY_READS`: a second engine on the primary SQLite file,
+   opened with `mode=ro` and `PRAGMA query_only`, so page reads can never
+   take the write lock.
+
+Read-your-writes: after a request that may have written (POST and
+friends), the user's session is pinned to the primary for
+`READ_YOUR_WRITES_SECONDS`, so the page they are redirected to doesn't come
+from a replica that hasn't caught up yet.
+
+With libraries kept in files of their own (`LIBRARY_DATABASE_DIR`, see
+backend.libraries) there is no replica: it would only hold the main
+library.
+"""
+
+import time
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+
+from backend.database import engine_options
+
+READ_METHODS = frozenset(('GET', 'HEAD'))
+WRITE_METHODS = frozenset(('POST', 'PUT', 'PATCH', 'DELETE'))
+PRIMARY_UNTIL_KEY = 'db_primary_until'
+
+
+class RoutingSession(Session):
+    """Session that sends reads to the replica while `g.read_replica` is
+    set for the current request."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and reads_from_replica() and not self._flushing \
+                and not getattr(clause, 'is_dml', False):
+            engine = current_app.extensions.get('read_replica')
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind,
+                                **kwargs)
+
+
+def reads_from_replica():
+    return has_request_context() and g.get('read_replica', False)
+
+
+def read_only_sqlite_uri(uri):
+    """URI opening the same SQLite file read-only, or None when `uri` is
+    not a file-based SQLite database."""
+    url = make_url(uri)
+    if url.get_backend_name() != 'sqlite' or url.database in (
+            None, '', ':memory:'):
+        return None
+    return f'sqlite:///file:{url.database}?mode=ro&uri=true'
+
+
+def replica_uri(config):
+    """The configured replica URI, or None."""
+    if config.get('LIBRARY_DATABASE_DIR'):
+        return None
+    uri = config.get('READ_REPLICA_URI')
+    if not uri and config.get('SQLITE_READ_ONLY_READS'):
+        uri = read_only_sqlite_uri(config['SQLALCHEMY_DATABASE_URI'])
+    return uri or None
+
+
+def set_query_only(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA query_only=ON')
+    cursor.close()
+
+
+def init_read_routing(app):
+    """Create the replica engine and install the request hooks that pick
+    the engine. Does nothing when no replica is configured.
+
+    The replica is deliberately not a Flask-SQLAlchemy bind: it holds no
+    tables of its own, and `db.create_all()` must never touch it.
+    """
+    uri = replica_uri(app.config)
+    if uri is None:
+        return None
+    replica = create_engine(uri, **engine_options(app.config, uri))
+    if replica.dialect.name == 'sqlite':
+        event.listen(replica, 'connect', set_query_only)
+    app.extensions['read_replica'] = replica
+
+    @app.before_request
+    def choose_read_engine():
+        g.read_replica = (request.method in READ_METHODS
+                          and session.get(PRIMARY_UNTIL_KEY, 0) <= time.time())
+
+    @app.after_request
+    def pin_writer_to_primary(response):
+        window = app.config['READ_YOUR_WRITES_SECONDS']
+        if request.method in WRITE_METHODS and window > 0:
+            session[PRIMARY_UNTIL_KEY] = time.time() + window
+        return response
+
+    return replica
@@ -0,0 +1,99 @@
+"""Keyword search for the home page, per database dialect.
+
+ - SQLite (and anything else): case-insensitive substring match with
+   `LIKE '%q%'`, a full scan of the (small) tables.
+ - PostgreSQL, `SEARCH_MODE=auto` or `trigram`: the same `ILIKE '%q%'`
+   predicate, so results are identical, but served by GIN `pg_trgm`
+   indexes on book title, ISBN and author name instead of a scan (when
+   the server has the pg_trgm extension; without it the query is the
+   same, just unindexed).
+ - PostgreSQL, `SEARCH_MODE=fulltext`: word search. Every word of the
+   query must start a word of the title or author name
+   (`to_tsvector @@ 'word:*'`), served by GIN expression indexes. ISBNs
+   still match as substrings.
+
+The indexes are declared on the models with `ddl_if(dialect='postgresql')`
+(and created by a migration for existing databases), so SQLite schemas
+are unchanged.
+
+The author picker looks names up by prefix instead (`author_prefix_filter`):
+a range scan of a case-insensitive B-tree index on both dialects.
+"""
+
+import re
+
+from flask import current_app
+from sqlalchemy import and_, func, literal_column, or_
+
+from backend.data_models import db, Author, Book, TSVECTOR_CONFIG
+
+SEARCH_MODES = ('auto', 'like', 'trigram', 'fulltext')
+# Sorts after any character a name can continue with
+MAX_CHAR = '\U0010ffff'
+
+
+def search_mode():
+    """The search implementation used for the current database."""
+    mode = current_app.config.get('SEARCH_MODE', 'auto')
+    if mode not in SEARCH_MODES:
+        raise ValueError(f'Unknown SEARCH_MODE {mode!r}')
+    if db.engine.dialect.name != 'postgresql':
+        return 'like'
+    return 'trigram' if mode == 'auto' else mode
+
+
+def prefix_tsquery(q):
+    """`to_tsquery` matching every word of `q` as a prefix, or None when
+    `q` has no words. Only word characters reach the query, so user input
+    can never be a tsquery syntax error."""
+    words = re.findall(r'\w+', q.lower())
+    if not words:
+        return None
+    return func.to_tsquery(literal_column(TSVECTOR_CONFIG),
+                           ' & '.join(f'{word}:*' for word in words))
+
+
+def matches_words(column, q):
+    tsquery = prefix_tsquery(q)
+    if tsquery is None:
+        return db.false()
+    # Same expression as the GIN index, or the planner won't use it
+    return func.to_tsvector(literal_column(TSVECTOR_CONFIG),
+                            column).op('@@')(tsquery)
+
+
+def book_search_filter(q):
+    """Condition for books matching `q`; the query must join Author."""
+    if search_mode() == 'fulltext':
+        return or_(matches_words(Book.title, q),
+                   matches_words(Author.name, q),
+                   Book.isbn.ilike(f"%{q}%"))
+    return or_(Book.title.ilike(f"%{q}%"), Book.isbn.ilike(f"%{q}%"),
+               Author.name.ilike(f"%{q}%"))
+
+
+def author_search_filter(q):
+    """Condition for authors whose name matches `q`."""
+    if search_mode() == 'fulltext':
+        return matches_words(Author.name, q)
+    return Author.name.ilike(f"%{q}%")
+
+
+def author_name_key():
+    """Case-insensitive form of `Author.name`, the expression of the
+    per-dialect prefix index (see backend.data_models): ASCII case folding
+    on SQLite, `lower()` compared byte-wise on PostgreSQL."""
+    if db.engine.dialect.name == 'postgresql':
+        return func.lower(Author.name).collate('C')
+    return Author.name.collate('NOCASE')
+
+
+def author_prefix_filter(prefix):
+    """Condition for authors whose name starts with `prefix`, ignoring
+    case. Written as a range rather than LIKE so the index is used with
+    bound parameters and any characters in `prefix` are literal."""
+    low, high = prefix, prefix + MAX_CHAR
+    if db.engine.dialect.name == 'postgresql':
+        low, high = func.lower(low), func.lower(high)
+    key = author_name_key()
+    return and_(key >= low, key < high)
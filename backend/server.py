@@ -0,0 +1,445 @@
+"""Pre-forking production server for BookAlchemy.
+
+`app.run()` is Flask's development server: one process, the reloader and
+the debugger. This launcher is the pure-Python alternative to gunicorn (see
+`gunicorn.conf.py`): a master process binds the listening socket once and
+forks `--workers` processes that accept from it, each answering requests on
+a pool of `--threads` threads.
+
+    python -m backend.server --bind 0.0.0.0:5002 --workers 4 --threads 8
+
+Signals sent to the master:
+
+ - HUP: graceful reload. A new set of workers is started (importing the
+   application code again, unless `--preload` is used) and the old workers
+   stop accepting, finish their in-flight requests and exit.
+ - TERM / INT: graceful shutdown, same drain as above.
+
+Workers that die unexpectedly are replaced. Each worker drops the database
+connections it may have inherited from the master (`prepare_worker`), so
+pooled SQLite connections are never shared between processes.
+
+The periodic jobs (the purge and "also liked" threads) run in one worker
+only, started after the fork (`start_background_jobs`): never in the master,
+which would keep them away from the workers (and fork with them running).
+
+Needs `os.fork` (Linux, macOS); elsewhere it serves from a single process.
+"""
+
+import argparse
+import os
+import tempfile
+import zlib
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+try:
+    import fcntl
+except ImportError:  # Windows: no fork either, so a single process
+    fcntl = None
+
+DEFAULT_BIND = '0.0.0.0:5002'
+RESPAWN_DELAY = 1.0
+
+# Set once this worker was told to stop
+stopping = threading.Event()
+
+
+def default_workers():
+    """`WEB_CONCURRENCY` or the usual 2 x cores + 1."""
+    return int(os.environ.get('WEB_CONCURRENCY', (os.cpu_count() or 1) * 2 + 1))
+
+
+def default_threads():
+    return int(os.environ.get('WEB_THREADS', 4))
+
+
+def log(message):
+    # one write per line, so lines from concurrent workers don't interleave
+    try:
+        sys.stderr.write(f'[server {os.getpid()}] {message}\n')
+        sys.stderr.flush()
+    except (OSError, ValueError):
+        # stderr went away with whatever was reading it
+        pass
+
+
+def dispose_engines(app):
+    """Forget the pooled connections inherited from the parent process.
+
+    `close=False` leaves the parent's connections open (closing a SQLite
+    handle from the child would pull it out from under the parent); the
+    worker simply starts with empty pools and opens its own connections.
+    """
+    from backend.data_models import db
+    with app.app_context():
+        engines = list(db.engines.values())
+    if 'read_replica' in app.extensions:
+        engines.append(app.extensions['read_replica'])
+    for engine in engines:
+        engine.dispose(close=False)
+
+
+def enable_wal(app):
+    """Switch file-based SQLite databases to write-ahead logging, so
+    readers in one worker aren't blocked while another worker writes. The
+    setting is stored in the database file; other backends are left alone."""
+    from backend.data_models import db
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name != 'sqlite' or engine.url.database in (
+                None, '', ':memory:'):
+            return
+        with engine.connect() as conn:
+            conn.exec_driver_sql('PRAGMA journal_mode=WAL')
+
+
+def background_lock_file(app):
+    """`BACKGROUND_LOCK_FILE`, or a file in the temp directory named after
+    the database, so separate deployments on one host don't share it."""
+    path = app.config.get('BACKGROUND_LOCK_FILE')
+    if path:
+        return path
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    return os.path.join(tempfile.gettempdir(),
+                        f'bookalchemy-{zlib.crc32(uri.encode()):08x}.lock')
+
+
+def start_background_jobs(app):
+    """Start the periodic jobs (`PURGE_INTERVAL_SECONDS`,
+    `ALSO_LIKED_INTERVAL_SECONDS`) in exactly one of the server's processes.
+
+    Every worker calls this after the fork. Each one waits in a daemon
+    thread for an exclusive lock on `background_lock_file()`, which the
+    process running the jobs holds until it exits; a waiting worker then
+    takes over (a worker that died, or the old workers of a reload). Returns
+    the waiting thread, or None when there is nothing to run.
+    """
+    config = app.config
+    if not (config.get('PURGE_INTERVAL_SECONDS')
+            or config.get('ALSO_LIKED_INTERVAL_SECONDS')):
+        return None
+    # Once per process (an app inherited from a preloading master has the
+    # master's pid here)
+    if app.extensions.get('background_jobs') == os.getpid():
+        return None
+    app.extensions['background_jobs'] = os.getpid()
+    thread = threading.Thread(target=run_background_jobs, args=(app,),
+                              name='background-jobs', daemon=True)
+    thread.start()
+    return thread
+
+
+def run_background_jobs(app):
+    from backend.also_liked import start_also_liked_thread
+    from backend.purge import start_purge_thread
+    if fcntl is not None:
+        lock = open(background_lock_file(app), 'a')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if stopping.is_set():
+            # leave the jobs to the workers that stay
+            lock.close()
+            return
+        # held (the file open) for the rest of the process
+        app.extensions['background_jobs_lock'] = lock
+    log('Running the background jobs')
+    start_purge_thread(app)
+    start_also_liked_thread(app)
+
+
+def prepare_worker(app):
+    """Per-worker setup, run in each worker before it serves requests."""
+    dispose_engines(app)
+    enable_wal(app)
+    start_background_jobs(app)
+
+
+def flush_rating_buffer(app):
+    buffer = app.extensions.get('rating_buffer')
+    if buffer is not None:
+        from backend.rating_buffer import flush_quietly
+        flush_quietly(buffer)
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug server answering requests on a fixed pool of threads.
+
+    A connection is only accepted once a thread is free, so a busy worker
+    leaves new connections in the shared listen queue for its siblings.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads, fd=None, handler=None):
+        # BaseWSGIServer calls server_close() on its own placeholder socket
+        # when given an fd, so the pool only exists once it's set up
+        self.pool = None
+        super().__init__(host, port, app, handler=handler, fd=fd)
+        self.pool = ThreadPoolExecutor(max_workers=threads,
+                                       thread_name_prefix='request')
+        self.slots = threading.BoundedSemaphore(threads)
+
+    def verify_request(self, request, client_address):
+        self.slots.acquire()
+        return True
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.handle_in_thread, request, client_address)
+
+    def handle_in_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+    def server_close(self):
+        # Wait for the requests in flight before closing
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+        super().server_close()
+
+
+def bind_socket(bind, backlog=2048):
+    """Create the listening socket shared by all workers."""
+    host, _, port = bind.rpartition(':')
+    host = host.strip('[]') or '0.0.0.0'
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, int(port)))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def build_app(config_overrides=None):
+    from backend.app import create_app
+    return create_app(config_overrides)
+
+
+def watch_parent(server, parent_pid, interval=1.0):
+    """Stop the worker if its master goes away (it was killed, say), instead
+    of serving on as an orphan nobody will ever stop."""
+    while os.getppid() == parent_pid:
+        time.sleep(interval)
+    log('Master is gone; stopping worker')
+    server.shutdown()
+
+
+def serve_worker(sock, app, threads, quiet=False, parent_pid=None):
+    """Run one worker until it receives SIGTERM."""
+    handler = QuietRequestHandler if quiet else None
+    host, port = sock.getsockname()[:2]
+    server = PooledWSGIServer(host, port, app, threads,
+                              fd=sock.fileno(), handler=handler)
+
+    def stop(signum, frame):
+        stopping.set()
+        # shutdown() waits for serve_forever() to return, so it can't run
+        # on the thread that is inside serve_forever()
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    if parent_pid is not None:
+        threading.Thread(target=watch_parent, args=(server, parent_pid),
+                         name='watch-master', daemon=True).start()
+    server.serve_forever()
+    flush_rating_buffer(app)
+
+
+class Master:
+    """Forks and supervises the worker processes."""
+
+    def __init__(self, bind=DEFAULT_BIND, workers=None, threads=None,
+                 preload=False, graceful_timeout=30.0, config_overrides=None,
+                 quiet=False):
+        self.bind = bind
+        self.num_workers = workers or default_workers()
+        self.threads = threads or default_threads()
+        self.preload = preload
+        self.graceful_timeout = graceful_timeout
+        self.config_overrides = config_overrides
+        self.quiet = quiet
+        self.app = None
+        self.sock = None
+        self.workers = {}        # pid -> start time
+        self.retiring = {}       # pid -> kill deadline
+        self.signals = []
+        self.stopping = False
+
+    def run(self):
+        self.sock = bind_socket(self.bind)
+        host, port = self.sock.getsockname()[:2]
+        log(f'Listening on http://{host}:{port} '
+            f'({self.num_workers} workers x {self.threads} threads)')
+        if self.preload:
+            self.app = build_app(self.config_overrides)
+        if not hasattr(os, 'fork'):
+            log('os.fork is not available; serving from a single process')
+            app = self.app or build_app(self.config_overrides)
+            prepare_worker(app)
+            serve_worker(self.sock, app, self.threads, self.quiet)
+            return 0
+
+        self.wakeup_r, self.wakeup_w = os.pipe()
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT,
+                       signal.SIGCHLD):
+            signal.signal(signum, self.on_signal)
+        self.spawn_generation()
+        while self.workers or self.retiring:
+            self.wait_for_event(1.0)
+            self.handle_signals()
+            self.reap()
+            self.kill_overdue()
+        self.sock.close()
+        log('Shut down')
+        return 0
+
+    def on_signal(self, signum, frame):
+        self.signals.append(signum)
+        os.write(self.wakeup_w, b'.')
+
+    def wait_for_event(self, timeout):
+        try:
+            ready, _, _ = select.select([self.wakeup_r], [], [], timeout)
+        except InterruptedError:
+            return
+        if ready:
+            os.read(self.wakeup_r, 1024)
+
+    def handle_signals(self):
+        while self.signals:
+            signum = self.signals.pop(0)
+            if signum == signal.SIGHUP and not self.stopping:
+                log('Reloading workers')
+                old = list(self.workers)
+                self.spawn_generation()
+                self.retire(old)
+            elif signum in (signal.SIGTERM, signal.SIGINT) \
+                    and not self.stopping:
+                log('Shutting down gracefully')
+                self.stopping = True
+                self.retire(list(self.workers))
+
+    def spawn_generation(self):
+        for _ in range(self.num_workers):
+            self.spawn_worker()
+
+    def spawn_worker(self):
+        master_pid = os.getpid()
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = time.monotonic()
+            return pid
+        # In the child: never return into the master's loop
+        status = 0
+        try:
+            for signum in (signal.SIGHUP, signal.SIGCHLD):
+                signal.signal(signum, signal.SIG_DFL)
+            # The master turns Ctrl-C into a graceful TERM for everyone
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            os.close(self.wakeup_r)
+            os.close(self.wakeup_w)
+            app = self.app or build_app(self.config_overrides)
+            prepare_worker(app)
+            log('Booting worker')
+            serve_worker(self.sock, app, self.threads, self.quiet,
+                         parent_pid=master_pid)
+        except BaseException as exc:
+            log(f'Worker failed: {exc!r}')
+            status = 1
+        finally:
+            os._exit(status)
+
+    def retire(self, pids):
+        deadline = time.monotonic() + self.graceful_timeout
+        for pid in pids:
+            self.workers.pop(pid, None)
+            self.retiring[pid] = deadline
+            self.send(pid, signal.SIGTERM)
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            if self.retiring.pop(pid, None) is not None:
+                continue
+            started = self.workers.pop(pid, None)
+            if started is not None and not self.stopping:
+                log(f'Worker {pid} exited unexpectedly '
+                    f'(status {status}); starting a new one')
+                if time.monotonic() - started < RESPAWN_DELAY:
+                    # don't spin on a worker that fails while booting
+                    time.sleep(RESPAWN_DELAY)
+                self.spawn_worker()
+
+    def kill_overdue(self):
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if now > deadline:
+                log(f'Worker {pid} did not stop in time; killing it')
+                self.send(pid, signal.SIGKILL)
+                self.retiring[pid] = now + self.graceful_timeout
+
+    @staticmethod
+    def send(pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Serve BookAlchemy with pre-forked worker processes.')
+    parser.add_argument('--bind', default=os.environ.get('WEB_BIND',
+                                                         DEFAULT_BIND),
+                        help='HOST:PORT to listen on (default %(default)s)')
+    parser.add_argument('--workers', type=int, default=default_workers(),
+                        help='Worker processes (default: WEB_CONCURRENCY or '
+                             '2 x cores + 1)')
+    parser.add_argument('--threads', type=int, default=default_threads(),
+                        help='Request threads per worker (default: '
+                             'WEB_THREADS or 4)')
+    parser.add_argument('--preload', action='store_true',
+                        help='Build the app once in the master before forking '
+                             '(faster worker start, but HUP then does not '
+                             'pick up code changes)')
+    parser.add_argument('--graceful-timeout', type=float, default=30.0,
+                        help='Seconds a stopping worker may spend on '
+                             'in-flight requests')
+    parser.add_argument('--db-uri', default=None,
+                        help='Override SQLALCHEMY_DATABASE_URI')
+    parser.add_argument('--quiet', action='store_true',
+                        help='Do not log every request')
+    args = parser.parse_args(argv)
+    overrides = ({'SQLALCHEMY_DATABASE_URI': args.db_uri}
+                 if args.db_uri else None)
+    master = Master(bind=args.bind, workers=args.workers,
+                    threads=args.threads, preload=args.preload,
+                    graceful_timeout=args.graceful_timeout,
+                    config_overrides=overrides, quiet=args.quiet)
+    return master.run()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
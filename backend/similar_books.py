@@ -0,0 +1,527 @@
+"""Content-based "similar books", computed locally.
+
+Every live book gets a sparse vector of its content: the words of its
+title and of its AI review, its author, and its publication decade and
+quarter-century. Tokens are hashed to integers (the "hashing trick": no
+vocabulary to store or keep in sync), weighted by TF-IDF and scaled to
+unit length, so the similarity of two books is the dot product of their
+vectors (cosine similarity).
+
+Vectors are stored in `book_feature`, one row per (book, feature), which
+is indexed by feature and doubles as an inverted index. The
+`NEIGHBOURS` most similar books of every book are stored in
+`similar_book`, so pages read them with one primary key range scan and no
+computation.
+
+Finding a book's neighbours reads only the postings of its
+`QUERY_FEATURES` heaviest features, and of each only the
+`POSTINGS_PER_FEATURE` heaviest entries: the work per book is bounded
+whatever the size of the library. The `CANDIDATES` best partial matches
+are then scored exactly with their full vectors.
+
+ - `rebuild_similar_books()` recomputes everything in memory
+   (`flask rebuild-similar-books`).
+ - `refresh_similar_books()` updates the books given after a write: their
+   vectors, their neighbour lists, and the lists of the books they now
+   enter or leave. It runs automatically when a flush adds or changes a
+   book's title, author, year or review (see `track_content_changes`);
+   set-based UPDATEs call it themselves. IDF weights of untouched books
+   stay as last computed, so rebuild now and then on a growing library.
+
+Each library (backend.libraries) is indexed on its own: its IDF weights
+count only its books, and its books are only ever similar to each other.
+
+With NumPy installed (optional) a full rebuild finds the neighbours of a
+batch of books at a time with array operations (`all_nearest_numpy`): the
+same candidates, scores and order as `nearest()`, which is used without
+it and for the few books of a refresh.
+
+Like backend.rating_stats, the functions take a SQLAlchemy Connection.
+"""
+
+import heapq
+import math
+import re
+import zlib
+from collections import Counter, defaultdict
+from itertools import chain
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from backend.data_models import Book, BookFeature, SimilarBook, utcnow
+from backend.listings import book_listing_select, fetch_book_listings
+
+try:
+    import numpy
+except ImportError:
+    # optional: `nearest()` is used for every book instead
+    numpy = None
+
+# Neighbours stored per book (pages show the first few live ones)
+NEIGHBOURS = 20
+QUERY_FEATURES = 12
+POSTINGS_PER_FEATURE = 128
+CANDIDATES = 48
+# Best-rated books the recommendation page starts from
+SEED_BOOKS = 50
+# Relative weight of each kind of feature
+FIELD_WEIGHTS = {'title': 1.0, 'author': 1.5, 'period': 0.5, 'review': 1.0}
+# Book attributes the vector is built from
+CONTENT_ATTRS = ('title', 'author_id', 'publication_year',
+                 'ai_recommendation')
+INSERT_BATCH = 1000
+# Books whose neighbours `all_nearest_numpy` finds at once (< 2**15)
+NUMPY_BATCH = 1000
+WORD = re.compile(r'\w\w+')
+
+book = Book.__table__
+feature_table = BookFeature.__table__
+similar_table = SimilarBook.__table__
+
+
+def feature_id(token):
+    """Stable 31-bit hash of a token (`hash()` differs between processes)."""
+    return zlib.crc32(token.encode('utf-8')) & 0x7fffffff
+
+
+def words(text):
+    return WORD.findall(text.lower()) if text else []
+
+
+def term_frequencies(title, author_id, publication_year, review):
+    """{feature: weighted term frequency} of one book, before IDF."""
+    counts = Counter()
+    for word in words(title):
+        counts['title', 't:' + word] += 1
+    for word in words(review):
+        counts['review', 'r:' + word] += 1
+    if author_id is not None:
+        counts['author', f'a:{author_id}'] += 1
+    if publication_year:
+        counts['period', f'd:{publication_year // 10}'] += 1
+        counts['period', f'q:{publication_year // 25}'] += 1
+    tf = defaultdict(float)
+    for (field, token), n in counts.items():
+        tf[feature_id(token)] += FIELD_WEIGHTS[field] * (1 + math.log(n))
+    return tf
+
+
+def idf(df, total):
+    return math.log((1 + total) / (1 + df)) + 1
+
+
+def weigh(tf, df, total):
+    """Unit-length TF-IDF vector ({feature: weight}) from term frequencies
+    and document frequencies ({feature: books having it})."""
+    vector = {f: w * idf(df.get(f, 1), total) for f, w in tf.items()}
+    norm = math.sqrt(sum(w * w for w in vector.values()))
+    if not norm:
+        return {}
+    return {f: w / norm for f, w in vector.items()}
+
+
+def dot(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(w * b[f] for f, w in a.items() if f in b)
+
+
+def content_rows(conn, book_ids=None):
+    query = select(book.c.id, book.c.library_id, book.c.title,
+                   book.c.author_id, book.c.publication_year,
+                   book.c.ai_recommendation).where(
+        book.c.deleted_at.is_(None))
+    if book_ids is not None:
+        query = query.where(book.c.id.in_(book_ids))
+    return conn.execute(query)
+
+
+def nearest(book_id, vector, postings, vectors, k=NEIGHBOURS):
+    """[(score, other_id)] of the `k` books most similar to `vector`.
+
+    `postings(feature)` yields (book_id, weight) pairs heaviest first;
+    `vectors(ids)` returns {book_id: vector}.
+    """
+    partial = defaultdict(float)
+    heaviest = heapq.nlargest(QUERY_FEATURES, vector.items(),
+                              key=lambda item: item[1])
+    for feature, weight in heaviest:
+        for other, other_weight in postings(feature):
+            if other != book_id:
+                partial[other] += weight * other_weight
+    candidates = heapq.nlargest(CANDIDATES, partial, key=partial.get)
+    scored = [(dot(vector, other_vector), other)
+              for other, other_vector in vectors(candidates).items()]
+    return heapq.nlargest(k, [pair for pair in scored if pair[0] > 0])
+
+
+def all_nearest(vectors, k=NEIGHBOURS):
+    """(book_id, `nearest()`) of every book of `vectors` ({book_id:
+    vector}) against the postings of the same vectors."""
+    index = defaultdict(list)
+    for book_id, vector in vectors.items():
+        for feature, weight in vector.items():
+            index[feature].append((weight, book_id))
+    postings = {feature: [(book_id, weight) for weight, book_id in
+                          heapq.nlargest(POSTINGS_PER_FEATURE, entries)]
+                for feature, entries in index.items()}
+    del index
+    for book_id, vector in vectors.items():
+        yield book_id, nearest(book_id, vector,
+                               lambda f: postings.get(f, ()),
+                               lambda ids: {i: vectors[i] for i in ids}, k)
+
+
+def group_ranks(groups):
+    """Position of each element within its run of equal values of the
+    sorted array `groups`."""
+    starts = numpy.flatnonzero(numpy.diff(groups, prepend=-1))
+    return numpy.arange(len(groups)) - numpy.repeat(
+        starts, numpy.diff(numpy.append(starts, len(groups))))
+
+
+def ranges(starts, lengths):
+    """Indexes start, ..., start + length - 1 of every range, one after
+    the other."""
+    offsets = numpy.arange(lengths.sum()) - numpy.repeat(
+        numpy.cumsum(lengths) - lengths, lengths)
+    return numpy.repeat(starts, lengths) + offsets
+
+
+def all_nearest_numpy(vectors, k=NEIGHBOURS):
+    """(book_id, `nearest()`) of every book of `vectors` ({book_id:
+    vector}) against the postings of the same vectors, `NUMPY_BATCH`
+    books at a time. Sums are taken in the same order as `nearest()`, so
+    the results are the same."""
+    book_ids = numpy.array(list(vectors), dtype=numpy.int64)
+    sizes = numpy.array([len(v) for v in vectors.values()], dtype=numpy.int64)
+    rows = numpy.repeat(numpy.arange(len(book_ids)), sizes)
+    features = numpy.fromiter(chain.from_iterable(vectors.values()),
+                              dtype=numpy.int64, count=len(rows))
+    weights = numpy.fromiter(
+        chain.from_iterable(v.values() for v in vectors.values()),
+        dtype=numpy.float64, count=len(rows))
+    vocabulary, cols = numpy.unique(features, return_inverse=True)
+    starts = numpy.cumsum(sizes) - sizes
+    position = numpy.arange(len(rows)) - numpy.repeat(starts, sizes)
+    # Every entry by (book, feature), to look weights up
+    entry_keys = rows * len(vocabulary) + cols
+    by_key = numpy.argsort(entry_keys)
+    sorted_keys = entry_keys[by_key]
+
+    # Postings: the heaviest entries of each feature (ties: highest id)
+    order = numpy.lexsort((-book_ids[rows], -weights, cols))
+    order = order[group_ranks(cols[order]) < POSTINGS_PER_FEATURE]
+    posting_rows, posting_weights = rows[order], weights[order]
+    posting_lengths = numpy.bincount(cols[order], minlength=len(vocabulary))
+    posting_starts = numpy.cumsum(posting_lengths) - posting_lengths
+    # Query features: the heaviest of each book (ties: first one)
+    order = numpy.lexsort((position, -weights, rows))
+    queries = order[group_ranks(rows[order]) < QUERY_FEATURES]
+    query_bounds = numpy.searchsorted(rows[queries],
+                                      numpy.arange(len(book_ids) + 1))
+
+    for first in range(0, len(book_ids), NUMPY_BATCH):
+        last = min(first + NUMPY_BATCH, len(book_ids))
+        batch = queries[query_bounds[first]:query_bounds[last]]
+        # Partial scores from the postings
+        lengths = posting_lengths[cols[batch]]
+        postings = ranges(posting_starts[cols[batch]], lengths)
+        book = numpy.repeat(rows[batch], lengths)
+        other = posting_rows[postings]
+        products = numpy.repeat(weights[batch], lengths) \
+            * posting_weights[postings]
+        mine = other != book
+        pairs, seen, inverse = numpy.unique(
+            book[mine] * len(book_ids) + other[mine],
+            return_index=True, return_inverse=True)
+        partial = numpy.bincount(inverse, weights=products[mine])
+        book, other = pairs // len(book_ids), pairs % len(book_ids)
+        # Candidates: best partial scores (ties: first seen). Three stable
+        # sorts, the last a radix sort of 16-bit batch positions, take
+        # half the time of one lexsort
+        order = numpy.argsort(seen)
+        order = order[numpy.argsort(-partial[order], kind='stable')]
+        order = order[numpy.argsort((book[order] - first).astype(numpy.int16),
+                                    kind='stable')]
+        order = order[group_ranks(book[order]) < CANDIDATES]
+        book, other = book[order], other[order]
+        # Exact scores, summed over the smaller vector in its own order
+        swap = sizes[book] > sizes[other]
+        small = numpy.where(swap, other, book)
+        large = numpy.where(swap, book, other)
+        entries = ranges(starts[small], sizes[small])
+        pair = numpy.repeat(numpy.arange(len(book)), sizes[small])
+        wanted = large[pair] * len(vocabulary) + cols[entries]
+        found = numpy.minimum(numpy.searchsorted(sorted_keys, wanted),
+                              len(sorted_keys) - 1)
+        match = sorted_keys[found] == wanted
+        scores = numpy.bincount(
+            pair[match], weights=weights[entries[match]]
+            * weights[by_key[found[match]]], minlength=len(book))
+        # The k best, as heapq.nlargest() of (score, other id) pairs
+        positive = scores > 0
+        book, other, scores = book[positive], other[positive], scores[positive]
+        order = numpy.lexsort((-book_ids[other], -scores, book))
+        order = order[group_ranks(book[order]) < k]
+        book, other, scores = book[order], other[order], scores[order]
+        bounds = numpy.searchsorted(book, numpy.arange(first, last + 1))
+        scores, others = scores.tolist(), book_ids[other].tolist()
+        for row in range(first, last):
+            start, end = bounds[row - first], bounds[row - first + 1]
+            yield int(book_ids[row]), list(zip(scores[start:end],
+                                               others[start:end]))
+
+
+def write_neighbours(conn, neighbours, when):
+    """Replace the neighbour lists of the books in `neighbours`
+    ({book_id: [(score, similar_id)]})."""
+    ids = list(neighbours)
+    for start in range(0, len(ids), INSERT_BATCH):
+        conn.execute(similar_table.delete().where(
+            similar_table.c.book_id.in_(ids[start:start + INSERT_BATCH])))
+    insert_rows(conn, similar_table, (
+        {'book_id': book_id, 'similar_id': other, 'score': score,
+         'updated_at': when}
+        for book_id, pairs in neighbours.items() for score, other in pairs))
+
+
+def insert_rows(conn, table, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == INSERT_BATCH:
+            conn.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        conn.execute(table.insert(), batch)
+
+
+def rebuild_similar_books(conn):
+    """Recompute every vector and neighbour list. Returns the number of
+    books indexed."""
+    libraries = defaultdict(dict)
+    for row in content_rows(conn):
+        libraries[row.library_id][row.id] = term_frequencies(
+            row.title, row.author_id, row.publication_year,
+            row.ai_recommendation)
+    conn.execute(similar_table.delete())
+    conn.execute(feature_table.delete())
+    when = utcnow()
+    for tfs in libraries.values():
+        index_library(conn, tfs, when)
+    return sum(len(tfs) for tfs in libraries.values())
+
+
+def index_library(conn, tfs, when):
+    """Write the vectors and neighbour lists of one library's books
+    ({book_id: term frequencies})."""
+    df = Counter(f for tf in tfs.values() for f in tf)
+    vectors = {book_id: weigh(tf, df, len(tfs)) for book_id, tf in tfs.items()}
+    del tfs
+
+    insert_rows(conn, feature_table, (
+        {'book_id': book_id, 'feature': feature, 'weight': weight}
+        for book_id, vector in vectors.items()
+        for feature, weight in vector.items()))
+    compute = all_nearest if numpy is None else all_nearest_numpy
+    neighbours = {}
+    for book_id, pairs in compute(vectors):
+        neighbours[book_id] = pairs
+        if len(neighbours) == INSERT_BATCH:
+            write_neighbours(conn, neighbours, when)
+            neighbours = {}
+    write_neighbours(conn, neighbours, when)
+
+
+class StoredVectors:
+    """`nearest()` lookups against the `book_feature` table, among the
+    live books of one library. Results are kept for the life of the object
+    (one refresh), so a batch of related books reads shared postings
+    once."""
+
+    def __init__(self, conn, library_id):
+        self.conn = conn
+        self.library_id = library_id
+        self._postings = {}
+        self._vectors = {}
+
+    def postings(self, feature):
+        entries = self._postings.get(feature)
+        if entries is None:
+            entries = self._postings[feature] = self.conn.execute(
+                select(feature_table.c.book_id, feature_table.c.weight)
+                .join(book, book.c.id == feature_table.c.book_id)
+                .where(feature_table.c.feature == feature,
+                       book.c.library_id == self.library_id,
+                       book.c.deleted_at.is_(None))
+                .order_by(feature_table.c.weight.desc())
+                .limit(POSTINGS_PER_FEATURE)).all()
+        return entries
+
+    def vectors(self, book_ids):
+        missing = [i for i in book_ids if i not in self._vectors]
+        for start in range(0, len(missing), INSERT_BATCH):
+            batch = missing[start:start + INSERT_BATCH]
+            for book_id in batch:
+                self._vectors[book_id] = {}
+            for book_id, feature, weight in self.conn.execute(
+                    select(feature_table.c.book_id, feature_table.c.feature,
+                           feature_table.c.weight)
+                    .where(feature_table.c.book_id.in_(batch))):
+                self._vectors[book_id][feature] = weight
+        return {i: self._vectors[i] for i in book_ids}
+
+    def update(self, vectors):
+        """Use these vectors (just written) for their books."""
+        self._vectors.update(vectors)
+
+
+def refresh_similar_books(conn, book_ids):
+    """Recompute the vectors and neighbour lists of `book_ids` after a
+    write and update the lists of the books they enter or leave.
+
+    Deleted books are left alone (pages skip them; their vectors come back
+    with an undo). Returns the number of books refreshed.
+    """
+    libraries = defaultdict(list)
+    for row in content_rows(conn, sorted(set(book_ids))):
+        libraries[row.library_id].append(row)
+    for library_id, rows in libraries.items():
+        refresh_library(conn, library_id, rows)
+    return sum(len(rows) for rows in libraries.values())
+
+
+def refresh_library(conn, library_id, rows):
+    """`refresh_similar_books()` of some books of one library (their
+    `content_rows`)."""
+    ids = [row.id for row in rows]
+    tfs = {row.id: term_frequencies(row.title, row.author_id,
+                                    row.publication_year,
+                                    row.ai_recommendation) for row in rows}
+    total = conn.execute(select(func.count()).select_from(book).where(
+        book.c.library_id == library_id,
+        book.c.deleted_at.is_(None))).scalar()
+    features = sorted({f for tf in tfs.values() for f in tf})
+    df = Counter()
+    for start in range(0, len(features), INSERT_BATCH):
+        df.update(dict(conn.execute(
+            select(feature_table.c.feature, func.count())
+            .join(book, book.c.id == feature_table.c.book_id)
+            .where(feature_table.c.feature.in_(
+                features[start:start + INSERT_BATCH]),
+                book.c.library_id == library_id,
+                feature_table.c.book_id.notin_(ids))
+            .group_by(feature_table.c.feature)).all()))
+    for tf in tfs.values():
+        df.update(tf.keys())
+    vectors = {book_id: weigh(tf, df, total) for book_id, tf in tfs.items()}
+
+    conn.execute(feature_table.delete().where(
+        feature_table.c.book_id.in_(ids)))
+    insert_rows(conn, feature_table, (
+        {'book_id': book_id, 'feature': feature, 'weight': weight}
+        for book_id, vector in vectors.items()
+        for feature, weight in vector.items()))
+
+    stored = StoredVectors(conn, library_id)
+    stored.update(vectors)
+    when = utcnow()
+    neighbours = {book_id: nearest(book_id, vector, stored.postings,
+                                   stored.vectors)
+                  for book_id, vector in vectors.items()}
+    write_neighbours(conn, neighbours, when)
+    # The other side of each pair: scores of lists already holding a
+    # refreshed book change, and it joins lists it now ranks in
+    holders = defaultdict(list)
+    for holder, book_id in conn.execute(
+            select(similar_table.c.book_id, similar_table.c.similar_id)
+            .where(similar_table.c.similar_id.in_(ids))):
+        holders[book_id].append(holder)
+    for book_id, vector in vectors.items():
+        scores = {other: score for score, other in neighbours[book_id]}
+        for other, other_vector in stored.vectors(holders[book_id]).items():
+            scores.setdefault(other, dot(vector, other_vector))
+        update_lists(conn, book_id, scores, when)
+
+
+def update_lists(conn, book_id, scores, when):
+    """Put `book_id` into (or take it out of) the neighbour lists of the
+    books in `scores` ({other_id: similarity}) where its score ranks."""
+    c = similar_table.c
+    standing = {other: (n, lowest) for other, n, lowest in conn.execute(
+        select(c.book_id, func.count(), func.min(c.score))
+        .where(c.book_id.in_(list(scores)), c.similar_id != book_id)
+        .group_by(c.book_id))}
+    conn.execute(similar_table.delete().where(
+        c.similar_id == book_id, c.book_id.in_(list(scores))))
+    entered = []
+    for other, score in scores.items():
+        n, lowest = standing.get(other, (0, 0.0))
+        if other != book_id and score > 0 and (
+                n < NEIGHBOURS or score > lowest):
+            entered.append({'book_id': other, 'similar_id': book_id,
+                            'score': score, 'updated_at': when})
+            if n >= NEIGHBOURS:
+                # push the weakest neighbour out
+                weakest = select(c.similar_id).where(
+                    c.book_id == other).order_by(c.score, c.similar_id) \
+                    .limit(1).scalar_subquery()
+                conn.execute(similar_table.delete().where(
+                    c.book_id == other, c.similar_id == weakest))
+    if entered:
+        conn.execute(similar_table.insert(), entered)
+
+
+def similar_book_listings(book_id, limit):
+    """Listing rows (backend.listings) of the most similar live books."""
+    return fetch_book_listings(
+        book_listing_select()
+        .join(SimilarBook, SimilarBook.similar_id == Book.id)
+        .where(SimilarBook.book_id == book_id)
+        .order_by(SimilarBook.score.desc(), Book.id)
+        .limit(limit))
+
+
+def suggested_book_listings(limit, seed_count=SEED_BOOKS):
+    """Unrated books most like the `seed_count` best-rated ones: each
+    candidate's similarity to those books, weighted by their rating."""
+    seeds = select(Book.id, Book.rating).where(
+        Book.rating.isnot(None), Book.deleted_at.is_(None)) \
+        .order_by(Book.rating.desc(), Book.id).limit(seed_count).subquery()
+    scores = select(
+        SimilarBook.similar_id.label('book_id'),
+        func.sum(SimilarBook.score * seeds.c.rating).label('score')) \
+        .join(seeds, seeds.c.id == SimilarBook.book_id) \
+        .group_by(SimilarBook.similar_id).subquery()
+    return fetch_book_listings(
+        book_listing_select()
+        .join(scores, scores.c.book_id == Book.id)
+        .where(Book.rating.is_(None))
+        .order_by(scores.c.score.desc(), Book.id)
+        .limit(limit))
+
+
+def similar_books_enabled():
+    return has_app_context() and current_app.config.get('SIMILAR_BOOKS')
+
+
+def content_changed(obj):
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes()
+               for name in CONTENT_ATTRS)
+
+
+@event.listens_for(Session, 'after_flush')
+def track_content_changes(session, flush_context):
+    """Refresh the similar books of books whose content this flush added
+    or changed, in the same transaction (when `SIMILAR_BOOKS` is on)."""
+    if not similar_books_enabled():
+        return
+    changed = [obj.id for obj in session.new if isinstance(obj, Book)]
+    changed += [obj.id for obj in session.dirty
+                if isinstance(obj, Book) and content_changed(obj)]
+    if changed:
+        refresh_similar_books(session.connection(), changed)
@@ -0,0 +1,51 @@
+"""Streamed rendering for the large listing pages.
+
+`render_template()` builds the whole page in memory before the first byte
+is sent. With `STREAM_LISTINGS` on, the home, admin and recommendations
+pages are rendered with `stream_template()` instead: the response starts
+as soon as the header of the page is rendered, and the rows come from
+`backend.listings.stream_rows()` while the template loops over them, so
+memory stays flat however many books are listed.
+
+Template output is sent in pieces of about `STREAM_CHUNK_CHARS` characters
+rather than one write per template expression.
+
+Things to keep in mind with a streamed page: the status code and headers
+are sent before the rows are read, so an error halfway through can only
+cut the page short, and a streamed listing can be looped over only once
+(count it in the view if the template needs the number).
+"""
+
+from flask import current_app, render_template, stream_template
+
+STREAM_CHUNK_CHARS = 16 * 1024
+
+
+def streaming_enabled():
+    return current_app.config['STREAM_LISTINGS']
+
+
+def chunked(pieces, size=STREAM_CHUNK_CHARS):
+    """Join the small strings of a template stream into pieces of about
+    `size` characters."""
+    buffer = []
+    buffered = 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= size:
+            yield ''.join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def render_listing(template_name, **context):
+    """`render_template()`, or a streamed response with `STREAM_LISTINGS`
+    on."""
+    if not streaming_enabled():
+        return render_template(template_name, **context)
+    return current_app.response_class(
+        chunked(stream_template(template_name, **context)),
+        mimetype='text/html')
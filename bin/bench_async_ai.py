@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Compare the blocking and the async AI review endpoint against a slow stub.
+
+A stub AI service (separate process) answers every request after `--delay`
+seconds. `--requests` reviews are then sent at once to
+
+ - the Flask view, on a pool of `--threads` request threads (what a WSGI
+   server with that many threads can do), and
+ - the ASGI app from `backend.asgi`, on one event loop,
+
+and the wall time, throughput and peak thread count of each run are
+reported. Both use POST /api/book/<id>/ai_review on a temporary database.
+
+Usage:
+    python bin/bench_async_ai.py [--requests 200] [--delay 1.0] [--threads 8]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+proj_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, proj_root)
+
+
+def serve_stub(delay, port_queue):
+    class SlowAI(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(delay)
+            body = json.dumps({'result': 'A review from the stub'}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SlowAI)
+    server.daemon_threads = True
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+class ThreadSampler:
+    """Records the highest number of live threads while active."""
+
+    def __init__(self):
+        self.peak = 0
+        self.running = False
+
+    def __enter__(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def sample(self):
+        while self.running:
+            self.peak = max(self.peak, threading.active_count() - 1)
+            time.sleep(0.01)
+
+    def __exit__(self, *exc):
+        self.running = False
+        self.thread.join()
+
+
+def seed(app):
+    from backend.data_models import db, Author, Book
+    with app.app_context():
+        db.create_all()
+        author = Author(name='Bench Author')
+        db.session.add(author)
+        db.session.flush()
+        book = Book(isbn='9780000000000', title='Bench Book',
+                    author_id=author.id)
+        db.session.add(book)
+        db.session.commit()
+        book_id = book.id
+        db.session.remove()
+    return book_id
+
+
+def run_sync(app, path, requests, threads):
+    client = app.test_client()
+
+    def post(_):
+        return client.post(path).status_code
+
+    with ThreadSampler() as sampler:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            statuses = list(pool.map(post, range(requests)))
+        elapsed = time.perf_counter() - start
+    return elapsed, statuses, sampler.peak
+
+
+def run_async(asgi_app, path, requests):
+    import httpx
+
+    async def run():
+        transport = httpx.ASGITransport(app=asgi_app)
+        async with httpx.AsyncClient(transport=transport,
+                                     base_url='http://bench',
+                                     timeout=None) as client:
+            responses = await asyncio.gather(
+                *(client.post(path) for _ in range(requests)))
+        return [r.status_code for r in responses]
+
+    with ThreadSampler() as sampler:
+        start = time.perf_counter()
+        statuses = asyncio.run(run())
+        elapsed = time.perf_counter() - start
+    return elapsed, statuses, sampler.peak
+
+
+def report(name, requests, elapsed, statuses, peak):
+    failed = sum(1 for s in statuses if s != 200)
+    print(f'{name:<22} {elapsed:>8.2f} {requests / elapsed:>9.1f} '
+          f'{peak:>8} {failed:>7}', flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--delay', type=float, default=1.0,
+                        help='Seconds the stub takes per answer')
+    parser.add_argument('--threads', type=int, default=8,
+                        help='Request threads for the blocking view')
+    args = parser.parse_args()
+
+    port_queue = multiprocessing.Queue()
+    stub = multiprocessing.Process(target=serve_stub,
+                                   args=(args.delay, port_queue), daemon=True)
+    stub.start()
+    os.environ['RAPIDAPI_URL'] = f'http://127.0.0.1:{port_queue.get()}/'
+    os.environ['RAPIDAPI_KEY'] = 'bench'
+
+    from backend.asgi import create_asgi_app
+    from backend.server import prepare_worker
+    with tempfile.TemporaryDirectory() as tmp:
+        asgi_app = create_asgi_app({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp}/bench.sqlite",
+            'TESTING': True})
+        path = f'/api/book/{seed(asgi_app.flask_app)}/ai_review'
+        # what the ASGI lifespan startup does (ASGITransport skips it)
+        prepare_worker(asgi_app.flask_app)
+
+        print(f'{args.requests} reviews, stub delay {args.delay:g}s')
+        print(f'{"endpoint":<22} {"wall s":>8} {"req/s":>9} '
+              f'{"threads":>8} {"failed":>7}')
+        report(f'sync, {args.threads} threads', args.requests,
+               *run_sync(asgi_app.flask_app, path, args.requests,
+                         args.threads))
+        report('async, 1 event loop', args.requests,
+               *run_async(asgi_app, path, args.requests))
+        with asgi_app.flask_app.app_context():
+            from backend.data_models import db
+            db.engine.dispose()
+    stub.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Measure the in-process catalogue snapshot against the ORM listing.
+
+Seeds a temporary SQLite database with `--books` books (spread over
+`--authors` authors), then reports
+
+ - memory held by a snapshot of the catalogue (tracemalloc), next to the
+   same books loaded as ORM objects, and the time to build each
+ - the time of an incremental refresh after `--changes` books are rated
+ - GET / latency (median of `--runs`) with the snapshot and with the ORM
+   path, for a paginated page, the full listing and a search
+
+Usage:
+    python bin/bench_catalogue.py [--books 100000] [--authors 5000]
+                                  [--changes 100] [--runs 5] [--per-page 50]
+"""
+import argparse
+import gc
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+proj_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, proj_root)
+
+from backend.app import create_app  # noqa: E402
+from backend.catalogue import build_snapshot, read_state  # noqa: E402
+from backend.data_models import db, Author, Book  # noqa: E402
+
+
+def make_app(db_uri, snapshot):
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': db_uri,
+        'CATALOGUE_SNAPSHOT': snapshot,
+        'RATING_BUFFER_FLUSH_INTERVAL': 0,
+    })
+
+
+def seed(app, books, authors):
+    rng = random.Random(42)
+    words = ['River', 'Stone', 'Night', 'Garden', 'Winter', 'Glass', 'Salt',
+             'Iron', 'Paper', 'Silent', 'Golden', 'Hollow', 'Northern']
+    with app.app_context():
+        db.create_all()
+        db.session.execute(db.insert(Author), [
+            {'id': i, 'name': f'{rng.choice(words)} Author {i}'}
+            for i in range(1, authors + 1)])
+        db.session.execute(db.insert(Book), [
+            {'id': i, 'isbn': f'978{i:010d}',
+             'title': f'The {rng.choice(words)} {rng.choice(words)} {i}',
+             'author_id': rng.randint(1, authors),
+             'rating': rng.choice([None, *range(1, 11)]),
+             'publication_year': rng.randint(1900, 2024)}
+            for i in range(1, books + 1)])
+        db.session.commit()
+
+
+def measure(fn):
+    """(result, seconds, bytes still allocated by the result)."""
+    gc.collect()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t0
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, elapsed, size
+
+
+def latency(client, path, runs):
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        resp = client.get(path)
+        times.append(time.perf_counter() - t0)
+        assert resp.status_code == 200, resp.status_code
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--authors', type=int, default=5000)
+    parser.add_argument('--changes', type=int, default=100)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--per-page', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_uri = f"sqlite:///{os.path.join(tmp, 'bench.sqlite')}"
+        snapshot_app = make_app(db_uri, True)
+        orm_app = make_app(db_uri, False)
+        t0 = time.perf_counter()
+        seed(snapshot_app, args.books, args.authors)
+        print(f'seeded {args.books} books / {args.authors} authors '
+              f'in {time.perf_counter() - t0:.1f}s')
+        per_100k = 100000 / args.books
+
+        with snapshot_app.app_context():
+            with db.engine.connect() as conn:
+                snapshot, build_s, snap_bytes = measure(
+                    lambda: build_snapshot(conn, *read_state(conn)))
+            del snapshot
+            books, orm_s, orm_bytes = measure(
+                lambda: Book.query.options(db.joinedload(Book.author)).all())
+            del books
+            db.session.remove()
+        print(f'snapshot : {snap_bytes * per_100k / 2**20:7.1f} MiB per 100k '
+              f'books, built in {build_s * 1000:7.0f} ms')
+        print(f'ORM      : {orm_bytes * per_100k / 2**20:7.1f} MiB per 100k '
+              f'books, loaded in {orm_s * 1000:7.0f} ms')
+
+        catalogue = snapshot_app.extensions['catalogue']
+        client = snapshot_app.test_client()
+        client.get('/')
+        ids = random.Random(1).sample(range(1, args.books + 1), args.changes)
+        with snapshot_app.app_context():
+            db.session.execute(db.update(Book).where(Book.id.in_(ids)).values(
+                rating=10))
+            db.session.commit()
+            t0 = time.perf_counter()
+            catalogue.current()
+            refresh_ms = (time.perf_counter() - t0) * 1000
+        print(f'incremental refresh after {args.changes} changes: '
+              f'{refresh_ms:.1f} ms (stats {catalogue.stats})')
+
+        pages = [
+            ('page', f'/?per_page={args.per_page}&page=20'),
+            ('page by rating',
+             f'/?per_page={args.per_page}&sort=rating&order=desc'),
+            ('search', f'/?per_page={args.per_page}&q=winter+glass'),
+            ('full listing', '/'),
+        ]
+        orm_client = orm_app.test_client()
+        print(f'{"GET /":<16} {"snapshot":>10} {"ORM":>10} {"speedup":>8}')
+        for name, path in pages:
+            snap_ms = latency(client, path, args.runs)
+            orm_ms = latency(orm_client, path, args.runs)
+            print(f'{name:<16} {snap_ms:8.1f}ms {orm_ms:8.1f}ms '
+                  f'{orm_ms / snap_ms:7.1f}x')
+
+        for app in (snapshot_app, orm_app):
+            with app.app_context():
+                db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Measure the local "similar books" engine (backend.similar_books).
+
+Seeds a temporary SQLite database with `--books` books by `--authors`
+authors, a third of them with a short generated review, then reports
+
+ - the time of a full rebuild and the number of stored rows
+ - the time of an incremental refresh after one book is added and after
+   one review is edited (the work a write request does)
+ - GET /book/<id> and GET /recommend latency (median of `--runs`), with
+   and without the similar books sections
+
+Usage:
+    python bin/bench_similar_books.py [--books 10000] [--authors 1000]
+                                      [--runs 20] [--no-numpy]
+
+`--no-numpy` measures the pure-Python rebuild even if NumPy is installed.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+proj_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, proj_root)
+
+from backend.app import create_app  # noqa: E402
+from backend.data_models import (db, Author, Book, BookFeature,  # noqa: E402
+                                 SimilarBook)
+import backend.similar_books  # noqa: E402
+from backend.similar_books import rebuild_similar_books  # noqa: E402
+
+TOPICS = {
+    'sea': ['ship', 'voyage', 'storm', 'harbour', 'captain', 'whale'],
+    'war': ['soldier', 'battle', 'siege', 'empire', 'general', 'retreat'],
+    'love': ['letters', 'wedding', 'summer', 'heart', 'promise', 'garden'],
+    'crime': ['detective', 'murder', 'alibi', 'witness', 'inspector'],
+    'space': ['planet', 'orbit', 'colony', 'signal', 'station', 'star'],
+}
+FILLER = ['story', 'novel', 'reader', 'chapter', 'character', 'world',
+          'quiet', 'bright', 'long', 'old', 'young', 'life', 'family']
+
+
+def make_app(db_uri, similar):
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': db_uri,
+        'SIMILAR_BOOKS': similar,
+        'RATING_BUFFER_FLUSH_INTERVAL': 0,
+    })
+
+
+def text(rng, topic, n):
+    return ' '.join(rng.choice(TOPICS[topic] if rng.random() < 0.4
+                               else FILLER) for _ in range(n))
+
+
+def seed(app, books, authors):
+    rng = random.Random(42)
+    topics = list(TOPICS)
+    with app.app_context():
+        db.create_all()
+        db.session.execute(db.insert(Author), [
+            {'id': i, 'name': f'Author {i}'} for i in range(1, authors + 1)])
+        rows = []
+        for i in range(1, books + 1):
+            topic = rng.choice(topics)
+            rows.append({
+                'id': i, 'isbn': f'978{i:010d}',
+                'title': text(rng, topic, 3).title(),
+                'author_id': rng.randint(1, authors),
+                'rating': rng.choice([None, None, *range(1, 11)]),
+                'publication_year': rng.randint(1900, 2024),
+                'ai_recommendation': (text(rng, topic, 60)
+                                      if rng.random() < 0.33 else None)})
+        db.session.execute(db.insert(Book), rows)
+        db.session.commit()
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - t0
+
+
+def latency(client, path, runs):
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        resp = client.get(path)
+        times.append(time.perf_counter() - t0)
+        assert resp.status_code == 200, resp.status_code
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--authors', type=int, default=1000)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--no-numpy', action='store_true',
+                        help='rebuild without NumPy')
+    args = parser.parse_args()
+    if args.no_numpy:
+        backend.similar_books.numpy = None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_uri = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        app = make_app(db_uri, similar=True)
+        seed(app, args.books, args.authors)
+        print(f'{args.books} books, {args.authors} authors')
+
+        with app.app_context():
+            with db.engine.begin() as conn:
+                _, seconds = timed(lambda: rebuild_similar_books(conn))
+            features = db.session.query(BookFeature).count()
+            pairs = db.session.query(SimilarBook).count()
+        print(f'full rebuild: {seconds:.1f} s '
+              f'({features} feature rows, {pairs} neighbour rows)')
+
+        with app.app_context():
+            book = Book(isbn='NEW-1', title='Storm Over The Harbour',
+                        author_id=1, publication_year=1955,
+                        ai_recommendation=text(random.Random(1), 'sea', 60))
+            db.session.add(book)
+            _, seconds = timed(db.session.commit)
+            print(f'add one book (commit incl. refresh): {seconds * 1000:.0f} ms')
+            book.ai_recommendation = text(random.Random(2), 'war', 60)
+            _, seconds = timed(db.session.commit)
+            print(f'edit one review (commit incl. refresh): '
+                  f'{seconds * 1000:.0f} ms')
+            book_id = book.id
+
+        for similar in (True, False):
+            app = make_app(db_uri, similar)
+            client = app.test_client()
+            label = 'with' if similar else 'without'
+            print(f'GET /book/{book_id} {label} similar books: '
+                  f'{latency(client, f"/book/{book_id}", args.runs):.1f} ms')
+        app = make_app(db_uri, similar=True)
+        client = app.test_client()
+        print(f'GET /recommend: {latency(client, "/recommend", 3):.0f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Measure BookAlchemy import and startup cost.
+
+Each run starts a fresh interpreter with `python -X importtime`, imports the
+application factory and builds one app, then reports:
+
+ - cumulative import time of `backend.app` (from -X importtime)
+ - wall time of `create_app()`
+ - which heavy optional modules ended up imported
+ - optionally, the time `pytest --collect-only` takes
+
+Usage:
+    python bin/bench_startup.py [--runs 5] [--collect]
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+proj_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+HEAVY_MODULES = ('requests', 'dotenv', 'flask_migrate', 'alembic')
+
+PROBE = f"""
+import sys, time
+t0 = time.perf_counter()
+from backend.app import create_app
+t1 = time.perf_counter()
+create_app({{'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'TESTING': True}})
+t2 = time.perf_counter()
+print('CREATE_APP_MS', (t2 - t1) * 1000)
+print('HEAVY', ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))
+"""
+
+IMPORTTIME_LINE = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)')
+
+
+def probe_once():
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE],
+        cwd=proj_root, capture_output=True, text=True, check=True)
+    import_us = None
+    for line in proc.stderr.splitlines():
+        m = IMPORTTIME_LINE.match(line)
+        if m and m.group(3) == 'backend.app':
+            import_us = int(m.group(2))
+    values = dict(line.split(' ', 1) for line in proc.stdout.splitlines()
+                  if line.startswith(('CREATE_APP_MS', 'HEAVY')))
+    return (import_us / 1000.0 if import_us else float('nan'),
+            float(values.get('CREATE_APP_MS', 'nan')),
+            values.get('HEAVY', '').strip())
+
+
+def collect_once():
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, '-m', 'pytest', '--collect-only', '-q'],
+                   cwd=proj_root, capture_output=True, check=True)
+    return (time.perf_counter() - t0) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--collect', action='store_true',
+                        help='Also time pytest test collection')
+    args = parser.parse_args()
+
+    imports, creates, heavy = [], [], set()
+    for _ in range(args.runs):
+        import_ms, create_ms, loaded = probe_once()
+        imports.append(import_ms)
+        creates.append(create_ms)
+        heavy.update(m for m in loaded.split(',') if m)
+
+    print(f'runs: {args.runs}')
+    print(f'import backend.app : median {statistics.median(imports):7.1f} ms'
+          f'  (min {min(imports):.1f})')
+    print(f'create_app()       : median {statistics.median(creates):7.1f} ms'
+          f'  (min {min(creates):.1f})')
+    print(f'heavy modules      : {", ".join(sorted(heavy)) or "none"}')
+    if args.collect:
+        collects = [collect_once() for _ in range(args.runs)]
+        print(f'pytest collection  : median '
+              f'{statistics.median(collects):7.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
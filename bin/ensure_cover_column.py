@@ -4,12 +4,15 @@ Ensure `cover_url` column exists in the `book` table.
 
 This is a small helper for development when running without Flask-Migrate.
 It checks the `book` table's columns and performs a simple ALTER TABLE to add
-the `cover_url` column when missing. This is only intended for local development
-and small schema changes; in production use Flask-Migrate/Alembic.
+the `cover_url` column when missing. The statement is plain SQL, so it works on
+whichever database the app is configured for (SQLite or `DATABASE_URL`). This
+is only intended for local development and small schema changes; in production
+use Flask-Migrate/Alembic.
 """
 import sys
 import os
 from sqlalchemy import inspect, text
+from sqlalchemy.engine import make_url
 
 # Ensure project root is on sys.path when executed from bin/
 proj_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -17,8 +20,9 @@ if proj_root not in sys.path:
     sys.path.insert(0, proj_root)
 
 try:
-    from app import app
-    from data_models import db
+    from backend.app import create_app
+    from backend.data_models import db
+    app = create_app()
 except Exception as exc:
     # We will still attempt to patch the local sqlite file directly.
     app = None
@@ -26,6 +30,16 @@ except Exception as exc:
     fallback_msg = f"Cannot import app/db ({exc}). Falling back to raw sqlite access if possible."
     print(fallback_msg)
 
+ADD_COLUMN = 'ALTER TABLE book ADD COLUMN cover_url VARCHAR(512)'
+
+
+def sqlite_file(db_uri):
+    """Path of the SQLite database file, or None for other databases."""
+    url = make_url(db_uri)
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        return None
+    return url.database
+
 
 def ensure_cover_url():
     if app and db:
@@ -40,28 +54,21 @@ def ensure_cover_url():
                 return
             print('Adding `cover_url` column to `book` table via SQLAlchemy engine...')
             try:
-                db.session.execute(text('ALTER TABLE book ADD COLUMN cover_url VARCHAR(512)'))
-                db.session.commit()
+                with db.engine.begin() as conn:
+                    conn.execute(text(ADD_COLUMN))
                 print('Done. Column added.')
                 return
             except Exception as exc:
                 print('Failed to add column via SQLAlchemy:', exc)
-                print('Falling back to raw sqlite alter...')
-
-    # Fallback: try sqlite3 direct ALTER TABLE (works for local sqlite files)
-    # Try to find DB file; prefer SQLAlchemy config if available
-    if db and app:
-        try:
-            db_uri = app.config.get('SQLALCHEMY_DATABASE_URI', '')
-            if db_uri and db_uri.startswith('sqlite:///'):
-                db_file = db_uri.replace('sqlite:///', '')
-            else:
-                db_file = 'data/library.sqlite'
-        except Exception:
-            db_file = 'data/library.sqlite'
+        db_file = sqlite_file(app.config.get('SQLALCHEMY_DATABASE_URI', ''))
+        if db_file is None:
+            # Server databases have no file to patch directly
+            return
+        print('Falling back to raw sqlite alter...')
     else:
         db_file = 'data/library.sqlite'
 
+    # Fallback: sqlite3 direct ALTER TABLE (works for local sqlite files)
     import sqlite3
     if not os.path.exists(db_file):
         print('DB file does not exist:', db_file)
@@ -75,7 +82,7 @@ def ensure_cover_url():
             print('`cover_url` already exists on book table (sqlite).')
             return
         print('Adding `cover_url` column to `book` table via sqlite3...')
-        cur.execute('ALTER TABLE book ADD COLUMN cover_url VARCHAR(512)')
+        cur.execute(ADD_COLUMN)
         conn.commit()
         print('Done. Column added.')
     except Exception as exc:
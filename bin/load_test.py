@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Load-test the pre-forking server and show how throughput scales with the
+number of worker processes.
+
+A throwaway SQLite database is seeded with `--books` books, then for each
+worker count `python -m backend.server` is started on a free port and
+hammered by `--clients` client processes for `--duration` seconds. Reports
+requests per second, latency percentiles and the speedup over one worker.
+
+The clients run on the same machine and take CPU from the server, so expect
+the curve to flatten before the core count; scaling stops at the number of
+cores either way.
+
+Usage:
+    python bin/load_test.py [--workers 1,2,4] [--threads 4] [--clients 8]
+                            [--duration 10] [--path /] [--books 500]
+"""
+import argparse
+import http.client
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+proj_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, proj_root)
+
+
+def default_worker_counts():
+    cores = os.cpu_count() or 1
+    counts, n = [], 1
+    while n < cores:
+        counts.append(n)
+        n *= 2
+    counts.append(cores)
+    return counts
+
+
+def seed_database(uri, books):
+    from backend.app import create_app
+    from backend.data_models import db, Author, Book
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': uri, 'TESTING': True})
+    with app.app_context():
+        db.create_all()
+        authors = [Author(name=f'Author {i}') for i in range(max(1, books // 10))]
+        db.session.add_all(authors)
+        db.session.flush()
+        db.session.add_all(
+            Book(isbn=f'978{i:010d}', title=f'Book {i}',
+                 publication_year=1900 + i % 120, rating=1 + i % 10,
+                 author_id=authors[i % len(authors)].id)
+            for i in range(books))
+        db.session.commit()
+        db.session.remove()
+        db.engine.dispose()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(uri, port, workers, threads):
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'backend.server',
+         '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+         '--threads', str(threads), '--db-uri', uri, '--quiet'],
+        cwd=proj_root, stderr=subprocess.PIPE, text=True)
+    booted = 0
+    for line in proc.stderr:
+        if 'Booting worker' in line:
+            booted += 1
+            if booted == workers:
+                break
+    # keep draining the log so the server never blocks on a full pipe
+    threading.Thread(target=proc.stderr.read, daemon=True).start()
+    return proc
+
+
+def stop_server(proc):
+    proc.send_signal(signal.SIGTERM)
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def client(port, path, deadline):
+    """Request `path` until `deadline`; returns (ok, errors, latencies)."""
+    ok = errors = 0
+    latencies = []
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            conn.request('GET', path)
+            resp = conn.getresponse()
+            resp.read()
+            conn.close()
+        except OSError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+        if resp.status == 200:
+            ok += 1
+        else:
+            errors += 1
+    return ok, errors, latencies
+
+
+def run_load(port, path, clients, duration):
+    # warm up every worker (imports, first queries, template compilation)
+    client(port, path, time.time() + 1.0)
+    deadline = time.time() + duration
+    with ProcessPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(client, [port] * clients, [path] * clients,
+                                [deadline] * clients))
+    ok = sum(r[0] for r in results)
+    errors = sum(r[1] for r in results)
+    latencies = sorted(t for r in results for t in r[2])
+    return ok, errors, latencies
+
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workers', default=None,
+                        help='Comma-separated worker counts '
+                             '(default: powers of two up to the core count)')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=None,
+                        help='Concurrent client processes (default: '
+                             '2 x the largest worker count)')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--path', default='/')
+    parser.add_argument('--books', type=int, default=500)
+    args = parser.parse_args()
+
+    counts = ([int(n) for n in args.workers.split(',')] if args.workers
+              else default_worker_counts())
+    clients = args.clients or 2 * max(counts)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = f"sqlite:///{os.path.join(tmp, 'load.sqlite')}"
+        seed_database(uri, args.books)
+        print(f'cores: {os.cpu_count()}  threads/worker: {args.threads}  '
+              f'clients: {clients}  duration: {args.duration:g}s  '
+              f'path: {args.path}', flush=True)
+        print(f'{"workers":>7} {"req/s":>9} {"p50 ms":>8} {"p95 ms":>8} '
+              f'{"errors":>6} {"speedup":>7}')
+        baseline = None
+        for workers in counts:
+            port = free_port()
+            proc = start_server(uri, port, workers, args.threads)
+            try:
+                ok, errors, latencies = run_load(port, args.path, clients,
+                                                 args.duration)
+            finally:
+                stop_server(proc)
+            rps = ok / args.duration
+            baseline = baseline or rps
+            print(f'{workers:>7} {rps:>9.1f} '
+                  f'{percentile(latencies, 50) * 1000:>8.1f} '
+                  f'{percentile(latencies, 95) * 1000:>8.1f} '
+                  f'{errors:>6} {rps / baseline:>6.2f}x', flush=True)
+
+
+if __name__ == '__main__':
+    main()
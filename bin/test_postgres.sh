@@ -0,0 +1,35 @@
+#!/usr/bin/env bash
+# Run the test suite against a throwaway local PostgreSQL server.
+#
+# Needs the PostgreSQL server binaries (initdb, pg_ctl) on PATH, a driver in
+# the venv (`pip install "psycopg[binary]"`), and a regular user (initdb
+# refuses to run as root). The cluster lives in a temporary directory,
+# listens only on a Unix socket there, and is removed afterwards. Extra
+# arguments are passed to pytest:
+#
+#   bash bin/test_postgres.sh -q tests/test_search.py
+set -euo pipefail
+
+SCRIPT_DIR=$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)
+PROJECT_ROOT=$(cd "$SCRIPT_DIR/.." && pwd)
+cd "$PROJECT_ROOT"
+
+PYTHON=${PYTHON:-python3}
+PGPORT=${PGPORT:-54329}
+PGDATA=$(mktemp -d "${TMPDIR:-/tmp}/bookalchemy-pg.XXXXXX")
+
+cleanup() {
+  pg_ctl -D "$PGDATA" -m immediate stop >/dev/null 2>&1 || true
+  rm -rf "$PGDATA"
+}
+trap cleanup EXIT
+
+echo "Starting temporary PostgreSQL in $PGDATA..."
+initdb -D "$PGDATA" -U postgres --auth=trust --encoding=UTF8 --no-sync >/dev/null
+# fsync off: the data is thrown away anyway, and tests create/drop a lot
+pg_ctl -D "$PGDATA" -l "$PGDATA/server.log" -w start \
+  -o "-k $PGDATA -p $PGPORT -c listen_addresses='' -c fsync=off" >/dev/null
+createdb -h "$PGDATA" -p "$PGPORT" -U postgres books_test
+
+export TEST_DATABASE_URL="postgresql+psycopg://postgres@/books_test?host=$PGDATA&port=$PGPORT"
+$PYTHON -m pytest "$@"
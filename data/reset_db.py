@@ -3,16 +3,22 @@
 Safe database reset utility for BookAlchemy (development only)
 
 Usage:
-    python reset_db.py [--no-backup] [--remove-file] [--drop-tables] [--no-seed] [--force-kill] [--yes]
+    python reset_db.py [--no-backup] [--remove-file] [--drop-tables]
+                       [--no-seed] [--force-kill] [--yes]
+
+Works with the default SQLite file and with a server database configured
+through DATABASE_URL (e.g. PostgreSQL). File backups and --remove-file only
+apply to SQLite; back a server database up with its own tools (pg_dump).
 
 Default behavior:
- - Backs up data/library.sqlite to backups/
+ - Backs up data/library.sqlite to backups/ (SQLite only)
  - Drops tables and recreates schema (db.create_all())
  - Runs seed_authors.py and seed_books.py
 
 Options:
  - --no-backup     : skip creating backup
- - --remove-file   : instead of drop/create tables, delete the sqlite file entirely before recreating
+ - --remove-file   : instead of drop/create tables, delete the sqlite file
+                     entirely before recreating (SQLite only)
  - --drop-tables   : drop all tables then recreate
  - --no-seed       : skip running seed scripts
  - --force-kill    : kill running Flask/Python processes before proceeding
@@ -30,10 +36,13 @@ import time
 import signal
 from datetime import datetime
 
+from sqlalchemy.engine import make_url
+
 # Helper: import app and db
 try:
-    from app import app
-    from data_models import db
+    from backend.app import create_app
+    from backend.data_models import db
+    app = create_app()
 except Exception as e:
     print('Error: Could not import app or db from project. Ensure you run this script from the project root and use the venv.')
     print(e)
@@ -106,17 +115,22 @@ def backup_db(db_path, backup_dir='backups'):
     return dst
 
 
+def sqlite_file(db_uri):
+    """Path of the SQLite database file, or None for server databases."""
+    url = make_url(db_uri)
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        return None
+    return url.database
+
+
 def recreate_schema(remove_file=False, drop_tables=True):
     db_uri = app.config.get('SQLALCHEMY_DATABASE_URI')
-    if not db_uri or not db_uri.startswith('sqlite'):
-        print('Warning: Non-sqlite DB or not configured; attempting to drop/recreate via SQLAlchemy')
+    path = sqlite_file(db_uri)
     if remove_file:
         # Only delete the sqlite file if it's really a sqlite URI
-        if db_uri and db_uri.startswith('sqlite:///'):
-            path = db_uri.replace('sqlite:///', '')
-            if os.path.exists(path):
-                os.remove(path)
-                print('Removed DB file:', path)
+        if path and os.path.exists(path):
+            os.remove(path)
+            print('Removed DB file:', path)
         # recreate with create_all
         with app.app_context():
             db.create_all()
@@ -134,9 +148,8 @@ def run_seed_scripts():
     try:
         import data.seed_authors as seed_authors
         import data.seed_books as seed_books
-        with app.app_context():
-            seed_authors.seed_authors()
-            seed_books.seed_books()
+        seed_authors.seed_authors(app)
+        seed_books.seed_books(app)
     except Exception as e:
         print('Failed to run seed scripts:', e)
         return False
@@ -154,14 +167,19 @@ def main():
     args = parser.parse_args()
 
     db_uri = app.config.get('SQLALCHEMY_DATABASE_URI')
-    if not db_uri or not db_uri.startswith('sqlite'):
-        print('This script currently only supports sqlite databased via SQLALCHEMY_DATABASE_URI in app config.')
-        sys.exit(1)
-    db_path = db_uri.replace('sqlite:///', '')
-
-    print('Database file:', db_path)
-    if not os.path.exists(db_path):
-        print('(note) DB file does not exist yet, will be created by init or create_all')
+    db_path = sqlite_file(db_uri)
+    if db_path:
+        print('Database file:', db_path)
+        if not os.path.exists(db_path):
+            print('(note) DB file does not exist yet, will be created by init or create_all')
+    else:
+        print('Database:', make_url(db_uri).render_as_string(hide_password=True))
+        if args.remove_file:
+            print('--remove-file only applies to SQLite databases')
+            sys.exit(1)
+        if not args.no_backup:
+            print('(note) No file backup for server databases; use the database\'s own '
+                  'dump tool (e.g. pg_dump) first')
 
     pids = find_app_pids(5000)
     if pids:
@@ -174,11 +192,11 @@ def main():
             kill_pids(pids)
             time.sleep(0.5)
 
-    if os.path.exists(db_path):
+    if db_path and os.path.exists(db_path):
         if not args.no_backup:
             b = backup_db(db_path)
             print('Backup created at', b)
-    else:
+    elif db_path:
         print('No existing DB file found, proceeding to create one...')
 
     # Confirm
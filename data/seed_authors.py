@@ -1,11 +1,13 @@
 """Seed script to add example authors to the BookAlchemy database.
 
-This script is safe to run multiple times: it checks for the author's
-name before adding a new record so duplicates are not created.
+This script is safe to run multiple times: it skips authors already in
+the library under any spelling of their name ("J. Austen", "Austen,
+Jane"; see backend.author_names) so duplicates are not created.
 """
 from datetime import datetime
 from backend.data_models import db, Author
-from backend.app import app
+from backend.dedupe import similar_authors
+from backend.app import create_app
 import sys
 import os
 # add project root to path so `from app import app` works when run via
@@ -34,13 +36,15 @@ def parse_date(s):
     return datetime.strptime(s, "%Y-%m-%d").date()
 
 
-def seed_authors():
+def seed_authors(app=None):
+    app = app or create_app()
     with app.app_context():
         for name, b, d in AUTHORS:
-            # skip if already exists by name to avoid duplicates
-            existing = Author.query.filter_by(name=name).first()
+            # skip if already exists under a similar name
+            existing = similar_authors(name)
             if existing:
-                print(f"Skipping existing author: {name}")
+                print(f"Skipping existing author: {name} "
+                      f"({existing[0].name})")
                 continue
             a = Author(
                 name=name,
@@ -3,7 +3,7 @@
 This script is safe to run multiple times: it checks for existing ISBN/title before creating.
 """
 from backend.data_models import db, Author, Book
-from backend.app import app
+from backend.app import create_app
 import sys
 import os
 # add project root to path so `from app import app` works when run via
@@ -66,7 +66,8 @@ SAMPLE_BOOKS = [
 ]
 
 
-def seed_books():
+def seed_books(app=None):
+    app = app or create_app()
     with app.app_context():
         for item in SAMPLE_BOOKS:
             # support both 4-tuple and 5-tuple entries (with optional
@@ -0,0 +1,32 @@
+"""
+Gunicorn settings for BookAlchemy.
+
+Usage:
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Send HUP to the gunicorn master for a graceful reload and TERM for a
+graceful shutdown. Settings come from the same environment variables as
+`python -m backend.server`.
+"""
+
+import os
+
+from backend.server import (DEFAULT_BIND, default_threads, default_workers,
+                            prepare_worker)
+
+bind = os.environ.get('WEB_BIND', DEFAULT_BIND)
+workers = default_workers()
+threads = default_threads()
+worker_class = 'gthread'
+# With preload the app is built once in the master and inherited by forked
+# workers; post_worker_init then drops the inherited connection pools
+preload_app = os.environ.get('WEB_PRELOAD', '').lower() in ('1', 'true', 'yes')
+graceful_timeout = 30
+# AI review requests may take up to AI_REQUEST_TIMEOUT (60s) upstream
+timeout = 90
+
+
+def post_worker_init(worker):
+    # After the fork, in every worker: fresh pools, WAL, and the periodic
+    # jobs, which only the worker that wins their lock runs
+    prepare_worker(worker.wsgi)
@@ -0,0 +1,46 @@
+"""Add the ISBN enrichment queue and provider response cache
+
+Revision ID: 0b7d4e2a9c51
+Revises: f5a92c6e1d37
+Create Date: 2026-10-19 18:00:00.000000
+
+`flask enrich-books` queues the books missing a field on its first run.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b7d4e2a9c51'
+down_revision = 'f5a92c6e1d37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    tables = sa.inspect(conn).get_table_names()
+    if 'enrichment_job' not in tables:
+        op.create_table(
+            'enrichment_job',
+            sa.Column('isbn', sa.String(length=20), primary_key=True),
+            sa.Column('status', sa.String(length=10), nullable=False),
+            sa.Column('attempts', sa.Integer(), nullable=False),
+            sa.Column('last_error', sa.Text(), nullable=True),
+            sa.Column('enqueued_at', sa.DateTime(), nullable=False),
+            sa.Column('finished_at', sa.DateTime(), nullable=True))
+        op.create_index('ix_enrichment_job_status', 'enrichment_job',
+                        ['status', 'enqueued_at'])
+    if 'metadata_cache' not in tables:
+        op.create_table(
+            'metadata_cache',
+            sa.Column('provider', sa.String(length=40), primary_key=True),
+            sa.Column('isbn', sa.String(length=20), primary_key=True),
+            sa.Column('found', sa.Boolean(), nullable=False),
+            sa.Column('payload', sa.Text(), nullable=True),
+            sa.Column('fetched_at', sa.DateTime(), nullable=False))
+
+
+def downgrade():
+    op.drop_table('metadata_cache')
+    op.drop_table('enrichment_job')
@@ -0,0 +1,52 @@
+"""Add deleted_at tombstones and partial indexes to author and book
+
+Revision ID: 3c9e51b7d2a4
+Revises: 708a636a3d15
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9e51b7d2a4'
+down_revision = '708a636a3d15'
+branch_labels = None
+depends_on = None
+
+LIVE_ROWS = sa.text('deleted_at IS NULL')
+TOMBSTONES = sa.text('deleted_at IS NOT NULL')
+
+INDEXES = [
+    ('ix_author_live_name', 'author', ['name'], LIVE_ROWS),
+    ('ix_author_tombstones', 'author', ['deleted_at'], TOMBSTONES),
+    ('ix_book_live_title', 'book', ['title'], LIVE_ROWS),
+    ('ix_book_live_author', 'book', ['author_id'], LIVE_ROWS),
+    ('ix_book_live_rating', 'book', ['rating'], LIVE_ROWS),
+    ('ix_book_tombstones', 'book', ['deleted_at'], TOMBSTONES),
+]
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    for table in ('author', 'book'):
+        if table not in inspector.get_table_names():
+            continue
+        cols = [c['name'] for c in inspector.get_columns(table)]
+        if 'deleted_at' not in cols:
+            op.add_column(table, sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    for name, table, cols, where in INDEXES:
+        op.create_index(name, table, cols, sqlite_where=where, postgresql_where=where)
+
+
+def downgrade():
+    for name, table, _, _ in INDEXES:
+        op.drop_index(name, table_name=table)
+    for table in ('author', 'book'):
+        try:
+            op.drop_column(table, 'deleted_at')
+        except Exception:
+            # SQLite older versions do not support DROP COLUMN; ignore gracefully
+            pass
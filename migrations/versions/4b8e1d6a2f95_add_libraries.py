@@ -0,0 +1,126 @@
+"""Add libraries (tenants): the library table and book/author library_id
+
+Revision ID: 4b8e1d6a2f95
+Revises: 7a4c2e9f1b36
+Create Date: 2026-10-19 22:00:00.000000
+
+Existing books, authors and change log entries join the main library
+(id 1). Listing indexes are rebuilt to lead with `library_id`, and an ISBN
+is now unique within its library rather than overall. Libraries kept in
+files of their own (`LIBRARY_DATABASE_DIR`) are created with the current
+schema and are not migrated.
+"""
+from datetime import datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b8e1d6a2f95'
+down_revision = '7a4c2e9f1b36'
+branch_labels = None
+depends_on = None
+
+LIVE_ROWS = sa.text('deleted_at IS NULL')
+TABLES = ('author', 'book', 'change_log')
+# (name, table, columns, partial): the indexes that lead with library_id,
+# each without it before
+INDEXES = [
+    ('ix_author_live_name', 'author', ['name'], True),
+    ('ix_author_name_block', 'author', ['name_block'], False),
+    ('ix_book_live_title', 'book', ['title'], True),
+    ('ix_book_live_rating', 'book', ['rating'], True),
+    ('ix_book_isbn_key', 'book', ['isbn_key'], False),
+]
+NAME_INDEXES = {
+    'sqlite': ('ix_author_live_name_nocase', 'name COLLATE NOCASE'),
+    'postgresql': ('ix_author_live_name_lower', '(lower(name) COLLATE "C")'),
+}
+# Names SQLite batch mode gives the unnamed UNIQUE constraints it reflects
+NAMING_CONVENTION = {'uq': 'uq_%(table_name)s_%(column_0_name)s'}
+
+
+def create_indexes(dialect, with_library):
+    lead = ['library_id'] if with_library else []
+    for name, table, cols, partial in INDEXES:
+        where = {'sqlite_where': LIVE_ROWS,
+                 'postgresql_where': LIVE_ROWS} if partial else {}
+        op.create_index(name, table, lead + cols, if_not_exists=True,
+                        **where)
+    if dialect in NAME_INDEXES:
+        name, expression = NAME_INDEXES[dialect]
+        op.create_index(name, 'author', lead + [sa.text(expression)],
+                        if_not_exists=True,
+                        **{f'{dialect}_where': LIVE_ROWS})
+
+
+def drop_indexes():
+    for name, table, cols, partial in INDEXES:
+        op.drop_index(name, table_name=table, if_exists=True)
+    for name, expression in NAME_INDEXES.values():
+        op.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+def upgrade():
+    conn = op.get_bind()
+    dialect = conn.dialect.name
+    inspector = sa.inspect(conn)
+    if 'library' not in inspector.get_table_names():
+        library = op.create_table(
+            'library',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('name', sa.String(length=100), nullable=False,
+                      unique=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False))
+        op.bulk_insert(library, [{
+            'id': 1, 'name': 'Main Library',
+            'created_at': datetime.now(timezone.utc).replace(tzinfo=None)}])
+        if dialect == 'postgresql':
+            op.execute("SELECT setval(pg_get_serial_sequence('library', "
+                       "'id'), 1)")
+    for table in TABLES:
+        cols = [c['name'] for c in inspector.get_columns(table)]
+        if 'library_id' not in cols:
+            op.add_column(table, sa.Column('library_id', sa.Integer(),
+                                           nullable=False,
+                                           server_default='1'))
+
+    drop_indexes()
+    uniques = {tuple(uq['column_names']): uq['name']
+               for uq in inspector.get_unique_constraints('book')}
+    if ('isbn',) in uniques:
+        if dialect == 'sqlite':
+            with op.batch_alter_table(
+                    'book', recreate='always',
+                    naming_convention=NAMING_CONVENTION) as batch:
+                batch.drop_constraint('uq_book_isbn', type_='unique')
+                batch.create_unique_constraint('uq_book_library_isbn',
+                                               ['library_id', 'isbn'])
+        else:
+            op.drop_constraint(uniques['isbn',], 'book', type_='unique')
+            op.create_unique_constraint('uq_book_library_isbn', 'book',
+                                        ['library_id', 'isbn'])
+    create_indexes(dialect, with_library=True)
+    op.create_index('ix_change_log_library', 'change_log',
+                    ['library_id', 'id'], if_not_exists=True)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    op.drop_index('ix_change_log_library', table_name='change_log',
+                  if_exists=True)
+    drop_indexes()
+    if dialect == 'sqlite':
+        with op.batch_alter_table('book', recreate='always') as batch:
+            batch.drop_constraint('uq_book_library_isbn', type_='unique')
+            batch.create_unique_constraint('uq_book_isbn', ['isbn'])
+            batch.drop_column('library_id')
+    else:
+        op.drop_constraint('uq_book_library_isbn', 'book', type_='unique')
+        op.create_unique_constraint('book_isbn_key', 'book', ['isbn'])
+        op.drop_column('book', 'library_id')
+    op.drop_column('author', 'library_id')
+    op.drop_column('change_log', 'library_id')
+    create_indexes(dialect, with_library=False)
+    op.drop_table('library')
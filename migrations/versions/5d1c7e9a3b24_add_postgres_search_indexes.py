@@ -0,0 +1,58 @@
+"""Add PostgreSQL trigram and full-text search indexes
+
+Revision ID: 5d1c7e9a3b24
+Revises: 8f2a6d41c0e7
+Create Date: 2026-10-19 11:00:00.000000
+
+Only PostgreSQL gets these indexes (see backend/search.py); on SQLite this
+migration does nothing.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d1c7e9a3b24'
+down_revision = '8f2a6d41c0e7'
+branch_labels = None
+depends_on = None
+
+LIVE_ROWS = sa.text('deleted_at IS NULL')
+
+TRIGRAM_INDEXES = [
+    ('ix_book_title_trgm', 'book', 'title'),
+    ('ix_book_isbn_trgm', 'book', 'isbn'),
+    ('ix_author_name_trgm', 'author', 'name'),
+]
+FULLTEXT_INDEXES = [
+    ('ix_book_title_fts', 'book', 'title'),
+    ('ix_author_name_fts', 'author', 'name'),
+]
+
+
+def trigram_available(conn):
+    return conn.exec_driver_sql(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'").scalar() is not None
+
+
+def upgrade():
+    conn = op.get_bind()
+    if conn.dialect.name != 'postgresql':
+        return
+    # pg_trgm ships with contrib; without it substring search stays unindexed
+    if trigram_available(conn):
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for name, table, column in TRIGRAM_INDEXES:
+            op.create_index(name, table, [column], postgresql_using='gin',
+                            postgresql_ops={column: 'gin_trgm_ops'},
+                            postgresql_where=LIVE_ROWS)
+    for name, table, column in FULLTEXT_INDEXES:
+        op.create_index(name, table, [sa.text(f"to_tsvector('simple', {column})")],
+                        postgresql_using='gin', postgresql_where=LIVE_ROWS)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for name, table, _ in TRIGRAM_INDEXES + FULLTEXT_INDEXES:
+        op.execute(f'DROP INDEX IF EXISTS {name}')
@@ -0,0 +1,36 @@
+"""Add the change_log table behind /api/changes
+
+Revision ID: 7a4c2e9f1b36
+Revises: d2c8a5f7b613
+Create Date: 2026-10-19 21:00:00.000000
+
+The log starts empty: a consumer reads the full catalogue once, then
+follows /api/changes from the cursor 0.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a4c2e9f1b36'
+down_revision = 'd2c8a5f7b613'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    if 'change_log' not in sa.inspect(conn).get_table_names():
+        op.create_table(
+            'change_log',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('entity', sa.String(length=16), nullable=False),
+            sa.Column('entity_id', sa.Integer(), nullable=False),
+            sa.Column('op', sa.String(length=8), nullable=False),
+            sa.Column('changed_at', sa.DateTime(), nullable=False))
+        op.create_index('ix_change_log_entity', 'change_log',
+                        ['entity', 'entity_id', 'id'])
+
+
+def downgrade():
+    op.drop_table('change_log')
@@ -0,0 +1,51 @@
+"""Add rating_event history and rating_summary aggregates
+
+Revision ID: 8f2a6d41c0e7
+Revises: 3c9e51b7d2a4
+Create Date: 2026-10-19 10:00:00.000000
+
+Run `flask rebuild-rating-stats` afterwards to backfill history for books
+that were rated before this migration.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f2a6d41c0e7'
+down_revision = '3c9e51b7d2a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    tables = sa.inspect(conn).get_table_names()
+    if 'rating_event' not in tables:
+        op.create_table(
+            'rating_event',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('book_id', sa.Integer(),
+                      sa.ForeignKey('book.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('author_id', sa.Integer(), nullable=False),
+            sa.Column('rating', sa.Integer(), nullable=False),
+            sa.Column('previous_rating', sa.Integer(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False))
+        op.create_index('ix_rating_event_book', 'rating_event', ['book_id', 'created_at'])
+        op.create_index('ix_rating_event_author', 'rating_event', ['author_id', 'created_at'])
+        op.create_index('ix_rating_event_created', 'rating_event', ['created_at'])
+    if 'rating_summary' not in tables:
+        op.create_table(
+            'rating_summary',
+            sa.Column('scope', sa.String(10), primary_key=True),
+            sa.Column('subject_id', sa.Integer(), primary_key=True),
+            sa.Column('rating_count', sa.Integer(), nullable=False),
+            sa.Column('rating_sum', sa.Integer(), nullable=False),
+            *[sa.Column(f'hist_{value}', sa.Integer(), nullable=False,
+                        server_default='0') for value in range(1, 11)],
+            sa.Column('last_rated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_table('rating_summary')
+    op.drop_table('rating_event')
@@ -0,0 +1,45 @@
+"""Add the normalised book.isbn_key column and its index
+
+Revision ID: 9e3b6f1c8a42
+Revises: 0b7d4e2a9c51
+Create Date: 2026-10-19 19:00:00.000000
+
+Existing rows get their key here, in batches, so the duplicate check on
+entry sees every spelling of a stored ISBN right away. `flask dedupe-isbns`
+merges the books already stored more than once under one ISBN.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from backend.dedupe import backfill_keys
+from backend.isbn import isbn_key
+
+
+# revision identifiers, used by Alembic.
+revision = '9e3b6f1c8a42'
+down_revision = '0b7d4e2a9c51'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    cols = [c['name'] for c in sa.inspect(conn).get_columns('book')]
+    if 'isbn_key' not in cols:
+        op.add_column('book', sa.Column('isbn_key', sa.String(length=20),
+                                        nullable=True))
+    op.create_index('ix_book_isbn_key', 'book', ['isbn_key'],
+                    if_not_exists=True)
+    # The table as of this revision, not as the models have it now
+    book = sa.table('book', sa.column('id'), sa.column('isbn'),
+                    sa.column('isbn_key'))
+    backfill_keys(conn, book.c.isbn_key, book.c.isbn, isbn_key)
+
+
+def downgrade():
+    op.drop_index('ix_book_isbn_key', table_name='book')
+    try:
+        op.drop_column('book', 'isbn_key')
+    except Exception:
+        # SQLite older versions do not support DROP COLUMN; ignore gracefully
+        pass
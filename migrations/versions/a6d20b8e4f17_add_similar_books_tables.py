@@ -0,0 +1,45 @@
+"""Add book_feature vectors and similar_book neighbour lists
+
+Revision ID: a6d20b8e4f17
+Revises: c4f19a7e2d68
+Create Date: 2026-10-19 15:00:00.000000
+
+Run `flask rebuild-similar-books` afterwards to index the existing books.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d20b8e4f17'
+down_revision = 'c4f19a7e2d68'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    tables = sa.inspect(conn).get_table_names()
+    if 'book_feature' not in tables:
+        op.create_table(
+            'book_feature',
+            sa.Column('book_id', sa.Integer(),
+                      sa.ForeignKey('book.id', ondelete='CASCADE'), primary_key=True),
+            sa.Column('feature', sa.Integer(), primary_key=True, autoincrement=False),
+            sa.Column('weight', sa.Float(), nullable=False))
+        op.create_index('ix_book_feature_postings', 'book_feature', ['feature', 'weight'])
+    if 'similar_book' not in tables:
+        op.create_table(
+            'similar_book',
+            sa.Column('book_id', sa.Integer(),
+                      sa.ForeignKey('book.id', ondelete='CASCADE'), primary_key=True),
+            sa.Column('similar_id', sa.Integer(),
+                      sa.ForeignKey('book.id', ondelete='CASCADE'), primary_key=True),
+            sa.Column('score', sa.Float(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=False))
+        op.create_index('ix_similar_book_similar', 'similar_book', ['similar_id'])
+
+
+def downgrade():
+    op.drop_table('similar_book')
+    op.drop_table('book_feature')
@@ -0,0 +1,45 @@
+"""Add catalogue change tracking (change_seq columns, catalogue_state)
+
+Revision ID: b27e4c9d1f53
+Revises: 5d1c7e9a3b24
+Create Date: 2026-10-19 12:00:00.000000
+
+Existing rows keep change_seq NULL: snapshots load them on their first
+(full) build, and only rows written afterwards are re-read incrementally.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b27e4c9d1f53'
+down_revision = '5d1c7e9a3b24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    for table in ('author', 'book'):
+        cols = [c['name'] for c in inspector.get_columns(table)]
+        if 'change_seq' not in cols:
+            op.add_column(table, sa.Column('change_seq', sa.Integer(), nullable=True))
+            op.create_index(f'ix_{table}_change_seq', table, ['change_seq'])
+    if 'catalogue_state' not in inspector.get_table_names():
+        op.create_table(
+            'catalogue_state',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.Column('epoch', sa.Integer(), nullable=False))
+
+
+def downgrade():
+    op.drop_table('catalogue_state')
+    for table in ('book', 'author'):
+        op.drop_index(f'ix_{table}_change_seq', table_name=table)
+        try:
+            op.drop_column(table, 'change_seq')
+        except Exception:
+            # SQLite older versions do not support DROP COLUMN; ignore gracefully
+            pass
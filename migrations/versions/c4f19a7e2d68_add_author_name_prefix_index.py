@@ -0,0 +1,38 @@
+"""Add a case-insensitive author name prefix index
+
+Revision ID: c4f19a7e2d68
+Revises: e81f3a6c2b90
+Create Date: 2026-10-19 14:00:00.000000
+
+Serves the author picker's prefix lookups (see backend/search.py): an
+index on `name COLLATE NOCASE` on SQLite and on `lower(name) COLLATE "C"`
+on PostgreSQL, live rows only.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4f19a7e2d68'
+down_revision = 'e81f3a6c2b90'
+branch_labels = None
+depends_on = None
+
+LIVE_ROWS = sa.text('deleted_at IS NULL')
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.create_index('ix_author_live_name_nocase', 'author',
+                        [sa.text('name COLLATE NOCASE')],
+                        sqlite_where=LIVE_ROWS, if_not_exists=True)
+    elif dialect == 'postgresql':
+        op.create_index('ix_author_live_name_lower', 'author',
+                        [sa.text('(lower(name) COLLATE "C")')],
+                        postgresql_where=LIVE_ROWS, if_not_exists=True)
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_author_live_name_nocase')
+    op.execute('DROP INDEX IF EXISTS ix_author_live_name_lower')
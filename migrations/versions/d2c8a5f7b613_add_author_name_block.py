@@ -0,0 +1,45 @@
+"""Add the author.name_block blocking key and its index
+
+Revision ID: d2c8a5f7b613
+Revises: 9e3b6f1c8a42
+Create Date: 2026-10-19 20:00:00.000000
+
+Existing rows get their key here, in batches, so the similar-name check
+when adding an author sees them right away. `flask dedupe-authors
+--dry-run` prints the authors already stored under several spellings.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from backend.author_names import block_key
+from backend.dedupe import backfill_keys
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2c8a5f7b613'
+down_revision = '9e3b6f1c8a42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    cols = [c['name'] for c in sa.inspect(conn).get_columns('author')]
+    if 'name_block' not in cols:
+        op.add_column('author', sa.Column('name_block', sa.String(length=64),
+                                          nullable=True))
+    op.create_index('ix_author_name_block', 'author', ['name_block'],
+                    if_not_exists=True)
+    # The table as of this revision, not as the models have it now
+    author = sa.table('author', sa.column('id'), sa.column('name'),
+                      sa.column('name_block'))
+    backfill_keys(conn, author.c.name_block, author.c.name, block_key)
+
+
+def downgrade():
+    op.drop_index('ix_author_name_block', table_name='author')
+    try:
+        op.drop_column('author', 'name_block')
+    except Exception:
+        # SQLite older versions do not support DROP COLUMN; ignore gracefully
+        pass
@@ -0,0 +1,38 @@
+"""Add updated_at to author and book
+
+Revision ID: e81f3a6c2b90
+Revises: b27e4c9d1f53
+Create Date: 2026-10-19 13:00:00.000000
+
+Existing rows are stamped with the migration time, so pages cached by
+browsers before the upgrade are revalidated once.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e81f3a6c2b90'
+down_revision = 'b27e4c9d1f53'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    for table in ('author', 'book'):
+        cols = [c['name'] for c in inspector.get_columns(table)]
+        if 'updated_at' not in cols:
+            op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+            op.execute(sa.text(
+                f'UPDATE {table} SET updated_at = CURRENT_TIMESTAMP'))
+
+
+def downgrade():
+    for table in ('book', 'author'):
+        try:
+            op.drop_column(table, 'updated_at')
+        except Exception:
+            # SQLite older versions do not support DROP COLUMN; ignore gracefully
+            pass
@@ -0,0 +1,55 @@
+"""Add readers, per-reader ratings and the also_liked table
+
+Revision ID: f5a92c6e1d37
+Revises: a6d20b8e4f17
+Create Date: 2026-10-19 17:00:00.000000
+
+`also_liked` is filled by `flask rebuild-also-liked`.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5a92c6e1d37'
+down_revision = 'a6d20b8e4f17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    tables = sa.inspect(conn).get_table_names()
+    if 'reader' not in tables:
+        op.create_table(
+            'reader',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('name', sa.String(length=100), nullable=False, unique=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False))
+    if 'reader_rating' not in tables:
+        op.create_table(
+            'reader_rating',
+            sa.Column('reader_id', sa.Integer(),
+                      sa.ForeignKey('reader.id', ondelete='CASCADE'), primary_key=True),
+            sa.Column('book_id', sa.Integer(),
+                      sa.ForeignKey('book.id', ondelete='CASCADE'), primary_key=True),
+            sa.Column('rating', sa.Integer(), nullable=False),
+            sa.Column('rated_at', sa.DateTime(), nullable=False))
+        op.create_index('ix_reader_rating_book', 'reader_rating', ['book_id'])
+    if 'also_liked' not in tables:
+        op.create_table(
+            'also_liked',
+            sa.Column('book_id', sa.Integer(),
+                      sa.ForeignKey('book.id', ondelete='CASCADE'), primary_key=True),
+            sa.Column('other_id', sa.Integer(),
+                      sa.ForeignKey('book.id', ondelete='CASCADE'), primary_key=True),
+            sa.Column('score', sa.Float(), nullable=False),
+            sa.Column('readers', sa.Integer(), nullable=False),
+            sa.Column('computed_at', sa.DateTime(), nullable=False))
+        op.create_index('ix_also_liked_other', 'also_liked', ['other_id'])
+
+
+def downgrade():
+    op.drop_table('also_liked')
+    op.drop_table('reader_rating')
+    op.drop_table('reader')
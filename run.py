@@ -8,8 +8,16 @@ Usage:
     python run.py
 """
 
-from backend.app import app
+from werkzeug.serving import is_running_from_reloader
+
+from backend.app import create_app
+from backend.server import start_background_jobs
+
+app = create_app()
 
 if __name__ == '__main__':
+    if is_running_from_reloader():
+        # the reloader's child serves; its parent only watches the files
+        start_background_jobs(app)
     # Bind to 0.0.0.0 for Codio deployment (makes app accessible externally)
     app.run(host='0.0.0.0', port=5002, debug=True)
@@ -0,0 +1,334 @@
+"""
+Shared test settings.
+
+Tests run on in-memory SQLite by default. To run them against PostgreSQL,
+point TEST_DATABASE_URL at an empty scratch database, or let
+bin/test_postgres.sh start a throwaway local server for the run:
+
+    TEST_DATABASE_URL=postgresql+psycopg://localhost/books_test pytest
+
+Two ways to get a database:
+
+- `app` / `client`: one app whose schema is created once per run
+  (`shared_app`). Each test runs in a transaction that is rolled back
+  afterwards; what the app commits meanwhile only releases a SAVEPOINT
+  (`SavepointConnection`). A module overrides `app_config` for settings
+  the app reads per request (SIMILAR_BOOKS, STREAM_LISTINGS, ...).
+- `db_uri`: for tests that build an app of their own, because they need
+  a setting only read when the app is created (LIVE_UPDATES,
+  CATALOGUE_SNAPSHOT, libraries in files of their own, a read replica).
+
+`build` adds authors and books to either; `statements` records the SQL
+the shared app runs.
+
+With pytest-xdist (`pytest -n 4`) every worker gets databases of its own:
+on PostgreSQL `<database>_gw0`, ... are created next to TEST_DATABASE_URL's.
+"""
+
+import itertools
+import os
+import sqlite3
+import weakref
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import StaticPool
+
+# The engines of `shared_app`: kept open for the whole run
+SHARED_ENGINES = weakref.WeakSet()
+
+
+def database_named(uri, suffix):
+    """`uri` with `_<suffix>` added to its database name; a PostgreSQL
+    database of that name is created if there is none. In-memory SQLite
+    databases are private to their engine already."""
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite':
+        if url.database in (None, '', ':memory:'):
+            return uri
+        root, ext = os.path.splitext(url.database)
+        return url.set(database=f'{root}_{suffix}{ext}').render_as_string(
+            hide_password=False)
+    name = f'{url.database}_{suffix}'
+    admin = create_engine(url, isolation_level='AUTOCOMMIT')
+    try:
+        with admin.connect() as conn:
+            exists = conn.exec_driver_sql(
+                'SELECT 1 FROM pg_database WHERE datname = %(name)s',
+                {'name': name}).scalar()
+            if not exists:
+                conn.exec_driver_sql(f'CREATE DATABASE "{name}"')
+    finally:
+        admin.dispose()
+    return url.set(database=name).render_as_string(hide_password=False)
+
+
+@pytest.fixture(scope='session')
+def worker_db_uri():
+    """TEST_DATABASE_URL, one database per pytest-xdist worker."""
+    uri = os.environ.get('TEST_DATABASE_URL', 'sqlite:///:memory:')
+    worker = os.environ.get('PYTEST_XDIST_WORKER')
+    return database_named(uri, worker) if worker else uri
+
+
+@pytest.fixture
+def db_uri(worker_db_uri):
+    """Database URI for tests that don't depend on a particular database."""
+    return worker_db_uri
+
+
+@pytest.fixture(autouse=True)
+def dispose_engines():
+    """Close the pools of every engine a test used. Each test builds its own
+    app (and engine); on a database server their idle connections would
+    otherwise pile up until it refuses new clients."""
+    engines = weakref.WeakSet()
+
+    def remember(conn):
+        engines.add(conn.engine)
+
+    event.listen(Engine, 'engine_connect', remember)
+    yield
+    event.remove(Engine, 'engine_connect', remember)
+    for engine in list(engines):
+        if engine not in SHARED_ENGINES:
+            engine.dispose()
+
+
+class SavepointConnection:
+    """A DBAPI connection that, during a test, turns the transactions the
+    app runs on it into SAVEPOINTs of the test's own transaction.
+
+    Every SQLAlchemy transaction begun on it starts a SAVEPOINT; its commit
+    releases the SAVEPOINT, its rollback rolls back to it. `end_test()`
+    rolls the whole test back. Transactions on the one connection nest, so
+    two connections open at once (a session and an engine-level writer)
+    see each other's changes, and rolling back the outer one also undoes
+    what the inner one committed: don't leave a session transaction open
+    across writes the test checks after the session is removed.
+    """
+
+    in_test = False
+
+    def begin_test(self):
+        self._savepoints = []
+        self.in_test = True
+
+    def end_test(self):
+        self.in_test = False
+        super().rollback()
+
+    def begin_savepoint(self):
+        if self.in_test:
+            name = f'test_savepoint_{len(self._savepoints)}'
+            self.execute(f'SAVEPOINT {name}')
+            self._savepoints.append(name)
+
+    def commit(self):
+        if not self.in_test:
+            return super().commit()
+        if self._savepoints:
+            self.execute(f'RELEASE SAVEPOINT {self._savepoints.pop()}')
+
+    def rollback(self):
+        if not self.in_test:
+            return super().rollback()
+        if self._savepoints:
+            name = self._savepoints.pop()
+            self.execute(f'ROLLBACK TO SAVEPOINT {name}')
+            self.execute(f'RELEASE SAVEPOINT {name}')
+
+
+class SavepointSQLite(SavepointConnection, sqlite3.Connection):
+    """pysqlite connection in autocommit mode, so it leaves BEGIN to us."""
+
+    def begin_test(self):
+        super().begin_test()
+        self.execute('BEGIN')
+
+
+def savepoint_connector(uri):
+    """`creator` for an engine on `uri` whose connection is a
+    `SavepointConnection`."""
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite':
+        def connect():
+            return sqlite3.connect(
+                url.database or ':memory:', factory=SavepointSQLite,
+                isolation_level=None, check_same_thread=False)
+        return connect
+
+    import psycopg
+
+    class SavepointPostgres(SavepointConnection, psycopg.Connection):
+        pass
+
+    dialect = url.get_dialect()()
+    cargs, cparams = dialect.create_connect_args(url)
+    return lambda: SavepointPostgres.connect(*cargs, **cparams)
+
+
+@pytest.fixture(scope='session')
+def shared_app(worker_db_uri):
+    """One app for the run, on one connection, with its schema created
+    once (in a database of its own, `<database>_shared`, so tests that
+    create and drop their own schema don't touch it)."""
+    from backend.app import create_app
+    from backend.data_models import db
+
+    uri = database_named(worker_db_uri, 'shared')
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': uri,
+        'SQLALCHEMY_ENGINE_OPTIONS': {
+            'creator': savepoint_connector(uri),
+            'poolclass': StaticPool,
+            # Rolled back by the test, not by the pool
+            'pool_reset_on_return': None,
+        },
+        # Off unless a module asks for them (`app_config`)
+        'SIMILAR_BOOKS': False,
+        # No timer thread: the `app` fixture flushes after each test
+        'RATING_BUFFER_FLUSH_INTERVAL': 0,
+    })
+    with app.app_context():
+        engine = db.primary_engine
+        SHARED_ENGINES.add(engine)
+
+        @event.listens_for(engine, 'begin')
+        def begin_savepoint(conn):
+            conn.connection.dbapi_connection.begin_savepoint()
+
+        db.drop_all()
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        engine.dispose()
+
+
+@pytest.fixture
+def app_config():
+    """Settings a module runs the shared app with, for these tests only
+    (override it in the module). Only settings the app reads per request
+    can change this way; a module that needs others builds its own app."""
+    return {}
+
+
+def forget_app_state(app):
+    """Drop what the app keeps in memory between requests, which a
+    rollback doesn't undo."""
+    from backend.page_cache import FragmentCache
+
+    page_cache = app.extensions['page_cache']
+    page_cache.fragments = FragmentCache(page_cache.fragments.max_entries)
+    feed = app.extensions.get('change_feed')
+    if feed is not None:
+        feed.__init__(feed._history.maxlen, feed.queue_size)
+
+
+@pytest.fixture
+def app(shared_app, app_config):
+    """The shared app inside a transaction rolled back after the test (its
+    config restored too)."""
+    from backend.data_models import db
+
+    config = dict(shared_app.config)
+    shared_app.config.update(app_config)
+    with shared_app.app_context():
+        proxy = db.primary_engine.raw_connection()
+        connection = proxy.dbapi_connection
+        proxy.close()
+        connection.begin_test()
+        try:
+            yield shared_app
+            shared_app.extensions['rating_buffer'].flush()
+        finally:
+            db.session.remove()
+            connection.end_test()
+            shared_app.config.clear()
+            shared_app.config.update(config)
+            forget_app_state(shared_app)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def statements(app):
+    """SQL of every statement executed."""
+    from backend.data_models import db
+
+    seen = []
+
+    def record(conn, cursor, statement, *args):
+        seen.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    yield seen
+    event.remove(db.engine, 'before_cursor_execute', record)
+
+
+class DataBuilder:
+    """Authors and books for tests, with unique names and valid ISBNs
+    unless given. Keyword arguments set any other column; `books()` adds
+    many in one flush. Rows go to the app in context: the shared `app`, or
+    one a test creates itself."""
+
+    def __init__(self, session):
+        self.session = session
+        self._numbers = itertools.count(1)
+
+    def author(self, **fields):
+        from backend.data_models import Author
+
+        fields.setdefault('name', f'Author {next(self._numbers)}')
+        author = Author(**fields)
+        self.session.add(author)
+        self.session.commit()
+        return author
+
+    def _book(self, author, fields):
+        from backend.data_models import Book
+        from backend.isbn import isbn13_check_digit
+
+        number = next(self._numbers)
+        first12 = f'978{number:09d}'
+        fields.setdefault('isbn', first12 + isbn13_check_digit(first12))
+        fields.setdefault('title', f'Book {number}')
+        return Book(author_id=getattr(author, 'id', author), **fields)
+
+    def book(self, author=None, **fields):
+        """A book of `author` (an `Author` or its id; a new one if None)."""
+        book = self._book(self.author() if author is None else author,
+                          fields)
+        self.session.add(book)
+        self.session.commit()
+        return book
+
+    def books(self, count=None, author=None, titles=(), isbns=(), **fields):
+        """`count` books, or one per title (or ISBN) given."""
+        author = self.author() if author is None else author
+        books = []
+        for i in range(count or max(len(titles), len(isbns))):
+            book_fields = dict(fields)
+            if titles:
+                book_fields['title'] = titles[i]
+            if isbns:
+                book_fields['isbn'] = isbns[i]
+            books.append(self._book(author, book_fields))
+        self.session.add_all(books)
+        self.session.commit()
+        return books
+
+
+@pytest.fixture
+def build():
+    """A `DataBuilder` on the session of the app in context (request
+    `app` before it for the shared one)."""
+    from backend.data_models import db
+
+    return DataBuilder(db.session)
@@ -1,31 +1,13 @@
 import sys
 import os
-import pytest
 
 # Add project root to sys.path so `app` is importable
 sys.path.insert(0, os.path.abspath(
     os.path.join(os.path.dirname(__file__), '..')))
 
-from backend.app import app as main_app  # noqa: E402
 from backend.data_models import db, Author, Book  # noqa: E402
 
 
-@pytest.fixture
-def app():
-    from backend.app import create_app
-    test_app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
-    with test_app.app_context():
-        db.create_all()
-        yield test_app
-        db.session.remove()
-        db.drop_all()
-
-
-@pytest.fixture
-def client(app):
-    return app.test_client()
-
-
 def test_admin_page_lists_authors_and_books(client, app):
     with app.app_context():
         a = Author(name='Alice')
@@ -65,3 +47,88 @@ def test_admin_delete_book_and_author(client, app):
         rv = client.post(f'/admin/delete_author/{a.id}')
         assert rv.status_code in (302, 200)
         assert Author.query.filter_by(id=a.id).first() is None
+
+
+def _make_books(app, n, author_name='Bulk Author'):
+    a = Author(name=author_name)
+    db.session.add(a)
+    db.session.commit()
+    books = [Book(isbn=f'{author_name}-{i}', title=f'{author_name} Book {i:03d}',
+                  author_id=a.id) for i in range(n)]
+    db.session.add_all(books)
+    db.session.commit()
+    return a.id, [b.id for b in books]
+
+
+def test_admin_bulk_delete_books(client, app):
+    with app.app_context():
+        _, ids = _make_books(app, 5)
+        rv = client.post('/admin/bulk/delete_books',
+                         data={'book_ids': [str(i) for i in ids[:3]]})
+        assert rv.status_code in (302, 200)
+        assert Book.query.count() == 2
+        assert {b.id for b in Book.query.all()} == set(ids[3:])
+
+
+def test_admin_bulk_rate_books(client, app):
+    with app.app_context():
+        _, ids = _make_books(app, 4)
+        rv = client.post('/admin/bulk/rate_books',
+                         data={'book_ids': [str(i) for i in ids[:2]],
+                               'rating': '9'})
+        assert rv.status_code in (302, 200)
+        db.session.expire_all()
+        ratings = {b.id: b.rating for b in Book.query.all()}
+        assert ratings[ids[0]] == 9 and ratings[ids[1]] == 9
+        assert ratings[ids[2]] is None
+
+        # out of range ratings are rejected without touching the rows
+        client.post('/admin/bulk/rate_books',
+                    data={'book_ids': [str(ids[2])], 'rating': '11'})
+        db.session.expire_all()
+        assert db.session.get(Book, ids[2]).rating is None
+
+
+def test_admin_bulk_reassign_books(client, app):
+    with app.app_context():
+        _, ids = _make_books(app, 3, 'First')
+        target_id, _ = _make_books(app, 0, 'Second')
+        rv = client.post('/admin/bulk/reassign_books',
+                         data={'book_ids': [str(i) for i in ids],
+                               'author_id': str(target_id)})
+        assert rv.status_code in (302, 200)
+        db.session.expire_all()
+        assert Book.query.filter_by(author_id=target_id).count() == 3
+
+        # unknown author is refused
+        client.post('/admin/bulk/reassign_books',
+                    data={'book_ids': [str(ids[0])], 'author_id': '9999'})
+        db.session.expire_all()
+        assert db.session.get(Book, ids[0]).author_id == target_id
+
+
+def test_admin_bulk_delete_authors(client, app):
+    with app.app_context():
+        a1, _ = _make_books(app, 2, 'Gone One')
+        a2, _ = _make_books(app, 2, 'Gone Two')
+        keep, _ = _make_books(app, 1, 'Keeper')
+        rv = client.post('/admin/bulk/delete_authors',
+                         data={'author_ids': [str(a1), str(a2)]})
+        assert rv.status_code in (302, 200)
+        assert [a.id for a in Author.query.all()] == [keep]
+        assert Book.query.count() == 1
+
+
+def test_admin_listing_is_paginated(client, app):
+    with app.app_context():
+        _make_books(app, 12, 'Paged')
+        rv = client.get('/admin?per_page=5')
+        body = rv.get_data(as_text=True)
+        assert 'Paged Book 000' in body
+        assert 'Paged Book 005' not in body
+        assert 'Page 1 of 3' in body
+
+        rv = client.get('/admin?per_page=5&page=3')
+        body = rv.get_data(as_text=True)
+        assert 'Paged Book 011' in body
+        assert 'Paged Book 000' not in body
@@ -0,0 +1,251 @@
+"""
+Tests for per-reader ratings and the batch-computed "readers who liked
+this also liked" table.
+"""
+
+import os
+import random
+import sys
+import time
+
+import pytest
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+import backend.also_liked  # noqa: E402
+from backend.also_liked import (LIKED_RATING, all_also_liked,  # noqa: E402
+                                all_also_liked_numpy, rebuild_also_liked,
+                                set_reader_rating, top_also_liked)
+from backend.data_models import (db, AlsoLiked, Author, Book,  # noqa: E402
+                                 Reader, ReaderRating)
+
+# Seconds a full recompute may take at 10k books x 1k readers
+RECOMPUTE_BUDGET = 20
+
+
+@pytest.fixture
+def books(app):
+    author = Author(name='Anyone')
+    db.session.add(author)
+    db.session.flush()
+    books = [Book(isbn=f'AL-{i}', title=f'Book {i}', author_id=author.id)
+             for i in range(6)]
+    db.session.add_all(books)
+    db.session.flush()
+    ids = [b.id for b in books]
+    db.session.commit()
+    return ids
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def computation(request, monkeypatch):
+    """Run the test with NumPy (if installed) and without."""
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(backend.also_liked, 'numpy', None)
+    return request.param
+
+
+def rate(ratings):
+    """ratings: {reader name: {book_id: rating}}"""
+    with db.engine.begin() as conn:
+        for name, by_book in ratings.items():
+            reader_id = conn.execute(db.insert(Reader).values(
+                name=name, created_at=db.func.now())).inserted_primary_key[0]
+            for book_id, rating in by_book.items():
+                set_reader_rating(conn, reader_id, book_id, rating)
+
+
+def rebuild():
+    with db.engine.begin() as conn:
+        return rebuild_also_liked(conn)
+
+
+def also_liked(book_id):
+    return [(row.other_id, row.readers) for row in AlsoLiked.query
+            .filter_by(book_id=book_id)
+            .order_by(AlsoLiked.score.desc(), AlsoLiked.other_id)]
+
+
+def test_cosine_of_liked_columns():
+    by_reader = {1: [10, 20, 30], 2: [10, 20], 3: [10, 30], 4: [20, 30]}
+    by_book = {10: [1, 2, 3], 20: [1, 2, 4], 30: [1, 3, 4]}
+    best = top_also_liked(10, by_reader, by_book)
+    assert [other for _, _, other in best] == [20, 30]
+    score, readers, _ = best[0]
+    assert readers == 2
+    assert score == pytest.approx(2 / 3)
+    # pairs liked together by fewer readers are dropped
+    assert top_also_liked(10, by_reader, by_book, min_readers=3) == []
+
+
+def test_numpy_matches_pure_python(monkeypatch):
+    pytest.importorskip('numpy')
+    rng = random.Random(5)
+    by_reader, by_book = {}, {}
+    for reader_id in range(300):
+        # two libraries: their books are never paired
+        library_id = reader_id % 2
+        liked = rng.sample(range(library_id * 500, library_id * 500 + 500),
+                           rng.randint(1, 40))
+        by_reader[library_id, reader_id] = liked
+        for book_id in liked:
+            by_book.setdefault(book_id, []).append((library_id, reader_id))
+    expected = dict(all_also_liked(by_reader, by_book))
+    assert dict(all_also_liked_numpy(by_reader, by_book)) == expected
+    # in batches of a few books
+    monkeypatch.setattr(backend.also_liked, 'PAIR_BATCH', 1000)
+    assert dict(all_also_liked_numpy(by_reader, by_book)) == expected
+    assert dict(all_also_liked_numpy({}, {})) == {}
+
+
+def test_rebuild_uses_liked_ratings_only(app, books, computation):
+    a, b, c, d = books[:4]
+    rate({
+        'ann': {a: 9, b: 8, c: 9},
+        'bob': {a: 10, b: 7, c: 2},
+        'cat': {a: 8, b: 9, d: LIKED_RATING - 1},
+        'dan': {c: 9, d: 9},
+    })
+    assert rebuild() == 2
+    assert also_liked(a) == [(b, 3)]
+    assert also_liked(b) == [(a, 3)]
+    # c was liked with a by one reader only, d never liked with anything
+    assert also_liked(c) == []
+    assert also_liked(d) == []
+
+
+def test_rebuild_replaces_rows_and_skips_deleted_books(app, books,
+                                                       computation):
+    a, b, c = books[:3]
+    rate({'ann': {a: 9, b: 9, c: 9}, 'bob': {a: 9, b: 9, c: 9}})
+    rebuild()
+    assert also_liked(a) == [(b, 2), (c, 2)]
+    db.session.get(Book, c).soft_delete()
+    db.session.commit()
+    rebuild()
+    assert also_liked(a) == [(b, 2)]
+    assert AlsoLiked.query.filter_by(other_id=c).count() == 0
+
+
+def test_reader_ratings_leave_library_rating_alone(client, books):
+    book_id = books[0]
+    client.post('/reader', data={'name': 'Ann'})
+    html = client.get('/reader').get_data(as_text=True)
+    assert 'Rating as <strong>Ann</strong>' in html
+
+    client.post(f'/book/{book_id}/rate', data={'rating': '8'})
+    client.post(f'/book/{book_id}/rate', data={'rating': '9'})
+    reader = Reader.query.filter_by(name='Ann').one()
+    assert db.session.get(ReaderRating, (reader.id, book_id)).rating == 9
+    assert db.session.get(Book, book_id).rating is None
+    html = client.get(f'/book/{book_id}').get_data(as_text=True)
+    assert 'Your Rating (Ann)' in html
+    assert '9/10' in html
+
+    # back to rating for the library
+    client.post('/reader', data={'name': ''})
+    client.post(f'/book/{book_id}/rate', data={'rating': '4'})
+    assert db.session.get(Book, book_id).rating == 4
+    assert ReaderRating.query.count() == 1
+
+
+def test_reader_name_is_reused(client, app):
+    client.post('/reader', data={'name': 'Ann'})
+    app.test_client().post('/reader', data={'name': 'Ann'})
+    assert Reader.query.count() == 1
+    resp = client.post('/reader', data={'name': 'x' * 101})
+    assert resp.status_code == 400
+
+
+def test_book_page_shows_also_liked(client, books):
+    a, b, c = books[:3]
+    rate({'ann': {a: 9, b: 9}, 'bob': {a: 9, b: 8}, 'cat': {c: 10}})
+    path = f'/book/{a}'
+    etag = client.get(path).headers['ETag']
+    assert 'Readers Who Liked This' not in client.get(path).get_data(
+        as_text=True)
+
+    rebuild()
+    resp = client.get(path, headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    html = resp.get_data(as_text=True)
+    assert 'Readers Who Liked This Also Liked' in html
+    assert f'href="/book/{b}"' in html
+    assert f'href="/book/{c}"' not in html
+
+
+def test_etag_differs_per_reader(client, app, books):
+    path = f'/book/{books[0]}'
+    library_etag = client.get(path).headers['ETag']
+    client.post('/reader', data={'name': 'Ann'})
+    client.get('/')  # shows the flash message
+    ann_etag = client.get(path).headers['ETag']
+    assert ann_etag != library_etag
+    client.post(f'/book/{books[0]}/rate', data={'rating': '7'})
+    client.get(path)  # shows the flash message
+    assert client.get(path).headers['ETag'] != ann_etag
+
+
+def test_cli_rebuild(app, books):
+    a, b = books[:2]
+    rate({'ann': {a: 9, b: 9}, 'bob': {a: 9, b: 9}})
+    result = app.test_cli_runner().invoke(args=['rebuild-also-liked'])
+    assert 'for 2 book(s)' in result.output
+    assert also_liked(a) == [(b, 2)]
+
+
+def seed_readers(n_books, n_readers, per_reader, topics=20, seed=7):
+    """Books in `topics` equal clusters; each reader rates mostly books of
+    two favourite topics highly and a few random ones anywhere."""
+    rng = random.Random(seed)
+    db.session.execute(db.insert(Author), [{'id': 1, 'name': 'Many'}])
+    db.session.execute(db.insert(Book), [
+        {'id': i, 'isbn': f'SCALE-{i}', 'title': f'Book {i}', 'author_id': 1}
+        for i in range(1, n_books + 1)])
+    db.session.execute(db.insert(Reader), [
+        {'id': r, 'name': f'reader {r}'} for r in range(1, n_readers + 1)])
+    size = n_books // topics
+    rows = []
+    for reader_id in range(1, n_readers + 1):
+        favourites = rng.sample(range(topics), 2)
+        picked = set()
+        while len(picked) < per_reader:
+            if rng.random() < 0.75:
+                topic = rng.choice(favourites)
+                book_id = topic * size + rng.randint(1, size)
+                rating = rng.randint(6, 10)
+            else:
+                book_id = rng.randint(1, n_books)
+                rating = rng.randint(1, 10)
+            if book_id not in picked:
+                picked.add(book_id)
+                rows.append({'reader_id': reader_id, 'book_id': book_id,
+                             'rating': rating})
+    for start in range(0, len(rows), 5000):
+        db.session.execute(db.insert(ReaderRating), rows[start:start + 5000])
+    db.session.commit()
+    return size
+
+
+def test_recompute_time_at_scale(app, record_property):
+    """10k books x 1k readers (60 ratings each): time a full recompute."""
+    size = seed_readers(10_000, 1_000, 60)
+    start = time.perf_counter()
+    books = rebuild()
+    elapsed = time.perf_counter() - start
+    record_property('recompute_seconds', round(elapsed, 2))
+    print(f'\nalso-liked recompute: {elapsed:.2f} s for {books} books')
+    assert elapsed < RECOMPUTE_BUDGET
+    assert books > 5_000
+
+    # suggestions stay within the book's topic cluster
+    same_topic = total = 0
+    for book_id, other_id in db.session.query(
+            AlsoLiked.book_id, AlsoLiked.other_id).limit(2000):
+        total += 1
+        same_topic += (book_id - 1) // size == (other_id - 1) // size
+    assert same_topic / total > 0.8
@@ -0,0 +1,184 @@
+"""
+Tests for fingerprinted static assets and response compression.
+"""
+
+import gzip
+import hashlib
+import os
+import re
+import shutil
+import sys
+
+import pytest
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.app import create_app  # noqa: E402
+from backend.assets import IMMUTABLE, build_assets  # noqa: E402
+from backend.data_models import db, Author, Book  # noqa: E402
+
+STYLES = os.path.join(os.path.dirname(__file__), '..', 'frontend', 'static',
+                      'styles.css')
+STYLESHEET = re.compile(r'href="(/static/[^"]+\.css)"')
+
+
+def make_app(db_uri, static_folder, **config):
+    """An app of its own (not the shared `app`): each test builds the
+    assets of a static folder of its own."""
+    settings = {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': db_uri,
+        'RATING_BUFFER_FLUSH_INTERVAL': 0,
+    }
+    settings.update(config)
+    app = create_app(settings)
+    app.static_folder = str(static_folder)
+    return app
+
+
+@pytest.fixture
+def static_folder(tmp_path):
+    folder = tmp_path / 'static'
+    folder.mkdir()
+    shutil.copy(STYLES, folder / 'styles.css')
+    return folder
+
+
+@pytest.fixture
+def app(db_uri, static_folder):
+    app = make_app(db_uri, static_folder)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def library(app):
+    author = Author(name='Asset Author')
+    db.session.add(author)
+    db.session.flush()
+    db.session.add_all([
+        Book(isbn=f'AST-{i}', title=f'Asset Book {i}', author_id=author.id)
+        for i in range(30)])
+    db.session.commit()
+
+
+def stylesheet_url(client):
+    return STYLESHEET.search(client.get('/').get_data(as_text=True)).group(1)
+
+
+def styles_bytes():
+    with open(STYLES, 'rb') as f:
+        return f.read()
+
+
+def test_pages_link_fingerprinted_stylesheet(client, static_folder):
+    digest = hashlib.sha256(styles_bytes()).hexdigest()[:12]
+    assert stylesheet_url(client) == f'/static/dist/styles.{digest}.css'
+    assert (static_folder / 'dist' / 'manifest.json').exists()
+
+
+def test_fingerprinted_file_is_immutable(client):
+    resp = client.get(stylesheet_url(client))
+    assert resp.status_code == 200
+    assert resp.headers['Cache-Control'] == IMMUTABLE
+    assert 'Content-Encoding' not in resp.headers
+    assert 'Accept-Encoding' in resp.headers['Vary']
+    assert resp.mimetype == 'text/css'
+    assert resp.data == styles_bytes()
+
+
+def test_precompressed_gzip_variant(client):
+    resp = client.get(stylesheet_url(client),
+                      headers={'Accept-Encoding': 'gzip, deflate'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert resp.headers['Cache-Control'] == IMMUTABLE
+    assert resp.mimetype == 'text/css'
+    assert gzip.decompress(resp.data) == styles_bytes()
+
+
+def test_precompressed_brotli_variant(client):
+    brotli = pytest.importorskip('brotli')
+    resp = client.get(stylesheet_url(client),
+                      headers={'Accept-Encoding': 'gzip, br'})
+    assert resp.headers['Content-Encoding'] == 'br'
+    assert brotli.decompress(resp.data) == styles_bytes()
+
+
+def test_plain_static_url_still_served(client):
+    resp = client.get('/static/styles.css')
+    assert resp.status_code == 200
+    assert 'immutable' not in resp.headers.get('Cache-Control', '')
+
+
+def test_build_assets(static_folder):
+    first = build_assets(str(static_folder))
+    (static_folder / 'styles.css').write_text('body { color: red; }')
+    second = build_assets(str(static_folder))
+    assert first['styles.css'] != second['styles.css']
+    dist = static_folder / 'dist'
+    assert (dist / first['styles.css']).exists()
+
+    build_assets(str(static_folder), clean=True)
+    assert not (dist / first['styles.css']).exists()
+    assert not (dist / (first['styles.css'] + '.gz')).exists()
+    assert (dist / second['styles.css']).exists()
+
+
+def test_without_build_links_plain_file(db_uri, static_folder):
+    app = make_app(db_uri, static_folder, ASSET_AUTO_BUILD=False)
+    with app.test_request_context():
+        assert app.extensions['assets'].url('styles.css') == \
+            '/static/styles.css'
+    assert not (static_folder / 'dist').exists()
+
+
+def test_html_compressed(client, library):
+    plain = client.get('/')
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+    resp = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert int(resp.headers['Content-Length']) == len(resp.data)
+    assert len(resp.data) < len(plain.data)
+    assert gzip.decompress(resp.data) == plain.data
+
+
+def test_small_and_json_responses(client, app, library):
+    book_id = Book.query.first().id
+    resp = client.post(f'/api/book/{book_id}/rating', json={'rating': 5},
+                       headers={'Accept-Encoding': 'gzip'})
+    # below COMPRESS_MIN_SIZE
+    assert 'Content-Encoding' not in resp.headers
+    assert resp.get_json()['rating'] == 5
+
+    app.config['COMPRESS_MIN_SIZE'] = 10
+    resp = client.post(f'/api/book/{book_id}/rating', json={'rating': 6},
+                       headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert b'"rating"' in gzip.decompress(resp.data)
+    app.extensions['rating_buffer'].flush()
+
+
+def test_streamed_page_compressed(client, app, library):
+    app.config['STREAM_LISTINGS'] = True
+    plain = client.get('/')
+    resp = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in resp.headers
+    assert gzip.decompress(resp.data) == plain.data
+
+
+def test_compression_off(client, app, library):
+    app.config['COMPRESS_RESPONSES'] = False
+    resp = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in resp.headers
@@ -0,0 +1,196 @@
+"""
+Tests for the AI review JSON endpoint: the async ASGI variant in
+`backend.asgi` and the blocking Flask view behind the same URL.
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+httpx = pytest.importorskip('httpx')
+pytest.importorskip('asgiref')
+
+from backend.asgi import create_asgi_app  # noqa: E402
+from backend.data_models import db, Author, Book, BookFeature  # noqa: E402
+
+
+class FakeAIService:
+    """Stands in for the AI service through httpx.MockTransport."""
+
+    def __init__(self, delay=0.0, error=None, response=None):
+        self.delay = delay
+        self.error = error
+        self.response = response
+        self.calls = 0
+
+    async def __call__(self, request):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        if self.response is not None:
+            return self.response
+        return httpx.Response(200, json={'result': 'A fine review'})
+
+
+@pytest.fixture
+def service():
+    return FakeAIService()
+
+
+@pytest.fixture
+def asgi_app(service, tmp_path):
+    # A file database: the endpoint reads and writes from worker threads,
+    # which must not share the single connection of an in-memory database
+    app = create_asgi_app(
+        {'TESTING': True,
+         'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'ai.sqlite'}"},
+        client=httpx.AsyncClient(transport=httpx.MockTransport(service)))
+    with app.flask_app.app_context():
+        db.create_all()
+        author = Author(name='Async Author')
+        db.session.add(author)
+        db.session.flush()
+        db.session.add(Book(isbn='9780000000002', title='Async Book',
+                            author_id=author.id))
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+
+def book_id():
+    return Book.query.filter_by(title='Async Book').one().id
+
+
+def post_reviews(app, paths):
+    """POST to every path concurrently through the ASGI app."""
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport,
+                                     base_url='http://test') as client:
+            return await asyncio.gather(*(client.post(p) for p in paths))
+    return asyncio.run(run())
+
+
+def test_async_review_saves_recommendation(asgi_app, service):
+    bid = book_id()
+    [resp] = post_reviews(asgi_app, [f'/api/book/{bid}/ai_review'])
+    assert resp.status_code == 200
+    assert resp.json() == {'book_id': bid, 'ai_recommendation': 'A fine review'}
+    assert service.calls == 1
+    db.session.expire_all()
+    assert db.session.get(Book, bid).ai_recommendation == 'A fine review'
+
+
+def test_async_review_refreshes_similar_books(asgi_app, service):
+    """The review is part of a book's content: its feature vector follows
+    the set-based UPDATE."""
+    bid = book_id()
+
+    def features():
+        return {f for f, in db.session.query(BookFeature.feature)
+                .filter_by(book_id=bid)}
+    before = features()
+    post_reviews(asgi_app, [f'/api/book/{bid}/ai_review'])
+    db.session.expire_all()
+    assert features() > before
+
+
+def test_async_review_unknown_book(asgi_app, service):
+    [resp] = post_reviews(asgi_app, ['/api/book/9999/ai_review'])
+    assert resp.status_code == 404
+    assert service.calls == 0
+
+
+def test_async_review_upstream_timeout(asgi_app, service):
+    service.error = httpx.ReadTimeout('too slow')
+    bid = book_id()
+    [resp] = post_reviews(asgi_app, [f'/api/book/{bid}/ai_review'])
+    assert resp.status_code == 504
+    db.session.expire_all()
+    assert db.session.get(Book, bid).ai_recommendation is None
+
+
+@pytest.mark.parametrize('response', [
+    lambda: httpx.Response(200, text='<html>Bad gateway</html>'),
+    lambda: httpx.Response(200, headers={'Content-Encoding': 'gzip'},
+                           stream=httpx.ByteStream(b'not gzip')),
+], ids=['not-json', 'undecodable'])
+def test_async_review_bad_upstream_answer(asgi_app, service, response):
+    service.response = response()
+    bid = book_id()
+    [resp] = post_reviews(asgi_app, [f'/api/book/{bid}/ai_review'])
+    assert resp.status_code == 502
+    assert 'AI service' in resp.json()['error']
+    db.session.expire_all()
+    assert db.session.get(Book, bid).ai_recommendation is None
+
+
+def test_concurrent_reviews_overlap(asgi_app, service):
+    # 50 upstream calls of 0.3s each take ~0.3s when awaited concurrently
+    # (15s if they were made one after another)
+    service.delay = 0.3
+    bid = book_id()
+    start = time.perf_counter()
+    responses = post_reviews(asgi_app, [f'/api/book/{bid}/ai_review'] * 50)
+    elapsed = time.perf_counter() - start
+    assert [r.status_code for r in responses] == [200] * 50
+    assert service.calls == 50
+    assert elapsed < 3.0
+
+
+def test_other_routes_are_served_by_flask(asgi_app):
+    async def run():
+        transport = httpx.ASGITransport(app=asgi_app)
+        async with httpx.AsyncClient(transport=transport,
+                                     base_url='http://test') as client:
+            return await client.get('/')
+    resp = asyncio.run(run())
+    assert resp.status_code == 200
+    assert 'Async Book' in resp.text
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+def test_sync_json_endpoint(asgi_app, monkeypatch):
+    import requests
+    monkeypatch.setattr(requests, 'post', lambda *a, **kw: FakeResponse(
+        {'result': {'message': 'Sync review'}}))
+    bid = book_id()
+    client = asgi_app.flask_app.test_client()
+    resp = client.post(f'/api/book/{bid}/ai_review')
+    assert resp.status_code == 200
+    assert resp.get_json()['ai_recommendation'] == 'Sync review'
+    db.session.expire_all()
+    assert db.session.get(Book, bid).ai_recommendation == 'Sync review'
+
+
+def test_sync_json_endpoint_timeout(asgi_app, monkeypatch):
+    import requests
+
+    def timeout(*args, **kwargs):
+        raise requests.exceptions.Timeout()
+    monkeypatch.setattr(requests, 'post', timeout)
+    client = asgi_app.flask_app.test_client()
+    resp = client.post(f'/api/book/{book_id()}/ai_review')
+    assert resp.status_code == 504
+    assert 'error' in resp.get_json()
@@ -0,0 +1,197 @@
+"""
+Tests for author name matching, the add author duplicate check and the
+batch author merge.
+"""
+
+import os
+import random
+import sys
+import time
+from datetime import date
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.author_names import (block_key, name_similarity,  # noqa: E402
+                                  parse_name)
+from backend.data_models import (db, Author, Book,  # noqa: E402
+                                 RatingEvent, RatingSummary)
+from backend.dedupe import (apply_author_merges,  # noqa: E402
+                            author_merge_plan, match_block)
+from backend.rating_stats import AUTHOR_SCOPE, set_ratings  # noqa: E402
+
+# Seconds allowed for the merge plan of SCALE_AUTHORS authors
+PLAN_BUDGET = 15
+SCALE_AUTHORS = 50_000
+
+
+def add_author(name, **fields):
+    author = Author(name=name, **fields)
+    db.session.add(author)
+    db.session.commit()
+    return author.id
+
+
+def similarity(a, b):
+    return name_similarity(parse_name(a), parse_name(b))
+
+
+def test_parse_name():
+    for name in ('Jane Austen', 'Austen, Jane', 'JANE AUSTEN', ' jane  austen'):
+        assert parse_name(name) == ('austen', ('jane',))
+    assert parse_name('JK Rowling') == parse_name('J.K. Rowling') \
+        == ('rowling', ('j', 'k'))
+    assert parse_name('Ursula K. Le Guin') == ('leguin', ('ursula', 'k'))
+    assert parse_name('Martin Luther King, Jr.') == \
+        ('king', ('martin', 'luther'))
+    assert parse_name('Gabriel García Márquez') == \
+        ('marquez', ('gabriel', 'garcia'))
+    assert block_key('J. Austen') == block_key('Jane Austen') == 'austen j'
+    assert block_key('Plato') == 'plato'
+    assert block_key('...') is None
+
+
+def test_name_similarity():
+    assert similarity('Jane Austen', 'Austen, Jane') == 1.0
+    assert similarity('Jane Austen', 'J. Austen') == 0.9
+    assert similarity('J. R. R. Tolkien', 'John Ronald Reuel Tolkien') == 0.9
+    assert similarity('Ursula K. Le Guin', 'Ursula Le Guin') == 0.95
+    assert similarity('Jane Austen', 'John Austen') == 0.0
+    assert similarity('J. R. Tolkien', 'J. K. Tolkien') == 0.0
+
+
+def test_abbreviated_name_matching_two_people_is_left_alone():
+    members = [(1, 'Jane Austen'), (2, 'John Austen'), (3, 'J. Austen'),
+               (4, 'Austen, Jane')]
+    assert match_block(members) == [[1, 4]]
+    assert match_block([(1, 'Jane Austen'), (3, 'J. Austen')]) == [[1, 3]]
+
+
+def test_name_block_is_set_on_insert_and_update(app):
+    author_id = add_author('Jane Austen')
+    author = db.session.get(Author, author_id)
+    assert author.name_block == 'austen j'
+    author.name = 'Emily Bronte'
+    db.session.commit()
+    assert db.session.get(Author, author_id).name_block == 'bronte e'
+    db.session.execute(Author.__table__.insert().values(name='Ann Brontë'))
+    assert Author.query.filter_by(name='Ann Brontë').one().name_block == \
+        'bronte a'
+
+
+def test_add_author_asks_before_adding_a_similar_name(client):
+    add_author('Jane Austen')
+    response = client.post('/add_author', data={'name': 'J. Austen'})
+    assert response.status_code == 409
+    page = response.get_data(as_text=True)
+    assert 'looks like an author already in the library' in page
+    assert 'Jane Austen' in page and 'confirm_similar' in page
+    assert Author.query.count() == 1
+
+    response = client.post('/add_author', data={
+        'name': 'J. Austen', 'confirm_similar': '1'})
+    assert response.status_code == 302
+    response = client.post('/add_author', data={'name': 'Cassandra Austen'})
+    assert response.status_code == 302
+    assert Author.query.count() == 3
+
+
+def test_merge_authors(app, build, statements):
+    jane = add_author('Jane Austen', birth_date=date(1775, 12, 16))
+    short = add_author('J. Austen', date_of_death=date(1817, 7, 18))
+    flipped = add_author('Austen, Jane')
+    john = add_author('John Austen')
+    books = [b.id for b in build.books(2, author=short)
+             + build.books(1, author=flipped)]
+    own = [b.id for b in build.books(1, author=jane)]
+    build.books(1, author=john)
+    set_ratings(db.session.connection(), {books[0]: 8, own[0]: 6})
+    db.session.commit()
+
+    plan = author_merge_plan()
+    # J. Austen could be John as well as Jane
+    assert plan == [[(jane, 'Jane Austen'), (flipped, 'Austen, Jane')]]
+    plan = author_merge_plan(threshold=0.9)
+    assert plan == [[(jane, 'Jane Austen'), (flipped, 'Austen, Jane')]]
+
+    db.session.delete(db.session.get(Author, john))
+    db.session.commit()
+    plan = author_merge_plan()
+    # The fullest name first, abbreviated last
+    assert [author_id for author_id, _ in plan[0]] == [jane, flipped, short]
+    del statements[:]
+    assert apply_author_merges(plan) == 2
+    assert len([s for s in statements
+                if s.lstrip().upper().startswith('UPDATE BOOK ')]) == 1
+
+    assert [a.id for a in Author.query] == [jane]
+    author = db.session.get(Author, jane)
+    assert author.birth_date == date(1775, 12, 16)
+    assert author.date_of_death == date(1817, 7, 18)
+    assert {b.id for b in Book.query.filter_by(author_id=jane)} == \
+        set(books + own)
+    assert {e.author_id for e in RatingEvent.query} == {jane}
+    summary = db.session.get(RatingSummary, (AUTHOR_SCOPE, jane))
+    assert summary.rating_count == 2
+    assert db.session.get(RatingSummary, (AUTHOR_SCOPE, short)) is None
+    assert author_merge_plan() == []
+
+
+def test_live_author_survives(app):
+    old = add_author('Jane Austen')
+    live = add_author('Austen, Jane')
+    db.session.get(Author, old).soft_delete()
+    db.session.commit()
+    assert [author_id for author_id, _ in author_merge_plan()[0]] == \
+        [live, old]
+
+
+def test_cli_dry_run_and_old_rows(app):
+    jane = add_author('Jane Austen')
+    austen = add_author('Austen, Jane')
+    # Rows from before the name_block column
+    db.session.execute(Author.__table__.update().values(name_block=None))
+    db.session.commit()
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['dedupe-authors', '--dry-run'])
+    assert f'Jane Austen (#{jane}) <- Austen, Jane (#{austen})' in \
+        result.output
+    assert 'Would merge 1 group(s); 1 author(s) to remove.' in result.output
+    assert Author.query.count() == 2
+    assert Author.query.filter(Author.name_block.is_(None)).count() == 0
+
+    result = runner.invoke(args=['dedupe-authors'])
+    assert '1 duplicate author(s) removed' in result.output
+    assert Author.query.count() == 1
+
+
+def test_plan_time_at_scale(app, record_property):
+    """50k authors, 1 in 20 entered again under another spelling."""
+    rng = random.Random(3)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+
+    def word(low, high):
+        return ''.join(rng.choice(letters)
+                       for _ in range(rng.randint(low, high))).title()
+    firsts = [word(4, 8) for _ in range(400)]
+    lasts = [word(6, 10) for _ in range(5000)]
+    names = sorted({f'{rng.choice(firsts)} {rng.choice(lasts)}'
+                    for _ in range(SCALE_AUTHORS)})
+    planted = names[::20]
+    rows = [{'name': name} for name in names]
+    rows += [{'name': f'{last}, {first}'}
+             for first, last in (name.split() for name in planted)]
+    for start in range(0, len(rows), 5000):
+        db.session.execute(db.insert(Author), rows[start:start + 5000])
+    db.session.commit()
+
+    start = time.perf_counter()
+    plan = author_merge_plan()
+    elapsed = time.perf_counter() - start
+    record_property('plan_seconds', round(elapsed, 2))
+    print(f'\nauthor merge plan: {elapsed:.2f} s for {len(rows)} authors')
+    assert elapsed < PLAN_BUDGET
+    found = {group[0][1] for group in plan if len(group) == 2}
+    assert len(found & set(planted)) >= 0.95 * len(planted)
@@ -0,0 +1,147 @@
+"""
+Tests for the author picker: /api/authors prefix lookups and the add book
+form that uses them.
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.data_models import db, Author, Book  # noqa: E402
+
+NAMES = ['Tolkien', 'tolstoy', 'Toni Morrison', 'Zadie Smith', 'tol%_x',
+         'Ursula Le Guin']
+
+
+@pytest.fixture
+def authors(app):
+    authors = {name: Author(name=name) for name in NAMES}
+    db.session.add_all(authors.values())
+    db.session.commit()
+    return authors
+
+
+def lookup(client, **params):
+    resp = client.get('/api/authors', query_string=params)
+    assert resp.status_code == 200
+    return resp.get_json()
+
+
+def names(result):
+    return [a['name'] for a in result['authors']]
+
+
+def test_prefix_ignores_case(client, authors):
+    assert names(lookup(client, q='tol')) == ['tol%_x', 'Tolkien', 'tolstoy']
+    assert names(lookup(client, q='TOLS')) == ['tolstoy']
+    assert names(lookup(client, q='  zad ')) == ['Zadie Smith']
+    assert lookup(client, q='nobody') == {'authors': [], 'more': False}
+
+
+def test_wildcards_are_literal(client, authors):
+    assert names(lookup(client, q='tol%')) == ['tol%_x']
+    assert names(lookup(client, q='%')) == []
+    assert names(lookup(client, q='_')) == []
+
+
+def test_ids_returned(client, authors):
+    result = lookup(client, q='ursula')
+    assert result['authors'] == [
+        {'id': authors['Ursula Le Guin'].id, 'name': 'Ursula Le Guin'}]
+
+
+def test_limit_and_more(client, app, authors):
+    result = lookup(client, limit=2)
+    assert names(result) == ['tol%_x', 'Tolkien']
+    assert result['more'] is True
+    assert lookup(client, q='to', limit=4)['more'] is False
+    app.config['AUTHOR_LOOKUP_MAX_LIMIT'] = 3
+    assert len(lookup(client, limit=50)['authors']) == 3
+    assert len(lookup(client, limit=0)['authors']) == 1
+
+
+def test_deleted_authors_hidden(client, authors):
+    authors['Tolkien'].soft_delete()
+    db.session.commit()
+    assert names(lookup(client, q='tol')) == ['tol%_x', 'tolstoy']
+
+
+def test_lookup_is_bounded(client, authors, statements):
+    lookup(client, q='tol', limit=2)
+    [sql] = [s for s in statements if 'FROM author' in s]
+    assert 'LIMIT' in sql
+    assert 'LIKE' not in sql.upper()
+
+
+def test_form_does_not_list_authors(client, authors, statements):
+    html = client.get('/add_book').get_data(as_text=True)
+    assert '<datalist id="author_options"></datalist>' in html
+    assert not any(name in html for name in NAMES)
+    assert 'data-lookup-url="/api/authors"' in html
+    assert not any('FROM author' in s for s in statements)
+
+
+def test_edit_form_prefills_author(client, authors):
+    book = Book(isbn='PICK-1', title='Picked',
+                author_id=authors['Zadie Smith'].id)
+    db.session.add(book)
+    db.session.commit()
+    html = client.get(f'/add_book?book_id={book.id}').get_data(as_text=True)
+    assert 'value="Zadie Smith"' in html
+    assert f'name="author_id" value="{authors["Zadie Smith"].id}"' in html
+
+
+def test_add_book_with_typed_author_name(client, authors):
+    resp = client.post('/add_book', data={
+        'isbn': '9780000000026', 'title': 'Typed', 'author_id': '',
+        'author_name': 'Toni Morrison'})
+    assert resp.status_code == 302
+    book = Book.query.filter_by(isbn='9780000000026').one()
+    assert book.author_id == authors['Toni Morrison'].id
+
+
+def test_picked_author_id_wins(client, authors):
+    client.post('/add_book', data={
+        'isbn': '9780000000033', 'title': 'Picked Id',
+        'author_id': str(authors['tolstoy'].id), 'author_name': 'Tolkien'})
+    book = Book.query.filter_by(isbn='9780000000033').one()
+    assert book.author_id == authors['tolstoy'].id
+
+
+def test_add_book_with_unknown_author(client, authors):
+    for name in ('Nobody In Particular', ''):
+        resp = client.post('/add_book', data={
+            'isbn': '9780000000040', 'title': 'Orphan', 'author_id': '',
+            'author_name': name})
+        assert resp.status_code == 400
+        assert 'Please choose an existing author.' in resp.get_data(
+            as_text=True)
+    resp = client.post('/add_book', data={
+        'isbn': '9780000000040', 'title': 'Orphan', 'author_id': '999999'})
+    assert resp.status_code == 400
+    assert Book.query.filter_by(isbn='9780000000040').count() == 0
+
+
+def test_edit_book_with_unknown_author(client, authors):
+    book = Book(isbn='9780000000057', title='Kept',
+                author_id=authors['Zadie Smith'].id)
+    db.session.add(book)
+    db.session.commit()
+    resp = client.post('/add_book', data={
+        'book_id': str(book.id), 'isbn': '9780000000057', 'title': 'Kept',
+        'author_id': '', 'author_name': 'Nobody In Particular'})
+    assert resp.status_code == 400
+    assert Book.query.filter_by(isbn='9780000000057').count() == 1
+    assert db.session.get(Book, book.id).author_id == \
+        authors['Zadie Smith'].id
+
+
+def test_home_does_not_load_every_author(client, authors, statements):
+    client.get('/')
+    assert not any(s.lstrip().startswith('SELECT author.id')
+                   and 'ORDER BY author.name' in s for s in statements)
@@ -11,29 +11,9 @@ import pytest
 sys.path.insert(0, os.path.abspath(
     os.path.join(os.path.dirname(__file__), '..')))
 
-from backend.app import create_app  # noqa: E402
 from backend.data_models import db, Author, Book  # noqa: E402
 
 
-@pytest.fixture
-def app():
-    """Create and configure test app with isolated in-memory database."""
-    app = create_app(
-        {'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
-
-    with app.app_context():
-        db.create_all()
-        yield app
-        db.session.remove()
-        db.drop_all()
-
-
-@pytest.fixture
-def client(app):
-    """Test client for making requests."""
-    return app.test_client()
-
-
 @pytest.fixture
 def auth_author(app):
     """Create test author."""
@@ -263,7 +243,7 @@ class TestRatingDisplay:
         """Unrated books should not show rating on home page."""
         response = client.get('/')
         # Should not show "Not rated" or empty rating
-        assert b'/10' not in response.data
+        assert b'/10</strong>' not in response.data
 
     def test_rating_displayed_on_book_detail(self, client, app, auth_book):
         """Book detail page should display rating."""
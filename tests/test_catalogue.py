@@ -0,0 +1,239 @@
+"""
+Tests for the in-process catalogue snapshot behind the home page listing:
+parity with the ORM listing, incremental refreshes from the change counter,
+full rebuilds after DELETEs, and buffered ratings.
+"""
+
+import os
+import re
+import sys
+from datetime import timedelta
+
+import pytest
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.app import create_app  # noqa: E402
+from backend.catalogue import BookRow, CatalogueSnapshot  # noqa: E402
+from backend.data_models import (db, Author, Book,  # noqa: E402
+                                 CatalogueState, utcnow)
+from backend.purge import purge_deleted  # noqa: E402
+
+
+def make_app(db_uri, **config):
+    """An app of its own (not the shared `app`): CATALOGUE_SNAPSHOT is
+    only read when the app is created."""
+    settings = {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': db_uri,
+        'CATALOGUE_SNAPSHOT': True,
+        'RATING_BUFFER_FLUSH_INTERVAL': 0,
+    }
+    settings.update(config)
+    return create_app(settings)
+
+
+@pytest.fixture
+def app(db_uri):
+    app = make_app(db_uri)
+    with app.app_context():
+        db.create_all()
+        yield app
+        app.extensions['rating_buffer'].flush()
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def shared_uri(db_uri, tmp_path):
+    """`db_uri`, or a file database when that is in-memory SQLite (which
+    a second app could not see)."""
+    if db_uri.startswith('sqlite') and ':memory:' in db_uri:
+        return f"sqlite:///{tmp_path / 'library.sqlite'}"
+    return db_uri
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def add_library():
+    """Two authors, five books, some rated."""
+    ada = Author(name='Ada Writer')
+    zed = Author(name='Zed Author')
+    db.session.add_all([ada, zed])
+    db.session.flush()
+    books = [
+        Book(isbn='CAT-1', title='Maple Street', author_id=ada.id, rating=7),
+        Book(isbn='CAT-2', title='Birch Lane', author_id=zed.id, rating=9),
+        Book(isbn='CAT-3', title='Cedar Road', author_id=ada.id),
+        Book(isbn='CAT-4', title='Alder Way', author_id=zed.id, rating=3,
+             ai_recommendation='Worth a read.'),
+        Book(isbn='CAT-5', title='Elm Court', author_id=zed.id, rating=5),
+    ]
+    db.session.add_all(books)
+    db.session.commit()
+    return {b.title: b.id for b in books}
+
+
+@pytest.fixture
+def library(app):
+    return add_library()
+
+
+BOOK_LINK = re.compile(r'<h3 class="title">\s*<a href="/book/(\d+)"[^>]*>([^<]*)<')
+
+
+def listing(client, **args):
+    """Book titles on the home page, in order."""
+    html = client.get('/', query_string=args).get_data(as_text=True)
+    return [title for _, title in BOOK_LINK.findall(html)]
+
+
+@pytest.mark.parametrize('sort,order', [
+    ('title', 'asc'), ('title', 'desc'), ('author', 'asc'),
+    ('rating', 'asc'), ('rating', 'desc')])
+def test_listing_matches_orm(shared_uri, sort, order):
+    snapshot_app = make_app(shared_uri)
+    orm_app = make_app(shared_uri, CATALOGUE_SNAPSHOT=False)
+    with snapshot_app.app_context():
+        db.create_all()
+        try:
+            add_library()
+        finally:
+            db.session.remove()
+    expected = listing(orm_app.test_client(), sort=sort, order=order)
+    assert len(expected) == 5
+    try:
+        assert listing(snapshot_app.test_client(), sort=sort,
+                       order=order) == expected
+    finally:
+        with snapshot_app.app_context():
+            db.drop_all()
+
+
+def test_search_and_pagination(client, library):
+    assert sorted(listing(client, q='zed')) == [
+        'Alder Way', 'Birch Lane', 'Elm Court']
+    assert listing(client, q='cat-3') == ['Cedar Road']
+    assert listing(client, per_page=2) == ['Alder Way', 'Birch Lane']
+    assert listing(client, per_page=2, page=3) == ['Maple Street']
+    html = client.get('/?per_page=2&q=a').get_data(as_text=True)
+    assert 'Found 5 results' in html
+    assert 'Page 1 of 3' in html
+
+
+def test_rows_read_from_columns(app, library):
+    snapshot = app.extensions['catalogue'].current()
+    assert isinstance(snapshot, CatalogueSnapshot)
+    rows = snapshot.rows(snapshot.select('alder'))
+    assert len(rows) == 1
+    row = rows[0]
+    assert isinstance(row, BookRow)
+    assert (row.id, row.title, row.rating, row.has_review,
+            row.author.name) == (library['Alder Way'], 'Alder Way', 3,
+                                 True, 'Zed Author')
+    assert snapshot.book_counts[row.author_id] == 3
+    with pytest.raises(AttributeError):
+        row.extra = 1
+
+
+def test_writes_refresh_incrementally(app, client, library):
+    catalogue = app.extensions['catalogue']
+    listing(client)
+    assert catalogue.stats == {'full': 1, 'incremental': 0}
+
+    client.post(f"/book/{library['Cedar Road']}/rate", data={'rating': '10'})
+    assert listing(client, sort='rating', order='desc')[0] == 'Cedar Road'
+    client.post(f"/book/{library['Elm Court']}/delete")
+    assert 'Elm Court' not in listing(client)
+    client.post(f"/book/{library['Elm Court']}/undo_delete")
+    assert 'Elm Court' in listing(client)
+    assert catalogue.stats == {'full': 1, 'incremental': 3}
+
+    # no writes: nothing to re-read
+    listing(client)
+    assert catalogue.stats['incremental'] == 3
+    # the library fixture was the first write
+    assert db.session.get(CatalogueState, 1).version == 4
+
+
+def test_delete_statement_forces_rebuild(app, client, library):
+    catalogue = app.extensions['catalogue']
+    listing(client)
+    Book.query.filter_by(id=library['Birch Lane']).delete()
+    db.session.commit()
+    assert 'Birch Lane' not in listing(client)
+    assert catalogue.stats['full'] == 2
+
+
+def test_purge_keeps_snapshot(app, client, library):
+    catalogue = app.extensions['catalogue']
+    client.post(f"/book/{library['Elm Court']}/delete")
+    Book.query.execution_options(include_deleted=True).filter_by(
+        id=library['Elm Court']).update(
+        {'deleted_at': utcnow() - timedelta(days=60)})
+    db.session.commit()
+    listing(client)
+    assert catalogue.stats == {'full': 1, 'incremental': 0}
+
+    assert purge_deleted(retention=60, pause=0) == {'books': 1, 'authors': 0}
+    assert 'Elm Court' not in listing(client)
+    assert catalogue.stats == {'full': 1, 'incremental': 0}
+
+
+def test_other_process_writes(shared_uri):
+    first, second = make_app(shared_uri), make_app(shared_uri)
+    with first.app_context():
+        db.create_all()
+        author = Author(name='Shared Author')
+        db.session.add(author)
+        db.session.flush()
+        db.session.add(Book(isbn='CAT-S', title='Shared Book',
+                            author_id=author.id))
+        db.session.commit()
+        db.session.remove()
+    assert 'Shared Book' in listing(second.test_client())
+    with first.app_context():
+        db.session.execute(db.update(Book).where(
+            Book.title == 'Shared Book').values(title='Renamed Shared'))
+        db.session.commit()
+        db.session.remove()
+    try:
+        titles = listing(second.test_client())
+        assert 'Renamed Shared' in titles and 'Shared Book' not in titles
+        assert second.extensions['catalogue'].stats['incremental'] == 1
+    finally:
+        with first.app_context():
+            db.drop_all()
+
+
+def test_buffered_rating_overlay(app, client, library):
+    book_id = library['Cedar Road']
+    resp = client.post(f'/api/book/{book_id}/rating', json={'rating': 6})
+    assert resp.status_code in (200, 202)
+    snapshot = app.extensions['catalogue'].current()
+    row = snapshot.rows([snapshot.index_by_id[book_id]])[0]
+    assert row.rating == 6
+    # sorting by rating flushes the buffer into the table first
+    assert listing(client, sort='rating') == [
+        'Alder Way', 'Elm Court', 'Cedar Road', 'Maple Street',
+        'Birch Lane']
+
+
+def test_tracking_off_leaves_rows_unstamped(db_uri):
+    app = make_app(db_uri, CATALOGUE_SNAPSHOT=False)
+    with app.app_context():
+        db.create_all()
+        try:
+            author = Author(name='Plain Author')
+            db.session.add(author)
+            db.session.commit()
+            assert author.change_seq is None
+            assert db.session.get(CatalogueState, 1) is None
+        finally:
+            db.session.remove()
+            db.drop_all()
@@ -0,0 +1,239 @@
+"""
+Tests for the live updates: the in-process change feed, what commits
+publish on it, the Server-Sent Events stream and the row fragments the
+pages fetch.
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.app import create_app  # noqa: E402
+from backend.change_feed import ChangeFeed, note_changes  # noqa: E402
+from backend.data_models import db, Author, Book  # noqa: E402
+from backend.rating_stats import set_ratings  # noqa: E402
+
+
+@pytest.fixture
+def feed(app):
+    return app.extensions['change_feed']
+
+
+@pytest.fixture
+def library(app):
+    """Two authors, three books; returns their ids."""
+    jane, emily = Author(name='Jane Austen'), Author(name='Emily Bronte')
+    db.session.add_all([jane, emily])
+    db.session.flush()
+    books = [Book(isbn='9780000000019', title='Emma', author_id=jane.id),
+             Book(isbn='9780000000026', title='Persuasion',
+                  author_id=jane.id),
+             Book(isbn='9780000000033', title='Wuthering Heights',
+                  author_id=emily.id)]
+    db.session.add_all(books)
+    db.session.commit()
+    return {'jane': jane.id, 'emily': emily.id,
+            'books': [book.id for book in books]}
+
+
+def published(feed, since=0):
+    return [change for change in feed._history if change['id'] > since]
+
+
+def messages(stream, count):
+    """The next `count` SSE messages of `stream`, parsed."""
+    parsed = []
+    for _ in range(count):
+        fields = {}
+        message = next(stream)
+        if isinstance(message, bytes):
+            message = message.decode()
+        for line in message.strip().split('\n'):
+            name, _, value = line.partition(': ')
+            fields[name] = value
+        parsed.append(fields)
+    return parsed
+
+
+def test_subscribers_get_published_events():
+    feed = ChangeFeed()
+    first, second = feed.subscribe(), feed.subscribe()
+    assert feed.publish() is None
+    change = feed.publish(books={3, 1}, authors=[2], added=[3])
+    assert change == {'id': 1, 'books': [1, 3], 'authors': [2],
+                      'added': [3], 'library': None}
+    assert first.get(0) == second.get(0) == change
+    feed.unsubscribe(first)
+    feed.publish(books=[4])
+    assert first.get(0) is None
+    assert second.get(0)['books'] == [4]
+    assert len(feed) == 1
+
+
+def test_reconnect_replays_missed_events():
+    feed = ChangeFeed(history=3)
+    for book_id in range(1, 6):
+        feed.publish(books=[book_id])
+    subscription = feed.subscribe(feed.event_id(3))
+    assert [subscription.get(0)['books'] for _ in range(2)] == [[4], [5]]
+    assert not subscription.overflowed
+    # Event 2 is no longer kept
+    assert feed.subscribe(feed.event_id(1)).overflowed
+    # An id of another process (or from before a restart) starts afresh
+    subscription = feed.subscribe('0000-3')
+    assert not subscription.overflowed and subscription.get(0) is None
+
+
+def test_stream_format_and_overflow():
+    feed = ChangeFeed(queue_size=2)
+    stream = feed.stream(keepalive=0.01)
+    assert next(stream) == 'retry: 3000\n\n'
+    assert len(feed) == 1
+    assert next(stream) == ': keepalive\n\n'
+
+    feed.publish(books=[1], authors=[2], added=[1])
+    [message] = messages(stream, 1)
+    assert message['id'] == feed.event_id(1)
+    assert message['event'] == 'change'
+    assert json.loads(message['data']) == {'books': [1], 'authors': [2],
+                                           'added': [1]}
+    # A listener that can't keep up is told to reload, and nothing else
+    for book_id in range(3):
+        feed.publish(books=[book_id])
+    [message] = messages(stream, 1)
+    assert message['event'] == 'reload'
+    with pytest.raises(StopIteration):
+        next(stream)
+    assert len(feed) == 0
+
+
+def test_stream_ends_after_max_seconds():
+    feed = ChangeFeed()
+    stream = feed.stream(keepalive=5, max_seconds=0.01)
+    assert list(stream) == ['retry: 3000\n\n']
+    assert len(feed) == 0
+
+
+def test_commits_publish_what_they_changed(app, feed, library):
+    jane, emily = library['jane'], library['emily']
+    emma, persuasion, heights = library['books']
+    [change] = published(feed)
+    assert change['books'] == [emma, persuasion, heights]
+    assert change['added'] == [emma, persuasion, heights]
+    assert change['authors'] == [jane, emily]
+
+    db.session.get(Book, emma).title = 'Emma (2nd ed.)'
+    db.session.commit()
+    [change] = published(feed, 1)
+    assert (change['books'], change['authors'], change['added']) == \
+        ([emma], [jane], [])
+
+    set_ratings(db.session.connection(), {heights: 8})
+    db.session.commit()
+    assert published(feed, 2)[0]['books'] == [heights]
+
+    # A bulk soft delete through the ORM
+    db.session.get(Author, jane).soft_delete()
+    db.session.commit()
+    [change] = published(feed, 3)
+    assert change['books'] == [emma, persuasion]
+    assert change['authors'] == [jane]
+
+
+def test_rolled_back_changes_are_not_published(app, feed, library):
+    last_id = feed.last_id
+    db.session.get(Book, library['books'][0]).title = 'Never saved'
+    db.session.flush()
+    db.session.rollback()
+    # Written outside a session: dropped when the connection is reused
+    with db.engine.begin() as conn:
+        note_changes(conn, books=[library['books'][1]])
+    db.session.get(Book, library['books'][2]).title = 'Saved'
+    db.session.commit()
+    assert [change['books'] for change in published(feed, last_id)] == \
+        [[library['books'][2]]]
+
+
+def test_buffered_rating_is_published_when_accepted(client, feed, library):
+    last_id = feed.last_id
+    book_id = library['books'][0]
+    response = client.post(f'/api/book/{book_id}/rating',
+                           json={'rating': 7})
+    assert response.status_code == 202
+    assert published(feed, last_id)[0]['books'] == [book_id]
+    # The fragment already shows the buffered rating
+    rows = client.get(f'/live/rows?views=home&ids={book_id}').get_json()
+    assert '7/10' in rows['rows']['home'][str(book_id)]
+
+
+def test_changes_endpoint(client, feed, library):
+    response = client.get('/live/changes', buffered=False,
+                          headers={'Last-Event-ID': feed.event_id(0)})
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    stream = iter(response.response)
+    assert next(stream) == b'retry: 3000\n\n'
+    # Replayed from the history
+    [message] = messages(stream, 1)
+    assert message['id'] == feed.event_id(1)
+    assert json.loads(message['data'])['added'] == library['books']
+    response.close()
+    assert len(feed) == 0
+
+
+def test_rows_endpoint(client, library):
+    emma, persuasion, heights = library['books']
+    db.session.get(Book, persuasion).ai_recommendation = 'A quiet classic.'
+    db.session.get(Book, heights).soft_delete()
+    db.session.commit()
+
+    response = client.get(
+        f'/live/rows?views=home,library,review,bogus'
+        f'&ids={emma},{persuasion},{heights}&q=emm')
+    rows = response.get_json()['rows']
+    assert set(rows) == {'home', 'library', 'review'}
+    home = rows['home'][str(emma)]
+    assert f'data-book-id="{emma}"' in home
+    assert f'data-author-id="{library["jane"]}"' in home
+    assert '(2 books)' in home
+    assert 'class="match">Emm</mark>a' in home
+    assert rows['home'][str(heights)] is None
+    assert 'data-live-view="library"' in rows['library'][str(emma)]
+    assert rows['review'][str(emma)] is None
+    assert 'A quiet classic.' in rows['review'][str(persuasion)]
+
+    assert client.get('/live/rows?views=home&ids=x').status_code == 400
+    ids = ','.join(str(i) for i in range(1, 300))
+    assert client.get(f'/live/rows?views=home&ids={ids}').status_code == 400
+
+
+def test_pages_mark_their_rows(client, library):
+    db.session.get(Book, library['books'][0]).ai_recommendation = 'Witty.'
+    db.session.commit()
+    page = client.get('/').get_data(as_text=True)
+    assert 'data-live-view="home"' in page
+    assert "new EventSource('/live/changes')" in page
+    page = client.get('/recommend').get_data(as_text=True)
+    assert 'data-live-list="review"' in page
+    assert 'data-live-view="review"' in page
+    assert 'data-live-view="library"' in page
+
+
+def test_live_updates_can_be_turned_off(db_uri):
+    # An app of its own: LIVE_UPDATES is only read when it is created
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': db_uri,
+                      'LIVE_UPDATES': False})
+    with app.app_context():
+        db.create_all()
+        assert 'change_feed' not in app.extensions
+        client = app.test_client()
+        assert client.get('/live/changes').status_code == 404
+        assert 'EventSource' not in client.get('/').get_data(as_text=True)
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,200 @@
+"""
+Tests for the change log: what book and author writes append to it, the
+/api/changes cursor endpoint and compaction.
+"""
+
+import os
+import sys
+from datetime import timedelta
+
+import pytest
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.app import create_app  # noqa: E402
+from backend.change_log import compact_change_log  # noqa: E402
+from backend.data_models import (db, Author, Book, ChangeLogEntry,  # noqa: E402
+                                 utcnow)
+from backend.dedupe import apply_author_merges  # noqa: E402
+from backend.rating_stats import set_ratings  # noqa: E402
+
+
+@pytest.fixture
+def library(app):
+    """Two authors, three books; returns their ids."""
+    jane, emily = Author(name='Jane Austen'), Author(name='Emily Bronte')
+    db.session.add_all([jane, emily])
+    db.session.flush()
+    books = [Book(isbn='9780000000019', title='Emma', author_id=jane.id),
+             Book(isbn='9780000000026', title='Persuasion',
+                  author_id=jane.id),
+             Book(isbn='9780000000033', title='Wuthering Heights',
+                  author_id=emily.id)]
+    db.session.add_all(books)
+    db.session.commit()
+    return {'jane': jane.id, 'emily': emily.id,
+            'books': [book.id for book in books]}
+
+
+def logged(since=0):
+    """(entity, entity_id, op) of the entries after the id `since`."""
+    return [(entry.entity, entry.entity_id, entry.op)
+            for entry in ChangeLogEntry.query.filter(
+                ChangeLogEntry.id > since).order_by(ChangeLogEntry.id)]
+
+
+def last_entry_id():
+    return db.session.query(db.func.max(ChangeLogEntry.id)).scalar() or 0
+
+
+def test_orm_writes_are_logged(app, library):
+    jane, emily = library['jane'], library['emily']
+    emma, persuasion, heights = library['books']
+    assert sorted(logged()) == sorted(
+        [('author', jane, 'insert'), ('author', emily, 'insert')]
+        + [('book', book_id, 'insert') for book_id in library['books']])
+
+    since = last_entry_id()
+    db.session.get(Book, emma).title = 'Emma (2nd ed.)'
+    # Loaded but unchanged: nothing to log
+    db.session.get(Book, persuasion).title = 'Persuasion'
+    db.session.commit()
+    assert logged(since) == [('book', emma, 'update')]
+
+    since = last_entry_id()
+    db.session.get(Book, heights).soft_delete()
+    db.session.commit()
+    assert logged(since) == [('book', heights, 'delete')]
+    since = last_entry_id()
+    assert Book.restore(heights)
+    db.session.commit()
+    assert logged(since) == [('book', heights, 'insert')]
+
+    since = last_entry_id()
+    db.session.delete(db.session.get(Author, emily))
+    db.session.commit()
+    assert sorted(logged(since)) == [('author', emily, 'delete'),
+                                     ('book', heights, 'delete')]
+
+
+def test_bulk_deletes_and_undo_are_logged(client, library):
+    jane = library['jane']
+    emma, persuasion, heights = library['books']
+    since = last_entry_id()
+    response = client.post(f'/author/{jane}/delete')
+    assert response.status_code == 302
+    assert sorted(logged(since)) == [('author', jane, 'delete'),
+                                     ('book', emma, 'delete'),
+                                     ('book', persuasion, 'delete')]
+
+    since = last_entry_id()
+    response = client.post(f'/author/{jane}/undo_delete')
+    assert response.status_code == 302
+    assert sorted(logged(since)) == [('author', jane, 'insert'),
+                                     ('book', emma, 'insert'),
+                                     ('book', persuasion, 'insert')]
+
+    # The admin page's delete
+    since = last_entry_id()
+    response = client.post(f'/admin/delete_author/{jane}')
+    assert response.status_code == 302
+    assert len(logged(since)) == 3
+
+    since = last_entry_id()
+    Book.query.filter(Book.id == heights).update(
+        {Book.rating: 9}, synchronize_session=False)
+    db.session.commit()
+    assert logged(since) == [('book', heights, 'update')]
+
+
+def test_core_writes_are_logged(app, library):
+    jane, emily = library['jane'], library['emily']
+    emma, persuasion, heights = library['books']
+    since = last_entry_id()
+    set_ratings(db.session.connection(), {emma: 8, persuasion: 6, heights: None})
+    db.session.commit()
+    assert logged(since) == [('book', emma, 'update'),
+                             ('book', persuasion, 'update')]
+
+    since = last_entry_id()
+    apply_author_merges([((jane, 'Jane Austen'), (emily, 'Emily Bronte'))])
+    assert sorted(logged(since)) == [('author', emily, 'delete'),
+                                     ('book', heights, 'update')]
+
+
+def test_rolled_back_writes_are_not_logged(app, library):
+    since = last_entry_id()
+    db.session.get(Book, library['books'][0]).title = 'Never saved'
+    db.session.flush()
+    assert logged(since) == [('book', library['books'][0], 'update')]
+    db.session.rollback()
+    assert logged(since) == []
+
+
+def test_changes_endpoint_pages_with_a_cursor(client, library):
+    emma, persuasion, heights = library['books']
+    db.session.get(Book, emma).title = 'Emma (2nd ed.)'
+    db.session.get(Book, heights).soft_delete()
+    db.session.commit()
+
+    seen = []
+    cursor = 0
+    while True:
+        page = client.get(f'/api/changes?since={cursor}&limit=3').get_json()
+        assert len(page['changes']) <= 3
+        seen.extend(page['changes'])
+        cursor = page['cursor']
+        if not page['more']:
+            break
+    assert [change['id'] for change in seen] == \
+        sorted(change['id'] for change in seen)
+    assert len(seen) == 7
+    *_, edit, deletion = seen
+    assert (edit['entity'], edit['entity_id'], edit['op']) == \
+        ('book', emma, 'update')
+    assert edit['data']['title'] == 'Emma (2nd ed.)'
+    assert edit['data']['author_id'] == library['jane']
+    assert (deletion['entity_id'], deletion['op'], deletion['data']) == \
+        (heights, 'delete', None)
+    # Caught up: nothing new, the cursor stays
+    page = client.get(f'/api/changes?since={cursor}').get_json()
+    assert page == {'changes': [], 'cursor': cursor, 'more': False}
+
+
+def test_compaction_keeps_the_latest_entry_of_each_row(app, library):
+    emma, persuasion, heights = library['books']
+    for title in ('One', 'Two', 'Three'):
+        db.session.get(Book, emma).title = title
+        db.session.commit()
+    total = len(logged())
+    # Nothing is old enough yet
+    assert compact_change_log(older_than=3600) == 0
+    # Age every entry but the last edit
+    last = last_entry_id()
+    ChangeLogEntry.query.filter(ChangeLogEntry.id < last).update(
+        {ChangeLogEntry.changed_at: utcnow() - timedelta(days=30)},
+        synchronize_session=False)
+    db.session.commit()
+
+    # Emma's insert and two first edits are superseded
+    assert compact_change_log(older_than=3600, batch_size=2) == 3
+    assert len(logged()) == total - 3
+    assert [entry for entry in logged() if entry[1] == emma
+            and entry[0] == 'book'] == [('book', emma, 'update')]
+    assert ('book', heights, 'insert') in logged()
+
+
+def test_change_log_can_be_turned_off(db_uri):
+    # An app of its own: CHANGE_LOG also sets up its hooks when created
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': db_uri,
+                      'CHANGE_LOG': False})
+    with app.app_context():
+        db.create_all()
+        db.session.add(Author(name='Jane Austen'))
+        db.session.commit()
+        assert ChangeLogEntry.query.count() == 0
+        assert app.test_client().get('/api/changes').status_code == 404
+        db.session.remove()
+        db.drop_all()
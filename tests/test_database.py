@@ -0,0 +1,150 @@
+"""
+Tests for the database URL / pool settings and the dialect-aware search.
+
+The PostgreSQL SQL is checked by compiling it with the PostgreSQL dialect,
+which needs no server. Tests marked with `on_postgres` run against a real
+server when TEST_DATABASE_URL points at one (see bin/test_postgres.sh).
+"""
+
+import os
+import sys
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.app import create_app  # noqa: E402
+from backend.data_models import (db, Author, Book,  # noqa: E402
+                                 trigram_available)
+from backend.database import database_url, engine_options  # noqa: E402
+from backend.search import (book_search_filter, matches_words,  # noqa: E402
+                            search_mode)
+
+on_postgres = pytest.mark.skipif(
+    not os.environ.get('TEST_DATABASE_URL', '').startswith('postgresql'),
+    reason='needs TEST_DATABASE_URL pointing at PostgreSQL')
+
+
+@pytest.fixture
+def app(app):
+    """The shared app with two books by one author."""
+    author = Author(name='Ursula K. Le Guin')
+    db.session.add(author)
+    db.session.flush()
+    db.session.add_all([
+        Book(isbn='9780441478125', title='The Left Hand of Darkness',
+             author_id=author.id),
+        Book(isbn='9780060512750', title='The Dispossessed',
+             author_id=author.id)])
+    db.session.commit()
+    return app
+
+
+def pg_sql(clause):
+    return str(clause.compile(dialect=postgresql.dialect(),
+                              compile_kwargs={'literal_binds': True}))
+
+
+def test_database_url():
+    assert database_url(None, 'sqlite:///x.db') == 'sqlite:///x.db'
+    assert database_url('', 'sqlite:///x.db') == 'sqlite:///x.db'
+    assert database_url('postgres://u@db/books', None) == \
+        'postgresql://u@db/books'
+    assert database_url('postgresql+psycopg://u@db/books', None) == \
+        'postgresql+psycopg://u@db/books'
+
+
+def test_database_url_from_environment(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:////tmp/from-env.sqlite')
+    app = create_app({'TESTING': True})
+    assert app.config['SQLALCHEMY_DATABASE_URI'] == \
+        'sqlite:////tmp/from-env.sqlite'
+
+
+def test_pool_options_only_for_server_databases(monkeypatch):
+    monkeypatch.setenv('DB_POOL_SIZE', '20')
+    monkeypatch.setenv('DB_POOL_PRE_PING', '0')
+    app = create_app({'TESTING': True,
+                      'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS'] == {}
+    options = engine_options(app.config, 'postgresql://u@db/books')
+    assert options == {'pool_size': 20, 'max_overflow': 10,
+                       'pool_timeout': 30.0, 'pool_recycle': 1800,
+                       'pool_pre_ping': False}
+
+
+def test_search_indexes_are_postgres_only():
+    pg_indexes = {ix.name: ix for ix in Book.__table__.indexes
+                  if ix.dialect_options['postgresql']['using'] == 'gin'}
+    assert set(pg_indexes) == {'ix_book_title_trgm', 'ix_book_isbn_trgm',
+                               'ix_book_title_fts'}
+    assert pg_sql(CreateIndex(pg_indexes['ix_book_title_trgm'])) == (
+        'CREATE INDEX ix_book_title_trgm ON book USING gin '
+        '(title gin_trgm_ops) WHERE deleted_at IS NULL')
+    assert pg_sql(CreateIndex(pg_indexes['ix_book_title_fts'])) == (
+        "CREATE INDEX ix_book_title_fts ON book USING gin "
+        "(to_tsvector('simple', title)) WHERE deleted_at IS NULL")
+
+
+def test_fulltext_query_matches_index_expression():
+    sql = pg_sql(matches_words(Book.title, "left hand's"))
+    assert sql == ("to_tsvector('simple', book.title) @@ "
+                   "to_tsquery('simple', 'left:* & hand:* & s:*')")
+    # punctuation-only input matches nothing instead of failing
+    assert pg_sql(matches_words(Book.title, '&|!')) == 'false'
+
+
+def test_sqlite_falls_back_to_like(app):
+    if db.engine.dialect.name != 'sqlite':
+        pytest.skip('SQLite only')
+    app.config['SEARCH_MODE'] = 'fulltext'
+    assert search_mode() == 'like'
+    assert 'LIKE' in str(book_search_filter('dark'))
+    names = {ix['name'] for ix in db.inspect(db.engine).get_indexes('book')}
+    assert not {name for name in names if name.endswith(('_trgm', '_fts'))}
+
+
+def test_search_results(app):
+    client = app.test_client()
+    body = client.get('/?q=darkn').get_data(as_text=True)
+    assert 'Left Hand of' in body
+    assert 'Dispossessed' not in body
+    body = client.get('/?q=guin&scope=authors').get_data(as_text=True)
+    assert 'Ursula' in body
+
+
+@on_postgres
+def test_postgres_search_indexes_exist(app):
+    names = {ix['name'] for ix in db.inspect(db.engine).get_indexes('book')}
+    assert 'ix_book_title_fts' in names
+    with db.engine.connect() as conn:
+        trigram = trigram_available(None, None, conn)
+    assert ('ix_book_title_trgm' in names) == trigram
+    assert search_mode() == 'trigram'
+
+
+@on_postgres
+def test_postgres_fulltext_search(app):
+    app.config['SEARCH_MODE'] = 'fulltext'
+    client = app.test_client()
+    # whole-word prefixes match, the middle of a word doesn't
+    body = client.get('/?q=left+dark').get_data(as_text=True)
+    assert 'Left Hand of' in body
+    body = client.get('/?q=arkness').get_data(as_text=True)
+    assert 'Left Hand of' not in body
+    # ISBNs still match as substrings
+    body = client.get('/?q=0512750').get_data(as_text=True)
+    assert 'Dispossessed' in body
+
+
+def test_migrate_commands_are_registered(db_uri):
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': db_uri})
+    assert 'migrate' not in app.extensions
+    result = app.test_cli_runner().invoke(args=['db', '--help'])
+    assert result.exit_code == 0, result.output
+    assert 'upgrade' in result.output
+    assert 'migrate' in app.extensions
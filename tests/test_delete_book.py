@@ -1,30 +1,13 @@
 import sys
 import os
-import pytest
 
 # Add project root to sys.path so `app` is importable
 sys.path.insert(0, os.path.abspath(
     os.path.join(os.path.dirname(__file__), '..')))
 
-from backend.app import create_app  # noqa: E402
 from backend.data_models import db, Author, Book  # noqa: E402
 
 
-@pytest.fixture
-def app():
-    test_app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
-    with test_app.app_context():
-        db.create_all()
-        yield test_app
-        db.session.remove()
-        db.drop_all()
-
-
-@pytest.fixture
-def client(app):
-    return app.test_client()
-
-
 def test_delete_book_removes_book(client, app):
     """Test that DELETE /book/<id>/delete removes the book when author has multiple books."""
     with app.app_context():
@@ -0,0 +1,238 @@
+"""
+Tests for the offline ISBN metadata enrichment pipeline.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.data_models import (db, Author, Book,  # noqa: E402
+                                 EnrichmentJob, MetadataCache)
+from backend.enrichment import (MAX_ATTEMPTS, OpenLibraryProvider,  # noqa: E402
+                                StubProvider, enqueue_isbns,
+                                enqueue_missing, parse_open_library,
+                                run_enrichment)
+
+COVER = 'https://covers.example/{}.jpg'
+
+
+@pytest.fixture
+def author(app):
+    author = Author(name='Someone')
+    db.session.add(author)
+    db.session.commit()
+    return author.id
+
+
+def records(isbns):
+    return {isbn: {'publication_year': 1900 + i,
+                   'cover_url': COVER.format(isbn)}
+            for i, isbn in enumerate(isbns)}
+
+
+def statuses():
+    return {job.isbn: job.status for job in EnrichmentJob.query}
+
+
+class FailingProvider(StubProvider):
+    """Raises for the ISBNs in `broken`."""
+
+    def __init__(self, records, broken=(), error=ConnectionError):
+        super().__init__(records)
+        self.broken = set(broken)
+        self.error = error
+
+    def fetch(self, isbns):
+        if self.broken & set(isbns):
+            raise self.error('provider unavailable')
+        return super().fetch(isbns)
+
+
+def test_parse_open_library():
+    entry = {'title': 'Pride and Prejudice', 'publish_date': 'Jan 28, 1813',
+             'cover': {'small': 'https://c/s.jpg', 'medium': 'https://c/m.jpg'}}
+    assert parse_open_library(entry) == {
+        'publication_year': 1813, 'cover_url': 'https://c/m.jpg'}
+    assert parse_open_library({'publish_date': 'unknown'}) == {}
+    assert parse_open_library(None) is None
+
+
+def test_open_library_provider_batches_isbns(monkeypatch):
+    import requests
+    calls = []
+
+    class FakeResponse:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {'ISBN:111': {'publish_date': '1999',
+                                 'cover': {'large': 'https://c/l.jpg'}}}
+
+    def get(url, params, timeout):
+        calls.append((url, params))
+        return FakeResponse()
+
+    monkeypatch.setattr(requests, 'get', get)
+    provider = OpenLibraryProvider('https://books.example/', timeout=3)
+    assert provider.fetch(['111', '222']) == {
+        '111': {'publication_year': 1999, 'cover_url': 'https://c/l.jpg'},
+        '222': None}
+    url, params = calls[0]
+    assert url == 'https://books.example/api/books'
+    assert params['bibkeys'] == 'ISBN:111,ISBN:222'
+
+
+def test_add_book_queues_incomplete_books(client, author):
+    client.post('/add_book', data={
+        'isbn': '9780000000040', 'title': 'No Cover', 'author_id': author,
+        'publication_year': '1950'})
+    client.post('/add_book', data={
+        'isbn': '9780000000057', 'title': 'Complete', 'author_id': author,
+        'publication_year': '1950', 'cover_url': 'https://c/q2.jpg'})
+    assert statuses() == {'9780000000040': 'pending'}
+
+
+def test_fills_only_missing_fields(app, build, author):
+    build.books(author=author, isbns=['A-1'])
+    build.books(author=author, isbns=['A-2'], publication_year=2001)
+    build.books(author=author, isbns=['A-3'], cover_url='https://mine.jpg')
+    assert enqueue_missing() == 3
+    db.session.commit()
+
+    stats = run_enrichment(StubProvider(records(['A-1', 'A-2', 'A-3'])))
+    assert stats['filled'] == 3 and stats['done'] == 3
+    books = {b.isbn: b for b in Book.query}
+    assert books['A-1'].publication_year == 1900
+    assert books['A-1'].cover_url == COVER.format('A-1')
+    assert books['A-2'].publication_year == 2001
+    assert books['A-3'].cover_url == 'https://mine.jpg'
+    assert set(statuses().values()) == {'done'}
+    # nothing left to queue or fetch
+    assert enqueue_missing() == 0
+
+
+def test_not_found_is_cached(app, build, author):
+    build.books(author=author, isbns=['N-1'])
+    enqueue_missing()
+    db.session.commit()
+    stats = run_enrichment(StubProvider())
+    assert stats['not_found'] == 1
+    assert statuses() == {'N-1': 'not_found'}
+    cached = db.session.get(MetadataCache, ('stub', 'N-1'))
+    assert cached.found is False
+
+
+def test_batches_and_bounded_concurrency(app, build, author):
+    isbns = [f'C-{i:02d}' for i in range(23)]
+    build.books(author=author, isbns=isbns)
+    enqueue_missing()
+    db.session.commit()
+    lock = threading.Lock()
+    active = []
+    peak = []
+
+    class SlowProvider(StubProvider):
+        def fetch(self, batch):
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.05)
+            with lock:
+                active.pop()
+            return super().fetch(batch)
+
+    provider = SlowProvider(records(isbns))
+    stats = run_enrichment(provider, batch_size=5, concurrency=2)
+    assert stats['fetched'] == 23 and stats['filled'] == 23
+    assert sorted(len(call) for call in provider.calls) == [3, 5, 5, 5, 5]
+    assert max(peak) == 2
+
+
+def test_zero_concurrency_still_makes_progress(app, build, author):
+    build.books(author=author, isbns=['Z-1', 'Z-2', 'Z-3'])
+    enqueue_missing()
+    db.session.commit()
+    provider = StubProvider(records(['Z-1', 'Z-2', 'Z-3']))
+    stats = run_enrichment(provider, batch_size=0, concurrency=0)
+    assert stats['fetched'] == 3 and stats['filled'] == 3
+    assert [len(call) for call in provider.calls] == [1, 1, 1]
+
+
+def test_resume_after_interruption(app, build, author):
+    isbns = [f'R-{i}' for i in range(6)]
+    build.books(author=author, isbns=isbns)
+    enqueue_missing()
+    db.session.commit()
+
+    # The third batch is interrupted (e.g. Ctrl-C) mid-run
+    interrupted = FailingProvider(records(isbns), broken=['R-4'],
+                                  error=KeyboardInterrupt)
+    with pytest.raises(KeyboardInterrupt):
+        run_enrichment(interrupted, batch_size=2, concurrency=1)
+    assert [s for _, s in sorted(statuses().items())] == \
+        ['done'] * 4 + ['pending'] * 2
+
+    provider = StubProvider(records(isbns))
+    stats = run_enrichment(provider, batch_size=2, concurrency=1)
+    assert provider.calls == [['R-4', 'R-5']]
+    assert stats['done'] == 2
+    assert Book.query.filter(Book.cover_url.is_(None)).count() == 0
+
+
+def test_requeued_isbns_come_from_the_cache(app, build, author):
+    build.books(author=author, isbns=['K-1'])
+    enqueue_missing()
+    db.session.commit()
+    run_enrichment(StubProvider(records(['K-1'])))
+
+    # The fields are cleared by hand and the ISBN is queued again
+    book = Book.query.filter_by(isbn='K-1').one()
+    book.cover_url = None
+    book.publication_year = None
+    assert enqueue_isbns(['K-1']) == 1
+    db.session.commit()
+    provider = StubProvider()
+    stats = run_enrichment(provider)
+    assert provider.calls == []
+    assert stats['cached'] == 1 and stats['filled'] == 1
+    assert Book.query.filter_by(isbn='K-1').one().publication_year == 1900
+
+
+def test_failures_are_retried_then_given_up(app, build, author):
+    build.books(author=author, isbns=['F-1', 'F-2'])
+    enqueue_missing()
+    db.session.commit()
+    provider = FailingProvider(records(['F-1', 'F-2']), broken=['F-1'])
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        stats = run_enrichment(provider, batch_size=1)
+        job = db.session.get(EnrichmentJob, 'F-1')
+        assert job.attempts == attempt
+        assert 'provider unavailable' in job.last_error
+    assert stats['failed'] == 1
+    assert statuses() == {'F-1': 'failed', 'F-2': 'done'}
+    assert run_enrichment(provider)['fetched'] == 0
+
+
+def test_cli_with_stub_file(app, build, author, tmp_path):
+    build.books(author=author, isbns=['S-1', 'S-2'])
+    stub = tmp_path / 'stub.json'
+    stub.write_text(json.dumps(records(['S-1'])))
+    app.config['ENRICHMENT_STUB_FILE'] = str(stub)
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['enrich-books', '--provider', 'stub'])
+    assert 'Queued 2 ISBN(s).' in result.output
+    assert '1 found, 1 not found' in result.output
+    assert 'filled in 1 book(s)' in result.output
+
+    result = runner.invoke(args=['enrich-books', '--provider', 'nope'])
+    assert result.exit_code != 0
+    assert 'Unknown enrichment provider' in result.output
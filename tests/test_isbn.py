@@ -0,0 +1,235 @@
+"""
+Tests for ISBN validation on the add book form and merging books stored
+more than once under one ISBN.
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.also_liked import set_reader_rating  # noqa: E402
+from backend.data_models import (db, Author, Book,  # noqa: E402
+                                 RatingEvent, RatingSummary, Reader,
+                                 ReaderRating, utcnow)
+from backend.dedupe import merge_duplicate_isbns  # noqa: E402
+from backend.isbn import InvalidIsbn, isbn_key, normalize_isbn  # noqa: E402
+from backend.rating_stats import (AUTHOR_SCOPE, BOOK_SCOPE,  # noqa: E402
+                                  set_ratings)
+
+# One book, three spellings
+EMMA = '9780141439587'
+EMMA_HYPHENS = '978-0-14-143958-7'
+EMMA_10 = '0141439580'
+
+
+@pytest.fixture
+def author(app):
+    author = Author(name='Jane Austen')
+    db.session.add(author)
+    db.session.commit()
+    return author.id
+
+
+def add_book(author_id, isbn, **fields):
+    book = Book(isbn=isbn, title=fields.pop('title', 'Emma'),
+                author_id=author_id, **fields)
+    db.session.add(book)
+    db.session.commit()
+    return book.id
+
+
+def book_count():
+    return Book.query.execution_options(include_deleted=True).count()
+
+
+def test_normalize_isbn():
+    assert normalize_isbn(EMMA_HYPHENS) == EMMA
+    assert normalize_isbn(' 0-14-143958-0 ') == EMMA_10
+    assert normalize_isbn('0-8044-2957-x') == '080442957X'
+    for raw, reason in [('978-0-14-143958-6', 'wrong check digit'),
+                        ('0141439581', 'wrong check digit'),
+                        ('9770141439584', 'must start with 978 or 979'),
+                        ('12345', 'expected 10 or 13 digits'),
+                        ('', 'expected 10 or 13 digits')]:
+        with pytest.raises(InvalidIsbn, match=reason):
+            normalize_isbn(raw)
+
+
+def test_isbn_key_matches_every_spelling():
+    assert isbn_key(EMMA) == isbn_key(EMMA_HYPHENS) == isbn_key(EMMA_10) \
+        == EMMA
+    # Values from before the validation only match themselves
+    assert isbn_key('abc-1') == isbn_key('ABC 1') == 'ABC1'
+    assert isbn_key(None) is None
+
+
+def test_key_is_set_on_insert_and_update(app, author):
+    book_id = add_book(author, EMMA_10)
+    book = db.session.get(Book, book_id)
+    assert book.isbn_key == EMMA
+    book.isbn = 'OLD-1'
+    db.session.commit()
+    assert db.session.get(Book, book_id).isbn_key == 'OLD1'
+    # Core inserts get it too
+    db.session.execute(Book.__table__.insert().values(
+        isbn=EMMA_HYPHENS, title='Core', author_id=author))
+    assert Book.query.filter_by(title='Core').one().isbn_key == EMMA
+
+
+def test_add_book_stores_the_normalised_isbn(client, author):
+    response = client.post('/add_book', data={
+        'isbn': EMMA_HYPHENS, 'title': 'Emma', 'author_id': author})
+    assert response.status_code == 302
+    assert Book.query.one().isbn == EMMA
+
+
+def test_add_book_rejects_invalid_isbn(client, author):
+    response = client.post('/add_book', data={
+        'isbn': '978-0-14-143958-6', 'title': 'Emma', 'author_id': author})
+    assert response.status_code == 400
+    page = response.get_data(as_text=True)
+    assert 'wrong check digit' in page
+    # What was typed is kept
+    assert 'value="978-0-14-143958-6"' in page
+    assert Book.query.count() == 0
+
+
+def test_add_book_rejects_another_spelling_of_a_stored_isbn(client, author):
+    add_book(author, EMMA)
+    for isbn in (EMMA_HYPHENS, EMMA_10):
+        response = client.post('/add_book', data={
+            'isbn': isbn, 'title': 'Emma again', 'author_id': author})
+        assert response.status_code == 409
+        assert 'already in the library' in response.get_data(as_text=True)
+    assert book_count() == 1
+
+
+def test_add_book_rejects_the_isbn_of_a_deleted_book(client, author):
+    book_id = add_book(author, EMMA)
+    db.session.get(Book, book_id).soft_delete()
+    db.session.commit()
+    response = client.post('/add_book', data={
+        'isbn': EMMA_10, 'title': 'Emma again', 'author_id': author})
+    assert response.status_code == 409
+    assert 'recently deleted' in response.get_data(as_text=True)
+
+
+def test_isbn_added_meanwhile_is_a_conflict(client, author, monkeypatch):
+    """Another request stores the ISBN between the check and the INSERT:
+    the unique constraint catches it, and the form says so."""
+    add_book(author, EMMA)
+    other = add_book(author, '9780141439518', title='Pride and Prejudice')
+    monkeypatch.setattr('backend.app.book_with_isbn', lambda isbn: None)
+    for data in ({}, {'book_id': other}):
+        response = client.post('/add_book', data={
+            'isbn': EMMA, 'title': 'Emma again', 'author_id': author,
+            **data})
+        assert response.status_code == 409
+        assert 'already in the library' in response.get_data(as_text=True)
+    assert book_count() == 2
+    assert db.session.get(Book, other).isbn == '9780141439518'
+
+
+def test_missing_title_is_not_an_isbn_conflict(client, author):
+    book_id = add_book(author, EMMA)
+    for data in ({'isbn': '9780141439518'}, {'isbn': EMMA, 'book_id': book_id}):
+        response = client.post('/add_book', data={
+            'title': '  ', 'author_id': author, **data})
+        assert response.status_code == 400
+        html = response.get_data(as_text=True)
+        assert 'Please enter a title.' in html
+        assert 'already in the library' not in html
+    assert book_count() == 1
+    assert db.session.get(Book, book_id).title == 'Emma'
+
+
+def test_editing_keeps_its_own_isbn(client, author):
+    book_id = add_book(author, EMMA)
+    response = client.post('/add_book', data={
+        'book_id': book_id, 'isbn': EMMA_HYPHENS, 'title': 'Emma (2nd ed.)',
+        'author_id': author})
+    assert response.status_code == 302
+    assert db.session.get(Book, book_id).title == 'Emma (2nd ed.)'
+
+
+def test_duplicate_lookup_uses_the_index(app):
+    if db.engine.dialect.name != 'sqlite':
+        pytest.skip('EXPLAIN QUERY PLAN is SQLite syntax')
+    # Lookups run within the current library
+    plan = db.session.execute(db.text(
+        'EXPLAIN QUERY PLAN SELECT id FROM book '
+        'WHERE library_id = 1 AND isbn_key = :key'),
+        {'key': EMMA}).all()
+    assert 'ix_book_isbn_key' in str(plan)
+
+
+def test_merge_duplicates(app, author):
+    survivor = add_book(author, EMMA_HYPHENS, publication_year=1815)
+    copy_10 = add_book(author, EMMA_10, cover_url='https://c/emma.jpg')
+    copy_13 = add_book(author, EMMA, publication_year=1816)
+    other = add_book(author, '9780141439518', title='Pride and Prejudice')
+    conn = db.session.connection()
+    set_ratings(conn, {survivor: 6, copy_10: 8, copy_13: 10})
+    ann, bob = Reader(name='Ann'), Reader(name='Bob')
+    db.session.add_all([ann, bob])
+    db.session.flush()
+    start = utcnow()
+    set_reader_rating(conn, ann.id, survivor, 5, when=start)
+    set_reader_rating(conn, ann.id, copy_10, 9, when=start)
+    set_reader_rating(conn, bob.id, copy_10, 4, when=start)
+    set_reader_rating(conn, bob.id, copy_13, 7)
+    db.session.commit()
+
+    assert merge_duplicate_isbns() == {'groups': 1, 'removed': 2}
+    db.session.expire_all()
+    assert book_count() == 2
+    book = db.session.get(Book, survivor)
+    assert book.isbn == EMMA
+    assert book.publication_year == 1815
+    assert book.cover_url == 'https://c/emma.jpg'
+    assert book.rating == 6
+    assert RatingEvent.query.filter(
+        RatingEvent.book_id != survivor).count() == 0
+    assert {(r.reader_id, r.rating) for r in ReaderRating.query.filter_by(
+        book_id=survivor)} == {(ann.id, 5), (bob.id, 7)}
+    assert ReaderRating.query.count() == 2
+    summary = db.session.get(RatingSummary, (BOOK_SCOPE, survivor))
+    assert summary.rating_count == 3
+    assert db.session.get(RatingSummary, (BOOK_SCOPE, copy_10)) is None
+    # Emma is now rated once among the author's books
+    assert db.session.get(RatingSummary, (AUTHOR_SCOPE, author)) \
+        .rating_count == 1
+    assert db.session.get(Book, other) is not None
+    assert merge_duplicate_isbns() == {'groups': 0, 'removed': 0}
+
+
+def test_deleted_copies_are_merged_into_the_live_one(app, author):
+    first = add_book(author, EMMA)
+    live = add_book(author, EMMA_10)
+    db.session.get(Book, first).deleted_at = utcnow()
+    db.session.commit()
+    merge_duplicate_isbns()
+    assert [b.id for b in Book.query.execution_options(
+        include_deleted=True)] == [live]
+
+
+def test_dry_run_and_keys_of_old_rows(app, author):
+    add_book(author, EMMA)
+    add_book(author, EMMA_10)
+    # Rows from before the isbn_key column
+    db.session.execute(Book.__table__.update().values(isbn_key=None))
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['dedupe-isbns', '--dry-run'])
+    assert 'Would merge 1 ISBN(s)' in result.output
+    assert book_count() == 2
+    assert Book.query.filter(Book.isbn_key.is_(None)).count() == 0
+
+    result = app.test_cli_runner().invoke(args=['dedupe-isbns'])
+    assert '1 duplicate book(s) removed' in result.output
+    assert book_count() == 1
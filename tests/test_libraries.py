@@ -0,0 +1,215 @@
+"""
+Tests for libraries (tenants): what each library's pages and APIs see,
+switching libraries, and keeping libraries in database files of their own.
+"""
+
+import os
+import sys
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.app import create_app  # noqa: E402
+from backend.change_log import (BOOK, UPDATE, changes_since,  # noqa: E402
+                                current_rows, record_changes)
+from backend.data_models import (db, Author, Book,  # noqa: E402
+                                 LIBRARY_ENGINES_KEY, RatingEvent)
+from backend.dedupe import duplicate_groups  # noqa: E402
+from backend.libraries import (find_or_create_library,  # noqa: E402
+                               use_library)
+from backend.rating_stats import set_ratings  # noqa: E402
+
+
+def make_app(db_uri, **config):
+    """An app of its own, for settings read only when it is created
+    (CATALOGUE_SNAPSHOT, LIBRARY_DATABASE_DIR); other tests use the shared
+    `app`."""
+    return create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': db_uri,
+        'SIMILAR_BOOKS': False,
+        'RATING_BUFFER_FLUSH_INTERVAL': 0,
+        **config})
+
+
+def switch(client, name):
+    return client.post('/library', data={'name': name})
+
+
+def test_pages_only_show_the_chosen_library(app, client, build):
+    emma = build.book(title='Emma').id
+    branch_id, _ = find_or_create_library('Branch')
+    with use_library(branch_id):
+        persuasion = build.book(title='Persuasion').id
+        assert db.session.get(Book, emma) is None
+    assert Book.query.count() == 2
+
+    page = client.get('/').get_data(as_text=True)
+    assert 'Emma' in page and 'Persuasion' not in page
+    assert client.get(f'/book/{persuasion}').status_code == 404
+
+    switch(client, 'Branch')
+    page = client.get('/').get_data(as_text=True)
+    assert 'Persuasion' in page and 'Emma' not in page
+    assert 'Branch' in page
+    assert client.get(f'/book/{emma}').status_code == 404
+    assert client.get(f'/book/{persuasion}').status_code == 200
+    changes = client.get('/api/changes').get_json()['changes']
+    assert {(c['entity'], c['entity_id']) for c in changes} == {
+        ('book', persuasion), ('author', db.session.get(
+            Book, persuasion).author_id)}
+
+
+def test_new_rows_join_the_chosen_library(app, client):
+    switch(client, 'Branch')
+    response = client.post('/add_author', data={'name': 'Anne Bronte'})
+    assert response.status_code == 302
+    with use_library(None):
+        author = Author.query.filter_by(name='Anne Bronte').one()
+    assert author.library_id == find_or_create_library('Branch')[0]
+
+
+def test_isbn_is_unique_within_a_library(app, build):
+    build.book(isbn='9780000000002')
+    with use_library(find_or_create_library('Branch')[0]):
+        build.book(isbn='9780000000002')
+    assert len(Book.query.filter_by(isbn='9780000000002').all()) == 2
+    # Copies in two libraries are not duplicates
+    assert duplicate_groups(db.session.connection()) == []
+    db.session.rollback()
+    with pytest.raises(IntegrityError):
+        build.book(isbn='9780000000002')
+    db.session.rollback()
+
+
+def test_switching_libraries(app, client):
+    assert 'Which Library?' in client.get('/library').get_data(as_text=True)
+    assert switch(client, 'Branch').status_code == 302
+    with client.session_transaction() as session:
+        branch_id = session['library_id']
+        assert session['library_name'] == 'Branch'
+    # An existing library is reused
+    switch(client, 'Branch')
+    with client.session_transaction() as session:
+        assert session['library_id'] == branch_id
+    switch(client, '')
+    with client.session_transaction() as session:
+        assert 'library_id' not in session
+    assert switch(client, 'x' * 101).status_code == 400
+
+
+def test_catalogue_snapshot_per_library(db_uri, build):
+    app = make_app(db_uri, CATALOGUE_SNAPSHOT=True)
+    with app.app_context():
+        db.create_all()
+        build.book(title='Emma')
+        with use_library(find_or_create_library('Branch')[0]):
+            build.book(title='Persuasion')
+        client = app.test_client()
+        assert 'Emma' in client.get('/').get_data(as_text=True)
+        switch(client, 'Branch')
+        page = client.get('/').get_data(as_text=True)
+        assert 'Persuasion' in page and 'Emma' not in page
+        assert len(app.extensions['catalogue']._snapshots) == 2
+        db.session.remove()
+        db.drop_all()
+
+
+def test_changes_are_kept_per_library(app, build):
+    feed = app.extensions['change_feed']
+    branch_id = find_or_create_library('Branch')[0]
+    austen = build.author()
+    with use_library(branch_id):
+        bronte = build.author()
+    main = feed.subscribe(library_id=1)
+    branch = feed.subscribe(library_id=branch_id)
+    emma = build.book(austen, title='Emma').id
+    with use_library(branch_id):
+        persuasion = build.book(bronte, title='Persuasion').id
+        assert [c['entity_id'] for c in changes_since(0, 10)[0]
+                if c['entity'] == 'book'] == [persuasion]
+    assert main.get(0)['books'] == [emma]
+    assert main.get(0) is None
+    assert branch.get(0)['books'] == [persuasion]
+    # Without a library: every library's entries
+    assert len(changes_since(0, 10)[0]) == 4
+
+
+def test_bulk_actions_stay_in_the_chosen_library(app, client, build):
+    emma = build.book(title='Emma').id
+    main_author = db.session.get(Book, emma).author_id
+    set_ratings(db.session.connection(), {emma: 8})
+    db.session.commit()
+    switch(client, 'Other')
+    with client.session_transaction() as session:
+        other_id = session['library_id']
+    with use_library(other_id):
+        persuasion = build.book(title='Persuasion').id
+        other_author = db.session.get(Book, persuasion).author_id
+
+    client.post('/admin/bulk/rate_books',
+                data={'book_ids': [emma, persuasion], 'rating': 2})
+    client.post('/admin/bulk/reassign_books',
+                data={'book_ids': [emma], 'author_id': other_author})
+    changes = client.get('/api/changes').get_json()['changes']
+    db.session.expire_all()
+    # The requests shared the test's app context: see every library again
+    with use_library(None):
+        emma_book = db.session.get(Book, emma)
+        assert (emma_book.rating, emma_book.author_id) == (8, main_author)
+        assert db.session.get(Book, persuasion).rating == 2
+        assert [e.author_id for e in RatingEvent.query.filter_by(
+            book_id=emma)] == [main_author]
+
+    # Core writes are logged under each row's own library
+    with use_library(other_id):
+        record_changes(db.session.connection(), BOOK, UPDATE, [emma])
+        db.session.commit()
+        assert current_rows(BOOK, [emma, persuasion]).keys() == {persuasion}
+        assert emma not in {c['entity_id'] for c in changes_since(0, 100)[0]}
+    with use_library(None):
+        assert changes_since(0, 100)[0][-1]['entity_id'] == emma
+    assert {c['entity_id'] for c in changes if c['entity'] == 'book'} == \
+        {persuasion}
+
+
+def test_libraries_in_files_of_their_own(db_uri, tmp_path, build):
+    app = make_app(db_uri, LIBRARY_DATABASE_DIR=str(tmp_path),
+                   LIBRARY_ENGINE_CACHE_SIZE=1)
+    engines = app.extensions[LIBRARY_ENGINES_KEY]
+    with app.app_context():
+        db.create_all()
+        build.book(build.author(name='Jane Austen'), title='Emma')
+        client = app.test_client()
+        switch(client, 'Branch')
+        with client.session_transaction() as session:
+            branch_id = session['library_id']
+        client.post('/add_author', data={'name': 'Anne Bronte'})
+        assert os.path.exists(engines.path(branch_id))
+        page = client.get('/').get_data(as_text=True)
+        assert 'Anne Bronte' in page and 'Jane Austen' not in page
+
+        with use_library(None):
+            db.session.remove()
+            assert [a.name for a in Author.query] == ['Jane Austen']
+            db.session.remove()
+        with use_library(branch_id):
+            assert [a.name for a in Author.query] == ['Anne Bronte']
+            db.session.remove()
+
+        # One engine kept open: the next library's replaces it
+        switch(client, 'Annex')
+        client.get('/')
+        assert len(engines) == 1
+        # CLI commands run once per database
+        result = app.test_cli_runner().invoke(args=['rebuild-similar-books'])
+        assert result.output.count('Indexed') == 3
+        engines.dispose()
+        # The requests left the last library chosen in this app context
+        with use_library(None):
+            db.session.remove()
+            db.drop_all()
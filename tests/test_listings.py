@@ -0,0 +1,124 @@
+"""
+Tests for the read-only listing projections used by the home, admin and
+recommendations pages.
+"""
+
+import os
+import sys
+from datetime import date
+
+import pytest
+from flask import template_rendered
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.data_models import db, Author, Book  # noqa: E402
+from backend.listings import (AuthorListing, BookListing,  # noqa: E402
+                              ProjectionPagination, book_listing_select,
+                              book_listings, fetch_book_listings)
+
+
+@pytest.fixture
+def library(app):
+    """Two authors with three live books and one soft-deleted book."""
+    ann = Author(name='Ann Lister')
+    bob = Author(name='Bob Lister')
+    db.session.add_all([ann, bob])
+    db.session.flush()
+    books = [
+        Book(isbn='LST-1', title='Alpha', author_id=ann.id, rating=4,
+             ai_recommendation='A fine start.'),
+        Book(isbn='LST-2', title='Beta', author_id=ann.id),
+        Book(isbn='LST-3', title='Gamma', author_id=bob.id, rating=8),
+        Book(isbn='LST-4', title='Delta', author_id=bob.id),
+    ]
+    db.session.add_all(books)
+    db.session.flush()
+    books[3].soft_delete()
+    db.session.commit()
+    return {b.title: b.id for b in books}
+
+
+@pytest.fixture
+def rendered(app):
+    """(template name, context, books in the session) per render."""
+    seen = []
+
+    def record(sender, template, context, **extra):
+        books = [obj for obj in db.session.identity_map.values()
+                 if isinstance(obj, Book)]
+        seen.append((template.name, context, len(books)))
+    template_rendered.connect(record, app)
+    yield seen
+    template_rendered.disconnect(record, app)
+
+
+def test_book_listings(app, library):
+    books = fetch_book_listings(book_listing_select().order_by(Book.title))
+    assert [b.title for b in books] == ['Alpha', 'Beta', 'Gamma']
+    alpha, beta, _ = books
+    assert isinstance(alpha, BookListing)
+    assert (alpha.rating, alpha.has_review, alpha.ai_recommendation) == (
+        4, True, None)
+    assert beta.has_review is False
+    # one shared row per author
+    assert alpha.author is beta.author
+    assert alpha.author.name == 'Ann Lister'
+    assert not db.session.identity_map
+
+
+def test_pagination_counts_live_rows(app, library):
+    page = ProjectionPagination(
+        page=2, per_page=2, error_out=False,
+        select=book_listing_select().order_by(Book.title),
+        rows=book_listings)
+    assert page.total == 3
+    assert [b.title for b in page.items] == ['Gamma']
+
+
+def test_home_renders_projections(client, library, rendered):
+    resp = client.get('/?sort=author&order=desc')
+    assert resp.status_code == 200
+    name, context, loaded = rendered[-1]
+    assert name == 'home.html'
+    assert [b.title for b in context['books']] == ['Gamma', 'Beta', 'Alpha']
+    assert all(isinstance(b, BookListing) for b in context['books'])
+    assert loaded == 0
+    assert b'Delta' not in resp.data
+
+
+def test_home_author_search(client, library, rendered):
+    author = Author.query.filter_by(name='Bob Lister').one()
+    author.birth_date = date(1950, 5, 17)
+    db.session.commit()
+    resp = client.get('/?q=bob&scope=authors')
+    assert b'Bob Lister' in resp.data and b'1950-05-17' in resp.data
+    assert [a.name for a in rendered[-1][1]['authors_search']] == [
+        'Bob Lister']
+
+
+def test_admin_renders_projections(client, library, rendered):
+    resp = client.get('/admin?per_page=2')
+    assert resp.status_code == 200
+    _, context, loaded = rendered[-1]
+    assert loaded == 0
+    assert context['books_page'].total == 3
+    assert all(isinstance(a, AuthorListing) for a in context['authors'])
+    assert b'Alpha' in resp.data and b'Gamma' not in resp.data
+
+
+def test_recommend_shows_reviews(client, library, rendered):
+    resp = client.get('/recommend')
+    assert b'A fine start.' in resp.data
+    _, context, loaded = rendered[-1]
+    assert loaded == 0
+    assert context['books_with_reviews_count'] == 1
+
+
+def test_buffered_rating_applied(app, client, library):
+    client.post(f"/api/book/{library['Beta']}/rating", json={'rating': 9})
+    books = fetch_book_listings(
+        book_listing_select().where(Book.id == library['Beta']))
+    assert books[0].rating == 9
@@ -0,0 +1,170 @@
+"""
+Tests for conditional GET and fragment caching of the book detail page.
+"""
+
+import os
+import sys
+from datetime import timedelta
+
+import pytest
+from flask import template_rendered
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.data_models import db, Author, Book  # noqa: E402
+from backend.page_cache import FragmentCache  # noqa: E402
+
+
+@pytest.fixture
+def book(app):
+    author = Author(name='Cache Author')
+    db.session.add(author)
+    db.session.flush()
+    book = Book(isbn='CACHE-1', title='Cached Book', author_id=author.id,
+                ai_recommendation='First line.\nSecond "line".')
+    db.session.add(book)
+    db.session.commit()
+    return book
+
+
+@pytest.fixture
+def rendered(app):
+    """Names of the templates rendered."""
+    names = []
+
+    def record(sender, template, context, **extra):
+        names.append(template.name)
+    template_rendered.connect(record, app)
+    yield names
+    template_rendered.disconnect(record, app)
+
+
+def etag_of(client, book_id):
+    resp = client.get(f'/book/{book_id}')
+    assert resp.status_code == 200
+    return resp.headers['ETag']
+
+
+def test_validators_sent(client, book):
+    resp = client.get(f'/book/{book.id}')
+    assert resp.headers['ETag']
+    assert resp.headers['Last-Modified']
+    assert 'no-cache' in resp.headers['Cache-Control']
+    assert 'private' in resp.headers['Cache-Control']
+
+
+def test_if_none_match_skips_rendering(client, book, rendered):
+    etag = etag_of(client, book.id)
+    rendered.clear()
+    resp = client.get(f'/book/{book.id}', headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+    assert resp.data == b''
+    assert resp.headers['ETag'] == etag
+    assert rendered == []
+
+
+def test_if_modified_since(client, book):
+    last_modified = client.get(f'/book/{book.id}').headers['Last-Modified']
+    resp = client.get(f'/book/{book.id}',
+                      headers={'If-Modified-Since': last_modified})
+    assert resp.status_code == 304
+
+    book.title = 'Retitled Book'
+    book.updated_at = book.updated_at + timedelta(seconds=5)
+    db.session.commit()
+    resp = client.get(f'/book/{book.id}',
+                      headers={'If-Modified-Since': last_modified})
+    assert resp.status_code == 200
+    assert 'Retitled Book' in resp.get_data(as_text=True)
+
+
+def test_etag_changes_with_rating(client, app, book):
+    etag = etag_of(client, book.id)
+    client.post(f'/api/book/{book.id}/rating', json={'rating': 8})
+    # Buffered rating: shown, but the row hasn't changed yet
+    resp = client.get(f'/book/{book.id}', headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert 'ETag' not in resp.headers
+    app.extensions['rating_buffer'].flush()
+    resp = client.get(f'/book/{book.id}', headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != etag
+
+
+def test_etag_changes_with_author_and_books(client, book):
+    first = etag_of(client, book.id)
+    book.author.name = 'Renamed Author'
+    db.session.commit()
+    second = etag_of(client, book.id)
+    assert second != first
+
+    db.session.add(Book(isbn='CACHE-2', title='Another Book',
+                        author_id=book.author_id))
+    db.session.commit()
+    third = etag_of(client, book.id)
+    assert third not in (first, second)
+    assert etag_of(client, book.id) == third
+
+
+def test_no_304_with_pending_flash(client, book):
+    etag = etag_of(client, book.id)
+    with client.session_transaction() as session:
+        session['_flashes'] = [('success', 'Saved!')]
+    resp = client.get(f'/book/{book.id}', headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert 'Saved!' in resp.get_data(as_text=True)
+
+
+def test_deleted_book_not_found(client, book):
+    etag = etag_of(client, book.id)
+    book.deleted_at = book.updated_at
+    db.session.commit()
+    resp = client.get(f'/book/{book.id}', headers={'If-None-Match': etag})
+    assert resp.status_code == 404
+    assert client.get('/book/999999').status_code == 404
+
+
+def test_review_fragment_cached(client, app, book, rendered):
+    fragments = app.extensions['page_cache'].fragments
+    client.get(f'/book/{book.id}')
+    client.get(f'/book/{book.id}')
+    assert rendered.count('_book_review.html') == 1
+    assert fragments.hits == 1
+
+    client.post(f'/book/{book.id}/edit_review',
+                data={'ai_recommendation': 'Rewritten review.'})
+    html = client.get(f'/book/{book.id}').get_data(as_text=True)
+    assert 'Rewritten review.' in html
+    assert rendered.count('_book_review.html') == 2
+
+
+def test_review_kept_in_data_attribute(client, book):
+    html = client.get(f'/book/{book.id}').get_data(as_text=True)
+    assert 'data-review="First line.\nSecond &#34;line&#34;."' in html
+
+
+def test_compressed_page_revalidates(client, app, book):
+    app.config['COMPRESS_MIN_SIZE'] = 10
+    resp = client.get(f'/book/{book.id}', headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    etag = resp.headers['ETag']
+    assert etag.startswith('W/')
+    resp = client.get(f'/book/{book.id}', headers={
+        'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert resp.status_code == 304
+
+
+def test_fragment_cache_lru():
+    cache = FragmentCache(max_entries=2)
+    for key in ('a', 'b', 'a', 'c'):
+        cache.get_or_render(key, lambda: f'<p>{key}</p>')
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (1, 3)
+    # 'b' was least recently used
+    assert cache.get_or_render('b', lambda: 'again') == 'again'
+
+    off = FragmentCache(max_entries=0)
+    off.get_or_render('a', lambda: 'x')
+    assert len(off) == 0
@@ -0,0 +1,168 @@
+"""
+Tests for the buffered JSON rating endpoint and the rating write buffer.
+"""
+
+import sys
+import os
+import pytest
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.app import create_app  # noqa: E402
+from backend.data_models import db, Author, Book  # noqa: E402
+
+
+@pytest.fixture
+def buffer(app, monkeypatch):
+    buffer = app.extensions['rating_buffer']
+    # flushes on its own after three books (RATING_BUFFER_MAX_PENDING)
+    monkeypatch.setattr(buffer, 'max_pending', 3)
+    return buffer
+
+
+@pytest.fixture
+def book_ids(app):
+    author = Author(name='Buffered Author')
+    db.session.add(author)
+    db.session.commit()
+    books = [Book(isbn=f'BUF-{i}', title=f'Buffered {i}', author_id=author.id)
+             for i in range(5)]
+    db.session.add_all(books)
+    db.session.commit()
+    ids = [b.id for b in books]
+    db.session.expunge_all()
+    return ids
+
+
+def stored_rating(book_id):
+    """Rating as stored in the table, bypassing the buffer overlay."""
+    return db.session.execute(
+        db.text('SELECT rating FROM book WHERE id = :id'),
+        {'id': book_id}).scalar()
+
+
+def test_rating_is_buffered_and_coalesced(client, buffer, book_ids):
+    book_id = book_ids[0]
+    for rating in (3, 6, 8):
+        rv = client.post(f'/api/book/{book_id}/rating', json={'rating': rating})
+        assert rv.status_code == 202
+    assert len(buffer) == 1
+    assert stored_rating(book_id) is None
+
+    assert buffer.flush() == 1
+    assert stored_rating(book_id) == 8
+    assert len(buffer) == 0
+
+
+def test_pending_rating_is_visible_on_read(client, book_ids):
+    book_id = book_ids[0]
+    client.post(f'/api/book/{book_id}/rating', json={'rating': 7})
+    body = client.get(f'/book/{book_id}').get_data(as_text=True)
+    assert '7/10' in body
+    assert db.session.get(Book, book_id).rating == 7
+    # the overlay doesn't make the object dirty
+    assert not db.session.dirty
+
+
+def test_flush_at_size_threshold(client, buffer, book_ids):
+    for book_id in book_ids[:3]:
+        client.post(f'/api/book/{book_id}/rating', json={'rating': 5})
+    # max_pending is 3, so the third rating triggered a flush
+    assert len(buffer) == 0
+    assert [stored_rating(i) for i in book_ids[:3]] == [5, 5, 5]
+
+
+def test_flush_is_one_update_statement(app, buffer, book_ids):
+    from sqlalchemy import event
+    statements = []
+
+    def record(conn, cursor, statement, params, context, executemany):
+        statements.append(statement)
+
+    buffer.add(book_ids[0], 2)
+    buffer.add(book_ids[1], 9)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        buffer.flush()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    updates = [s for s in statements
+               if s.lstrip().upper().startswith('UPDATE BOOK ')]
+    assert len(updates) == 1
+    assert 'CASE' in updates[0]
+    assert stored_rating(book_ids[0]) == 2
+    assert stored_rating(book_ids[1]) == 9
+
+
+def test_direct_rating_wins_over_buffered(client, buffer, book_ids):
+    book_id = book_ids[0]
+    client.post(f'/api/book/{book_id}/rating', json={'rating': 4})
+    client.post(f'/book/{book_id}/rate', data={'rating': '9'})
+    buffer.flush()
+    assert stored_rating(book_id) == 9
+
+
+@pytest.mark.parametrize('payload', [
+    {'rating': 0}, {'rating': 11}, {'rating': '5'}, {'rating': True}, {}])
+def test_invalid_rating_rejected(client, buffer, book_ids, payload):
+    rv = client.post(f'/api/book/{book_ids[0]}/rating', json=payload)
+    assert rv.status_code == 400
+    assert len(buffer) == 0
+
+
+def test_unknown_book_is_404(client, buffer):
+    rv = client.post('/api/book/9999/rating', json={'rating': 5})
+    assert rv.status_code == 404
+    assert len(buffer) == 0
+
+
+def test_sort_by_rating_sees_buffered_values(client, book_ids):
+    client.post(f'/api/book/{book_ids[4]}/rating', json={'rating': 10})
+    body = client.get('/?sort=rating&order=desc').get_data(as_text=True)
+    assert body.index('Buffered 4') < body.index('Buffered 0')
+
+
+def test_failed_flush_is_retried_by_the_timer(buffer, book_ids, monkeypatch):
+    buffer.add(book_ids[0], 4)
+    buffer.flush_interval = 60
+
+    def fail(batch):
+        raise RuntimeError('database is locked')
+    monkeypatch.setattr(buffer, '_write', fail)
+    with pytest.raises(RuntimeError):
+        buffer.flush()
+    # Requeued, with a timer armed to try again
+    assert buffer.get(book_ids[0]) == 4
+    assert buffer._timer is not None
+    monkeypatch.undo()
+    assert buffer.flush() == 1
+    assert buffer._timer is None
+    assert stored_rating(book_ids[0]) == 4
+
+
+def test_failed_quiet_flush_is_logged(buffer, book_ids, monkeypatch, caplog):
+    from backend.rating_buffer import flush_quietly
+
+    buffer.add(book_ids[0], 4)
+
+    def fail(batch):
+        raise RuntimeError('database is locked')
+    monkeypatch.setattr(buffer, '_write', fail)
+    flush_quietly(buffer)
+    assert 'Could not flush buffered ratings' in caplog.text
+    assert 'database is locked' in caplog.text
+    monkeypatch.undo()
+    assert buffer.flush() == 1
+
+
+def test_buffers_do_not_keep_apps_alive(db_uri):
+    import gc
+    import weakref
+
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': db_uri})
+    gone = weakref.ref(app)
+    del app
+    gc.collect()
+    assert gone() is None
@@ -0,0 +1,165 @@
+"""
+Tests for the rating history table and the incremental rating aggregates.
+"""
+
+import sys
+import os
+import pytest
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.data_models import (db, Author, Book, RatingEvent,  # noqa: E402
+                                 RatingSummary)
+from backend.rating_stats import (author_summary, rebuild_rating_stats,  # noqa: E402
+                                  recent_ratings, set_ratings)
+
+
+@pytest.fixture
+def author_books(app):
+    """Author with three unrated books."""
+    author = Author(name='Stats Author')
+    db.session.add(author)
+    db.session.commit()
+    books = [Book(isbn=f'STAT-{i}', title=f'Stats Book {i}',
+                  author_id=author.id) for i in range(3)]
+    db.session.add_all(books)
+    db.session.commit()
+    return author.id, [b.id for b in books]
+
+
+def summary_from_scan(author_id):
+    """What the author summary should contain, computed the slow way."""
+    ratings = [b.rating for b in Book.query.filter_by(author_id=author_id)
+               if b.rating is not None]
+    return len(ratings), sum(ratings)
+
+
+def test_rate_book_appends_event(client, author_books):
+    _, (book_id, _, _) = author_books
+    client.post(f'/book/{book_id}/rate', data={'rating': '6'})
+    client.post(f'/book/{book_id}/rate', data={'rating': '9'})
+
+    events = RatingEvent.query.filter_by(book_id=book_id).order_by(
+        RatingEvent.id).all()
+    assert [(e.previous_rating, e.rating) for e in events] == [
+        (None, 6), (6, 9)]
+
+    book_summary = db.session.get(RatingSummary, ('book', book_id))
+    assert book_summary.rating_count == 2
+    assert book_summary.rating_sum == 15
+    assert book_summary.hist_6 == 1 and book_summary.hist_9 == 1
+
+
+def test_same_rating_is_not_an_event(client, author_books):
+    _, (book_id, _, _) = author_books
+    client.post(f'/book/{book_id}/rate', data={'rating': '6'})
+    client.post(f'/book/{book_id}/rate', data={'rating': '6'})
+    assert RatingEvent.query.count() == 1
+
+
+def test_author_summary_tracks_current_ratings(client, author_books):
+    author_id, (b1, b2, b3) = author_books
+    client.post(f'/book/{b1}/rate', data={'rating': '4'})
+    client.post(f'/book/{b2}/rate', data={'rating': '8'})
+    client.post(f'/book/{b1}/rate', data={'rating': '10'})
+
+    summary = author_summary(author_id)
+    assert (summary.rating_count, summary.rating_sum) == (2, 18)
+    assert summary.average == 9
+    assert summary.hist_4 == 0 and summary.hist_10 == 1
+    assert (summary.rating_count, summary.rating_sum) == \
+        summary_from_scan(author_id)
+
+
+def test_add_and_edit_book_record_ratings(client, author_books):
+    author_id, _ = author_books
+    client.post('/add_book', data={
+        'isbn': '9780000000019', 'title': 'New', 'author_id': author_id,
+        'rating': '7'})
+    book = Book.query.filter_by(isbn='9780000000019').one()
+    assert [e.rating for e in RatingEvent.query.filter_by(book_id=book.id)] == [7]
+
+    # editing other fields with the same rating logs nothing new
+    client.post('/add_book', data={
+        'book_id': book.id, 'isbn': '9780000000019', 'title': 'Renamed',
+        'author_id': author_id, 'rating': '7'})
+    assert RatingEvent.query.filter_by(book_id=book.id).count() == 1
+
+    client.post('/add_book', data={
+        'book_id': book.id, 'isbn': '9780000000019', 'title': 'Renamed',
+        'author_id': author_id, 'rating': '3'})
+    assert RatingEvent.query.filter_by(book_id=book.id).count() == 2
+    assert author_summary(author_id).rating_sum == 3
+
+
+def test_out_of_range_ratings_are_rejected(client, author_books):
+    author_id, book_ids = author_books
+    for rating in ('15', '0', '-3'):
+        response = client.post('/add_book', data={
+            'book_id': book_ids[0], 'isbn': '9780000000019',
+            'title': 'Stats Book 0', 'author_id': author_id,
+            'rating': rating})
+        assert response.status_code == 400
+        assert 'Rating must be between 1 and 10.' in response.get_data(
+            as_text=True)
+    assert RatingEvent.query.count() == 0
+    with pytest.raises(ValueError):
+        set_ratings(db.session.connection(), {book_ids[0]: 11})
+
+
+def test_delete_and_undo_adjust_author_summary(client, author_books):
+    author_id, (b1, b2, _) = author_books
+    client.post(f'/book/{b1}/rate', data={'rating': '5'})
+    client.post(f'/book/{b2}/rate', data={'rating': '7'})
+
+    client.post(f'/book/{b1}/delete')
+    assert author_summary(author_id).rating_sum == 7
+    client.post(f'/book/{b1}/undo_delete')
+    assert author_summary(author_id).rating_sum == 12
+
+
+def test_reassign_moves_ratings(client, author_books):
+    author_id, (b1, _, _) = author_books
+    other = Author(name='Other Author')
+    db.session.add(other)
+    db.session.commit()
+    other_id = other.id
+    client.post(f'/book/{b1}/rate', data={'rating': '8'})
+
+    client.post('/admin/bulk/reassign_books',
+                data={'book_ids': [str(b1)], 'author_id': str(other_id)})
+    assert author_summary(author_id).rating_count == 0
+    assert author_summary(other_id).rating_sum == 8
+    assert [e.book_id for e in recent_ratings(other_id)] == [b1]
+    assert recent_ratings(author_id) == []
+
+
+def test_author_detail_shows_stats(client, author_books):
+    author_id, (b1, b2, _) = author_books
+    client.post(f'/book/{b1}/rate', data={'rating': '6'})
+    client.post(f'/book/{b2}/rate', data={'rating': '9'})
+    body = client.get(f'/author/{author_id}').get_data(as_text=True)
+    assert 'Average:' in body
+    assert '7.5/10' in body
+    assert 'Recently rated' in body
+    assert body.index('Stats Book 1') < body.index('Stats Book 0', body.index(
+        'Recently rated'))
+
+
+def test_rebuild_backfills_existing_ratings(app, author_books):
+    author_id, (b1, b2, _) = author_books
+    # ratings written behind the app's back have no history yet
+    Book.query.filter(Book.id.in_([b1, b2])).update({Book.rating: 4})
+    db.session.commit()
+
+    with db.engine.begin() as conn:
+        added, _ = rebuild_rating_stats(conn)
+    assert added == 2
+    summary = author_summary(author_id)
+    assert (summary.rating_count, summary.rating_sum) == (2, 8)
+    assert db.session.get(RatingSummary, ('book', b1)).rating_count == 1
+
+    result = app.test_cli_runner().invoke(args=['rebuild-rating-stats'])
+    assert 'Added 0 rating event(s)' in result.output
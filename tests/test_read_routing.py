@@ -0,0 +1,158 @@
+"""
+Tests for routing reads to a read-only replica engine and writes to the
+primary, including read-your-writes stickiness after a POST.
+"""
+
+import os
+import sys
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.app import create_app  # noqa: E402
+from backend.data_models import db, Author, Book  # noqa: E402
+from backend.read_routing import (PRIMARY_UNTIL_KEY,  # noqa: E402
+                                  read_only_sqlite_uri)
+from backend.server import enable_wal  # noqa: E402
+
+
+def make_app(tmp_path, **config):
+    """An app of its own (not the shared `app`): a file database with a
+    read-only replica engine next to the primary."""
+    settings = {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'library.sqlite'}",
+        'SQLITE_READ_ONLY_READS': True,
+        'RATING_BUFFER_FLUSH_INTERVAL': 0,
+    }
+    settings.update(config)
+    return create_app(settings)
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(tmp_path)
+    with app.app_context():
+        db.create_all()
+        author = Author(name='Routed Author')
+        db.session.add(author)
+        db.session.flush()
+        db.session.add(Book(isbn='9780000000003', title='Routed Book',
+                            author_id=author.id))
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+        app.extensions['read_replica'].dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def statements(app):
+    """SQL statements seen by each engine, keyed 'primary' / 'replica'."""
+    seen = {'primary': [], 'replica': []}
+    listeners = []
+    engines = {'primary': db.engine,
+               'replica': app.extensions['read_replica']}
+    for name, engine in engines.items():
+        def record(conn, cursor, statement, params, context, executemany,
+                   name=name):
+            seen[name].append(statement.split()[0].upper())
+        event.listen(engine, 'before_cursor_execute', record)
+        listeners.append((engine, record))
+    yield seen
+    for engine, record in listeners:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def book():
+    return Book.query.filter_by(title='Routed Book').one()
+
+
+def test_read_only_sqlite_uri():
+    uri = read_only_sqlite_uri('sqlite:////tmp/x/library.sqlite')
+    assert uri == 'sqlite:///file:/tmp/x/library.sqlite?mode=ro&uri=true'
+    assert read_only_sqlite_uri('sqlite:///:memory:') is None
+    assert read_only_sqlite_uri('postgresql://db/books') is None
+
+
+def test_no_replica_without_config(tmp_path):
+    app = make_app(tmp_path, SQLITE_READ_ONLY_READS=False)
+    assert 'read_replica' not in app.extensions
+
+
+def test_replica_rejects_writes(app):
+    with app.extensions['read_replica'].connect() as conn:
+        assert conn.exec_driver_sql('SELECT title FROM book').scalar() \
+            == 'Routed Book'
+        with pytest.raises(OperationalError, match='readonly'):
+            conn.exec_driver_sql("UPDATE book SET title = 'x'")
+
+
+def test_get_reads_from_replica(client, statements):
+    resp = client.get('/')
+    assert resp.status_code == 200
+    assert b'Routed Book' in resp.data
+    assert 'SELECT' in statements['replica']
+    assert 'SELECT' not in statements['primary']
+
+
+def test_post_uses_primary_and_pins_reads(client, app, statements):
+    bid = book().id
+    resp = client.post(f'/book/{bid}/rate', data={'rating': '7'})
+    assert resp.status_code == 302
+    assert 'UPDATE' in statements['primary']
+    assert not statements['replica']
+    with client.session_transaction() as sess:
+        assert sess[PRIMARY_UNTIL_KEY] > 0
+
+    # the redirect target is read from the primary (read-your-writes)
+    statements['primary'].clear()
+    client.get(resp.headers['Location'])
+    assert 'SELECT' in statements['primary']
+    assert not statements['replica']
+
+    # once the window has passed, reads go back to the replica
+    with client.session_transaction() as sess:
+        sess[PRIMARY_UNTIL_KEY] = 0
+    client.get('/')
+    assert 'SELECT' in statements['replica']
+
+
+def test_writes_during_get_go_to_primary(app):
+    with app.test_request_context('/'):
+        app.preprocess_request()
+        target = book()
+        target.title = 'Renamed In GET'
+        db.session.commit()
+        db.session.remove()
+    with app.app_context():
+        assert Book.query.filter_by(title='Renamed In GET').count() == 1
+
+
+def test_replica_reads_wal_database(tmp_path):
+    app = make_app(tmp_path)
+    with app.app_context():
+        db.create_all()
+    enable_wal(app)
+    with app.app_context():
+        db.session.add(Author(name='WAL Author'))
+        db.session.commit()
+        db.session.remove()
+    client = app.test_client()
+    resp = client.get('/')
+    assert resp.status_code == 200
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+        app.extensions['read_replica'].dispose()
@@ -0,0 +1,199 @@
+"""
+Tests for the production server: per-worker engine disposal after fork, the
+one worker running the periodic jobs, and the pre-forking launcher's reload
+and shutdown.
+"""
+
+import os
+import queue
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import pytest
+
+# Add project root to sys.path
+proj_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, proj_root)
+
+from backend.app import create_app  # noqa: E402
+from backend.data_models import db, Author, Book  # noqa: E402
+from backend.server import (background_lock_file,  # noqa: E402
+                            dispose_engines, prepare_worker,
+                            start_background_jobs)
+
+needs_fork = pytest.mark.skipif(not hasattr(os, 'fork'),
+                                reason='needs os.fork')
+
+
+@pytest.fixture
+def db_uri(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'library.sqlite'}"
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': uri})
+    with app.app_context():
+        db.create_all()
+        author = Author(name='Served Author')
+        db.session.add(author)
+        db.session.flush()
+        db.session.add(Book(isbn='9780000000001', title='Served Book',
+                            author_id=author.id))
+        db.session.commit()
+        db.session.remove()
+        db.engine.dispose()
+    return uri
+
+
+@needs_fork
+def test_forked_child_gets_fresh_pool(db_uri):
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': db_uri})
+    with app.app_context():
+        assert Book.query.count() == 1
+        db.session.remove()
+        parent_pool = db.engine.pool
+        assert parent_pool.checkedin() == 1
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        result = 'error'
+        try:
+            os.close(read_fd)
+            dispose_engines(app)
+            with app.app_context():
+                fresh = db.engine.pool
+                result = f'{fresh is not parent_pool} {fresh.checkedin()} ' \
+                         f'{Book.query.count()}'
+                db.session.remove()
+        finally:
+            os.write(write_fd, result.encode())
+            os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as pipe:
+        result = pipe.read()
+    os.waitpid(pid, 0)
+    assert result == 'True 0 1'
+
+    # the parent's pooled connection was left open and still works
+    with app.app_context():
+        assert db.engine.pool is parent_pool
+        assert Book.query.count() == 1
+        db.session.remove()
+
+
+def test_prepare_worker_enables_wal(db_uri):
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': db_uri})
+    prepare_worker(app)
+    with app.app_context():
+        with db.engine.connect() as conn:
+            mode = conn.exec_driver_sql('PRAGMA journal_mode').scalar()
+        db.engine.dispose()
+    assert mode == 'wal'
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='needs fcntl')
+def test_background_jobs_wait_for_the_lock(db_uri, tmp_path, monkeypatch):
+    import fcntl
+    import backend.purge
+    started = threading.Event()
+    monkeypatch.setattr(backend.purge, 'start_purge_thread',
+                        lambda app: started.set())
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': db_uri,
+                      'PURGE_INTERVAL_SECONDS': 3600,
+                      'BACKGROUND_LOCK_FILE': str(tmp_path / 'jobs.lock')})
+    assert background_lock_file(app) == str(tmp_path / 'jobs.lock')
+
+    # Another process holds the lock: this one waits
+    with open(background_lock_file(app), 'a') as other:
+        fcntl.flock(other, fcntl.LOCK_EX)
+        thread = start_background_jobs(app)
+        assert not started.wait(0.3)
+        # once per process
+        assert start_background_jobs(app) is None
+    # ... and takes over once it's gone
+    assert started.wait(5)
+    thread.join(5)
+    app.extensions.pop('background_jobs_lock').close()
+
+
+def test_no_background_jobs_without_intervals(db_uri):
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': db_uri})
+    assert start_background_jobs(app) is None
+
+
+def read_lines(stream, lines, log):
+    for line in stream:
+        log.append(line)
+        lines.put(line)
+
+
+def logged(log, pattern, count, timeout=20):
+    """Wait until `pattern` is in `count` lines of `log`; return them."""
+    deadline = time.monotonic() + timeout
+    while True:
+        found = [m for m in map(re.compile(pattern).search, list(log)) if m]
+        if len(found) >= count or time.monotonic() > deadline:
+            return found
+        time.sleep(0.05)
+
+
+def wait_for(lines, pattern, count=1, timeout=20):
+    """Consume server log lines until `pattern` was seen `count` times."""
+    seen = []
+    deadline = time.monotonic() + timeout
+    while len(seen) < count:
+        try:
+            line = lines.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            raise AssertionError(f'timed out waiting for {pattern!r}')
+        match = re.search(pattern, line)
+        if match:
+            seen.append(match)
+    return seen
+
+
+@needs_fork
+def test_launcher_serves_reloads_and_stops(db_uri):
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'backend.server', '--bind', '127.0.0.1:0',
+         '--workers', '2', '--threads', '2', '--db-uri', db_uri, '--quiet'],
+        cwd=proj_root, stderr=subprocess.PIPE, text=True,
+        env={**os.environ, 'PURGE_INTERVAL_SECONDS': '3600'})
+    lines, log = queue.Queue(), []
+    reader = threading.Thread(target=read_lines,
+                              args=(proc.stderr, lines, log), daemon=True)
+    reader.start()
+    jobs = r'server (\d+)\] Running the background jobs'
+    try:
+        port = int(wait_for(lines, r'Listening on http://[\d.]+:(\d+)')[0]
+                   .group(1))
+        first = wait_for(lines, r'server (\d+)\] Booting worker', count=2)
+        # the periodic jobs run in one of the workers
+        [runner] = logged(log, jobs, count=1)
+        assert runner.group(1) in {m.group(1) for m in first}
+        url = f'http://127.0.0.1:{port}/'
+        with urllib.request.urlopen(url, timeout=10) as resp:
+            assert resp.status == 200
+            assert 'Served Book' in resp.read().decode()
+
+        proc.send_signal(signal.SIGHUP)
+        second = wait_for(lines, r'server (\d+)\] Booting worker', count=2)
+        assert {m.group(1) for m in first}.isdisjoint(
+            {m.group(1) for m in second})
+        # ... and move to a new worker once the old ones are gone
+        runners = logged(log, jobs, count=2)
+        assert runners[1].group(1) in {m.group(1) for m in second}
+        with urllib.request.urlopen(url, timeout=10) as resp:
+            assert resp.status == 200
+
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=20) == 0
+        reader.join(5)
+        assert len(logged(log, jobs, count=3, timeout=0)) == 2
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
@@ -0,0 +1,248 @@
+"""
+Tests for the local content-based "similar books" engine.
+"""
+
+import os
+import random
+import sys
+
+import pytest
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+import backend.similar_books  # noqa: E402
+from backend.data_models import (db, Author, Book, BookFeature,  # noqa: E402
+                                 SimilarBook)
+from backend.similar_books import (NEIGHBOURS, all_nearest,  # noqa: E402
+                                   all_nearest_numpy, dot,
+                                   rebuild_similar_books,
+                                   refresh_similar_books, term_frequencies,
+                                   weigh)
+
+SEA = 'A voyage on a whaling ship, storms and a mad captain at sea.'
+SPACE = 'A colony on a distant planet answers a signal from orbit.'
+
+
+@pytest.fixture
+def app_config():
+    return {'SIMILAR_BOOKS': True}
+
+
+@pytest.fixture
+def library(app):
+    """Two sea stories, two space stories and an unrelated book."""
+    melville = Author(name='Herman Melville')
+    other = Author(name='Someone Else')
+    db.session.add_all([melville, other])
+    db.session.flush()
+    books = {
+        'whale': Book(isbn='SIM-1', title='The Whale', author_id=melville.id,
+                      publication_year=1851, ai_recommendation=SEA),
+        'ship': Book(isbn='SIM-2', title='Storm Ship', author_id=other.id,
+                     publication_year=1850,
+                     ai_recommendation='Another ship lost in a storm at sea.'),
+        'colony': Book(isbn='SIM-3', title='Colony', author_id=other.id,
+                       publication_year=1990, ai_recommendation=SPACE),
+        'signal': Book(isbn='SIM-4', title='The Signal', author_id=other.id,
+                       publication_year=1992,
+                       ai_recommendation='A planet, an orbit and a signal.'),
+        'cookbook': Book(isbn='SIM-5', title='Soups', author_id=other.id),
+    }
+    db.session.add_all(books.values())
+    db.session.commit()
+    return {name: b.id for name, b in books.items()}
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def computation(request, monkeypatch):
+    """Run the test with NumPy (if installed) and without."""
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(backend.similar_books, 'numpy', None)
+    return request.param
+
+
+def neighbours(book_id):
+    return [similar_id for (similar_id,) in db.session.query(
+        SimilarBook.similar_id).filter_by(book_id=book_id)
+        .order_by(SimilarBook.score.desc())]
+
+
+def rebuild():
+    with db.engine.begin() as conn:
+        return rebuild_similar_books(conn)
+
+
+def test_vectors_are_unit_length():
+    tf = term_frequencies('Sea Sea Stories', 7, 1851, SEA)
+    vector = weigh(tf, {}, 10)
+    assert dot(vector, vector) == pytest.approx(1.0)
+    # hashing is stable across processes and calls
+    assert tf == term_frequencies('Sea Sea Stories', 7, 1851, SEA)
+
+
+def test_rebuild_finds_related_books(app, library, computation):
+    assert rebuild() == 5
+    assert neighbours(library['whale'])[0] == library['ship']
+    assert neighbours(library['colony'])[0] == library['signal']
+    assert library['whale'] not in neighbours(library['whale'])
+    scores = [s for (s,) in db.session.query(SimilarBook.score)]
+    assert all(0 < s <= 1.0 + 1e-9 for s in scores)
+
+
+def test_numpy_matches_pure_python(monkeypatch):
+    pytest.importorskip('numpy')
+    rng = random.Random(3)
+    words = [f'word{i}' for i in range(400)]
+    tfs = {}
+    for book_id in range(1, 601):
+        topic = words[book_id % 20 * 20:book_id % 20 * 20 + 20]
+        tfs[book_id] = term_frequencies(
+            ' '.join(rng.choice(topic) for _ in range(3)), book_id % 40,
+            rng.choice([None, 1850, 1990]),
+            ' '.join(rng.choice(words if rng.random() < 0.3 else topic)
+                     for _ in range(rng.randint(0, 30))))
+    # no content, and books with the same content (tied scores)
+    tfs[601], tfs[602], tfs[603] = {}, dict(tfs[1]), dict(tfs[1])
+    df = {}
+    for tf in tfs.values():
+        for feature in tf:
+            df[feature] = df.get(feature, 0) + 1
+    vectors = {book_id: weigh(tf, df, len(tfs)) for book_id, tf in tfs.items()}
+    expected = dict(all_nearest(vectors))
+    assert dict(all_nearest_numpy(vectors)) == expected
+    monkeypatch.setattr(backend.similar_books, 'NUMPY_BATCH', 7)
+    assert dict(all_nearest_numpy(vectors)) == expected
+    # postings cut short
+    monkeypatch.setattr(backend.similar_books, 'POSTINGS_PER_FEATURE', 8)
+    assert dict(all_nearest_numpy(vectors)) == dict(all_nearest(vectors))
+    assert dict(all_nearest_numpy({})) == {}
+
+
+def test_new_book_refreshed_on_commit(app, library):
+    rebuild()
+    author_id = db.session.get(Book, library['whale']).author_id
+    book = Book(isbn='SIM-6', title='Whale Ship', author_id=author_id,
+                publication_year=1852, ai_recommendation=SEA)
+    db.session.add(book)
+    db.session.commit()
+    assert db.session.query(BookFeature).filter_by(book_id=book.id).count()
+    assert neighbours(book.id)[0] == library['whale']
+    # and it joined the lists of the books it is like
+    assert book.id in neighbours(library['whale'])
+    colony = neighbours(library['colony'])
+    assert book.id not in colony or colony[0] == library['signal']
+
+
+def test_edited_review_moves_book(app, library):
+    rebuild()
+    ship = db.session.get(Book, library['ship'])
+    ship.ai_recommendation = SPACE
+    ship.title = 'Planet Ship'
+    db.session.commit()
+    assert neighbours(library['ship'])[0] == library['colony']
+    assert library['ship'] in neighbours(library['colony'])
+    whale_list = neighbours(library['whale'])
+    assert library['ship'] not in whale_list[:1]
+
+
+def test_rating_change_does_not_refresh(app, library):
+    rebuild()
+    before = db.session.query(SimilarBook.updated_at).filter_by(
+        book_id=library['whale']).first()
+    db.session.get(Book, library['whale']).rating = 9
+    db.session.commit()
+    after = db.session.query(SimilarBook.updated_at).filter_by(
+        book_id=library['whale']).first()
+    assert before == after
+
+
+def test_refresh_matches_rebuild(app, library):
+    rebuild()
+    expected = {book_id: neighbours(book_id) for book_id in library.values()}
+    with db.engine.begin() as conn:
+        assert refresh_similar_books(conn, list(library.values())) == 5
+    for book_id, ids in expected.items():
+        assert neighbours(book_id)[:1] == ids[:1]
+
+
+def test_lists_are_bounded(app):
+    author = Author(name='Prolific')
+    db.session.add(author)
+    db.session.flush()
+    db.session.add_all([
+        Book(isbn=f'MANY-{i}', title=f'Sea Voyage {i}', author_id=author.id,
+             ai_recommendation=SEA) for i in range(NEIGHBOURS + 5)])
+    db.session.commit()
+    counts = [n for (n,) in db.session.query(db.func.count()).select_from(
+        SimilarBook).group_by(SimilarBook.book_id)]
+    assert counts and max(counts) == NEIGHBOURS
+
+
+def test_detail_page_shows_similar_books(client, library):
+    rebuild()
+    html = client.get(f'/book/{library["whale"]}').get_data(as_text=True)
+    assert 'Similar Books' in html
+    assert f'href="/book/{library["ship"]}"' in html
+    assert 'class="similar-book"' in html
+
+
+def test_deleted_books_hidden(client, library):
+    rebuild()
+    db.session.get(Book, library['ship']).soft_delete()
+    db.session.commit()
+    html = client.get(f'/book/{library["whale"]}').get_data(as_text=True)
+    assert f'href="/book/{library["ship"]}"' not in html
+
+
+def test_etag_follows_similar_books(client, library):
+    rebuild()
+    path = f'/book/{library["whale"]}'
+    etag = client.get(path).headers['ETag']
+    ship = db.session.get(Book, library['ship'])
+    ship.title = 'Storm Ship, Revised'
+    db.session.commit()
+    resp = client.get(path, headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert 'Storm Ship, Revised' in resp.get_data(as_text=True)
+
+
+def test_bulk_reassign_refreshes(client, library):
+    rebuild()
+    whale = db.session.get(Book, library['whale'])
+    author_id = db.session.get(Book, library['colony']).author_id
+    before = db.session.query(BookFeature.feature).filter_by(
+        book_id=whale.id).all()
+    client.post('/admin/bulk/reassign_books', data={
+        'book_ids': [str(whale.id)], 'author_id': str(author_id)})
+    after = db.session.query(BookFeature.feature).filter_by(
+        book_id=whale.id).all()
+    assert set(before) != set(after)
+
+
+def test_recommend_suggests_unrated_similar_books(client, library):
+    rebuild()
+    db.session.get(Book, library['whale']).rating = 10
+    db.session.commit()
+    html = client.get('/recommend').get_data(as_text=True)
+    assert 'Picked for You' in html
+    section = html[html.index('Picked for You'):html.index('AI Recommendations')]
+    assert 'Storm Ship' in section
+    assert 'The Whale' not in section
+
+
+def test_disabled(app, client):
+    app.config['SIMILAR_BOOKS'] = False
+    author = Author(name='Quiet')
+    db.session.add(author)
+    db.session.flush()
+    books = [Book(isbn=f'OFF-{i}', title='Sea Voyage', author_id=author.id,
+                  ai_recommendation=SEA) for i in range(2)]
+    db.session.add_all(books)
+    db.session.commit()
+    assert db.session.query(BookFeature).count() == 0
+    html = client.get(f'/book/{books[0].id}').get_data(as_text=True)
+    assert 'Similar Books' not in html
@@ -0,0 +1,139 @@
+"""
+Tests for soft deletes, undo and the background purge.
+
+Deleting a book or author only sets `deleted_at`; the rows disappear from
+every listing right away, can be restored through the undo routes, and are
+physically removed by `backend.purge` once older than the retention window.
+"""
+
+import sys
+import os
+from datetime import timedelta
+
+import pytest
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.data_models import (db, Author, Book,  # noqa: E402
+                                 RatingSummary, utcnow)
+from backend.purge import purge_batch, purge_deleted  # noqa: E402
+from backend.rating_stats import set_ratings  # noqa: E402
+
+
+@pytest.fixture
+def library(app):
+    """One author with two books."""
+    author = Author(name='Soft Author')
+    db.session.add(author)
+    db.session.commit()
+    books = [Book(isbn=f'SOFT-{i}', title=f'Soft Book {i}',
+                  author_id=author.id) for i in range(2)]
+    db.session.add_all(books)
+    db.session.commit()
+    return author.id, [b.id for b in books]
+
+
+def raw_count(table):
+    """Row count including tombstones."""
+    return db.session.execute(
+        db.text(f'SELECT COUNT(*) FROM {table}')).scalar()
+
+
+def test_delete_book_keeps_tombstone(client, library):
+    _, (book_id, _) = library
+    client.post(f'/book/{book_id}/delete')
+
+    assert db.session.get(Book, book_id) is None
+    assert Book.query.count() == 1
+    assert raw_count('book') == 2
+    body = client.get('/').get_data(as_text=True)
+    assert 'Soft Book 0' not in body
+
+
+def test_undo_delete_book(client, library):
+    _, (book_id, _) = library
+    rv = client.post(f'/book/{book_id}/delete', follow_redirects=True)
+    assert f'/book/{book_id}/undo_delete' in rv.get_data(as_text=True)
+
+    rv = client.post(f'/book/{book_id}/undo_delete')
+    assert rv.status_code in (302, 303)
+    assert db.session.get(Book, book_id) is not None
+    assert Book.query.count() == 2
+
+
+def test_undo_unknown_or_live_book_is_404(client, library):
+    _, (book_id, _) = library
+    assert client.post(f'/book/{book_id}/undo_delete').status_code == 404
+    assert client.post('/book/9999/undo_delete').status_code == 404
+
+
+def test_undo_delete_author_restores_its_books(client, library):
+    author_id, book_ids = library
+    # A book deleted earlier on its own stays deleted after the undo
+    client.post(f'/book/{book_ids[0]}/delete')
+    client.post(f'/author/{author_id}/delete')
+    assert Author.query.count() == 0
+    assert Book.query.count() == 0
+
+    client.post(f'/author/{author_id}/undo_delete')
+    assert db.session.get(Author, author_id) is not None
+    assert [b.id for b in Book.query.all()] == [book_ids[1]]
+
+
+def test_purge_respects_retention(app, client, library):
+    author_id, _ = library
+    client.post(f'/author/{author_id}/delete')
+
+    assert purge_deleted(retention=3600) == {'books': 0, 'authors': 0}
+    assert raw_count('book') == 2
+
+    purged = purge_deleted(retention=0, batch_size=1, pause=0)
+    assert purged == {'books': 2, 'authors': 1}
+    assert raw_count('book') == 0
+    assert raw_count('author') == 0
+    # once purged there is nothing left to undo
+    assert client.post(
+        f'/author/{author_id}/undo_delete').status_code == 404
+
+
+def test_purge_max_batches(app, client, library):
+    _, book_ids = library
+    for book_id in book_ids:
+        Book.query.filter_by(id=book_id).update(
+            {Book.deleted_at: utcnow() - timedelta(days=1)})
+    db.session.commit()
+
+    assert purge_deleted(retention=0, batch_size=1, pause=0,
+                         max_batches=1) == {'books': 1, 'authors': 0}
+    assert raw_count('book') == 1
+
+
+def test_purging_an_author_drops_its_books_summaries(app, client, library):
+    author_id, book_ids = library
+    set_ratings(db.session.connection(), {book_id: 7 for book_id in book_ids})
+    db.session.commit()
+    client.post(f'/author/{author_id}/delete')
+
+    # The author's books go with it through the database cascade
+    assert purge_batch(Author, utcnow() + timedelta(seconds=1), 10) == 1
+    assert raw_count('book') == 0
+    assert RatingSummary.query.count() == 0
+
+
+def test_listing_uses_partial_index(app, library):
+    if db.engine.dialect.name != 'sqlite':
+        pytest.skip('EXPLAIN QUERY PLAN is SQLite syntax')
+    plan = db.session.execute(db.text(
+        'EXPLAIN QUERY PLAN SELECT id FROM book '
+        'WHERE library_id = 1 AND deleted_at IS NULL ORDER BY title')).all()
+    assert 'ix_book_live_title' in str(plan)
+
+
+def test_purge_cli_command(app, client, library):
+    author_id, _ = library
+    client.post(f'/author/{author_id}/delete')
+    result = app.test_cli_runner().invoke(
+        args=['purge-deleted', '--retention', '0', '--pause', '0'])
+    assert 'Purged 2 book(s) and 1 author(s).' in result.output
@@ -0,0 +1,99 @@
+"""
+Tests for streamed rendering of the listing pages (STREAM_LISTINGS).
+"""
+
+import os
+import sys
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Add project root to sys.path
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.data_models import db, Author, Book  # noqa: E402
+from backend.streaming import chunked  # noqa: E402
+
+
+@pytest.fixture
+def app_config():
+    return {'STREAM_LISTINGS': True, 'STREAM_BATCH_SIZE': 3}
+
+
+@pytest.fixture
+def library(app):
+    """Ten books by one author; every other one rated, one reviewed."""
+    author = Author(name='Stream Author')
+    db.session.add(author)
+    db.session.flush()
+    db.session.add_all([
+        Book(isbn=f'STR-{i}', title=f'Stream Book {i:02d}',
+             author_id=author.id, rating=(i if i % 2 else None),
+             ai_recommendation=('Streams well.' if i == 3 else None))
+        for i in range(10)])
+    db.session.commit()
+
+
+@pytest.fixture
+def yield_per(app):
+    """yield_per option of every ORM statement executed."""
+    seen = []
+
+    def record(execute_state):
+        seen.append(execute_state.execution_options.get('yield_per'))
+    event.listen(Session, 'do_orm_execute', record)
+    yield seen
+    event.remove(Session, 'do_orm_execute', record)
+
+
+def body(client, app, path, stream):
+    app.config['STREAM_LISTINGS'] = stream
+    resp = client.get(path)
+    assert resp.status_code == 200
+    return resp.get_data(as_text=True)
+
+
+@pytest.mark.parametrize('path', [
+    '/', '/?q=book+0', '/?sort=rating&order=desc', '/?per_page=4&page=2',
+    '/admin?per_page=4', '/recommend'])
+def test_streamed_page_matches_rendered(client, app, library, path):
+    assert body(client, app, path, True) == body(client, app, path, False)
+
+
+def test_listing_read_in_batches(client, app, library, yield_per):
+    html = client.get('/').get_data(as_text=True)
+    assert html.count('Stream Book') == 10
+    assert 3 in yield_per
+
+    yield_per.clear()
+    app.config['STREAM_LISTINGS'] = False
+    client.get('/')
+    assert not any(yield_per)
+
+
+def test_search_counts_streamed_results(client, library):
+    html = client.get('/?q=book+0').get_data(as_text=True)
+    assert 'Found 10 results' in html
+    html = client.get('/?q=nothing-like-this').get_data(as_text=True)
+    assert 'Found 0 results' in html
+
+
+def test_recommend_stats(client, library):
+    html = client.get('/recommend').get_data(as_text=True)
+    # ratings 1, 3, 5, 7, 9
+    assert '<strong>5</strong> books rated' in html
+    assert '5.0/10' in html
+    assert html.count('Streams well.') == 1
+
+
+def test_admin_page_past_the_end(client, library):
+    html = client.get('/admin?per_page=4&page=9').get_data(as_text=True)
+    assert 'Stream Book' not in html
+
+
+def test_chunked():
+    pieces = ['a' * 5] * 7
+    assert list(chunked(pieces, size=12)) == ['a' * 15, 'a' * 15, 'a' * 5]
+    assert list(chunked([], size=12)) == []
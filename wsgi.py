@@ -0,0 +1,23 @@
+"""
+WSGI entry point for production servers.
+
+Exposes the application as `wsgi:app` for any WSGI server, e.g.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The bundled pre-forking launcher builds its app the same way:
+
+    python -m backend.server --workers 4 --threads 8
+
+`run.py` remains the development server (debugger and reloader on).
+
+Creating the app doesn't start the periodic purge and "also liked" jobs
+(`PURGE_INTERVAL_SECONDS`, `ALSO_LIKED_INTERVAL_SECONDS`); the servers above
+start them in one worker after forking. Under another server, call
+`backend.server.start_background_jobs(app)` in each worker process, or run
+the `purge-deleted` and `rebuild-also-liked` commands from cron.
+"""
+
+from backend.app import create_app
+
+app = create_app()